@@ -0,0 +1,18 @@
+"""
+Helpers shared by the benchmark scripts in this directory. The scripts are run as ``python benchmarks/<name>.py``,
+so this directory is on sys.path and this module can be imported as ``benchmark_utils``.
+"""
+
+import importlib.util
+from pathlib import Path
+
+
+def load_stats_benchmarks():
+    """
+    Load benchmarks/stats.py from its path, to reuse its helpers (best_of, compare). Importing it as "stats" could
+    pick up another module with that name.
+    """
+    spec = importlib.util.spec_from_file_location("locust_stats_benchmarks", Path(__file__).parent / "stats.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
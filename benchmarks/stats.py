@@ -0,0 +1,314 @@
+"""
+This file contains benchmarks to validate the performance of Locust itself.
+More precisely, the performance of the code that handles request statistics: logging requests on
+the workers, sending the stats reports to the master, merging them on the master and serving
+them to the web UI. This benchmark is to be used by people working on Locust's development.
+
+The results are written to a JSON file, which can be compared to the results of an earlier run
+(e.g. of the previous version) using --compare. The comparison fails (exit code 1) if any
+benchmark got slower than the allowed --threshold.
+
+    python benchmarks/stats.py --output before.json
+    (make changes)
+    python benchmarks/stats.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from prettytable import PrettyTable
+
+import locust
+from locust.env import Environment
+from locust.rpc import Message
+from locust.stats import RequestStats, StatsEntry
+from locust.stats_codec import StatsDecoder, StatsEncoder
+
+
+ENTRY_COUNT_CASES = [10, 100, 1000]
+
+
+def best_of(func, repeat):
+    """
+    Run func repeat times and return the shortest duration in seconds. The shortest duration is the one least
+    affected by other processes, garbage collection etc.
+    """
+    durations = []
+    for _ in range(repeat):
+        ts = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - ts)
+    return min(durations)
+
+
+def populated_stats(entry_count, requests_per_entry=100):
+    random.seed(entry_count)
+    stats = RequestStats()
+    for i in range(entry_count):
+        for _ in range(requests_per_entry):
+            stats.log_request("GET", "/endpoint/%i" % i, random.randint(1, 5000), 1000)
+        stats.log_error("GET", "/endpoint/%i" % i, "Error %i" % (i % 10))
+    return stats
+
+
+def bench_log_request(entry_count, iterations, repeat):
+    stats = RequestStats()
+    names = ["/endpoint/%i" % i for i in range(entry_count)]
+    response_times = [random.randint(1, 5000) for _ in range(iterations)]
+
+    def run():
+        for i in range(iterations):
+            stats.log_request("GET", names[i % entry_count], response_times[i], 1000)
+
+    return iterations / best_of(run, repeat)
+
+
+def bench_log_error(entry_count, iterations, repeat):
+    stats = RequestStats()
+    names = ["/endpoint/%i" % i for i in range(entry_count)]
+    errors = [Exception("Error %i" % i) for i in range(10)]
+
+    def run():
+        for i in range(iterations):
+            stats.log_error("GET", names[i % entry_count], errors[i % 10])
+
+    return iterations / best_of(run, repeat)
+
+
+def bench_worker_report_merge(entry_count, repeat):
+    """
+    Time it takes the master to merge one (uncompressed) stats report with entry_count entries
+    """
+    worker_stats = populated_stats(entry_count)
+    report = Message.unserialize(
+        Message("stats", {"stats": worker_stats.serialize_stats()}, "worker").serialize()
+    ).data["stats"]
+    master_stats = RequestStats(use_response_times_cache=False)
+
+    def run():
+        for stats_data in report:
+            entry = StatsEntry.unserialize(stats_data)
+            request_key = (entry.name, entry.method)
+            if request_key not in master_stats.entries:
+                master_stats.entries[request_key] = StatsEntry(master_stats, entry.name, entry.method)
+            master_stats.entries[request_key].extend(entry)
+
+    return best_of(run, repeat) * 1000
+
+
+def bench_current_percentile(entry_count, repeat):
+    """
+    Time it takes to calculate the current response time percentile of every entry
+    """
+    stats = RequestStats()
+    random.seed(entry_count)
+    for i in range(entry_count):
+        for _ in range(100):
+            stats.log_request("GET", "/endpoint/%i" % i, random.randint(1, 5000), 1000)
+
+    def run():
+        for entry in stats.entries.values():
+            entry.get_current_response_time_percentile(0.95)
+
+    return best_of(run, repeat) * 1000
+
+
+def bench_stats_requests_view(entry_count, repeat):
+    """
+    Time it takes to render /stats/requests (without the cache that the web UI normally uses)
+    """
+    environment = Environment()
+    environment.stats = populated_stats(entry_count)
+    environment.create_local_runner()
+    web_ui = environment.create_web_ui("127.0.0.1", 0, delayed_start=True)
+    view = web_ui.app.view_functions["request_stats"]
+    client = web_ui.app.test_client()
+
+    def run():
+        view.clear_cache()
+        response = client.get("/stats/requests")
+        assert response.status_code == 200
+
+    duration = best_of(run, repeat)
+    environment.runner.quit()
+    return duration * 1000
+
+
+def bench_message(entry_count, repeat):
+    """
+    Size of a stats report with entry_count entries, the time it takes to serialize it, and the time it takes the
+    master to unserialize and decode it into entries, both for the plain stats message and for the stats_delta
+    message (see locust.stats_codec), and the time it takes the master to decode the flat layout that workers write
+    to shared memory (see locust.stats_shm)
+    """
+    stats = populated_stats(entry_count)
+    legacy = Message("stats", {"stats": stats.serialize_stats(), "errors": stats.serialize_errors()}, "worker")
+    legacy_bytes = legacy.serialize()
+    delta = Message("stats_delta", list(StatsEncoder().encode(populated_stats(entry_count))), "worker")
+    delta_bytes = delta.serialize()
+
+    def decode_legacy():
+        [StatsEntry.unserialize(stats_data) for stats_data in Message.unserialize(legacy_bytes).data["stats"]]
+
+    flat_names, flat_bytes = StatsEncoder().encode_flat(populated_stats(entry_count))
+
+    def decode_delta():
+        StatsDecoder().decode(*Message.unserialize(delta_bytes).data)
+
+    def decode_flat():
+        StatsDecoder().decode_flat(flat_names, flat_bytes)
+
+    return {
+        "size (bytes)": len(legacy_bytes),
+        "serialize (ms)": best_of(legacy.serialize, repeat) * 1000,
+        "unserialize (ms)": best_of(lambda: Message.unserialize(legacy_bytes), repeat) * 1000,
+        "unserialize + decode (ms)": best_of(decode_legacy, repeat) * 1000,
+        "stats_delta size (bytes)": len(delta_bytes),
+        "stats_delta serialize (ms)": best_of(delta.serialize, repeat) * 1000,
+        "stats_delta unserialize + decode (ms)": best_of(decode_delta, repeat) * 1000,
+        "stats_flat size (bytes)": len(flat_bytes),
+        "stats_flat decode (ms)": best_of(decode_flat, repeat) * 1000,
+    }
+
+
+def bench_delta_report_merge(entry_count, repeat):
+    """
+    Time it takes the master to merge one stats report with entry_count entries sent using the compact encoding,
+    to compare with bench_worker_report_merge
+    """
+    new_names, payload = StatsEncoder().encode(populated_stats(entry_count))
+    _, report = StatsDecoder().decode(new_names, payload)
+    master_stats = RequestStats(use_response_times_cache=False)
+
+    def run():
+        for entry in report:
+            request_key = (entry.name, entry.method)
+            if request_key not in master_stats.entries:
+                master_stats.entries[request_key] = StatsEntry(master_stats, entry.name, entry.method)
+            master_stats.entries[request_key].extend(entry)
+
+    return best_of(run, repeat) * 1000
+
+
+def run_benchmarks(quick):
+    """
+    Returns a dict of benchmark name -> {"value": ..., "unit": ..., "higher_is_better": ...}
+    """
+    iterations = 20_000 if quick else 200_000
+    repeat = 3 if quick else 10
+    results = {}
+
+    def add(name, value, unit, higher_is_better=False):
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print("{:<70} {:>14,.3f} {}".format(name, value, unit))
+
+    for entry_count in ENTRY_COUNT_CASES:
+        add(
+            "log_request - %i entries" % entry_count,
+            bench_log_request(entry_count, iterations, repeat),
+            "requests/s",
+            higher_is_better=True,
+        )
+        add(
+            "log_error - %i entries" % entry_count,
+            bench_log_error(entry_count, iterations, repeat),
+            "errors/s",
+            higher_is_better=True,
+        )
+        add("worker report merge - %i entries" % entry_count, bench_worker_report_merge(entry_count, repeat), "ms")
+        add(
+            "worker report merge (stats_delta) - %i entries" % entry_count,
+            bench_delta_report_merge(entry_count, repeat),
+            "ms",
+        )
+        add(
+            "current response time percentile - %i entries" % entry_count,
+            bench_current_percentile(entry_count, repeat),
+            "ms",
+        )
+        add("/stats/requests - %i entries" % entry_count, bench_stats_requests_view(entry_count, repeat), "ms")
+        for name, value in bench_message(entry_count, repeat).items():
+            metric, unit = name.rsplit(" ", 1)
+            add("stats message %s - %i entries" % (metric, entry_count), value, unit.strip("()"))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print a comparison of results and baseline, and return the names of the benchmarks that regressed by more
+    than threshold (a fraction, e.g. 0.1 for 10%)
+    """
+    table = PrettyTable()
+    table.field_names = ["Benchmark", "Baseline", "Current", "Change", ""]
+    table.align["Benchmark"] = "l"
+    table.align["Baseline"] = "r"
+    table.align["Current"] = "r"
+    table.align["Change"] = "r"
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["value"]
+        after = result["value"]
+        change = (after - before) / before if before else 0.0
+        worse = -change if result["higher_is_better"] else change
+        status = ""
+        if worse > threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        table.add_row(
+            [
+                name,
+                "{:,.3f}".format(before),
+                "{:,.3f} {}".format(after, result["unit"]),
+                "{:+.1%}".format(change),
+                status,
+            ]
+        )
+    print()
+    print(table)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for Locust's request statistics")
+    parser.add_argument("--output", help="File to write the results to (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results (JSON) of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fail if any benchmark is worse than the baseline by more than this fraction. Defaults to 0.2 (20%%)",
+    )
+    parser.add_argument("--quick", action="store_true", help="Run fewer iterations (less accurate)")
+    args = parser.parse_args()
+    # the web UI parses the command line to find the extra arguments to show, which would fail on our arguments
+    sys.argv = sys.argv[:1]
+
+    results = run_benchmarks(args.quick)
+
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(
+                {
+                    "locust_version": locust.__version__,
+                    "python_version": platform.python_version(),
+                    "platform": platform.platform(),
+                    "timestamp": time.time(),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n%i benchmark(s) regressed by more than %.0f%%" % (len(regressions), args.threshold * 100))
+            sys.exit(1)
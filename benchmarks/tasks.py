@@ -0,0 +1,211 @@
+"""
+This file contains benchmarks to validate the performance of Locust itself.
+More precisely, the overhead of the loop that picks, runs and waits between tasks (TaskSet.run), measured as
+task iterations per second per greenlet with tasks that do nothing and a wait_time of 0. With very short tasks,
+this is what limits how much load a worker can generate. This benchmark is to be used by people working on
+Locust's development (in particular on locust/user/task.py).
+
+The results can be written to, and compared with, JSON files in the same way as benchmarks/stats.py:
+
+    python benchmarks/tasks.py --output before.json
+    (make changes)
+    python benchmarks/tasks.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from gevent.pool import Group
+
+import locust
+from locust import SequentialTaskSet, TaskSet, User, constant, task
+from locust.env import Environment
+from locust.exception import StopUser
+
+from benchmark_utils import load_stats_benchmarks
+
+
+_stats_benchmarks = load_stats_benchmarks()
+best_of = _stats_benchmarks.best_of
+compare = _stats_benchmarks.compare
+
+
+GREENLET_COUNT_CASES = [1, 100]
+
+
+class BenchmarkUser(User):
+    abstract = True
+    wait_time = constant(0)
+    iterations = 0
+    limit = 0
+
+
+def count(user):
+    user.iterations += 1
+    if user.iterations >= user.limit:
+        raise StopUser()
+
+
+def user_tasks():
+    class MyUser(BenchmarkUser):
+        @task
+        def t(self):
+            count(self)
+
+    return MyUser
+
+
+def weighted_user_tasks():
+    class MyUser(BenchmarkUser):
+        @task(997)
+        def t1(self):
+            count(self)
+
+        @task(3)
+        def t2(self):
+            count(self)
+
+    return MyUser
+
+
+def nested_taskset():
+    class MyTaskSet(TaskSet):
+        @task(10)
+        def t1(self):
+            count(self.user)
+
+        @task(1)
+        def t2(self):
+            count(self.user)
+
+    class MyUser(BenchmarkUser):
+        tasks = [MyTaskSet]
+
+    return MyUser
+
+
+def sequential_taskset():
+    class MySequence(SequentialTaskSet):
+        @task
+        def t1(self):
+            count(self.user)
+
+        @task
+        def t2(self):
+            count(self.user)
+
+    class MyUser(BenchmarkUser):
+        tasks = [MySequence]
+
+    return MyUser
+
+
+def scheduled_tasks():
+    """
+    A task that schedules another task on the TaskSet (using schedule_task) before each iteration
+    """
+
+    class MyTaskSet(TaskSet):
+        @task
+        def t(self):
+            self.schedule_task(self.scheduled, first=True)
+
+        def scheduled(self):
+            count(self.user)
+
+    class MyUser(BenchmarkUser):
+        tasks = [MyTaskSet]
+
+    return MyUser
+
+
+CASES = {
+    "User tasks": user_tasks,
+    "User tasks with weights 997:3": weighted_user_tasks,
+    "nested TaskSet": nested_taskset,
+    "SequentialTaskSet": sequential_taskset,
+    "schedule_task": scheduled_tasks,
+}
+
+
+def bench_iterations(make_user_class, greenlet_count, iterations, repeat):
+    """
+    Task iterations per second per greenlet
+    """
+    environment = Environment()
+    user_class = make_user_class()
+
+    def run():
+        group = Group()
+        for _ in range(greenlet_count):
+            user = user_class(environment)
+            user.limit = iterations
+            user.start(group)
+        # each user stops (by raising StopUser) after the given number of iterations
+        group.join()
+
+    return iterations / best_of(run, repeat)
+
+
+def run_benchmarks(quick):
+    """
+    Returns a dict of benchmark name -> {"value": ..., "unit": ..., "higher_is_better": ...}
+    """
+    iterations = 10_000 if quick else 100_000
+    repeat = 3 if quick else 5
+    results = {}
+
+    def add(name, value, unit, higher_is_better=False):
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print("{:<70} {:>14,.3f} {}".format(name, value, unit))
+
+    for greenlet_count in GREENLET_COUNT_CASES:
+        for name, make_user_class in CASES.items():
+            add(
+                "%s - %i greenlet(s)" % (name, greenlet_count),
+                bench_iterations(make_user_class, greenlet_count, iterations // greenlet_count, repeat),
+                "iterations/s per greenlet",
+                higher_is_better=True,
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for Locust's task scheduling loop")
+    parser.add_argument("--output", help="File to write the results to (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results (JSON) of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fail if any benchmark is worse than the baseline by more than this fraction. Defaults to 0.2 (20%%)",
+    )
+    parser.add_argument("--quick", action="store_true", help="Run fewer iterations (less accurate)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick)
+
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(
+                {
+                    "locust_version": locust.__version__,
+                    "python_version": platform.python_version(),
+                    "platform": platform.platform(),
+                    "timestamp": time.time(),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n%i benchmark(s) regressed by more than %.0f%%" % (len(regressions), args.threshold * 100))
+            sys.exit(1)
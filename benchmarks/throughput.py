@@ -0,0 +1,254 @@
+"""
+This file contains benchmarks to validate the performance of Locust itself.
+More precisely, how many requests per second a single Locust process can generate using HttpUser and
+FastHttpUser, depending on the number of users and the size of the responses. This benchmark is to be used
+by people working on Locust's development (in particular on locust/clients.py and locust/contrib/fasthttp.py).
+
+The requests are made to a minimal HTTP server that is started in a separate process on 127.0.0.1, so no
+network access is needed, and the CPU time used by Locust can be measured separately from the CPU time used
+by the server. For each case the following is reported:
+
+- achieved requests per second
+- CPU time used by Locust per request
+- CPU time used by the server per request
+- average response time as measured by Locust, and the average time the server spent handling a request
+  (the difference being the overhead of the client, including the time a request waits to be scheduled).
+  Note that FastHttpUser reports response times in whole milliseconds.
+
+The results can be written to, and compared with, JSON files in the same way as benchmarks/stats.py:
+
+    python benchmarks/throughput.py --output before.json
+    (make changes)
+    python benchmarks/throughput.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+import gevent
+from gevent.server import StreamServer
+from prettytable import PrettyTable
+
+import locust
+from locust import HttpUser, constant, task
+from locust.contrib.fasthttp import FastHttpUser
+from locust.env import Environment
+
+from benchmark_utils import load_stats_benchmarks
+
+
+compare = load_stats_benchmarks().compare
+
+USER_COUNT_CASES = [1, 10, 100]
+RESPONSE_SIZE_CASES = [100, 10_000, 1_000_000]
+WARMUP_TIME = 1
+
+
+class BenchmarkServer:
+    """
+    A minimal HTTP/1.1 server, that always keeps the connection alive and responds to GET /?size=<n> with
+    n bytes. GET /_stats returns the number of requests handled, the time spent handling them and the
+    CPU time used by the process.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = StreamServer((host, port), self.handle)
+        self.payloads = {}
+        self.requests = 0
+        self.handle_time = 0.0
+
+    def serve_forever(self):
+        self.server.start()
+        # tell the parent process which port we're listening on
+        print(self.server.server_port, flush=True)
+        self.server.serve_forever()
+
+    def handle(self, sock, address):
+        buffer = b""
+        while True:
+            end = buffer.find(b"\r\n\r\n")
+            if end == -1:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                continue
+            request, buffer = buffer[:end], buffer[end + 4 :]
+            ts = time.perf_counter()
+            path = request.split(b" ", 2)[1]
+            if path == b"/_stats":
+                body = json.dumps(
+                    {"requests": self.requests, "handle_time": self.handle_time, "cpu_time": time.process_time()}
+                ).encode()
+            else:
+                size = int(path.partition(b"size=")[2] or 0)
+                body = self.payloads.get(size)
+                if body is None:
+                    body = self.payloads[size] = b"x" * size
+            sock.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %i\r\n\r\n%s" % (len(body), body))
+            if path != b"/_stats":
+                self.requests += 1
+                self.handle_time += time.perf_counter() - ts
+        sock.close()
+
+
+def start_server():
+    """
+    Start the benchmark server in a new process. Returns the process and the base URL of the server.
+    """
+    process = subprocess.Popen([sys.executable, __file__, "--serve"], stdout=subprocess.PIPE)
+    port = int(process.stdout.readline())
+    return process, "http://127.0.0.1:%i" % port
+
+
+def server_stats(host):
+    with urlopen(host + "/_stats") as response:
+        return json.load(response)
+
+
+def run_case(user_base_class, host, user_count, response_size, duration):
+    class BenchmarkUser(user_base_class):
+        wait_time = constant(0)
+        path = "/?size=%i" % response_size
+
+        @task
+        def request(self):
+            self.client.get(self.path)
+
+    BenchmarkUser.host = host
+    environment = Environment(user_classes=[BenchmarkUser])
+    runner = environment.create_local_runner()
+    runner.start(user_count, spawn_rate=user_count)
+    gevent.sleep(WARMUP_TIME)
+
+    runner.stats.reset_all()
+    server_before = server_stats(host)
+    cpu_time = time.process_time()
+    ts = time.perf_counter()
+    gevent.sleep(duration)
+    elapsed = time.perf_counter() - ts
+    cpu_time = time.process_time() - cpu_time
+    total = runner.stats.total
+    num_requests = total.num_requests
+    avg_response_time = total.avg_response_time
+    num_failures = total.num_failures
+    runner.quit()
+    server_after = server_stats(host)
+
+    server_requests = max(server_after["requests"] - server_before["requests"], 1)
+    num_requests = max(num_requests, 1)
+    return {
+        "requests/s": num_requests / elapsed,
+        "client CPU time per request (us)": cpu_time / num_requests * 1_000_000,
+        "server CPU time per request (us)": (server_after["cpu_time"] - server_before["cpu_time"])
+        / server_requests
+        * 1_000_000,
+        "avg response time (ms)": avg_response_time,
+        "avg server time (ms)": (server_after["handle_time"] - server_before["handle_time"]) / server_requests * 1000,
+        "failures": num_failures,
+    }
+
+
+def run_benchmarks(user_counts, response_sizes, duration):
+    """
+    Returns a dict of benchmark name -> {"value": ..., "unit": ..., "higher_is_better": ...}
+    """
+    process, host = start_server()
+    table = PrettyTable()
+    table.field_names = [
+        "User class",
+        "Users",
+        "Response size",
+        "Requests/s",
+        "Client CPU/req (us)",
+        "Server CPU/req (us)",
+        "Avg response time (ms)",
+        "Avg server time (ms)",
+        "Failures",
+    ]
+    results = {}
+    try:
+        for user_base_class in (HttpUser, FastHttpUser):
+            for user_count in user_counts:
+                for response_size in response_sizes:
+                    case = run_case(user_base_class, host, user_count, response_size, duration)
+                    table.add_row(
+                        [user_base_class.__name__, user_count, response_size]
+                        + ["{:,.2f}".format(value) for value in case.values()]
+                    )
+                    name = "%s - %i users - %i bytes" % (user_base_class.__name__, user_count, response_size)
+                    print("{:<50} {:>12,.2f} requests/s".format(name, case["requests/s"]))
+                    results[name + " - requests/s"] = {
+                        "value": case["requests/s"],
+                        "unit": "requests/s",
+                        "higher_is_better": True,
+                    }
+                    results[name + " - client CPU time per request"] = {
+                        "value": case["client CPU time per request (us)"],
+                        "unit": "us",
+                        "higher_is_better": False,
+                    }
+    finally:
+        process.terminate()
+        process.wait()
+    print()
+    print(table)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the throughput of HttpUser and FastHttpUser")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--duration", type=float, default=5, help="Duration of each case, in seconds")
+    parser.add_argument(
+        "--users", type=int, nargs="+", default=USER_COUNT_CASES, help="Number of users to run each case with"
+    )
+    parser.add_argument(
+        "--response-sizes",
+        type=int,
+        nargs="+",
+        default=RESPONSE_SIZE_CASES,
+        help="Sizes (in bytes) of the responses to run each case with",
+    )
+    parser.add_argument("--output", help="File to write the results to (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results (JSON) of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fail if any benchmark is worse than the baseline by more than this fraction. Defaults to 0.2 (20%%)",
+    )
+    args = parser.parse_args()
+
+    if args.serve:
+        BenchmarkServer().serve_forever()
+        sys.exit(0)
+
+    results = run_benchmarks(args.users, args.response_sizes, args.duration)
+
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(
+                {
+                    "locust_version": locust.__version__,
+                    "python_version": platform.python_version(),
+                    "platform": platform.platform(),
+                    "timestamp": time.time(),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n%i benchmark(s) regressed by more than %.0f%%" % (len(regressions), args.threshold * 100))
+            sys.exit(1)
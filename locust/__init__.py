@@ -8,8 +8,9 @@ from .user import wait_time
 from .user.task import task, tag, TaskSet
 from .user.users import HttpUser, User
 from .contrib.fasthttp import FastHttpUser
-from .user.wait_time import between, constant, constant_pacing, constant_throughput
+from .user.wait_time import between, constant, constant_pacing, constant_throughput, rate_limited
 from .shape import LoadTestShape
+from .ratelimit import RateLimit
 
 from .event import Events
 
@@ -28,8 +29,10 @@ __all__ = (
     "constant",
     "constant_pacing",
     "constant_throughput",
+    "rate_limited",
     "events",
     "LoadTestShape",
+    "RateLimit",
 )
 
 # Used for raising a DeprecationWarning if old Locust/HttpLocust is used
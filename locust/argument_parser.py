@@ -272,6 +272,13 @@ def setup_parser_arguments(parser):
         help="Set locust to run in distributed mode with this process as master",
         env_var="LOCUST_MODE_MASTER",
     )
+    master_group.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="Number of worker processes to fork. This process will act as master and the workers will connect to it over local IPC sockets, so you can use all the cores of a machine without starting a master and workers yourself. Use -1 to fork one worker per CPU core. Not supported on Windows.",
+        env_var="LOCUST_PROCESSES",
+    )
     master_group.add_argument(
         "--master-bind-host",
         default="*",
@@ -318,12 +325,25 @@ Only the LOCUSTFILE (-f option) needs to be specified when starting a Worker, si
         help="Set locust to run in distributed mode with this process as worker",
         env_var="LOCUST_MODE_WORKER",
     )
+    # if locust should be run in distributed mode as a relay between the master and a group of workers
+    worker_group.add_argument(
+        "--relay",
+        action="store_true",
+        help="Set locust to run in distributed mode with this process as a relay. A relay connects to the master (--master-host/--master-port) like a worker, and accepts connections from its own workers (--master-bind-host/--master-bind-port) like a master. Use it to spread a large number of workers over several processes.",
+        env_var="LOCUST_MODE_RELAY",
+    )
     worker_group.add_argument(
         "--slave",
         action="store_true",
         help=configargparse.SUPPRESS,
     )
     # master host options
+    worker_group.add_argument(
+        "--shared-memory-stats",
+        action="store_true",
+        help="Write the request stats to a shared memory ring buffer that the master reads, rather than sending them over the network. Only has an effect if the master runs on the same machine, otherwise the stats are sent over the network as usual. Always enabled for the workers started by --processes.",
+        env_var="LOCUST_SHARED_MEMORY_STATS",
+    )
     worker_group.add_argument(
         "--master-host",
         default="127.0.0.1",
@@ -376,6 +396,52 @@ Only the LOCUSTFILE (-f option) needs to be specified when starting a Worker, si
         help="Store each stats entry in CSV format to _stats_history.csv file. You must also specify the '--csv' argument to enable this.",
         env_var="LOCUST_CSV_FULL_HISTORY",
     )
+    stats_group.add_argument(
+        "--csv-snapshot-interval",
+        type=float,
+        metavar="SECONDS",
+        help="Number of seconds between the rewrites of the _stats.csv, _failures.csv and _exceptions.csv files. Defaults to every time the stats are written (once a second).",
+        env_var="LOCUST_CSV_SNAPSHOT_INTERVAL",
+    )
+    stats_group.add_argument(
+        "--csv-atomic",
+        action="store_true",
+        default=False,
+        help="Replace the _stats.csv, _failures.csv and _exceptions.csv files atomically (by writing a temporary file and renaming it) instead of rewriting them in place, and write all the CSV files from a background thread.",
+        env_var="LOCUST_CSV_ATOMIC",
+    )
+    stats_group.add_argument(
+        "--batch-requests",
+        action="store_true",
+        help="Update the request stats in batches (a few times per second) rather than for every request, which lowers the overhead per request at high request rates. Listeners that only need aggregated data can use the request_batch event. Should be set on the workers when running in distributed mode",
+        env_var="LOCUST_BATCH_REQUESTS",
+    )
+    stats_group.add_argument(
+        "--record-requests",
+        metavar="FILE",
+        help="Record every request (start time, name, method, response time, response length, exception and context) to FILE, in a chunked columnar format that can be read using locust.recorder.read_recording(). When running distributed, only set this on the master, the workers will send their recorded requests to it.",
+        env_var="LOCUST_RECORD_REQUESTS",
+    )
+    stats_group.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve the stats in the Prometheus text format on /metrics on this port (the web UI also serves them on /metrics, but this works when running headless too). Binds to --web-host.",
+        env_var="LOCUST_METRICS_PORT",
+    )
+    stats_group.add_argument(
+        "--history-per-entry",
+        action="store_true",
+        default=False,
+        help="Record the history of the request rate and response time distribution of every stats entry, and not only of the aggregated stats",
+        env_var="LOCUST_HISTORY_PER_ENTRY",
+    )
+    stats_group.add_argument(
+        "--history-spill-file",
+        metavar="FILE",
+        help="Append the stats history to FILE (as CSV) before it's downsampled. The history kept in memory (used for the charts) is merged into buckets of 1 minute after an hour, and of 10 minutes after a day.",
+        env_var="LOCUST_HISTORY_SPILL_FILE",
+    )
     stats_group.add_argument(
         "--print-stats",
         action="store_true",
@@ -394,6 +460,41 @@ Only the LOCUSTFILE (-f option) needs to be specified when starting a Worker, si
         help="Reset statistics once spawning has been completed. Should be set on both master and workers when running in distributed mode",
         env_var="LOCUST_RESET_STATS",
     )
+    stats_group.add_argument(
+        "--response-time-histogram",
+        choices=["legacy", "hdr"],
+        default="legacy",
+        help="Histogram used to store response times. 'legacy' rounds response times to two significant digits and stores them in a dict, 'hdr' uses a log-linear histogram that is cheaper to update and has a precision relative to the response time. Should be set on both master and workers when running in distributed mode",
+        env_var="LOCUST_RESPONSE_TIME_HISTOGRAM",
+    )
+    stats_group.add_argument(
+        "--histogram-significant-digits",
+        type=int,
+        default=2,
+        help="Number of significant digits to keep for response times when using '--response-time-histogram hdr'. Defaults to 2.",
+        env_var="LOCUST_HISTOGRAM_SIGNIFICANT_DIGITS",
+    )
+    stats_group.add_argument(
+        "--histogram-resolution",
+        type=float,
+        default=0.001,
+        help="Lowest discernible response time, in ms, when using '--response-time-histogram hdr'. Defaults to 0.001 (1 µs), which keeps sub-millisecond response times. Raise it (e.g. to 1) to use a little less memory per request name if you don't need them.",
+        env_var="LOCUST_HISTOGRAM_RESOLUTION",
+    )
+    stats_group.add_argument(
+        "--current-response-time-window",
+        type=int,
+        default=None,
+        help="Size (in seconds) of the sliding window used to calculate the current response time percentiles shown in the web UI and written to the CSV history. Defaults to 10.",
+        env_var="LOCUST_CURRENT_RESPONSE_TIME_WINDOW",
+    )
+    stats_group.add_argument(
+        "--correct-coordinated-omission",
+        action="store_true",
+        default=False,
+        help="Also report response time percentiles that are corrected for coordinated omission: when a request of a user with a constant_pacing or constant_throughput wait time takes longer than the interval between its tasks, the requests it would have made in the meantime are back-filled with the response times they would have had. Only needs to be set on the master.",
+        env_var="LOCUST_CORRECT_COORDINATED_OMISSION",
+    )
     stats_group.add_argument(
         "--html",
         dest="html_file",
@@ -479,6 +580,34 @@ Only the LOCUSTFILE (-f option) needs to be specified when starting a Worker, si
         dest="enable_rebalancing",
         help="Allow to automatically rebalance users if new workers are added or removed during a test run.",
     )
+    other_group.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Sample where the CPU time goes (user tasks, event listeners, stats, rpc, web UI), on the master and all workers. The samples can be downloaded as a flamegraph compatible file from /profile in the web UI, and a summary is logged on exit. Only needs to be set on the master.",
+        env_var="LOCUST_PROFILE",
+    )
+    other_group.add_argument(
+        "--profile-file",
+        metavar="FILE",
+        help="Write the profiling samples to FILE on exit, in the folded format that e.g. flamegraph.pl and speedscope read. Implies --profile.",
+        env_var="LOCUST_PROFILE_FILE",
+    )
+
+    other_group.add_argument(
+        "--arrival-rate",
+        type=float,
+        metavar="RATE",
+        help="Start task iterations at a fixed rate (iterations per second, in total) instead of running each user's tasks in a loop (an open model). The users (-u) form the pool that runs the iterations, and iterations that are due when all users are busy are dropped. Only needs to be set on the master.",
+        env_var="LOCUST_ARRIVAL_RATE",
+    )
+    other_group.add_argument(
+        "--arrival-rate-ramp",
+        type=float,
+        metavar="RAMP",
+        help="Ramp up to --arrival-rate (or to the rate returned by a LoadTestShape) by this many iterations/s per second, instead of starting at the full rate",
+        env_var="LOCUST_ARRIVAL_RATE_RAMP",
+    )
 
     user_classes_group = parser.add_argument_group("User classes")
     user_classes_group.add_argument(
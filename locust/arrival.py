@@ -0,0 +1,264 @@
+"""
+Open model ("arrival rate") load generation.
+
+Normally every user runs its tasks in a loop, waiting ``wait_time`` between them. That is a closed model: when the
+system under test slows down, the users spend more time waiting for responses and the load drops, which hides the
+slowdown (coordinated omission). With ``--arrival-rate`` the users instead form a pool of pre-spawned workers, and an
+:class:`ArrivalRateExecutor` starts task iterations (one task of a user, picked like it normally is) at a fixed
+global rate, no matter how long the previous iterations take. The rate can be constant, ramp towards its target at
+``--arrival-rate-ramp`` iterations/s per second, or be controlled by a :class:`LoadTestShape <locust.LoadTestShape>`
+whose ``tick`` returns the rate as a third element.
+
+A nested TaskSet can't loop over its tasks like it normally does (it would never return to the pool), so once it has
+been picked, each iteration of the user runs one task of the nested TaskSet, until the TaskSet calls ``interrupt()``.
+
+When an iteration is due and every user in the pool is busy, the iteration is dropped. Iterations that start more
+than :data:`LATE_THRESHOLD` seconds after they were due (because the process is overloaded) are counted as late.
+Both are logged, and are a sign that more users (or more workers) are needed.
+
+When running distributed the master splits the rate among the workers, in proportion to the number of users it
+gives them, and the workers report their dropped and late iterations back to the master.
+"""
+import logging
+import time
+import traceback
+from collections import deque
+
+import gevent
+from gevent import GreenletExit
+from gevent.event import Event
+
+from .exception import InterruptTaskSet, RescheduleTask, RescheduleTaskImmediately, StopUser
+from .log import greenlet_exception_logger
+from .runners import WorkerRunner
+from .user.task import LOCUST_STATE_RUNNING, LOCUST_STATE_STOPPING, LOCUST_STATE_WAITING, TASK_TASKSET, get_task_kind
+
+logger = logging.getLogger(__name__)
+greenlet_exception_handler = greenlet_exception_logger(logger)
+
+LATE_THRESHOLD = 0.1
+"""Number of seconds after which an iteration that starts later than it was due is counted as late"""
+
+MAX_SCHEDULER_SLEEP = 0.1
+"""Maximum number of seconds the scheduler sleeps between iterations, so that rate changes are applied promptly"""
+
+WARNING_INTERVAL = 10.0
+"""Minimum number of seconds between the warnings about dropped or late iterations"""
+
+
+class _Slot:
+    """
+    A user of the pool, waiting for its next iteration
+    """
+
+    __slots__ = ("ready", "due", "alive")
+
+    def __init__(self):
+        self.ready = Event()
+        self.due = 0.0
+        self.alive = True
+
+
+class ArrivalRateExecutor:
+    """
+    Starts task iterations on the users of the pool at a target rate (iterations per second)
+    """
+
+    def __init__(self, environment, rate=0.0, ramp=None):
+        """
+        :param environment: Environment instance
+        :param rate: Target number of iterations to start per second, in this process (or, on a master, in total)
+        :param ramp: Number of iterations/s per second that the rate changes by towards its target. The target rate
+                     is applied immediately if None
+        """
+        self.environment = environment
+        self.target_rate = rate
+        """Number of iterations per second that the rate is changing towards"""
+        self.ramp = ramp
+        self.rate = 0.0 if ramp else rate
+        """Current number of iterations started per second"""
+        self.iterations = 0
+        """Number of iterations started (on all nodes, when running distributed)"""
+        self.dropped = 0
+        """Number of iterations that were dropped because all the users of the pool were busy"""
+        self.late = 0
+        """Number of iterations that started more than LATE_THRESHOLD seconds after they were due"""
+        self.pool_size = 0
+        """Number of users in the pool (in this process)"""
+        self._idle = deque()
+        self._scheduler_greenlet = None
+        self._reported = (0, 0, 0)
+        self._warned = (0, 0)
+        self._last_warning = 0.0
+
+        environment.events.test_start.add_listener(self.on_test_start)
+        environment.events.report_to_master.add_listener(self.on_report_to_master)
+        environment.events.worker_report.add_listener(self.on_worker_report)
+
+    def set_rate(self, rate, ramp=None):
+        """
+        Change the target rate. If ramp is set, the rate changes gradually by that many iterations/s per second
+        """
+        self.target_rate = rate
+        self.ramp = ramp
+        if not ramp:
+            self.rate = rate
+
+    def run_user(self, user):
+        """
+        Used instead of the TaskSet loop as the main function of the users' greenlets. The user waits in the pool
+        until the scheduler gives it an iteration to run.
+        """
+        # the user's TaskSet, followed by the nested TaskSets that it is running, if any
+        stack = [user._taskset_instance]
+        slot = _Slot()
+        self._join_pool()
+        try:
+            while True:
+                user._state = LOCUST_STATE_WAITING
+                self._idle.append(slot)
+                slot.ready.wait()
+                slot.ready.clear()
+                user._state = LOCUST_STATE_RUNNING
+                if time.perf_counter() - slot.due > LATE_THRESHOLD:
+                    self.late += 1
+                self._run_iteration(user, stack)
+                if user._state == LOCUST_STATE_STOPPING:
+                    raise StopUser()
+        finally:
+            # the slot is skipped, rather than removed from the (possibly long) idle queue
+            slot.alive = False
+            self._leave_pool()
+
+    def _run_iteration(self, user, stack):
+        while True:
+            taskset = stack[-1]
+            nested = None
+            try:
+                if not taskset._task_queue:
+                    taskset.schedule_task(taskset.get_next_task())
+                if get_task_kind(taskset._task_queue[0]) is not TASK_TASKSET:
+                    taskset.execute_next_task()
+                    return
+                # start the nested TaskSet, and run one of its tasks (now and in the following iterations)
+                # instead of its run() loop
+                nested = taskset._pop_next_task()(user if len(stack) == 1 else taskset)
+                nested.on_start()
+                stack.append(nested)
+            except (RescheduleTask, RescheduleTaskImmediately):
+                return
+            except InterruptTaskSet:
+                if nested is None and len(stack) > 1:
+                    stack.pop().on_stop()
+                return
+            except (StopUser, GreenletExit):
+                while len(stack) > 1:
+                    stack.pop().on_stop()
+                raise
+            except Exception as e:
+                user.environment.events.user_error.fire(user_instance=taskset, exception=e, tb=e.__traceback__)
+                if user.environment.catch_exceptions:
+                    logger.error("%s\n%s", e, traceback.format_exc())
+                    return
+                raise
+
+    def _join_pool(self):
+        self.pool_size += 1
+        if self._scheduler_greenlet is None:
+            if self.ramp:
+                self.rate = 0.0
+            self._scheduler_greenlet = gevent.spawn(self._schedule)
+            self._scheduler_greenlet.link_exception(greenlet_exception_handler)
+
+    def _leave_pool(self):
+        self.pool_size -= 1
+        if self.pool_size == 0 and self._scheduler_greenlet is not None:
+            self._scheduler_greenlet.kill(block=False)
+            self._scheduler_greenlet = None
+            self._idle.clear()
+
+    def _schedule(self):
+        now = last = next_due = time.perf_counter()
+        while True:
+            self._update_rate(now - last)
+            last = now
+            if self.rate <= 0:
+                gevent.sleep(MAX_SCHEDULER_SLEEP)
+                now = next_due = time.perf_counter()
+                continue
+            interval = 1.0 / self.rate
+            # start sooner if the rate has just gone up
+            next_due = min(next_due, now + interval)
+            while next_due <= now:
+                self._start_iteration(next_due)
+                next_due += interval
+            gevent.sleep(min(next_due - now, MAX_SCHEDULER_SLEEP))
+            now = time.perf_counter()
+
+    def _update_rate(self, elapsed):
+        if self.rate == self.target_rate:
+            return
+        step = self.ramp * elapsed
+        if self.rate < self.target_rate:
+            self.rate = min(self.rate + step, self.target_rate)
+        else:
+            self.rate = max(self.rate - step, self.target_rate)
+
+    def _start_iteration(self, due):
+        idle = self._idle
+        while idle:
+            slot = idle.popleft()
+            if slot.alive:
+                slot.due = due
+                slot.ready.set()
+                self.iterations += 1
+                return
+        self.dropped += 1
+        self._warn()
+
+    def _warn(self):
+        if isinstance(self.environment.runner, WorkerRunner):
+            # the master warns about the iterations of all the workers
+            return
+        now = time.time()
+        if now - self._last_warning < WARNING_INTERVAL:
+            return
+        if (self.dropped, self.late) == self._warned:
+            return
+        logger.warning(
+            "%d iteration(s) have been dropped because all users were busy, and %d started late. "
+            "More users are needed for an arrival rate of %.2f iterations/s",
+            self.dropped,
+            self.late,
+            self.target_rate,
+        )
+        self._warned = (self.dropped, self.late)
+        self._last_warning = now
+
+    def on_test_start(self, environment, **kwargs):
+        self.iterations = self.dropped = self.late = 0
+        self._reported = (0, 0, 0)
+        self._warned = (0, 0)
+
+    def log_summary(self):
+        """
+        Log the number of iterations that were started, dropped and late
+        """
+        logger.info(
+            "Arrival rate: %d iteration(s) started, %d dropped, %d late", self.iterations, self.dropped, self.late
+        )
+
+    def on_report_to_master(self, client_id, data):
+        counts = (self.iterations, self.dropped, self.late)
+        data["arrival_rate"] = [count - reported for count, reported in zip(counts, self._reported)]
+        self._reported = counts
+
+    def on_worker_report(self, client_id, data):
+        if "arrival_rate" not in data:
+            return
+        iterations, dropped, late = data["arrival_rate"]
+        self.iterations += iterations
+        self.dropped += dropped
+        self.late += late
+        if dropped or late:
+            self._warn()
@@ -86,7 +86,7 @@ class UsersDispatcher(Iterator):
 
         self._user_generator = self._user_gen()
 
-        self._worker_node_generator = itertools.cycle(self._worker_nodes)
+        self._worker_node_generator = self._worker_node_gen()
 
         # To keep track of how long it takes for each dispatch iteration to compute
         self._dispatch_iteration_durations = []
@@ -201,6 +201,21 @@ class UsersDispatcher(Iterator):
             return
         self._prepare_rebalance()
 
+    def update_worker_weight(self, worker_node: "WorkerNode", weight: int) -> None:
+        """
+        This method is to be called when the weight of a worker node changes (e.g. when workers connect to
+        or disconnect from a relay). Just like when workers are added or removed, the next dispatch iteration
+        will redistribute the users.
+
+        :param worker_node: The worker node whose weight has changed.
+        :param weight: The new weight of the worker node.
+        """
+        for w in self._worker_nodes:
+            if w.id == worker_node.id:
+                w.weight = weight
+        worker_node.weight = weight
+        self._prepare_rebalance()
+
     def _prepare_rebalance(self) -> None:
         """
         When a rebalance is required because of added and/or removed workers, we compute the desired state as if
@@ -298,7 +313,7 @@ class UsersDispatcher(Iterator):
         """
         user_gen = self._user_gen()
 
-        worker_gen = itertools.cycle(self._worker_nodes)
+        worker_gen = self._worker_node_gen()
 
         users_on_workers = {
             worker_node.id: {user_class.__name__: 0 for user_class in self._user_classes}
@@ -319,6 +334,21 @@ class UsersDispatcher(Iterator):
 
         return users_on_workers, user_gen, worker_gen, active_users
 
+    def _worker_node_gen(self) -> typing.Iterator["WorkerNode"]:
+        """
+        Cycle through the worker nodes. Worker nodes normally get the same number of users, but a node with a
+        weight > 1 (e.g. a relay with several workers connected to it) gets proportionally more of them.
+        The worker nodes are cycled through using the same smooth weighted round-robin algorithm as the users
+        (see `_user_gen`), so that the users stay evenly distributed during ramp-up/ramp-down.
+        """
+        weights = [max(0, w.weight) for w in self._worker_nodes]
+        if all(weight == 1 for weight in weights) or not any(weights):
+            return itertools.cycle(self._worker_nodes)
+        gen = smooth([(w, weight) for w, weight in zip(self._worker_nodes, weights) if weight > 0])
+        # `gen()` never returns None, so this calls it for every worker node that is needed, which is cheaper than
+        # precomputing a cycle of `sum(weights)` worker nodes every time the workers are rebalanced
+        return iter(gen, None)
+
     def _user_gen(self) -> Generator[str, None, None]:
         """
         This method generates users according to their weights using
@@ -13,7 +13,13 @@ from configargparse import Namespace
 from .event import Events
 from .exception import RunnerAlreadyExistsError
 from .stats import RequestStats
-from .runners import Runner, LocalRunner, MasterRunner, WorkerRunner
+from .recorder import RequestRecorder
+from .profiler import Profiler
+from .arrival import ArrivalRateExecutor
+from .ratelimit import RateLimit, RateLimitBalancer, rate_limits as _created_rate_limits
+from .histogram import DEFAULT_RESOLUTION, get_histogram_factory
+from .timeseries import StatsHistory
+from .runners import Runner, LocalRunner, MasterRunner, RelayRunner, WorkerRunner
 from .web import WebUI
 from .user import User
 from .user.task import TaskSet, filter_tasks_by_tags
@@ -38,6 +44,7 @@ class Environment:
         stop_timeout: Union[float, None] = None,
         catch_exceptions=True,
         parsed_options: Namespace = None,
+        rate_limits: Union[List[RateLimit], None] = None,
     ):
 
         self.runner: Runner = None
@@ -46,6 +53,24 @@ class Environment:
         self.web_ui: WebUI = None
         """Reference to the WebUI instance"""
 
+        self.request_recorder: RequestRecorder = None
+        """Reference to the :class:`RequestRecorder <locust.recorder.RequestRecorder>` instance, if requests are recorded"""
+
+        self.profiler: Profiler = None
+        """Reference to the :class:`Profiler <locust.profiler.Profiler>` instance, if profiling is enabled"""
+
+        self.arrival_executor: ArrivalRateExecutor = None
+        """
+        Reference to the :class:`ArrivalRateExecutor <locust.arrival.ArrivalRateExecutor>` instance, if the users
+        run their tasks at an arrival rate (open model) instead of in a loop
+        """
+
+        self.rate_limit_balancer: RateLimitBalancer = None
+        """
+        Reference to the :class:`RateLimitBalancer <locust.ratelimit.RateLimitBalancer>` instance, which splits the
+        :class:`RateLimits <locust.ratelimit.RateLimit>` among the workers when running distributed
+        """
+
         self.process_exit_code: int = None
         """
         If set it'll be the exit code of the Locust process
@@ -59,6 +84,8 @@ class Environment:
             """
         else:
             self.events = Events()
+        if getattr(parsed_options, "batch_requests", False):
+            self.events.request.enable_batching()
 
         self.locustfile = locustfile
         """Filename (not path) of locustfile"""
@@ -70,8 +97,6 @@ class Environment:
         """If set, only tasks that are tagged by tags in this list will be executed. Leave this as None to use the one from parsed_options"""
         self.exclude_tags = exclude_tags
         """If set, only tasks that aren't tagged by tags in this list will be executed. Leave this as None to use the one from parsed_options"""
-        self.stats = RequestStats()
-        """Reference to RequestStats instance"""
         self.host = host
         """Base URL of the target system"""
         self.reset_stats = reset_stats
@@ -88,6 +113,17 @@ class Environment:
         """
         self.parsed_options = parsed_options
         """Reference to the parsed command line options (used to pre-populate fields in Web UI). May be None when using Locust as a library"""
+        self.stats = self._create_stats()
+        """Reference to RequestStats instance"""
+        self.rate_limits: Dict[str, RateLimit] = (
+            {rate_limit.name: rate_limit for rate_limit in rate_limits}
+            if rate_limits is not None
+            else dict(_created_rate_limits)
+        )
+        """
+        :class:`RateLimits <locust.ratelimit.RateLimit>` that are split among the workers when running distributed, by
+        name. Defaults to the rate limits created before the Environment (i.e. those of the locustfile)
+        """
 
         self._remove_user_classes_with_weight_zero()
 
@@ -108,6 +144,8 @@ class Environment:
         if self.runner is not None:
             raise RunnerAlreadyExistsError("Environment.runner already exists (%s)" % self.runner)
         self.runner: RunnerType = runner_class(self, *args, **kwargs)
+        if not isinstance(self.runner, LocalRunner):
+            self.rate_limit_balancer = RateLimitBalancer(self)
 
         # Attach the runner to the shape class so that the shape class can access user count state
         if self.shape_class:
@@ -143,14 +181,35 @@ class Environment:
         :param master_port: Port on master node to connect to
         """
         # Create a new RequestStats with use_response_times_cache set to False to save some memory
-        # and CPU cycles, since the response_times_cache is not needed for Worker nodes
-        self.stats = RequestStats(use_response_times_cache=False)
+        # and CPU cycles, since the response_times_window is not needed for Worker nodes
+        self.stats = self._create_stats(use_response_times_cache=False)
         return self._create_runner(
             WorkerRunner,
             master_host=master_host,
             master_port=master_port,
         )
 
+    def create_relay_runner(self, master_host, master_port, relay_bind_host="*", relay_bind_port=5557) -> RelayRunner:
+        """
+        Create a :class:`RelayRunner <locust.runners.RelayRunner>` instance for this Environment
+
+        :param master_host: Host/IP of a running master node
+        :param master_port: Port on master node to connect to
+        :param relay_bind_host: Interface/host that the relay should use for incoming worker connections.
+                                Defaults to "*" which means all interfaces.
+        :param relay_bind_port: Port that the relay should listen for incoming worker connections on
+        """
+        # the relay forwards the stats from its workers to the master, so just like on the workers
+        # the response_times_window is not needed
+        self.stats = self._create_stats(use_response_times_cache=False)
+        return self._create_runner(
+            RelayRunner,
+            master_host=master_host,
+            master_port=master_port,
+            relay_bind_host=relay_bind_host,
+            relay_bind_port=relay_bind_port,
+        )
+
     def create_web_ui(
         self,
         host="",
@@ -188,6 +247,67 @@ class Environment:
         )
         return self.web_ui
 
+    def create_request_recorder(self, path=None, node="local") -> RequestRecorder:
+        """
+        Creates a :class:`RequestRecorder <locust.recorder.RequestRecorder>` instance for this Environment, which
+        records every request
+
+        :param path: File to write the recording to. If None, the recorded requests are sent to the master instead
+        :param node: Identifies the node that recorded the requests in the recording
+        """
+        self.request_recorder = RequestRecorder(self, path, node=node)
+        return self.request_recorder
+
+    def create_profiler(self) -> Profiler:
+        """
+        Creates a :class:`Profiler <locust.profiler.Profiler>` instance for this Environment, and starts sampling
+        the current thread. Must be called after the runner has been created.
+        """
+        self.profiler = Profiler(self)
+        self.profiler.start()
+        return self.profiler
+
+    def create_arrival_executor(self, rate: float = 0.0, ramp: float = None) -> ArrivalRateExecutor:
+        """
+        Creates an :class:`ArrivalRateExecutor <locust.arrival.ArrivalRateExecutor>` for this Environment, which
+        makes the users start task iterations at the given rate instead of running their tasks in a loop.
+
+        :param rate: Number of task iterations to start per second
+        :param ramp: Number of iterations/s per second to change the rate by, when ramping up to it
+        """
+        self.arrival_executor = ArrivalRateExecutor(self, rate, ramp)
+        return self.arrival_executor
+
+    def _create_stats(self, **kwargs) -> RequestStats:
+        """
+        Create a RequestStats instance that uses the response time histogram, window and history specified in
+        parsed_options
+        """
+        histogram_factory = None
+        response_times_window_size = None
+        history = None
+        correct_coordinated_omission = False
+        if self.parsed_options:
+            # parsed_options isn't necessarily created by our argument parser when Locust is used as a library
+            histogram_factory = get_histogram_factory(
+                getattr(self.parsed_options, "response_time_histogram", "legacy"),
+                getattr(self.parsed_options, "histogram_significant_digits", 2),
+                getattr(self.parsed_options, "histogram_resolution", DEFAULT_RESOLUTION),
+            )
+            response_times_window_size = getattr(self.parsed_options, "current_response_time_window", None)
+            history = StatsHistory(
+                per_entry=getattr(self.parsed_options, "history_per_entry", False),
+                spill_path=getattr(self.parsed_options, "history_spill_file", None),
+            )
+            correct_coordinated_omission = getattr(self.parsed_options, "correct_coordinated_omission", False)
+        return RequestStats(
+            histogram_factory=histogram_factory,
+            response_times_window_size=response_times_window_size,
+            history=history,
+            correct_coordinated_omission=correct_coordinated_omission,
+            **kwargs,
+        )
+
     def _filter_tasks_by_tags(self):
         """
         Filter the tasks on all the user_classes recursively, according to the tags and
@@ -235,7 +355,7 @@ class Environment:
         for u in self.user_classes:
             u.weight = 1
             user_tasks = []
-            tasks_frontier = u.tasks
+            tasks_frontier = list(u.tasks)
             while len(tasks_frontier) != 0:
                 t = tasks_frontier.pop()
                 if hasattr(t, "tasks") and t.tasks:
@@ -47,6 +47,102 @@ class EventHook:
                 log.unhandled_greenlet_exception = True
 
 
+REQUEST_BATCH_SIZE = 1000
+"""Maximum number of requests in a request_batch event, when request batching is enabled"""
+
+
+class RequestEventHook(EventHook):
+    """
+    EventHook used for the request event.
+
+    If batching has been enabled (using :meth:`enable_batching`), the requests are also collected into batches,
+    which are passed to the listeners of the request_batch event when :meth:`flush` is called (which the runner
+    does regularly), or when the batch is full. Listeners of the request event are still called for every request.
+    """
+
+    def __init__(self, batch_event, success_event, failure_event):
+        super().__init__()
+        self.batch_event = batch_event
+        self._success_event = success_event
+        self._failure_event = failure_event
+        self.batch_size = None
+        # function that returns the expected interval of the user making a request (see
+        # Runner._expected_interval), which is collected along with the batched requests, so that they can still be
+        # corrected for coordinated omission
+        self.expected_interval = None
+        self._reset_batch()
+
+    @property
+    def batching(self):
+        return self.batch_size is not None
+
+    def enable_batching(self, batch_size=REQUEST_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def _reset_batch(self):
+        self._request_types = []
+        self._names = []
+        self._response_times = []
+        self._response_lengths = []
+        self._exceptions = []
+        self._contexts = []
+        self._expected_intervals = []
+
+    def fire(self, *, reverse=False, **kwargs):
+        request_type = kwargs.get("request_type")
+        name = kwargs.get("name")
+        response_time = kwargs.get("response_time")
+        response_length = kwargs.get("response_length")
+        exception = kwargs.get("exception")
+        if self._handlers:
+            super().fire(reverse=reverse, **kwargs)
+        # the deprecated request_success and request_failure events are still fired for every request
+        if exception:
+            if self._failure_event._handlers:
+                self._failure_event.fire(
+                    request_type=request_type,
+                    name=name,
+                    response_time=response_time,
+                    response_length=response_length,
+                    exception=exception,
+                )
+        elif self._success_event._handlers:
+            self._success_event.fire(
+                request_type=request_type,
+                name=name,
+                response_time=response_time,
+                response_length=response_length,
+            )
+        if self.batch_size is not None:
+            self._request_types.append(request_type)
+            self._names.append(name)
+            self._response_times.append(response_time)
+            self._response_lengths.append(response_length)
+            self._exceptions.append(exception)
+            self._contexts.append(kwargs.get("context"))
+            self._expected_intervals.append(self.expected_interval() if self.expected_interval is not None else None)
+            if len(self._names) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Fire the request_batch event for the requests collected since the last flush
+        """
+        if not self._names:
+            return
+        batch = {
+            "request_types": self._request_types,
+            "names": self._names,
+            "response_times": self._response_times,
+            "response_lengths": self._response_lengths,
+            "exceptions": self._exceptions,
+            "contexts": self._contexts,
+            "expected_intervals": self._expected_intervals,
+        }
+        self._reset_batch()
+        self.batch_event.fire(**batch)
+
+
 class DeprecatedEventHook(EventHook):
     def __init__(self, message):
         self.message = message
@@ -73,6 +169,26 @@ class Events:
     :param exception: Exception instance that was thrown. None if request was successful.
     """
 
+    request_batch: EventHook
+    """
+    Fired with batches of requests, if request batching has been enabled (using ``--batch-requests``, or by calling
+    ``environment.events.request.enable_batching()`` before the runner is created). When batching is enabled,
+    Locust's own statistics are updated from these batches rather than for every request, so listeners that only
+    need aggregated data can use this event instead of the request event to keep the overhead per request low.
+
+    Event arguments are lists, with one element per request in the batch:
+
+    :param request_types: Request type methods used
+    :param names: Paths to the URLs that were called (or override names if they were used in the calls to the client)
+    :param response_times: Response times in milliseconds
+    :param response_lengths: Content-lengths of the responses
+    :param exceptions: Exception instances that were thrown, or None for requests that were successful
+    :param contexts: :ref:`User/request contexts <request_context>`
+    :param expected_intervals: Number of seconds between the tasks of the users that made the requests, if the stats
+        are corrected for coordinated omission (``--correct-coordinated-omission``) and the users follow a fixed
+        schedule, otherwise None
+    """
+
     request_success: DeprecatedEventHook
     """
     DEPRECATED. Fired when a request is completed successfully. This event is typically used to report requests
@@ -117,7 +233,8 @@ class Events:
     data to the dicts that are regularly sent to the master. It's fired regularly when a report
     is to be sent to the master server.
 
-    Note that the keys "stats" and "errors" are used by Locust and shouldn't be overridden.
+    Note that the keys "stats", "stats_total", "stats_names", "stats_delta", "stats_flat", "stats_shm",
+    "request_records" and "errors" are used by Locust and shouldn't be overridden.
 
     Event arguments:
 
@@ -138,6 +255,15 @@ class Events:
     :param data: Data dict with the data from the worker node
     """
 
+    worker_connect: EventHook
+    """
+    Fired on the master (or a relay) when a worker has connected and is ready to be given users
+
+    Event arguments:
+
+    :param client_id: Client id of the worker
+    """
+
     spawning_complete: EventHook
     """
     Fired when all simulated users has been spawned.
@@ -207,23 +333,4 @@ class Events:
 
         self.request_failure = DeprecatedEventHook("request_failure event deprecated. Use the request event.")
 
-        def fire_deprecated_request_handlers(
-            request_type, name, response_time, response_length, exception, context, **kwargs
-        ):
-            if exception:
-                self.request_failure.fire(
-                    request_type=request_type,
-                    name=name,
-                    response_time=response_time,
-                    response_length=response_length,
-                    exception=exception,
-                )
-            else:
-                self.request_success.fire(
-                    request_type=request_type,
-                    name=name,
-                    response_time=response_time,
-                    response_length=response_length,
-                )
-
-        self.request.add_listener(fire_deprecated_request_handlers)
+        self.request = RequestEventHook(self.request_batch, self.request_success, self.request_failure)
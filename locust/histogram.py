@@ -0,0 +1,437 @@
+"""
+Response time histograms used by :class:`StatsEntry <locust.stats.StatsEntry>`.
+
+Two backends are available and can be selected with ``--response-time-histogram``:
+
+* ``legacy`` (:class:`RoundedHistogram`) - a ``{rounded_response_time: count}`` dict, where response
+  times are rounded to two significant digits. This is what Locust has always used.
+* ``hdr`` (:class:`HdrHistogram`) - an array backed log-linear histogram modelled after
+  `HdrHistogram <http://hdrhistogram.org/>`_. Recording a value is O(1), percentiles are calculated with a
+  cumulative scan over the counts, and the precision is relative to the recorded value. The lowest discernible
+  value defaults to 1 µs (:data:`DEFAULT_RESOLUTION`), so sub-millisecond response times are kept, and can be
+  changed with ``--histogram-resolution``.
+
+Both backends serialize to a ``{response_time: count}`` dict, which is what is sent from workers to the
+master. Master and workers should use the same backend.
+"""
+import functools
+import math
+from array import array
+
+
+def round_response_time(response_time):
+    """
+    Round a response time to two significant digits, so that 147 becomes 150, 3432 becomes 3400
+    and 58760 becomes 59000
+    """
+    if response_time < 100:
+        return round(response_time)
+    elif response_time < 1000:
+        return round(response_time, -1)
+    elif response_time < 10000:
+        return round(response_time, -2)
+    else:
+        return round(response_time, -3)
+
+
+class RoundedHistogram(dict):
+    """
+    A {response_time => count} dict that holds the response time distribution of all the requests.
+
+    The keys (the response time in ms) are rounded to store 1, 2, ... 9, 10, 20. .. 90,
+    100, 200 .. 900, 1000, 2000 ... 9000, in order to save memory.
+    """
+
+    def add(self, response_time, count=1):
+        """
+        Record *count* occurrences of *response_time*. Returns the key the value was recorded under.
+        """
+        key = round_response_time(response_time)
+        self[key] = self.get(key, 0) + count
+        return key
+
+    def key_of(self, response_time):
+        """Return the key that :meth:`add` would record *response_time* under, without recording it"""
+        return round_response_time(response_time)
+
+    def merge(self, other):
+        """
+        Add the counts from another histogram (or a {response_time: count} dict) to this one
+        """
+        for key, count in other.items():
+            self[key] = self.get(key, 0) + count
+
+    def value_of(self, key):
+        """Return the response time (in ms) that a key returned by :meth:`add` represents"""
+        return key
+
+    def percentile(self, num_requests, percent):
+        return calculate_response_time_percentile(self, num_requests, percent)
+
+    def median(self, total):
+        return median_from_dict(total, self)
+
+    def serialize(self):
+        return dict(self)
+
+
+DEFAULT_RESOLUTION = 0.001
+"""Default lowest discernible response time of :class:`HdrHistogram`, in ms"""
+
+CHUNK_SIZE_MAGNITUDE = 5
+"""log2 of the number of counters that :class:`HdrHistogram` allocates at once"""
+
+
+class HdrHistogram:
+    """
+    A log-linear histogram backed by arrays of counters.
+
+    Values are recorded with a resolution of *resolution* ms (the lowest discernible value), and the error of
+    each recorded value is bounded by the number of *significant_digits* (e.g. with 2 significant digits the value
+    that is reported for a bucket is always within 1% of the recorded value). Values above
+    *highest_trackable_value* ms are counted in the last bucket.
+
+    The counters are allocated lazily, in chunks of 2 ** :data:`CHUNK_SIZE_MAGNITUDE`, so a histogram only uses
+    memory for the ranges of values that were actually recorded.
+    """
+
+    def __init__(self, significant_digits=2, highest_trackable_value=3_600_000, resolution=DEFAULT_RESOLUTION):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits must be between 1 and 5")
+        if resolution <= 0:
+            raise ValueError("resolution must be positive")
+        sub_bucket_count_magnitude = math.ceil(math.log2(2 * 10**significant_digits))
+        self._sub_bucket_half_count_magnitude = sub_bucket_count_magnitude - 1
+        self._sub_bucket_half_count = 1 << self._sub_bucket_half_count_magnitude
+        self._sub_bucket_mask = (1 << sub_bucket_count_magnitude) - 1
+        self._multiplier = 1 / resolution
+
+        bucket_count = 1
+        smallest_untrackable_value = 1 << sub_bucket_count_magnitude
+        while smallest_untrackable_value <= highest_trackable_value * self._multiplier:
+            smallest_untrackable_value <<= 1
+            bucket_count += 1
+
+        self.significant_digits = significant_digits
+        self.resolution = resolution
+        self.length = (bucket_count + 1) * self._sub_bucket_half_count
+        """Number of counters (buckets) of the histogram"""
+        self._chunks = [None] * -(-self.length >> CHUNK_SIZE_MAGNITUDE)
+        self.total_count = 0
+        self._min_index = self.length
+        self._max_index = -1
+
+    def _index_of(self, units):
+        bucket_index = (units | self._sub_bucket_mask).bit_length() - self._sub_bucket_half_count_magnitude - 1
+        return (
+            ((bucket_index + 1) << self._sub_bucket_half_count_magnitude)
+            + (units >> bucket_index)
+            - self._sub_bucket_half_count
+        )
+
+    def _add_at(self, index, count):
+        chunk = self._chunks[index >> CHUNK_SIZE_MAGNITUDE]
+        if chunk is None:
+            chunk = self._chunks[index >> CHUNK_SIZE_MAGNITUDE] = array("Q", bytes(8 << CHUNK_SIZE_MAGNITUDE))
+        chunk[index & ((1 << CHUNK_SIZE_MAGNITUDE) - 1)] += count
+        self.total_count += count
+        if index < self._min_index:
+            self._min_index = index
+        if index > self._max_index:
+            self._max_index = index
+
+    def add(self, response_time, count=1):
+        """
+        Record *count* occurrences of *response_time*. Returns the index of the bucket the value was recorded in.
+        """
+        # (the same as key_of(), inlined since it's called for every request)
+        units = round(response_time * self._multiplier)
+        if units > 0:
+            index = self._index_of(units)
+            if index >= self.length:
+                index = self.length - 1
+        else:
+            index = 0
+        self._add_at(index, count)
+        return index
+
+    def key_of(self, response_time):
+        """Return the index of the bucket that :meth:`add` would record *response_time* in, without recording it"""
+        units = round(response_time * self._multiplier)
+        if units <= 0:
+            return 0
+        return min(self._index_of(units), self.length - 1)
+
+    def count_at(self, index):
+        """
+        Return the number of values recorded in the bucket at *index*
+        """
+        chunk = self._chunks[index >> CHUNK_SIZE_MAGNITUDE]
+        return chunk[index & ((1 << CHUNK_SIZE_MAGNITUDE) - 1)] if chunk is not None else 0
+
+    def _indexes(self, reverse=False):
+        """
+        Yields the (index, count) of the buckets with a count, in ascending (or descending) order
+        """
+        chunk_numbers = range(self._min_index >> CHUNK_SIZE_MAGNITUDE, (self._max_index >> CHUNK_SIZE_MAGNITUDE) + 1)
+        for chunk_number in reversed(chunk_numbers) if reverse else chunk_numbers:
+            chunk = self._chunks[chunk_number]
+            if chunk is None:
+                continue
+            offset = chunk_number << CHUNK_SIZE_MAGNITUDE
+            offsets = range(len(chunk) - 1, -1, -1) if reverse else range(len(chunk))
+            for i in offsets:
+                if chunk[i]:
+                    yield offset + i, chunk[i]
+
+    def merge(self, other):
+        """
+        Add the counts from another histogram (or a {response_time: count} dict) to this one
+        """
+        if isinstance(other, HdrHistogram) and other.length == self.length and other.resolution == self.resolution:
+            for index, count in other._indexes():
+                self._add_at(index, count)
+        else:
+            for response_time, count in other.items():
+                self.add(response_time, count)
+
+    def value_of(self, index):
+        """
+        Return the response time (in ms) that a bucket represents, which is the middle of the range
+        of values that are counted in it
+        """
+        bucket_index = (index >> self._sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self._sub_bucket_half_count - 1)) + self._sub_bucket_half_count
+        if bucket_index < 0:
+            sub_bucket_index -= self._sub_bucket_half_count
+            bucket_index = 0
+        lowest_equivalent_value = sub_bucket_index << bucket_index
+        return (lowest_equivalent_value + ((1 << bucket_index) >> 1)) / self._multiplier
+
+    def items(self):
+        for index, count in self._indexes():
+            yield self.value_of(index), count
+
+    def percentile(self, num_requests, percent):
+        """
+        Get the response time that a certain number of percent of the requests finished within.
+        See :func:`calculate_response_time_percentile`.
+        """
+        num_of_request = int(num_requests * percent)
+        processed_count = 0
+        for index, count in self._indexes(reverse=True):
+            processed_count += count
+            if num_requests - processed_count <= num_of_request:
+                return self.value_of(index)
+        return 0
+
+    def median(self, total):
+        pos = (total - 1) / 2
+        for index, count in self._indexes():
+            if pos < count:
+                return self.value_of(index)
+            pos -= count
+
+    def serialize(self):
+        return dict(self.items())
+
+    def __bool__(self):
+        return self.total_count > 0
+
+    def __eq__(self, other):
+        if isinstance(other, HdrHistogram):
+            return self.length == other.length and list(self._indexes()) == list(other._indexes())
+        return NotImplemented
+
+    def __repr__(self):
+        return "<HdrHistogram %r>" % self.serialize()
+
+
+HISTOGRAM_BACKENDS = {
+    "legacy": RoundedHistogram,
+    "hdr": HdrHistogram,
+}
+
+
+def get_histogram_factory(backend="legacy", significant_digits=2, resolution=DEFAULT_RESOLUTION):
+    """
+    Return a callable that creates empty histograms of the specified backend. *significant_digits* and
+    *resolution* (the lowest discernible response time, in ms) only apply to the ``hdr`` backend
+    """
+    if backend not in HISTOGRAM_BACKENDS:
+        raise ValueError(
+            "Unknown response time histogram %r (valid values are: %s)" % (backend, ", ".join(HISTOGRAM_BACKENDS))
+        )
+    if backend == "hdr":
+        return functools.partial(HdrHistogram, significant_digits=significant_digits, resolution=resolution)
+    return HISTOGRAM_BACKENDS[backend]
+
+
+def add_with_expected_interval(histogram, response_time, expected_interval):
+    """
+    Record *response_time* (in ms) in *histogram*, correcting for coordinated omission like HdrHistogram's
+    ``recordValueWithExpectedInterval``: if the response time is longer than *expected_interval* (the time in ms
+    between requests that the sender aims for), the requests that the sender would have made while it was waiting
+    are back-filled with linearly decreasing response times (response_time - expected_interval,
+    response_time - 2 * expected_interval, ... down to expected_interval).
+
+    The back-filled values are added with one call per histogram bucket that they fall in, rather than one per
+    value, so a long stall with a short expected interval doesn't cost more than a few dozen calls.
+
+    Returns the number of values recorded.
+    """
+    histogram.add(response_time)
+    if not expected_interval or response_time <= expected_interval:
+        return 1
+    # the back-filled values are response_time - i * expected_interval, for i in 1..missing
+    missing = int((response_time - expected_interval) // expected_interval)
+    i = 1
+    while i <= missing:
+        key = histogram.key_of(response_time - i * expected_interval)
+        # the values decrease as i grows, so the ones in the same bucket are consecutive: find the last one
+        low, high = i, missing
+        while low < high:
+            middle = (low + high + 1) // 2
+            if histogram.key_of(response_time - middle * expected_interval) == key:
+                low = middle
+            else:
+                high = middle - 1
+        histogram.add(response_time - i * expected_interval, low - i + 1)
+        i = low + 1
+    return missing + 1
+
+
+def calculate_response_time_percentile(response_times, num_requests, percent):
+    """
+    Get the response time that a certain number of percent of the requests
+    finished within. Arguments:
+
+    response_times: A StatsEntry.response_times dict
+    num_requests: Number of request made (could be derived from response_times,
+                  but we save some CPU cycles by using the value which we already store)
+    percent: The percentile we want to calculate. Specified in range: 0.0 - 1.0
+    """
+    num_of_request = int((num_requests * percent))
+
+    processed_count = 0
+    for response_time in sorted(response_times.keys(), reverse=True):
+        processed_count += response_times[response_time]
+        if num_requests - processed_count <= num_of_request:
+            return response_time
+    # if all response times were None
+    return 0
+
+
+def median_from_dict(total, count):
+    """
+    total is the number of requests made
+    count is a dict {response_time: count}
+    """
+    pos = (total - 1) / 2
+    for k in sorted(count.keys()):
+        if pos < count[k]:
+            return k
+        pos -= count[k]
+
+
+class ResponseTimeWindow:
+    """
+    Ring buffer with the response times that were logged during the last *size* seconds. It's used to
+    calculate the *current* response time percentiles.
+
+    Every slot only holds the response times logged during one second, as a sparse {key: count} dict where
+    the keys are the ones returned by the ``add()`` method of *histogram*, so the current response time
+    percentiles can be calculated by merging *size* small dicts instead of diffing two full histograms.
+    """
+
+    def __init__(self, histogram, size, sink=None):
+        self.histogram = histogram
+        self.size = size
+        self.sink = sink
+        """
+        Optional callable that is called with the second, the {key: count} dict, the number of requests and the
+        number of failures of every second that is dropped from the window (see
+        :class:`ResponseTimeSeries <locust.timeseries.ResponseTimeSeries>`)
+        """
+        self._timestamps = [None] * size
+        self._slots = [None] * size
+        self._num_requests = [0] * size
+        self._num_failures = [0] * size
+
+    def _slot(self, t):
+        i = t % self.size
+        if self._timestamps[i] != t:
+            # the slot holds data from an older second, so we'll reuse it
+            if self.sink is not None and self._timestamps[i] is not None:
+                self.sink(self._timestamps[i], self._slots[i], self._num_requests[i], self._num_failures[i])
+            self._timestamps[i] = t
+            self._slots[i] = {}
+            self._num_requests[i] = 0
+            self._num_failures[i] = 0
+        return i
+
+    def log(self, t, key):
+        """
+        Log a request made at second *t*. *key* should be None for requests without response time
+        """
+        i = self._slot(t)
+        self._num_requests[i] += 1
+        if key is not None:
+            slot = self._slots[i]
+            slot[key] = slot.get(key, 0) + 1
+
+    def log_failure(self, t):
+        """
+        Log a failure at second *t*
+        """
+        self._num_failures[self._slot(t)] += 1
+
+    def extend(self, t, keys, num_requests, num_failures=0):
+        """
+        Log *num_requests* requests at second *t*, where *keys* is a {key: count} dict of their response times
+        """
+        i = self._slot(t)
+        self._num_requests[i] += num_requests
+        self._num_failures[i] += num_failures
+        slot = self._slots[i]
+        for key, count in keys.items():
+            slot[key] = slot.get(key, 0) + count
+
+    def seconds(self):
+        """
+        Returns the seconds that are still in the window, oldest first, as (t, {key: count}, num_requests,
+        num_failures) tuples
+        """
+        return sorted(
+            (t, self._slots[i], self._num_requests[i], self._num_failures[i])
+            for i, t in enumerate(self._timestamps)
+            if t is not None
+        )
+
+    def _merge(self, now):
+        now = int(now)
+        merged = {}
+        num_requests = 0
+        for i, t in enumerate(self._timestamps):
+            if t is not None and now - self.size < t <= now:
+                num_requests += self._num_requests[i]
+                for key, count in self._slots[i].items():
+                    merged[key] = merged.get(key, 0) + count
+        return merged, num_requests
+
+    def percentile(self, now, percent):
+        """
+        Get the response time percentile for the requests logged during the *size* seconds up until *now*
+        """
+        merged, num_requests = self._merge(now)
+        return self.histogram.value_of(calculate_response_time_percentile(merged, num_requests, percent))
+
+    def percentiles(self, now, percents):
+        """
+        Get several response time percentiles at once, merging the slots only once
+        """
+        merged, num_requests = self._merge(now)
+        return [
+            self.histogram.value_of(calculate_response_time_percentile(merged, num_requests, percent))
+            for percent in percents
+        ]
@@ -1,23 +1,172 @@
 from jinja2 import Environment, FileSystemLoader
+import functools
 import os
 import pathlib
 import datetime
+import re
+import struct
+import zlib
 from itertools import chain
 from .stats import sort_stats
 from .user.inspectuser import get_ratio
 from html import escape
 from json import dumps
+from .reporter_io import reporter_io
 from .runners import MasterRunner
 
 
+REPORT_CHUNK_SIZE = 64 * 1024
+"""Approximate size of the chunks that the streamed HTML report is sent or written in"""
+
+_STATIC_JS_FILES = ["jquery-1.11.3.min.js", "echarts.common.min.js", "vintage.js", "chart.js", "tasks.js"]
+_STATIC_CSS_FILES = ["tables.css"]
+
+# placeholders that are rendered instead of the static bundle, and replaced with it while streaming
+_STATIC_MARKERS = {"static_js": "\x00locust-static-js\x00", "static_css": "\x00locust-static-css\x00"}
+_STATIC_MARKER_PATTERN = re.compile("(%s)" % "|".join(_STATIC_MARKERS.values()))
+
+_jinja_environment = None
+_static_files = {}
+_static_bundle = None
+
+
+def _get_jinja_environment():
+    global _jinja_environment
+    if _jinja_environment is None:
+        templates_path = os.path.join(pathlib.Path(__file__).parent.absolute(), "templates")
+        # the templates are compiled once and never reloaded
+        _jinja_environment = Environment(
+            loader=FileSystemLoader(templates_path), extensions=["jinja2.ext.do"], auto_reload=False
+        )
+    return _jinja_environment
+
+
 def render_template(file, **kwargs):
-    templates_path = os.path.join(pathlib.Path(__file__).parent.absolute(), "templates")
-    env = Environment(loader=FileSystemLoader(templates_path), extensions=["jinja2.ext.do"])
-    template = env.get_template(file)
-    return template.render(**kwargs)
+    return _get_jinja_environment().get_template(file).render(**kwargs)
 
 
-def get_html_report(environment, show_download_link=True):
+def _read_file(path):
+    with open(path, encoding="utf8") as f:
+        return f.read()
+
+
+def read_static_file(name):
+    """
+    Returns the contents of a file in the static directory. The files are read in the
+    :mod:`reporter I/O <locust.reporter_io>` thread, and cached.
+    """
+    content = _static_files.get(name)
+    if content is None:
+        path = os.path.join(os.path.dirname(__file__), "static", name)
+        content = _static_files[name] = reporter_io.call(_read_file, path)
+    return content
+
+
+class _StaticPart:
+    """
+    A part of the static bundle, along with its deflate compressed data. The compressor is flushed with
+    Z_FULL_FLUSH, so the compressed data can be spliced into any deflate stream that has been flushed the same way.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.data = text.encode("utf-8")
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.deflated = compressor.compress(self.data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+def _get_static_bundle():
+    global _static_bundle
+    if _static_bundle is None:
+        static_js = []
+        for js_file in _STATIC_JS_FILES:
+            static_js.append("// " + js_file)
+            static_js.append(read_static_file(js_file))
+            static_js.extend(["", ""])
+        static_css = []
+        for css_file in _STATIC_CSS_FILES:
+            static_css.append("/* " + css_file + " */")
+            static_css.append(read_static_file(os.path.join("css", css_file)))
+            static_css.extend(["", ""])
+        parts = {"static_js": _StaticPart("\n".join(static_js)), "static_css": _StaticPart("\n".join(static_css))}
+        _static_bundle = {_STATIC_MARKERS[key]: part for key, part in parts.items()}
+    return _static_bundle
+
+
+def _render_parts(environment, show_download_link):
+    # yields the rendered text in chunks, and a _StaticPart where the static bundle goes
+    bundle = _get_static_bundle()
+    template = _get_jinja_environment().get_template("report.html")
+    buffered = []
+    buffered_size = 0
+    for chunk in template.generate(**_report_context(environment, show_download_link)):
+        for piece in _STATIC_MARKER_PATTERN.split(chunk):
+            part = bundle.get(piece)
+            if part is None:
+                buffered.append(piece)
+                buffered_size += len(piece)
+                if buffered_size < REPORT_CHUNK_SIZE:
+                    continue
+            if buffered:
+                yield "".join(buffered)
+                buffered = []
+                buffered_size = 0
+            if part is not None:
+                yield part
+    if buffered:
+        yield "".join(buffered)
+
+
+def stream_html_report(environment, show_download_link=True):
+    """
+    Renders the HTML report, and yields it in chunks (of about REPORT_CHUNK_SIZE characters), so that it's never
+    held in memory as a whole
+    """
+    for part in _render_parts(environment, show_download_link):
+        yield part.text if isinstance(part, _StaticPart) else part
+
+
+def stream_gzipped_html_report(environment, show_download_link=True):
+    """
+    Like stream_html_report(), but yields the report gzip compressed. Only the parts of the report that depend on
+    the stats are compressed, the static bundle has been compressed in advance.
+    """
+    # gzip header: magic, deflate, no flags, no mtime, no extra flags, unknown OS
+    yield b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+    crc = 0
+    size = 0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    for part in _render_parts(environment, show_download_link):
+        if isinstance(part, _StaticPart):
+            yield compressor.flush(zlib.Z_FULL_FLUSH)
+            yield part.deflated
+            data = part.data
+            # start over, since the compressor mustn't refer back to data that it hasn't seen
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        else:
+            data = part.encode("utf-8")
+            compressed = compressor.compress(data)
+            if compressed:
+                yield compressed
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+    yield compressor.flush(zlib.Z_FINISH)
+    yield struct.pack("<II", crc & 0xFFFFFFFF, size & 0xFFFFFFFF)
+
+
+def save_html_report(environment, path):
+    """
+    Renders the HTML report to *path*. The file is written by the reporter I/O thread while the report is rendered.
+    """
+    file = reporter_io.call(functools.partial(open, path, "w", encoding="utf-8"))
+    try:
+        for chunk in stream_html_report(environment, show_download_link=False):
+            reporter_io.write(file, chunk)
+    finally:
+        reporter_io.call(file.close)
+
+
+def _report_context(environment, show_download_link):
     stats = environment.runner.stats
 
     start_ts = stats.start_time
@@ -45,24 +194,6 @@ def get_html_report(environment, show_download_link=True):
 
     history = stats.history
 
-    static_js = []
-    js_files = ["jquery-1.11.3.min.js", "echarts.common.min.js", "vintage.js", "chart.js", "tasks.js"]
-    for js_file in js_files:
-        path = os.path.join(os.path.dirname(__file__), "static", js_file)
-        static_js.append("// " + js_file)
-        with open(path, encoding="utf8") as f:
-            static_js.append(f.read())
-        static_js.extend(["", ""])
-
-    static_css = []
-    css_files = ["tables.css"]
-    for css_file in css_files:
-        path = os.path.join(os.path.dirname(__file__), "static", "css", css_file)
-        static_css.append("/* " + css_file + " */")
-        with open(path, encoding="utf8") as f:
-            static_css.append(f.read())
-        static_css.extend(["", ""])
-
     is_distributed = isinstance(environment.runner, MasterRunner)
     user_spawned = (
         environment.runner.reported_user_classes_count if is_distributed else environment.runner.user_classes_count
@@ -73,8 +204,7 @@ def get_html_report(environment, show_download_link=True):
         "total": get_ratio(environment.user_classes, user_spawned, True),
     }
 
-    res = render_template(
-        "report.html",
+    return dict(
         int=int,
         round=round,
         requests_statistics=requests_statistics,
@@ -84,11 +214,14 @@ def get_html_report(environment, show_download_link=True):
         end_time=end_time,
         host=host,
         history=history,
-        static_js="\n".join(static_js),
-        static_css="\n".join(static_css),
+        static_js=_STATIC_MARKERS["static_js"],
+        static_css=_STATIC_MARKERS["static_css"],
         show_download_link=show_download_link,
         locustfile=environment.locustfile,
         tasks=escape(dumps(task_data)),
+        corrected=stats.correct_coordinated_omission,
     )
 
-    return res
+
+def get_html_report(environment, show_download_link=True):
+    return "".join(stream_html_report(environment, show_download_link))
@@ -2,8 +2,15 @@ import logging
 import logging.config
 import socket
 
+import gevent
+
+from .reporter_io import reporter_io
+
 HOSTNAME = socket.gethostname()
 
+HANDLER_FLUSH_TIMEOUT = 5.0
+"""Longest time that flushing or closing a BackgroundFileHandler waits for the pending writes"""
+
 # Global flag that we set to True if any unhandled exception occurs in a greenlet
 # Used by main.py to set the process return code to non-zero
 unhandled_greenlet_exception = False
@@ -54,7 +61,7 @@ def setup_logging(loglevel, logfile=None):
         # if a file has been specified add a file logging handler and set
         # the locust and root loggers to use it
         LOGGING_CONFIG["handlers"]["file"] = {
-            "class": "logging.FileHandler",
+            "class": "locust.log.BackgroundFileHandler",
             "filename": logfile,
             "formatter": "default",
         }
@@ -64,6 +71,53 @@ def setup_logging(loglevel, logfile=None):
     logging.config.dictConfig(LOGGING_CONFIG)
 
 
+class BackgroundFileHandler(logging.FileHandler):
+    """
+    A FileHandler that formats the log records right away, but writes them to the file in the
+    :mod:`reporter I/O <locust.reporter_io>` thread
+    """
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+        except Exception:
+            self.handleError(record)
+            return
+        reporter_io.submit(self._write, msg, record, size=len(msg))
+
+    def _write(self, msg, record):
+        stream = self.stream
+        if stream is None or stream.closed:
+            # closed while this write was waiting (see _wait_for_writes)
+            return
+        try:
+            stream.write(msg)
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self._wait_for_writes(self._flush_stream)
+
+    def _flush_stream(self):
+        if self.stream is not None and not self.stream.closed:
+            self.stream.flush()
+
+    def close(self):
+        self._wait_for_writes(lambda: None)
+        super().close()
+
+    def _wait_for_writes(self, func):
+        # flush() and close() are called with the handler's lock held (e.g. by logging.shutdown() at exit), so don't
+        # wait forever for writes that may be stuck, or waiting for the lock themselves
+        try:
+            reporter_io.call(func, timeout=HANDLER_FLUSH_TIMEOUT)
+        except gevent.Timeout:
+            pass
+
+
 def greenlet_exception_logger(logger, level=logging.CRITICAL):
     """
     Return a function that can be used as argument to Greenlet.link_exception() that will log the
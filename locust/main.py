@@ -5,6 +5,7 @@ import importlib
 import signal
 import socket
 import sys
+import tempfile
 import time
 import atexit
 
@@ -18,14 +19,15 @@ from .env import Environment
 from .log import setup_logging, greenlet_exception_logger
 from . import stats
 from .stats import print_error_report, print_percentile_stats, print_stats, stats_printer, stats_history
-from .stats import StatsCSV, StatsCSVFileWriter
+from .stats import AtomicStatsCSVFileWriter, StatsCSV, StatsCSVFileWriter
 from .user import User
 from .user.inspectuser import print_task_ratio, print_task_ratio_json
 from .util.timespan import parse_timespan
 from .exception import AuthCredentialsError
 from .shape import LoadTestShape
 from .input_events import input_listener
-from .html import get_html_report
+from .html import save_html_report
+from .metrics import MetricsServer
 from json import dumps
 
 version = locust.__version__
@@ -116,6 +118,25 @@ def create_environment(user_classes, options, events=None, shape_class=None, loc
     )
 
 
+def wait_for_processes(pids, timeout):
+    """
+    Wait for the child processes in pids to exit, and terminate the ones that are still running after timeout seconds
+    """
+    pids = list(pids)
+    deadline = time.monotonic() + timeout
+    while pids and time.monotonic() < deadline:
+        for pid in pids[:]:
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                    pids.remove(pid)
+            except ChildProcessError:
+                pids.remove(pid)
+        gevent.sleep(0.1)
+    for pid in pids:
+        logging.getLogger(__name__).warning("Worker process %s did not exit in time, terminating it", pid)
+        os.kill(pid, signal.SIGTERM)
+
+
 def main():
     # find specified locustfile and make sure it exists, using a very simplified
     # command line parser that is only used to parse the -f option
@@ -138,6 +159,10 @@ def main():
         sys.stderr.write("--autoquit is only meaningful in combination with --autostart\n")
         sys.exit(1)
 
+    if options.current_response_time_window is not None and options.current_response_time_window < 1:
+        sys.stderr.write("--current-response-time-window must be at least 1 second\n")
+        sys.exit(1)
+
     if options.step_time or options.step_load or options.step_users or options.step_clients:
         sys.stderr.write(
             "The step load feature was removed in Locust 1.3. You can achieve similar results using a LoadTestShape class. See https://docs.locust.io/en/stable/custom-load-shape.html\n"
@@ -203,6 +228,44 @@ def main():
                 )
             )
 
+    worker_processes = []
+    if options.processes:
+        if os.name == "nt":
+            logger.error("The --processes argument is not supported on Windows")
+            sys.exit(1)
+        if options.master or options.worker or options.relay:
+            logger.error("The --processes argument cannot be combined with --master, --worker or --relay")
+            sys.exit(1)
+        if options.processes == -1:
+            options.processes = os.cpu_count() or 1
+        elif options.processes < 1:
+            logger.error("--processes must be a positive number, or -1 to use one process per CPU core")
+            sys.exit(1)
+        # fork the workers after loading the locustfile, so that they don't have to load it again
+        master_pid = os.getpid()
+        ipc_file = os.path.join(tempfile.gettempdir(), "locust-%i.ipc" % master_pid)
+        for _ in range(options.processes):
+            pid = gevent.fork()
+            if pid == 0:
+                # the master process is in charge of stopping the test, so leave ctrl-c to it
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                options.worker = True
+                options.master_host = "ipc://" + ipc_file
+                options.shared_memory_stats = True
+                # these are handled by the master
+                options.run_time = None
+                options.autostart = False
+                options.csv_prefix = None
+                options.html_file = None
+                options.print_stats = False
+                worker_processes = []
+                break
+            worker_processes.append(pid)
+        else:
+            options.master = True
+            options.master_bind_host = "ipc://" + ipc_file
+            options.expect_workers = options.processes
+
     # create locust Environment
     environment = create_environment(
         user_classes, options, events=locust.events, shape_class=shape_class, locustfile=os.path.basename(locustfile)
@@ -225,6 +288,10 @@ def main():
         print_task_ratio_json(user_classes, options.num_users)
         sys.exit(0)
 
+    if options.relay and (options.master or options.worker):
+        logger.error("The --relay argument cannot be combined with --master or --worker")
+        sys.exit(-1)
+
     if options.master:
         if options.worker:
             logger.error("The --master argument cannot be combined with --worker")
@@ -233,6 +300,18 @@ def main():
             master_bind_host=options.master_bind_host,
             master_bind_port=options.master_bind_port,
         )
+    elif options.relay:
+        try:
+            runner = environment.create_relay_runner(
+                options.master_host,
+                options.master_port,
+                relay_bind_host=options.master_bind_host,
+                relay_bind_port=options.master_bind_port,
+            )
+            logger.debug("Connected to locust master: %s:%s", options.master_host, options.master_port)
+        except socket.error as e:
+            logger.error("Failed to connect to the Locust master: %s", e)
+            sys.exit(-1)
     elif options.worker:
         try:
             runner = environment.create_worker_runner(options.master_host, options.master_port)
@@ -243,11 +322,35 @@ def main():
     else:
         runner = environment.create_local_runner()
 
+    if options.processes and options.worker:
+
+        def watch_master_process():
+            # make sure that we don't leave orphaned workers behind if the master process dies
+            while os.getppid() == master_pid:
+                gevent.sleep(1)
+            logger.warning("The master process has exited, shutting down")
+            runner.quit()
+
+        gevent.spawn(watch_master_process).link_exception(greenlet_exception_handler)
+
+    if options.record_requests and not (options.worker or options.relay):
+        environment.create_request_recorder(options.record_requests)
+
+    if options.profile_file:
+        options.profile = True
+    if options.profile and not options.relay:
+        # the workers are told to profile through the options in the spawn message, relays just forward the samples
+        environment.create_profiler()
+
+    if options.arrival_rate is not None and not (options.worker or options.relay):
+        # the workers (and relays) get their share of the rate in the spawn messages
+        environment.create_arrival_executor(options.arrival_rate, options.arrival_rate_ramp)
+
     # main_greenlet is pointing to runners.greenlet by default, it will point the web greenlet later if in web mode
     main_greenlet = runner.greenlet
 
     if options.run_time:
-        if options.worker:
+        if options.worker or options.relay:
             logger.error("--run-time should be specified on the master node, and not on worker nodes")
             sys.exit(1)
         try:
@@ -257,14 +360,19 @@ def main():
             sys.exit(1)
 
     if options.csv_prefix:
-        stats_csv_writer = StatsCSVFileWriter(
-            environment, stats.PERCENTILES_TO_REPORT, options.csv_prefix, options.stats_history_enabled
+        writer_class = AtomicStatsCSVFileWriter if options.csv_atomic else StatsCSVFileWriter
+        stats_csv_writer = writer_class(
+            environment,
+            stats.PERCENTILES_TO_REPORT,
+            options.csv_prefix,
+            options.stats_history_enabled,
+            snapshot_interval=options.csv_snapshot_interval,
         )
     else:
         stats_csv_writer = StatsCSV(environment, stats.PERCENTILES_TO_REPORT)
 
     # start Web UI
-    if not options.headless and not options.worker:
+    if not options.headless and not (options.worker or options.relay):
         # spawn web greenlet
         protocol = "https" if options.tls_cert and options.tls_key else "http"
         try:
@@ -297,6 +405,12 @@ def main():
             logger.warning("Option --autostart is ignored for headless mode and worker process.")
         web_ui = None
 
+    metrics_server = None
+    if options.metrics_port and not (options.worker or options.relay):
+        metrics_host = "" if options.web_host == "*" else options.web_host
+        logger.info("Serving metrics at http://%s:%s/metrics" % (metrics_host or "0.0.0.0", options.metrics_port))
+        metrics_server = MetricsServer(environment, metrics_host, options.metrics_port)
+
     def assign_equal_weights(environment, **kwargs):
         environment.assign_equal_weights()
 
@@ -333,7 +447,9 @@ def main():
 
     headless_master_greenlet = None
     stats_printer_greenlet = None
-    if not options.only_summary and (options.print_stats or (options.headless and not options.worker)):
+    if not options.only_summary and (
+        options.print_stats or (options.headless and not (options.worker or options.relay))
+    ):
         # spawn stats printing greenlet
         stats_printer_greenlet = gevent.spawn(stats_printer(runner.stats))
         stats_printer_greenlet.link_exception(greenlet_exception_handler)
@@ -358,7 +474,7 @@ def main():
                 #       Right now, if the user sends a ctrl+c, the master will not gracefully
                 #       shutdown resulting in all the already started workers to stay active.
                 time.sleep(1)
-        if not options.worker:
+        if not (options.worker or options.relay):
             # apply headless mode defaults
             if options.num_users is None:
                 options.num_users = 1
@@ -380,14 +496,14 @@ def main():
         if options.run_time:
             logger.info("Run time limit set to %s seconds" % options.run_time)
             spawn_run_time_quit_greenlet()
-        elif not options.worker and not environment.shape_class:
+        elif not (options.worker or options.relay) and not environment.shape_class:
             logger.info("No run time limit set, use CTRL+C to interrupt")
 
     if options.headless:
         start_automatic_run()
 
     input_listener_greenlet = None
-    if not options.worker:
+    if not (options.worker or options.relay):
         # spawn input listener greenlet
         input_listener_greenlet = gevent.spawn(
             input_listener(
@@ -412,8 +528,10 @@ def main():
         # does something wild, like calling sys.exit() in the locustfile
         atexit.register(input_listener_greenlet.kill, block=True)
 
+    stats_csv_greenlet = None
     if options.csv_prefix:
-        gevent.spawn(stats_csv_writer.stats_writer).link_exception(greenlet_exception_handler)
+        stats_csv_greenlet = gevent.spawn(stats_csv_writer.stats_writer)
+        stats_csv_greenlet.link_exception(greenlet_exception_handler)
 
     def shutdown():
         """
@@ -444,11 +562,30 @@ def main():
         logger.debug("Cleaning up runner...")
         if runner is not None:
             runner.quit()
-
-        if not isinstance(runner, locust.runners.WorkerRunner):
+        if worker_processes:
+            wait_for_processes(worker_processes, timeout=10)
+            try:
+                os.remove(ipc_file)
+            except FileNotFoundError:
+                pass
+
+        if metrics_server is not None:
+            metrics_server.stop()
+        if stats_csv_greenlet is not None:
+            stats_csv_greenlet.kill(block=True)
+            stats_csv_writer.close_files()
+        environment.stats.history.close()
+
+        if not isinstance(runner, (locust.runners.WorkerRunner, locust.runners.RelayRunner)):
             print_stats(runner.stats, current=False)
             print_percentile_stats(runner.stats)
             print_error_report(runner.stats)
+            if environment.arrival_executor is not None:
+                environment.arrival_executor.log_summary()
+            if environment.profiler is not None:
+                environment.profiler.log_summary()
+                if options.profile_file:
+                    environment.profiler.save(options.profile_file)
 
         sys.exit(code)
 
@@ -466,9 +603,7 @@ def main():
 
         main_greenlet.join()
         if options.html_file:
-            html_report = get_html_report(environment, show_download_link=False)
-            with open(options.html_file, "w", encoding="utf-8") as file:
-                file.write(html_report)
+            save_html_report(environment, options.html_file)
     except KeyboardInterrupt:
         pass
     except Exception:
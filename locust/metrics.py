@@ -0,0 +1,143 @@
+"""
+Exposes the request stats in the `Prometheus text format <https://prometheus.io/docs/instrumenting/exposition_formats/>`_,
+on the web UI's ``/metrics`` endpoint, or (e.g. when running headless) on a separate port using ``--metrics-port``.
+
+The metrics are generated directly from the stats entries (without building any intermediate objects) and cached
+for :data:`METRICS_CACHE_TIME` seconds, so that several scrapers (or a short scrape interval) don't add any load.
+"""
+import logging
+import time
+from bisect import bisect_left
+
+import gevent
+from gevent import pywsgi
+
+from .log import greenlet_exception_logger
+from .reporter_io import reporter_io
+from .runners import MasterRunner
+
+logger = logging.getLogger(__name__)
+greenlet_exception_handler = greenlet_exception_logger(logger)
+
+METRICS_CACHE_TIME = 2.0
+"""Number of seconds the metrics are cached for"""
+
+METRICS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+"""Upper bounds (in ms) of the buckets of the locust_response_time_seconds histogram"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsExporter:
+    """
+    Renders the metrics of an :class:`Environment <locust.env.Environment>`'s runner
+    """
+
+    def __init__(self, environment, cache_time=METRICS_CACHE_TIME, buckets=METRICS_BUCKETS):
+        self.environment = environment
+        self.cache_time = cache_time
+        self.buckets = buckets
+        self._bucket_labels = ['le="%r"' % (bound / 1000) for bound in buckets] + ['le="+Inf"']
+        self._cached = None
+        self._cached_time = 0.0
+
+    def render(self):
+        """
+        Returns the metrics as a string in the Prometheus text format
+        """
+        now = time.time()
+        if self._cached is None or now - self._cached_time >= self.cache_time:
+            self._cached = self._render()
+            self._cached_time = now
+        return self._cached
+
+    def _render(self):
+        runner = self.environment.runner
+        entries = [
+            ('method="%s",name="%s"' % (escape_label_value(entry.method), escape_label_value(entry.name)), entry)
+            for entry in runner.stats.entries.values()
+        ]
+        lines = []
+        out = lines.append
+
+        out("# HELP locust_users Number of running users")
+        out("# TYPE locust_users gauge")
+        out("locust_users %i" % runner.user_count)
+        if isinstance(runner, MasterRunner):
+            out("# HELP locust_workers Number of connected workers")
+            out("# TYPE locust_workers gauge")
+            out("locust_workers %i" % runner.worker_count)
+
+        io_stats = reporter_io.stats()
+        out("# HELP locust_reporter_io_pending_writes Number of report writes waiting for the reporter I/O thread")
+        out("# TYPE locust_reporter_io_pending_writes gauge")
+        out("locust_reporter_io_pending_writes %i" % io_stats["pending_writes"])
+        out("# HELP locust_reporter_io_pending_bytes Number of bytes waiting to be written by the reporter I/O thread")
+        out("# TYPE locust_reporter_io_pending_bytes gauge")
+        out("locust_reporter_io_pending_bytes %i" % io_stats["pending_bytes"])
+        out("# HELP locust_reporter_io_lag_seconds Time the oldest pending report write has been waiting")
+        out("# TYPE locust_reporter_io_lag_seconds gauge")
+        out("locust_reporter_io_lag_seconds %r" % io_stats["write_lag"])
+        out("# HELP locust_reporter_io_failures_total Number of report writes that failed")
+        out("# TYPE locust_reporter_io_failures_total counter")
+        out("locust_reporter_io_failures_total %i" % io_stats["failed_writes"])
+
+        out("# HELP locust_requests_total Number of requests")
+        out("# TYPE locust_requests_total counter")
+        for labels, entry in entries:
+            out("locust_requests_total{%s} %i" % (labels, entry.num_requests))
+
+        out("# HELP locust_failures_total Number of failed requests")
+        out("# TYPE locust_failures_total counter")
+        for labels, entry in entries:
+            out("locust_failures_total{%s} %i" % (labels, entry.num_failures))
+
+        out("# HELP locust_response_size_bytes_total Total size of the responses")
+        out("# TYPE locust_response_size_bytes_total counter")
+        for labels, entry in entries:
+            out("locust_response_size_bytes_total{%s} %i" % (labels, entry.total_content_length))
+
+        out("# HELP locust_response_time_seconds Response times")
+        out("# TYPE locust_response_time_seconds histogram")
+        buckets = self.buckets
+        bucket_labels = self._bucket_labels
+        for labels, entry in entries:
+            counts = [0] * (len(buckets) + 1)
+            for response_time, count in entry.response_times.items():
+                counts[bisect_left(buckets, response_time)] += count
+            cumulative = 0
+            for bucket_label, count in zip(bucket_labels, counts):
+                cumulative += count
+                out("locust_response_time_seconds_bucket{%s,%s} %i" % (labels, bucket_label, cumulative))
+            out("locust_response_time_seconds_sum{%s} %r" % (labels, entry.total_response_time / 1000))
+            out("locust_response_time_seconds_count{%s} %i" % (labels, cumulative))
+
+        out("")
+        return "\n".join(lines)
+
+
+class MetricsServer:
+    """
+    Serves the metrics on /metrics, for when there is no web UI (or it shouldn't be reachable by the scraper)
+    """
+
+    def __init__(self, environment, host, port):
+        self.exporter = MetricsExporter(environment)
+        self.server = pywsgi.WSGIServer((host, port), self.application, log=None)
+        self.greenlet = gevent.spawn(self.server.serve_forever)
+        self.greenlet.link_exception(greenlet_exception_handler)
+
+    def application(self, environ, start_response):
+        if environ["PATH_INFO"] != "/metrics":
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"Not found"]
+        body = self.exporter.render().encode("utf-8")
+        start_response("200 OK", [("Content-Type", CONTENT_TYPE), ("Content-Length", str(len(body)))])
+        return [body]
+
+    def stop(self):
+        self.server.stop()
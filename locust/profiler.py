@@ -0,0 +1,260 @@
+"""
+A sampling profiler that shows where the CPU time of a Locust process goes, and whether it's spent in the
+locustfile or in Locust itself.
+
+Since all the greenlets run in the main thread, a background (OS) thread samples the stack of the main thread at a
+fixed interval. That stack only contains the frames of the greenlet that is running at that moment, so each sample
+belongs to exactly one greenlet. The samples are assigned a category from the frames on the stack, starting at the
+innermost frame (so the time spent logging a request in the stats is attributed to ``stats`` and not to the user
+task that made the request):
+
+=========== ====================================================================================================
+``user``    User and TaskSet code, including the locustfile and the clients it uses
+``events``  Event listeners (called from :meth:`EventHook.fire <locust.event.EventHook.fire>`)
+``stats``   Logging the requests in the :class:`RequestStats <locust.stats.RequestStats>` and merging reports
+``rpc``     Sending and receiving messages between the master and the workers
+``web``     The web UI and the metrics endpoint
+``runner``  Spawning users and the other runner greenlets
+``idle``    The gevent hub waiting for I/O or timers
+``other``   Anything else
+=========== ====================================================================================================
+
+The stacks are aggregated in the "folded" format (one line per stack, with the frames separated by ``;`` followed by
+the number of samples), which can be turned into a flamegraph using e.g. ``flamegraph.pl`` or speedscope. The
+category is the root frame. When running distributed, the workers send their samples to the master, which merges
+them with its own.
+"""
+import logging
+import os
+import sys
+from collections import Counter
+
+import gevent
+from gevent import monkey
+
+from .reporter_io import reporter_io
+from .runners import MasterRunner, WorkerRunner
+
+logger = logging.getLogger(__name__)
+
+_get_ident = monkey.get_original("_thread", "get_ident")
+_start_new_thread = monkey.get_original("_thread", "start_new_thread")
+_allocate_lock = monkey.get_original("_thread", "allocate_lock")
+_sleep = monkey.get_original("time", "sleep")
+
+PROFILE_INTERVAL = 0.005
+"""Number of seconds between two samples"""
+
+PROFILE_REPORT_INTERVAL = 3.0
+"""Number of seconds between two messages with samples from a worker to the master"""
+
+MESSAGE_TYPE = "profile_samples"
+"""Type of the custom message that the workers send their samples in"""
+
+CATEGORIES = ("user", "events", "stats", "rpc", "web", "runner", "idle", "other")
+
+_LOCUST_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# category of the modules and packages in locust
+_LOCUST_MODULE_CATEGORIES = {
+    "user": "user",
+    "event.py": "events",
+    "stats.py": "stats",
+    "histogram.py": "stats",
+    "timeseries.py": "stats",
+    "stats_index.py": "stats",
+    "stats_shm.py": "stats",
+    "rpc": "rpc",
+    "stats_codec.py": "rpc",
+    "web.py": "web",
+    "html.py": "web",
+    "metrics.py": "web",
+    "runners.py": "runner",
+    "dispatch.py": "runner",
+}
+
+# category of third party packages
+_PACKAGE_CATEGORIES = {
+    "zmq": "rpc",
+    "msgpack": "rpc",
+    "flask": "web",
+    "werkzeug": "web",
+    "jinja2": "web",
+}
+
+# code object -> (frame name, category)
+_code_info = {}
+
+
+def _categorize(code):
+    filename = os.path.abspath(code.co_filename)
+    if filename.startswith(_LOCUST_DIR):
+        return _LOCUST_MODULE_CATEGORIES.get(filename[len(_LOCUST_DIR) :].split(os.sep)[0])
+    parts = filename.split(os.sep)
+    if "gevent" in parts:
+        if parts[-1] == "pywsgi.py":
+            return "web"
+        if parts[-1] == "hub.py" and code.co_name == "run":
+            return "idle"
+        return None
+    for part in parts:
+        if part in _PACKAGE_CATEGORIES:
+            return _PACKAGE_CATEGORIES[part]
+    return None
+
+
+def _frame_name(code):
+    filename = os.path.abspath(code.co_filename)
+    if filename.startswith(_LOCUST_DIR):
+        filename = "locust/" + filename[len(_LOCUST_DIR) :].replace(os.sep, "/")
+    else:
+        filename = os.path.basename(filename)
+    # ";" separates the frames in the folded format
+    return ("%s (%s:%d)" % (code.co_name, filename, code.co_firstlineno)).replace(";", ",")
+
+
+def fold_stack(frame):
+    """
+    Returns the stack of *frame* in the folded format (with the category as the root frame)
+    """
+    names = []
+    category = None
+    innermost = True
+    while frame is not None:
+        code = frame.f_code
+        info = _code_info.get(code)
+        if info is None:
+            info = _code_info[code] = (_frame_name(code), _categorize(code))
+        names.append(info[0])
+        # the hub's loop is only idle if it isn't running anything else
+        if category is None and info[1] is not None and (info[1] != "idle" or innermost):
+            category = info[1]
+        innermost = False
+        frame = frame.f_back
+    names.append(category or "other")
+    names.reverse()
+    return ";".join(names)
+
+
+class Profiler:
+    """
+    Samples the stack of the main thread of an :class:`Environment <locust.env.Environment>`. Use
+    :meth:`Environment.create_profiler() <locust.env.Environment.create_profiler>` to create one.
+
+    On workers, the samples are sent to the master every PROFILE_REPORT_INTERVAL seconds. On the master, the samples
+    received from the workers are merged into :attr:`samples`.
+    """
+
+    def __init__(self, environment, interval=PROFILE_INTERVAL):
+        self.environment = environment
+        self.interval = interval
+        self.samples = Counter()
+        """Number of samples per stack (in the folded format), from all nodes"""
+        self.node_samples = Counter()
+        """Number of samples per node"""
+        runner = environment.runner
+        self.node = runner.client_id if isinstance(runner, WorkerRunner) else "local"
+        self._pending = Counter()
+        self._lock = _allocate_lock()
+        self._running = False
+        self._thread_id = None
+        self._report_greenlet = None
+
+        if isinstance(runner, WorkerRunner):
+            self._report_greenlet = gevent.spawn(self._report_to_master)
+        elif isinstance(runner, MasterRunner):
+            runner.register_message(MESSAGE_TYPE, self.on_samples)
+        environment.events.quitting.add_listener(self.on_quitting)
+
+    def start(self):
+        """
+        Start sampling the thread that it's called from
+        """
+        if self._running:
+            return
+        self._running = True
+        self._thread_id = _get_ident()
+        _start_new_thread(self._sample, ())
+
+    def stop(self):
+        self._running = False
+        if self._report_greenlet is not None:
+            self._report_greenlet.kill(block=False)
+            self._report_greenlet = None
+
+    def _sample(self):
+        # runs in the background thread
+        while self._running:
+            _sleep(self.interval)
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = fold_stack(frame)
+            del frame
+            with self._lock:
+                self._pending[stack] += 1
+
+    def take_samples(self):
+        """
+        Returns the samples that have been taken since the last call (and adds them to :attr:`samples`, unless
+        they're sent to the master)
+        """
+        with self._lock:
+            samples, self._pending = self._pending, Counter()
+        if self._report_greenlet is None:
+            self._add_samples(self.node, samples)
+        return samples
+
+    def _add_samples(self, node, samples):
+        self.samples.update(samples)
+        self.node_samples[node] += sum(samples.values())
+
+    def _report_to_master(self):
+        while True:
+            gevent.sleep(PROFILE_REPORT_INTERVAL)
+            samples = self.take_samples()
+            if samples:
+                self.environment.runner.send_message(MESSAGE_TYPE, dict(samples))
+
+    def on_samples(self, environment, msg, **_kwargs):
+        self._add_samples(msg.node_id, msg.data)
+
+    def on_quitting(self, environment, **_kwargs):
+        self.stop()
+
+    def folded(self):
+        """
+        Returns the samples in the folded format, one stack per line
+        """
+        self.take_samples()
+        return "".join("%s %d\n" % (stack, count) for stack, count in sorted(self.samples.items()))
+
+    def summary(self):
+        """
+        Returns the share (from 0 to 1) of the samples in each category
+        """
+        self.take_samples()
+        counts = Counter()
+        for stack, count in self.samples.items():
+            counts[stack.split(";", 1)[0]] += count
+        total = sum(counts.values())
+        return {category: counts[category] / total if total else 0.0 for category in CATEGORIES}
+
+    def save(self, path):
+        """
+        Writes the samples to *path* in the folded format
+        """
+        reporter_io.call(_write_file, path, self.folded())
+
+    def log_summary(self):
+        summary = self.summary()
+        logger.info(
+            "Profile (%d samples): %s",
+            sum(self.node_samples.values()),
+            ", ".join("%s %.1f%%" % (category, share * 100) for category, share in summary.items() if share),
+        )
+
+
+def _write_file(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
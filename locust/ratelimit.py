@@ -0,0 +1,263 @@
+"""
+Global (cluster-wide) rate limits.
+
+A :class:`RateLimit` caps the number of times something happens per second, in total, no matter how many users (or
+workers) do it. It is a token bucket: every call to :meth:`RateLimit.acquire` takes a token, and waits (cooperatively,
+like ``gevent.sleep``) for as long as is needed to stay below the rate. It can be used in a task, to limit the
+throughput of some requests, or as a ``wait_time`` (see :func:`rate_limited <locust.wait_time.rate_limited>`), to
+limit the number of task runs of the users of a class.
+
+When running distributed, each worker only enforces its own share of the rate (its budget). The master gives every
+worker an equal budget when the test starts, and rebalances the budgets each time the workers report their usage:
+workers that don't use their whole budget (because they have few users, or slow responses) keep what they use plus
+some :data:`HEADROOM`, and the rest is split among the workers that do. Workers that connect during the test get a
+budget right away. Relays split the budgets they get among their own workers in the same way.
+"""
+import logging
+import time
+
+import gevent
+from gevent.event import Event
+
+from .runners import WORKER_REPORT_INTERVAL, MasterRunner, RelayRunner, WorkerRunner
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TYPE = "rate_limits"
+"""Type of the custom message that carries the budgets of the rate limits to the workers"""
+
+HEADROOM = 0.2
+"""Fraction of their observed throughput that workers get on top of it, so that they can grow into a bigger share"""
+
+MIN_SHARE = 0.1
+"""Smallest budget a worker gets, as a fraction of an equal share of the rate"""
+
+CONSTRAINED_UTILIZATION = 0.9
+"""Fraction of its budget above which a worker is considered to be limited by it (and to want more)"""
+
+REBALANCE_THRESHOLD = 0.05
+"""Relative change below which a new budget isn't sent to a worker"""
+
+rate_limits = {}
+"""
+Rate limits created in this process, by name (the last one created with each name). They are the rate limits of the
+:class:`Environments <locust.env.Environment>` created afterwards, unless other ones are passed to them
+"""
+
+
+class RateLimit:
+    """
+    Limits the number of tokens that are acquired per second, on all workers together.
+
+    Example::
+
+        checkout_limit = RateLimit("checkout", 50)
+
+        class MyUser(HttpUser):
+            @task
+            def checkout(self):
+                checkout_limit.acquire()
+                self.client.post("/checkout")
+
+    The rate limits must be created when the locustfile is imported (at module level), so that they exist on the
+    master and on every worker, with the same names. Creating a rate limit with the name of an existing one replaces
+    it (e.g. when the locustfile is imported again).
+    """
+
+    def __init__(self, name, rate, burst=1):
+        """
+        :param name: Name of the rate limit, which identifies it on the master and the workers
+        :param rate: Number of tokens per second, in total
+        :param burst: Number of tokens that can be acquired at once without waiting, after a period of inactivity
+        """
+        if rate <= 0:
+            raise ValueError("The rate of a RateLimit must be positive")
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.local_rate = rate
+        """
+        Number of tokens per second that this process may acquire (its budget). The full rate when not running
+        distributed; None on a worker until the master has sent it a budget
+        """
+        self._has_budget = Event()
+        self._has_budget.set()
+        # theoretical arrival time of the next token (GCRA, the "virtual scheduling" form of a token bucket)
+        self._tat = 0.0
+        self._acquired = 0
+        rate_limits[name] = self
+
+    def __repr__(self):
+        return "<RateLimit %r %s/s>" % (self.name, self.rate)
+
+    def set_local_rate(self, rate):
+        """
+        Set the number of tokens per second that this process may acquire. Acquiring waits while it's None or 0
+        """
+        self.local_rate = rate
+        if rate:
+            self._has_budget.set()
+        else:
+            self._has_budget.clear()
+
+    def reserve(self, tokens=1):
+        """
+        Take *tokens* tokens, and return the number of seconds to wait before using them. Waits first if this
+        process doesn't have a budget yet
+        """
+        while not self.local_rate:
+            self._has_budget.wait()
+        rate = self.local_rate
+        now = time.perf_counter()
+        tat = max(self._tat, now)
+        self._tat = tat + tokens / rate
+        self._acquired += tokens
+        return max(0.0, tat - now - (self.burst - 1) / rate)
+
+    def acquire(self, tokens=1):
+        """
+        Take *tokens* tokens, waiting for as long as is needed to stay below the rate. Returns the time waited
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            gevent.sleep(delay)
+        return delay
+
+    def try_acquire(self, tokens=1):
+        """
+        Take *tokens* tokens if that can be done without waiting. Returns whether the tokens were taken
+        """
+        if not self.local_rate or self._tat - time.perf_counter() > (self.burst - 1) / self.local_rate:
+            return False
+        self.reserve(tokens)
+        return True
+
+    def take_usage(self):
+        """
+        Return the number of tokens acquired since the last call
+        """
+        acquired, self._acquired = self._acquired, 0
+        return acquired
+
+
+def allocate(rate, usage):
+    """
+    Split *rate* among nodes, based on their usage: a dict of node -> (observed rate, current budget), where either
+    can be None if unknown. Returns a dict of node -> budget.
+
+    Nodes that use less than :data:`CONSTRAINED_UTILIZATION` of their budget get their observed rate plus
+    :data:`HEADROOM` (but no more than an equal share, and no less than :data:`MIN_SHARE` of it), and the rest is
+    split equally among the other nodes. If every node is unconstrained, they all get an equal share.
+    """
+    if not usage:
+        return {}
+    equal = rate / len(usage)
+    shares = {}
+    constrained = []
+    for node, (observed, budget) in usage.items():
+        if observed is None or not budget or observed >= budget * CONSTRAINED_UTILIZATION:
+            constrained.append(node)
+        else:
+            shares[node] = min(equal, max(observed * (1 + HEADROOM), equal * MIN_SHARE))
+    if not constrained:
+        return dict.fromkeys(usage, equal)
+    rest = (rate - sum(shares.values())) / len(constrained)
+    for node in constrained:
+        shares[node] = rest
+    return shares
+
+
+class RateLimitBalancer:
+    """
+    Hands out the budgets of the rate limits of an :class:`Environment <locust.env.Environment>` to the workers (on a
+    master or a relay), and applies them (on a worker or a relay). Created by the Environment with distributed runners
+    """
+
+    def __init__(self, environment):
+        self.environment = environment
+        self.rate_limits = environment.rate_limits
+        """Rate limits of the environment, by name"""
+        runner = environment.runner
+        self.budgets = {}
+        """Rate of each rate limit to split among the workers (on a relay: the budgets it got from the master)"""
+        self._usage = {}
+        self._last_report = {}
+        self._sent = {}
+        # smallest budget of each worker since its last report, which its usage is compared to
+        self._smallest = {}
+        self._pending = {}
+
+        if isinstance(runner, (WorkerRunner, RelayRunner)):
+            runner.register_message(MESSAGE_TYPE, self.on_budgets)
+            environment.events.report_to_master.add_listener(self.on_report_to_master)
+        if isinstance(runner, WorkerRunner):
+            # wait for a budget from the master, rather than use the whole rate on every worker
+            for rate_limit in self.rate_limits.values():
+                rate_limit.set_local_rate(None)
+        if isinstance(runner, MasterRunner):
+            environment.events.worker_report.add_listener(self.on_worker_report)
+            environment.events.worker_connect.add_listener(self.on_worker_connect)
+            if not isinstance(runner, RelayRunner):
+                environment.events.test_start.add_listener(self.on_test_start)
+
+    def on_budgets(self, environment, msg, **kwargs):
+        if isinstance(self.environment.runner, RelayRunner):
+            self.budgets.update(msg.data)
+            self.rebalance()
+            return
+        for name, rate in msg.data.items():
+            if name in self.rate_limits:
+                self.rate_limits[name].set_local_rate(rate)
+
+    def on_report_to_master(self, client_id, data):
+        if isinstance(self.environment.runner, RelayRunner):
+            usage, self._pending = self._pending, {}
+        else:
+            usage = {name: rate_limit.take_usage() for name, rate_limit in self.rate_limits.items()}
+        data["rate_limits"] = usage
+
+    def on_worker_report(self, client_id, data):
+        if "rate_limits" not in data:
+            return
+        now = time.time()
+        elapsed = now - self._last_report.get(client_id, now - WORKER_REPORT_INTERVAL)
+        self._last_report[client_id] = now
+        if elapsed <= 0:
+            return
+        usage = data["rate_limits"]
+        smallest = self._smallest.get(client_id, {})
+        self._usage[client_id] = {name: (acquired / elapsed, smallest.get(name)) for name, acquired in usage.items()}
+        self._smallest[client_id] = dict(self._sent.get(client_id, {}))
+        for name, acquired in usage.items():
+            self._pending[name] = self._pending.get(name, 0) + acquired
+        self.rebalance()
+
+    def on_worker_connect(self, client_id):
+        # rather than leave the worker waiting for a budget until the next report from a worker
+        if self.budgets:
+            self.rebalance()
+
+    def on_test_start(self, environment, **kwargs):
+        self.budgets = {name: rate_limit.rate for name, rate_limit in self.rate_limits.items()}
+        self.rebalance()
+
+    def rebalance(self):
+        """
+        Compute the budget of every worker, and send those that changed to the workers
+        """
+        clients = self.environment.runner.clients
+        workers = [client.id for client in clients.ready + clients.spawning + clients.running]
+        changed = {}
+        for name, rate in self.budgets.items():
+            usage = {worker: self._usage.get(worker, {}).get(name, (None, None)) for worker in workers}
+            for worker, budget in allocate(rate, usage).items():
+                sent = self._sent.get(worker, {}).get(name)
+                if sent is None or abs(budget - sent) > sent * REBALANCE_THRESHOLD:
+                    changed.setdefault(worker, {})[name] = budget
+        for worker, budgets in changed.items():
+            logger.debug("Rate limit budgets of %s: %s", worker, budgets)
+            self._sent.setdefault(worker, {}).update(budgets)
+            smallest = self._smallest.setdefault(worker, {})
+            for name, budget in budgets.items():
+                smallest[name] = min(smallest.get(name, budget), budget)
+            self.environment.runner.send_message(MESSAGE_TYPE, budgets, client_id=worker)
@@ -0,0 +1,206 @@
+"""
+Records every request (rather than just the aggregated stats) to a file, for analysis after the test.
+
+The samples are appended to one array per column, and when ``chunk_size`` samples have been collected they are
+written to the file as a chunk. Each chunk is self contained: it consists of a small JSON header (the number of rows,
+the node that recorded them, the columns and the strings used in the chunk) followed by the raw column data. String
+columns (request_type, name, exception and context) are stored as indexes into the list of strings in the header.
+Chunks can therefore be written to the file in any order, and the master merges the recordings of the workers simply
+by appending the chunks it receives from them.
+
+Use :func:`read_recording` to read a recording. The numeric columns are returned as :py:class:`array.array`
+instances, which can be turned into NumPy arrays without copying using ``numpy.frombuffer``.
+"""
+import json
+import struct
+import sys
+import time
+from array import array
+
+from .reporter_io import reporter_io
+
+CHUNK_SIZE = 100_000
+"""Number of requests to collect before writing them to the file (or sending them to the master)"""
+
+MAGIC = b"LREC"
+
+COLUMNS = (
+    ("start_time", "d"),
+    ("response_time", "d"),
+    ("response_length", "q"),
+    ("request_type", "I"),
+    ("name", "I"),
+    ("exception", "I"),
+    ("context", "I"),
+)
+"""Name and array typecode of the recorded columns"""
+
+STRING_COLUMNS = ("request_type", "name", "exception", "context")
+
+_chunk_header = struct.Struct("<4sII")  # magic, length of JSON header, length of column data
+
+
+class RequestRecorder:
+    """
+    Records the requests of an :class:`Environment <locust.env.Environment>`. Use
+    :meth:`Environment.create_request_recorder() <locust.env.Environment.create_request_recorder>` to create one.
+
+    If path is None (which is the case on workers) the chunks are sent to the master along with the stats reports,
+    otherwise they are written to path, along with the chunks received from the workers.
+    """
+
+    def __init__(self, environment, path=None, node="local", chunk_size=CHUNK_SIZE):
+        self.environment = environment
+        self.path = path
+        self.node = node
+        self.chunk_size = chunk_size
+        self.pending_chunks = []
+        """Chunks waiting to be sent to the master"""
+        self._file = open(path, "wb") if path else None
+        self._reset_buffers()
+
+        events = environment.events
+        events.request.add_listener(self.on_request)
+        events.report_to_master.add_listener(self.on_report_to_master)
+        events.worker_report.add_listener(self.on_worker_report)
+        events.quitting.add_listener(self.on_quitting)
+
+    def _reset_buffers(self):
+        self._columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self._strings = {None: 0}
+        self._start_time = self._columns["start_time"].append
+        self._response_time = self._columns["response_time"].append
+        self._response_length = self._columns["response_length"].append
+        self._request_type = self._columns["request_type"].append
+        self._name = self._columns["name"].append
+        self._exception = self._columns["exception"].append
+        self._context = self._columns["context"].append
+
+    def _string_id(self, value):
+        strings = self._strings
+        string_id = strings.get(value)
+        if string_id is None:
+            string_id = strings[value] = len(strings)
+        return string_id
+
+    @property
+    def buffered_requests(self):
+        """Number of requests that have been recorded but not yet written or sent"""
+        return len(self._columns["start_time"])
+
+    def on_request(
+        self,
+        request_type,
+        name,
+        response_time,
+        response_length,
+        exception=None,
+        context=None,
+        start_time=None,
+        **_kwargs,
+    ):
+        if start_time is None:
+            start_time = time.time() - (response_time or 0) / 1000
+        self._start_time(start_time)
+        self._response_time(float("nan") if response_time is None else response_time)
+        self._response_length(response_length or 0)
+        self._request_type(self._string_id(request_type))
+        self._name(self._string_id(name))
+        self._exception(self._string_id(repr(exception)) if exception else 0)
+        self._context(self._string_id(json.dumps(context, sort_keys=True, default=repr)) if context else 0)
+        if len(self._columns["start_time"]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered requests to the file as a chunk (or queue them to be sent to the master)
+        """
+        if self.buffered_requests == 0:
+            return
+        chunk = encode_chunk(self.node, self._columns, list(self._strings))
+        self._reset_buffers()
+        self.write_chunk(chunk)
+
+    def write_chunk(self, chunk):
+        if self._file is not None:
+            reporter_io.write(self._file, chunk)
+        else:
+            self.pending_chunks.append(chunk)
+
+    def on_report_to_master(self, client_id, data):
+        self.flush()
+        data["request_records"] = self.pending_chunks
+        self.pending_chunks = []
+
+    def on_worker_report(self, client_id, data):
+        for chunk in data.get("request_records", []):
+            self.write_chunk(chunk)
+
+    def on_quitting(self, environment, **_kwargs):
+        self.close()
+
+    def close(self):
+        self.flush()
+        if self._file is not None and not self._file.closed:
+            reporter_io.call(self._file.close)
+
+
+def encode_chunk(node, columns, strings):
+    """
+    Encode a chunk. columns is a dict of column name to array, and strings is the list of strings referenced by
+    the string columns.
+    """
+    header = json.dumps(
+        {
+            "node": node,
+            "rows": len(columns["start_time"]),
+            "byteorder": sys.byteorder,
+            "columns": [[name, typecode, columns[name].itemsize] for name, typecode in COLUMNS],
+            "strings": strings,
+        }
+    ).encode()
+    body = b"".join(columns[name].tobytes() for name, _ in COLUMNS)
+    return _chunk_header.pack(MAGIC, len(header), len(body)) + header + body
+
+
+def decode_chunk(data, offset=0):
+    """
+    Decode the chunk at offset in data. Returns a tuple of the chunk (see :func:`read_recording`) and the offset of
+    the next chunk.
+    """
+    magic, header_length, body_length = _chunk_header.unpack_from(data, offset)
+    if magic != MAGIC:
+        raise ValueError("Not a request recording chunk at offset %i" % offset)
+    offset += _chunk_header.size
+    header = json.loads(bytes(data[offset : offset + header_length]))
+    offset += header_length
+    strings = header["strings"]
+    chunk = {"node": header["node"]}
+    for name, typecode, itemsize in header["columns"]:
+        column = array(typecode)
+        if column.itemsize != itemsize:
+            raise ValueError("Column %s was recorded with an item size of %i" % (name, itemsize))
+        size = header["rows"] * itemsize
+        column.frombytes(data[offset : offset + size])
+        offset += size
+        if header["byteorder"] != sys.byteorder:
+            column.byteswap()
+        chunk[name] = [strings[i] for i in column] if name in STRING_COLUMNS else column
+    return chunk, offset
+
+
+def read_recording(path):
+    """
+    Read a recording created by :class:`RequestRecorder`. Yields one dict per chunk, with the node (worker id, or
+    "local") that recorded it, and the columns. The numeric columns (start_time, response_time and
+    response_length) are :py:class:`array.array` instances, and the string columns (request_type, name, exception
+    and context) are lists. exception and context are None for requests without an exception or context.
+    """
+    with open(path, "rb") as f:
+        while True:
+            prefix = f.read(_chunk_header.size)
+            if not prefix:
+                return
+            _, header_length, body_length = _chunk_header.unpack(prefix)
+            chunk, _ = decode_chunk(prefix + f.read(header_length + body_length))
+            yield chunk
@@ -0,0 +1,174 @@
+"""
+Runs the blocking file I/O of the built-in reporters (the CSV files with ``--csv-atomic``, the request recording, the
+stats history spill file, the log file and the HTML report) in a background thread, so that a slow disk doesn't stall
+the user greenlets and distort the response times that they measure.
+
+All the I/O is done by a single thread, so the writes to a file happen in the order they were submitted in. The
+number of writes that are waiting and their age are available from :meth:`ReporterIO.stats` (and as Prometheus
+metrics, see :mod:`locust.metrics`), and a warning is logged when the writes fall behind.
+"""
+import logging
+import os
+import time
+from collections import deque
+
+import gevent
+from gevent import monkey
+from gevent.event import AsyncResult
+from gevent.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+_get_ident = monkey.get_original("_thread", "get_ident")
+
+WRITE_LAG_WARNING_SEC = 5.0
+"""Log a warning if the oldest pending write has been waiting for more than this many seconds"""
+
+WARNING_INTERVAL_SEC = 60.0
+"""Minimum number of seconds between two warnings about writes falling behind"""
+
+
+def _write(file, data):
+    file.write(data)
+    file.flush()
+
+
+def _capture(func, args):
+    # runs in the background thread, and returns the exception instead of letting gevent's hub report it
+    try:
+        return True, func(*args)
+    except Exception as e:
+        return False, e
+
+
+class ReporterIO:
+    """
+    Executor for the I/O of the reporters. Use the shared :data:`reporter_io` instance.
+
+    Submitting never blocks: the tasks are queued, and a single greenlet hands them to the thread one by one. It must
+    be created in the thread that runs the gevent loop (the shared instance is created when this module is imported).
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._pid = None
+        self._hub_thread_ident = gevent.get_hub().thread_ident
+        self._reset()
+
+    def _reset(self):
+        self._queue = deque()
+        self._greenlet = None
+        self._last_warning = 0.0
+        self.pending_bytes = 0
+        """Number of bytes that have been submitted but not yet written"""
+        self.max_pending = 0
+        """Highest number of pending writes"""
+        self.completed = 0
+        """Number of completed writes"""
+        self.failed = 0
+        """Number of writes that raised an exception"""
+
+    @property
+    def pending(self):
+        """Number of writes that have been submitted but haven't finished yet"""
+        return len(self._queue)
+
+    def _in_loop_thread(self):
+        if _get_ident() != self._hub_thread_ident:
+            return False
+        if self._pool is None or self._pid != os.getpid():
+            # (re)create the thread after a fork, since it doesn't exist in the child process
+            self._reset()
+            self._pool = ThreadPool(1)
+            self._pid = os.getpid()
+        return True
+
+    def submit(self, func, *args, size=0):
+        """
+        Queue func(\\*args) to be run in the background thread, and return an AsyncResult for it. *size* is the
+        number of bytes that will be written (used for the metrics).
+
+        If it's called from another thread than the one running the gevent loop (e.g. when something is logged by
+        the background thread), func is called directly and None is returned.
+        """
+        if not self._in_loop_thread():
+            func(*args)
+            return None
+        now = time.monotonic()
+        self._check_lag(now)
+        result = AsyncResult()
+        self._queue.append((func, args, size, now, result))
+        self.pending_bytes += size
+        self.max_pending = max(self.max_pending, len(self._queue))
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+        return result
+
+    def _run(self):
+        while self._queue:
+            func, args, size, _, result = self._queue[0]
+            try:
+                ok, value = self._pool.apply(_capture, (func, args))
+            finally:
+                self._queue.popleft()
+                self.pending_bytes -= size
+            if ok:
+                self.completed += 1
+                result.set(value)
+            else:
+                self.failed += 1
+                logger.error("Reporter I/O failed: %r", value)
+                result.set_exception(value)
+
+    def _check_lag(self, now):
+        lag = self.write_lag(now)
+        if lag > WRITE_LAG_WARNING_SEC and now - self._last_warning > WARNING_INTERVAL_SEC:
+            self._last_warning = now
+            logger.warning(
+                "Writing reports to disk is falling behind: %d writes (%d bytes) pending, the oldest for %.1fs",
+                self.pending,
+                self.pending_bytes,
+                lag,
+            )
+
+    def write_lag(self, now=None):
+        """
+        Number of seconds that the oldest pending write has been waiting for
+        """
+        if not self._queue:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self._queue[0][3]
+
+    def write(self, file, data):
+        """
+        Write *data* to *file* (and flush it) in the background thread
+        """
+        return self.submit(_write, file, data, size=len(data))
+
+    def call(self, func, *args, timeout=None):
+        """
+        Run func(\\*args) in the background thread, after everything that has already been submitted, and return
+        its result. Only the calling greenlet waits for it. If *timeout* is given, ``gevent.Timeout`` is raised
+        when the result isn't ready after that many seconds (func still runs when its turn comes).
+        """
+        if not self._in_loop_thread():
+            return func(*args)
+        return self.submit(func, *args).get(timeout=timeout)
+
+    def stats(self):
+        """
+        Returns a dict with the number of pending writes and bytes, the age of the oldest pending write in seconds,
+        the highest number of pending writes, and the number of completed and failed writes
+        """
+        return {
+            "pending_writes": self.pending,
+            "pending_bytes": self.pending_bytes,
+            "write_lag": self.write_lag(),
+            "max_pending_writes": self.max_pending,
+            "completed_writes": self.completed,
+            "failed_writes": self.failed,
+        }
+
+
+reporter_io = ReporterIO()
+"""The executor used by all built-in reporters"""
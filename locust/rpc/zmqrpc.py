@@ -6,6 +6,16 @@ import zmq.error as zmqerr
 import msgpack.exceptions as msgerr
 
 
+def endpoint(host, port):
+    """
+    Return the zmq endpoint to bind/connect to. Hosts that are already ipc endpoints (e.g. ipc:///tmp/locust.ipc),
+    which are used to communicate between processes on the same machine, are returned as is and the port is ignored.
+    """
+    if host.startswith("ipc://"):
+        return host
+    return "tcp://%s:%i" % (host, port)
+
+
 class BaseSocket:
     def __init__(self, sock_type):
         context = zmq.Context()
@@ -56,11 +66,11 @@ class BaseSocket:
 class Server(BaseSocket):
     def __init__(self, host, port):
         BaseSocket.__init__(self, zmq.ROUTER)
-        if port == 0:
+        if port == 0 and not host.startswith("ipc://"):
             self.port = self.socket.bind_to_random_port("tcp://%s" % host)
         else:
             try:
-                self.socket.bind("tcp://%s:%i" % (host, port))
+                self.socket.bind(endpoint(host, port))
                 self.port = port
             except zmqerr.ZMQError as e:
                 raise RPCError("Socket bind failure: %s" % (e))
@@ -70,4 +80,4 @@ class Client(BaseSocket):
     def __init__(self, host, port, identity):
         BaseSocket.__init__(self, zmq.DEALER)
         self.socket.setsockopt(zmq.IDENTITY, identity.encode())
-        self.socket.connect("tcp://%s:%i" % (host, port))
+        self.socket.connect(endpoint(host, port))
@@ -27,6 +27,7 @@ import gevent
 import greenlet
 import psutil
 from gevent.pool import Group
+from gevent.queue import JoinableQueue
 
 from . import User
 from locust import __version__
@@ -41,6 +42,9 @@ from .stats import (
     RequestStats,
     setup_distributed_stats_event_listeners,
 )
+from .user.wait_time import get_expected_interval
+from .stats_codec import STATS_CODEC, StatsDecoder, StatsEncoder
+from .stats_shm import StatsRingReader, StatsRingWriter
 from . import argument_parser
 
 logger = logging.getLogger(__name__)
@@ -58,8 +62,11 @@ STATE_INIT, STATE_SPAWNING, STATE_RUNNING, STATE_CLEANUP, STATE_STOPPING, STATE_
 WORKER_REPORT_INTERVAL = 3.0
 CPU_MONITOR_INTERVAL = 5.0
 HEARTBEAT_INTERVAL = 1
+REQUEST_BATCH_INTERVAL = 0.1
 HEARTBEAT_LIVENESS = 3
 FALLBACK_INTERVAL = 5
+STATS_QUEUE_SIZE = 100
+STATS_QUIT_TIMEOUT = 5
 
 
 greenlet_exception_handler = greenlet_exception_logger(logger)
@@ -106,18 +113,34 @@ class Runner:
 
         # set up event listeners for recording requests
         def on_request_success(request_type, name, response_time, response_length, **_kwargs):
-            self.stats.log_request(request_type, name, response_time, response_length)
+            expected_interval = self._expected_interval() if self.stats.correct_coordinated_omission else None
+            self.stats.log_request(request_type, name, response_time, response_length, expected_interval)
 
         def on_request_failure(request_type, name, response_time, response_length, exception, **_kwargs):
-            self.stats.log_request(request_type, name, response_time, response_length)
+            expected_interval = self._expected_interval() if self.stats.correct_coordinated_omission else None
+            self.stats.log_request(request_type, name, response_time, response_length, expected_interval)
             self.stats.log_error(request_type, name, exception)
 
-        # temporarily set log level to ignore warnings to suppress deprication message
-        loglevel = logging.getLogger().level
-        logging.getLogger().setLevel(logging.ERROR)
-        self.environment.events.request_success.add_listener(on_request_success)
-        self.environment.events.request_failure.add_listener(on_request_failure)
-        logging.getLogger().setLevel(loglevel)
+        def on_request_batch(
+            request_types, names, response_times, response_lengths, exceptions, expected_intervals=None, **_kwargs
+        ):
+            self.stats.log_request_batch(
+                request_types, names, response_times, response_lengths, exceptions, expected_intervals
+            )
+
+        if self.environment.events.request.batching:
+            # the stats are updated once per batch, rather than for every request
+            self.environment.events.request_batch.add_listener(on_request_batch)
+            if self.stats.correct_coordinated_omission:
+                self.environment.events.request.expected_interval = self._expected_interval
+            self.greenlet.spawn(self.request_batch_flusher).link_exception(greenlet_exception_handler)
+        else:
+            # temporarily set log level to ignore warnings to suppress deprication message
+            loglevel = logging.getLogger().level
+            logging.getLogger().setLevel(logging.ERROR)
+            self.environment.events.request_success.add_listener(on_request_success)
+            self.environment.events.request_failure.add_listener(on_request_failure)
+            logging.getLogger().setLevel(loglevel)
 
         self.connection_broken = False
 
@@ -399,8 +422,12 @@ class Runner:
             elif self.shape_last_state == new_state:
                 gevent.sleep(1)
             else:
-                user_count, spawn_rate = new_state
+                user_count, spawn_rate = new_state[:2]
                 logger.info("Shape test updating to %d users at %.2f spawn rate" % (user_count, spawn_rate))
+                if len(new_state) > 2 and self.environment.arrival_executor is not None:
+                    arrival_rate = new_state[2]
+                    logger.info("Shape test updating to an arrival rate of %.2f iterations/s" % arrival_rate)
+                    self.environment.arrival_executor.set_rate(arrival_rate, self.environment.arrival_executor.ramp)
                 # TODO: This `self.start()` call is blocking until the ramp-up is completed. This can leads
                 #       to unexpected behaviours such as the one in the following example:
                 #       A load test shape has the following stages:
@@ -439,12 +466,36 @@ class Runner:
             self.shape_last_state = None
 
         self.stop_users(self.user_classes_count)
+        self.environment.events.request.flush()
 
         self.update_state(STATE_STOPPED)
 
         self.cpu_log_warning()
         self.environment.events.test_stop.fire(environment=self.environment)
 
+    def _expected_interval(self):
+        """
+        The number of seconds between the tasks of the user running in the current greenlet, if the user follows a
+        fixed schedule (see :func:`get_expected_interval <locust.user.wait_time.get_expected_interval>`). Used to
+        correct the response times for coordinated omission.
+        """
+        if self.environment.arrival_executor is not None:
+            # the arrival rate executor starts the tasks on time, so there's nothing to correct
+            return None
+        args = getattr(gevent.getcurrent(), "args", None)
+        if args and isinstance(args[0], User):
+            return get_expected_interval(args[0])
+        return None
+
+    def request_batch_flusher(self):
+        """
+        Regularly hand the requests that have been collected when request batching is enabled over to the
+        request_batch listeners (see :class:`RequestEventHook <locust.event.RequestEventHook>`)
+        """
+        while True:
+            gevent.sleep(REQUEST_BATCH_INTERVAL)
+            self.environment.events.request.flush()
+
     def quit(self):
         """
         Stop any running load test and kill all greenlets for the runner
@@ -528,6 +579,14 @@ class DistributedRunner(Runner):
         self._local_worker_node = None
         setup_distributed_stats_event_listeners(self.environment.events, self.stats)
 
+    def _start_request_recorder(self, parsed_options):
+        """
+        Used by workers and relays, which are told to record the requests (and send them on to the master) through
+        the options in the spawn message
+        """
+        if parsed_options.get("record_requests") and self.environment.request_recorder is None:
+            self.environment.create_request_recorder(node=self.client_id)
+
 
 class WorkerNode:
     def __init__(self, id: str, state=STATE_INIT, heartbeat_liveness=HEARTBEAT_LIVENESS):
@@ -539,6 +598,10 @@ class WorkerNode:
         self.memory_usage = 0
         # The reported users running on the worker
         self.user_classes_count: Dict[str, int] = {}
+        # The share of the users that the node gets when they are dispatched. Relays report the number of
+        # workers connected to them, so that they get as many users as they would if their workers were
+        # connected directly to the master.
+        self.weight = 1
 
     @property
     def user_count(self) -> int:
@@ -612,6 +675,10 @@ class MasterRunner(DistributedRunner):
         self.spawning_completed = False
 
         self.clients = WorkerNodes()
+        # decoders for the workers that send their stats using the compact encoding (see locust.stats_codec)
+        self._stats_decoders: Dict[str, StatsDecoder] = {}
+        # ring buffers of the workers that send their stats through shared memory (see locust.stats_shm)
+        self._stats_rings: Dict[str, StatsRingReader] = {}
         try:
             self.server = rpc.Server(master_bind_host, master_bind_port)
         except RPCError as e:
@@ -627,9 +694,14 @@ class MasterRunner(DistributedRunner):
                 raise
 
         self._users_dispatcher: Union[UsersDispatcher, None] = None
+        # stats reports from the workers that are waiting to be merged by the stats_aggregator greenlet. It is
+        # bounded, so that if the master can't keep up, client_listener stops reading messages from the workers
+        # rather than piling up reports in memory
+        self._stats_queue = JoinableQueue(STATS_QUEUE_SIZE)
 
         self.greenlet.spawn(self.heartbeat_worker).link_exception(greenlet_exception_handler)
         self.greenlet.spawn(self.client_listener).link_exception(greenlet_exception_handler)
+        self.greenlet.spawn(self.stats_aggregator).link_exception(greenlet_exception_handler)
 
         # listener that gathers info on how many users the worker has spawned
         def on_worker_report(client_id, data):
@@ -707,6 +779,7 @@ class MasterRunner(DistributedRunner):
         try:
             for dispatched_users in self._users_dispatcher:
                 dispatch_greenlets = Group()
+                dispatched_user_count = sum(map(sum, map(methodcaller("values"), dispatched_users.values())))
                 for worker_node_id, worker_user_classes_count in dispatched_users.items():
                     data = {
                         "timestamp": time.time(),
@@ -717,6 +790,13 @@ class MasterRunner(DistributedRunner):
                         if self.environment.parsed_options
                         else {},
                     }
+                    if self.environment.arrival_executor is not None:
+                        _add_arrival_rate_share(
+                            data,
+                            self.environment.arrival_executor.target_rate,
+                            self.environment.arrival_executor.ramp,
+                            sum(worker_user_classes_count.values()) / (dispatched_user_count or 1),
+                        )
                     dispatch_greenlets.add(
                         gevent.spawn_later(
                             0,
@@ -724,7 +804,6 @@ class MasterRunner(DistributedRunner):
                             Message("spawn", data, worker_node_id),
                         )
                     )
-                dispatched_user_count = sum(map(sum, map(methodcaller("values"), dispatched_users.values())))
                 logger.debug(
                     "Sending spawn messages for %g total users to %i client(s)",
                     dispatched_user_count,
@@ -822,6 +901,7 @@ class MasterRunner(DistributedRunner):
             logger.debug("Sending quit message to client %s" % (client.id))
             self.server.send_to_client(Message("quit", None, client.id))
         gevent.sleep(0.5)  # wait for final stats report from all workers
+        self._stats_queue.join(timeout=STATS_QUIT_TIMEOUT)  # and for them to be merged
         self.server.close()
         # ensure heartbeat_worker doesnt try to re-establish connection to workers and throw lots of exceptions
         self.clients._worker_nodes = {}
@@ -884,20 +964,26 @@ class MasterRunner(DistributedRunner):
             self.connection_broken = False
             msg.node_id = client_id
             if msg.type == "client_ready":
-                if not msg.data:
+                worker_version = msg.data
+                weight = 1
+                if isinstance(worker_version, dict):
+                    # relays send their weight along with their version (see RelayRunner)
+                    worker_version, weight = worker_version["version"], worker_version["weight"]
+                if not worker_version:
                     logger.error(f"An old (pre 2.0) worker tried to connect ({client_id}). That's not going to work.")
                     continue
-                elif msg.data != __version__ and msg.data != -1:
-                    if msg.data[0:4] == __version__[0:4]:
+                elif worker_version != __version__ and worker_version != -1:
+                    if worker_version[0:4] == __version__[0:4]:
                         logger.debug(
-                            f"A worker ({client_id}) running a different patch version ({msg.data}) connected, master version is {__version__}"
+                            f"A worker ({client_id}) running a different patch version ({worker_version}) connected, master version is {__version__}"
                         )
                     else:
                         logger.warning(
-                            f"A worker ({client_id}) running a different version ({msg.data}) connected, master version is {__version__}"
+                            f"A worker ({client_id}) running a different version ({worker_version}) connected, master version is {__version__}"
                         )
                 worker_node_id = msg.node_id
                 self.clients[worker_node_id] = WorkerNode(worker_node_id, heartbeat_liveness=HEARTBEAT_LIVENESS)
+                self.clients[worker_node_id].weight = weight
                 if self._users_dispatcher is not None:
                     self._users_dispatcher.add_worker(worker_node=self.clients[worker_node_id])
                     if not self._users_dispatcher.dispatch_in_progress and self.state == STATE_RUNNING:
@@ -907,6 +993,7 @@ class MasterRunner(DistributedRunner):
                     "Client %r reported as ready. Currently %i clients ready to swarm."
                     % (worker_node_id, len(self.clients.ready + self.clients.running + self.clients.spawning))
                 )
+                self.environment.events.worker_connect.fire(client_id=worker_node_id)
                 if self.rebalancing_enabled() and self.state == STATE_RUNNING and self.spawning_completed:
                     self.start(self.target_user_count, self.spawn_rate)
                 # emit a warning if the worker's clock seem to be out of sync with our clock
@@ -936,6 +1023,8 @@ class MasterRunner(DistributedRunner):
                                 # TODO: Test this situation
                                 self.start(self.target_user_count, self.spawn_rate)
                     c.state = client_state
+                    if "stats_codecs" in msg.data:
+                        self._accept_stats_codec(msg.node_id, msg.data)
                     c.cpu_usage = msg.data["current_cpu_usage"]
                     if not c.cpu_warning_emitted and c.cpu_usage > 90:
                         self.worker_cpu_warning_emitted = True  # used to fail the test in the end
@@ -945,14 +1034,23 @@ class MasterRunner(DistributedRunner):
                         )
                     if "current_memory_usage" in msg.data:
                         c.memory_usage = msg.data["current_memory_usage"]
+                    if "weight" in msg.data and msg.data["weight"] != c.weight:
+                        logger.info("Weight of worker %s changed from %s to %s" % (c.id, c.weight, msg.data["weight"]))
+                        if self._users_dispatcher is not None:
+                            self._users_dispatcher.update_worker_weight(c, msg.data["weight"])
+                            if not self._users_dispatcher.dispatch_in_progress and self.state == STATE_RUNNING:
+                                self.start(self.target_user_count, self.spawn_rate)
+                        else:
+                            c.weight = msg.data["weight"]
             elif msg.type == "stats":
-                self.environment.events.worker_report.fire(client_id=msg.node_id, data=msg.data)
+                self._queue_stats_report(msg.node_id, msg.data)
             elif msg.type == "spawning":
                 self.clients[msg.node_id].state = STATE_SPAWNING
             elif msg.type == "spawning_complete":
                 self.clients[msg.node_id].state = STATE_RUNNING
                 self.clients[msg.node_id].user_classes_count = msg.data["user_classes_count"]
             elif msg.type == "quit":
+                self._queue_stats_report(msg.node_id, None)
                 if msg.node_id in self.clients:
                     client = self.clients[msg.node_id]
                     del self.clients[msg.node_id]
@@ -975,10 +1073,130 @@ class MasterRunner(DistributedRunner):
                 logger.debug(f"Recieved {msg.type} message from worker {msg.node_id}")
                 self.custom_messages[msg.type](environment=self.environment, msg=msg)
             else:
-                logger.warning(f"Unknown message type recieved from worker {msg.node_id}: {msg.type}")
+                self._handle_unknown_message(msg)
 
             self.check_stopped()
 
+    def _handle_unknown_message(self, msg):
+        logger.warning(f"Unknown message type recieved from worker {msg.node_id}: {msg.type}")
+
+    def stats_aggregator(self):
+        """
+        Merges the stats reports from the workers. This is done in a separate greenlet, rather than in
+        client_listener, so that heartbeats and other messages from the workers don't have to wait for
+        large reports to be merged.
+        """
+        while True:
+            client_id, data = self._stats_queue.get()
+            try:
+                self._merge_stats_report(client_id, data)
+            finally:
+                self._stats_queue.task_done()
+
+    def _merge_stats_report(self, client_id, data):
+        if data is None:
+            # the worker has quit
+            self._release_stats_transport(client_id)
+            return
+        if "stats_shm" in data and not self._read_stats_ring(client_id, data):
+            return
+        if ("stats_delta" in data or "stats_flat" in data) and not self._decode_stats(client_id, data):
+            return
+        self.environment.events.worker_report.fire(client_id=client_id, data=data)
+
+    def _queue_stats_report(self, client_id, data):
+        """
+        Queue a stats report from a worker for stats_aggregator, or None when the worker has quit: its decoder
+        and ring buffer are released only after its final report has been merged.
+        Waits if stats_aggregator is STATS_QUEUE_SIZE reports behind.
+        """
+        if self._stats_queue.full():
+            logger.warning(
+                "The master is %i stats reports behind, it will wait for them to be merged before handling more "
+                "messages from the workers" % self._stats_queue.qsize()
+            )
+        self._stats_queue.put((client_id, data))
+
+    def _release_stats_transport(self, client_id):
+        """
+        Forget the decoder and close the ring buffer of a worker that has quit
+        """
+        self._stats_decoders.pop(client_id, None)
+        ring = self._stats_rings.pop(client_id, None)
+        if ring is not None:
+            ring.close()
+
+    def _accept_stats_codec(self, client_id, data):
+        """
+        Tell a worker that advertised the compact stats encoding (see locust.stats_codec) in its heartbeat that
+        we support it too, and that we can read its shared memory ring buffer (see locust.stats_shm) if it has one
+        """
+        if STATS_CODEC not in data["stats_codecs"]:
+            return
+        self._stats_decoders.setdefault(client_id, StatsDecoder())
+        self.server.send_to_client(Message("stats_codec", STATS_CODEC, client_id))
+        stats_shm = data.get("stats_shm")
+        if stats_shm and self._open_stats_ring(client_id, stats_shm["path"], stats_shm["token"]):
+            self.server.send_to_client(Message("stats_shm", None, client_id))
+
+    def _open_stats_ring(self, client_id, path, token):
+        """
+        Open the shared memory ring buffer of a worker (unless it is already open). Returns False if it couldn't
+        be opened, which is expected if the worker is running on another machine.
+        """
+        ring = self._stats_rings.get(client_id)
+        if ring is not None and ring.path == path:
+            return True
+        try:
+            self._stats_rings[client_id] = StatsRingReader(path, token)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Worker {client_id} will send its stats over zmq, couldn't open {path}: {e}")
+            return False
+        if ring is not None:
+            ring.close()
+        return True
+
+    def _read_stats_ring(self, client_id, data):
+        """
+        Read the stats of a report (in the flat layout, see StatsEncoder.encode_flat) from the shared memory ring
+        buffer of the worker into the "stats_flat" key, where _decode_stats expects them. Returns False if they
+        couldn't be read.
+        """
+        ring = self._stats_rings.get(client_id)
+        position = data.pop("stats_shm")
+        try:
+            if ring is None:
+                raise ValueError("No stats ring buffer open")
+            data["stats_flat"] = ring.read(position)
+        except ValueError as e:
+            logger.warning(f"Discarded stats report from worker {client_id}: {e}")
+            return False
+        return True
+
+    def _decode_stats(self, client_id, data):
+        """
+        Decode a stats report sent using the compact encoding into the same "stats" and "stats_total" keys
+        that uncompressed reports use (but with StatsEntry instances rather than dicts).
+        Returns False if the report couldn't be decoded.
+        """
+        decoder = self._stats_decoders.setdefault(client_id, StatsDecoder())
+        try:
+            if "stats_flat" in data:
+                data["stats_total"], data["stats"] = decoder.decode_flat(
+                    data.pop("stats_names"), data.pop("stats_flat")
+                )
+            else:
+                data["stats_total"], data["stats"] = decoder.decode(data.pop("stats_names"), data.pop("stats_delta"))
+        except ValueError as e:
+            logger.warning(f"Discarded stats report from worker {client_id}: {e}")
+            return False
+        if decoder.unknown_ids:
+            # we don't know the names of some of the entries (e.g. because a message was lost when the worker
+            # reconnected). The decoder keeps their stats until we do, so we ask the worker to send the names again
+            logger.debug(f"Worker {client_id} reported entries with unknown ids {sorted(decoder.unknown_ids)}")
+            self.server.send_to_client(Message("stats_codec", STATS_CODEC, client_id))
+        return True
+
     @property
     def worker_count(self):
         return len(self.clients.ready) + len(self.clients.spawning) + len(self.clients.running)
@@ -1031,6 +1249,14 @@ class WorkerRunner(DistributedRunner):
         self.master_port = master_port
         self.worker_cpu_warning_emitted = False
         self._users_dispatcher = None
+        # set when the master has agreed to receive stats using the compact encoding (see locust.stats_codec)
+        self._stats_encoder: Union[StatsEncoder, None] = None
+        # set when the worker is started with --shared-memory-stats (see locust.stats_shm)
+        self._stats_ring: Union[StatsRingWriter, None] = None
+        if getattr(environment.parsed_options, "shared_memory_stats", False):
+            self._stats_ring = StatsRingWriter()
+        # set when the master has confirmed that it can read the ring buffer
+        self._stats_ring_enabled = False
         self.client = rpc.Client(master_host, master_port, self.client_id)
         self.greenlet.spawn(self.heartbeat).link_exception(greenlet_exception_handler)
         self.greenlet.spawn(self.worker).link_exception(greenlet_exception_handler)
@@ -1122,6 +1348,7 @@ class WorkerRunner(DistributedRunner):
                             "state": self.worker_state,
                             "current_cpu_usage": self.current_cpu_usage,
                             "current_memory_usage": self.current_memory_usage,
+                            **self._stats_capabilities(),
                         },
                         self.client_id,
                     )
@@ -1136,6 +1363,9 @@ class WorkerRunner(DistributedRunner):
         try:
             self.client.close()
             self.client = rpc.Client(self.master_host, self.master_port, self.client_id)
+            if self._stats_encoder is not None:
+                self._stats_encoder.reset()
+            self._stats_ring_enabled = False
         except RPCError as e:
             logger.error("Temporary failure when resetting connection: %s, will retry later." % (e))
 
@@ -1171,6 +1401,19 @@ class WorkerRunner(DistributedRunner):
                     or k in ["expect_workers", "tags", "exclude_tags"]
                 }
                 vars(self.environment.parsed_options).update(custom_args_from_master)
+                self._start_request_recorder(job["parsed_options"])
+                if job["parsed_options"].get("correct_coordinated_omission"):
+                    # takes effect for the entries created (or reset) from now on, which includes all of them once
+                    # the stats have been reported
+                    self.stats.correct_coordinated_omission = True
+                    if self.environment.events.request.batching:
+                        self.environment.events.request.expected_interval = self._expected_interval
+                if job["parsed_options"].get("profile") and self.environment.profiler is None:
+                    self.environment.create_profiler()
+                if "arrival_rate" in job:
+                    if self.environment.arrival_executor is None:
+                        self.environment.create_arrival_executor()
+                    self.environment.arrival_executor.set_rate(job["arrival_rate"], job["arrival_rate_ramp"])
 
                 if self.spawning_greenlet:
                     # kill existing spawning greenlet before we launch new one
@@ -1187,6 +1430,14 @@ class WorkerRunner(DistributedRunner):
                 gevent.sleep((self.environment.stop_timeout or 0) + additional_wait)
                 self.client.send(Message("client_ready", __version__, self.client_id))
                 self.worker_state = STATE_INIT
+            elif msg.type == "stats_codec":
+                if msg.data == STATS_CODEC:
+                    if self._stats_encoder is None:
+                        self._stats_encoder = StatsEncoder()
+                    else:
+                        self._stats_encoder.reset()
+            elif msg.type == "stats_shm":
+                self._stats_ring_enabled = self._stats_ring is not None
             elif msg.type == "quit":
                 logger.info("Got quit message from master, shutting down...")
                 self.stop()
@@ -1216,12 +1467,347 @@ class WorkerRunner(DistributedRunner):
         logger.debug(f"Sending {msg_type} message to master")
         self.client.send(Message(msg_type, data, self.client_id))
 
+    def quit(self):
+        super().quit()
+        if self._stats_ring is not None:
+            self._stats_ring_enabled = False
+            self._stats_ring.close()
+            self._stats_ring = None
+
+    def _stats_capabilities(self):
+        """
+        The stats encodings (and shared memory ring buffer) that we support, which are sent in the heartbeats until
+        the master confirms them. Masters that don't support them ignore the extra keys of the heartbeats, whereas
+        they expect the data of client_ready to be the version.
+        """
+        if self._stats_encoder is not None:
+            return {}
+        data = {"stats_codecs": [STATS_CODEC]}
+        if self._stats_ring is not None:
+            data["stats_shm"] = {"path": self._stats_ring.path, "token": self._stats_ring.token}
+        return data
+
+    def _send_stats(self):
+        self.environment.events.request.flush()
+        data = {}
+        if self._stats_encoder is not None and self._stats_ring_enabled:
+            data["stats_names"], payload = self._stats_encoder.encode_flat(self.stats)
+            position = self._stats_ring.write(payload)
+            if position is None:
+                # the ring buffer is full, so the stats are sent over zmq, in the same layout
+                data["stats_flat"] = payload
+            else:
+                data["stats_shm"] = position
+        elif self._stats_encoder is not None:
+            data["stats_names"], data["stats_delta"] = self._stats_encoder.encode(self.stats)
+        self.environment.events.report_to_master.fire(client_id=self.client_id, data=data)
+        self.client.send(Message("stats", data, self.client_id))
+
+
+class RelayRunner(MasterRunner):
+    """
+    Runner used to spread a large number of workers over several processes.
+
+    RelayRunner connects to a :class:`MasterRunner` just like a :class:`WorkerRunner` does, and accepts
+    connections from its own :class:`WorkerRunners <WorkerRunner>` just like a master does. The users that the
+    master dispatches to the relay are split among the relay's workers, and the stats reports from the workers
+    are merged into a single report that is forwarded to the master. The relay reports the number of workers
+    connected to it as its weight (in its client_ready messages and its heartbeats), so the master gives it as
+    many users as it would give those workers.
+
+    Events such as test_start and test_stop are not fired on relays.
+    """
+
+    def __init__(self, environment, master_host, master_port, relay_bind_host, relay_bind_port):
+        """
+        :param environment: Environment instance
+        :param master_host: Host/IP to use for connection to the master
+        :param master_port: Port to use for connecting to the master
+        :param relay_bind_host: Host/interface to use for incoming worker connections
+        :param relay_bind_port: Port to use for incoming worker connections
+        """
+        super().__init__(environment, relay_bind_host, relay_bind_port)
+        self.relay_state = STATE_INIT
+        self.client_id = socket.gethostname() + "_" + uuid4().hex
+        self.master_host = master_host
+        self.master_port = master_port
+        self._stats_encoder: Union[StatsEncoder, None] = None
+        # the last spawn message received from the master, and how its users were split among our workers
+        self._job: Union[dict, None] = None
+        self._users_on_workers: Dict[str, Dict[str, int]] = {}
+        self.client = rpc.Client(master_host, master_port, self.client_id)
+        self.greenlet.spawn(self.upstream_heartbeat).link_exception(greenlet_exception_handler)
+        self.greenlet.spawn(self.upstream_listener).link_exception(greenlet_exception_handler)
+        self.client.send(Message("client_ready", self._client_ready_data(), self.client_id))
+        self.greenlet.spawn(self.stats_reporter).link_exception(greenlet_exception_handler)
+
+        # register listener that adds the number of users running on our workers to the report sent to the master
+        def on_report_to_master(client_id, data):
+            data["user_classes_count"] = dict(self.reported_user_classes_count)
+            data["user_count"] = self.user_count
+
+        self.environment.events.report_to_master.add_listener(on_report_to_master)
+
+        # register listener that sends quit message to master
+        def on_quitting(environment, **kw):
+            self.client.send(Message("quit", None, self.client_id))
+
+        self.environment.events.quitting.add_listener(on_quitting)
+
+    def _stats_capabilities(self):
+        # see WorkerRunner._stats_capabilities
+        return {"stats_codecs": [STATS_CODEC]} if self._stats_encoder is None else {}
+
+    def start(self, user_count: int, spawn_rate: float, wait=False) -> None:
+        # the number of users is decided by the master, so all we can do is to redistribute them among our workers
+        self._dispatch_to_workers()
+
+    def stop(self, send_stop_to_client: bool = True):
+        self._job = None
+        self._users_on_workers = {}
+        if send_stop_to_client:
+            for client in self.clients.all:
+                logger.debug("Sending stop message to client %s" % client.id)
+                self.server.send_to_client(Message("stop", None, client.id))
+            timeout = gevent.Timeout((self.environment.stop_timeout or 0) + 60)
+            timeout.start()
+            try:
+                while self.user_count != 0:
+                    gevent.sleep(1)
+            except gevent.Timeout:
+                logger.error("Timeout waiting for all workers to stop")
+            finally:
+                timeout.cancel()
+        self.update_state(STATE_STOPPED)
+
+    def quit(self):
+        logger.debug("Quitting...")
+        self._job = None
+        for client in self.clients.all:
+            logger.debug("Sending quit message to client %s" % (client.id))
+            self.server.send_to_client(Message("quit", None, client.id))
+        gevent.sleep(0.5)  # wait for final stats report from all workers
+        self._stats_queue.join(timeout=STATS_QUIT_TIMEOUT)  # and for them to be merged
+        try:
+            self._send_stats()  # forward the final reports to the master
+        except RPCError as e:
+            logger.error("Failed to send the final stats report to master: %s" % e)
+        self.server.close()
+        self.clients._worker_nodes = {}
+        self.greenlet.kill(block=True)
+
+    def log_exception(self, node_id, msg, formatted_tb):
+        super().log_exception(node_id, msg, formatted_tb)
+        self.client.send(Message("exception", {"msg": msg, "traceback": formatted_tb}, self.client_id))
+
+    def _handle_unknown_message(self, msg):
+        # custom messages from the workers that we don't handle ourselves are meant for the master
+        self.client.send(Message(msg.type, msg.data, self.client_id))
+
+    def _dispatch_to_workers(self):
+        """
+        Split the users that the master has dispatched to us among our workers, and send spawn messages to
+        the workers whose users have changed
+        """
+        if self._job is None:
+            return
+        worker_ids = sorted(c.id for c in self.clients.ready + self.clients.spawning + self.clients.running)
+        if not worker_ids:
+            logger.warning("Can't spawn any users, because no workers are connected to this relay")
+            return
+        users_on_workers = _split_user_classes_count(
+            self._job["user_classes_count"], worker_ids, self._users_on_workers
+        )
+        user_count = sum(self._job["user_classes_count"].values())
+        for worker_id, user_classes_count in users_on_workers.items():
+            if self._users_on_workers.get(worker_id) == user_classes_count and "arrival_rate" not in self._job:
+                # (with an arrival rate, the rate may have changed even if the users haven't)
+                continue
+            data = dict(self._job, timestamp=time.time(), user_classes_count=user_classes_count)
+            if "arrival_rate" in self._job:
+                _add_arrival_rate_share(
+                    data,
+                    self._job["arrival_rate"],
+                    self._job["arrival_rate_ramp"],
+                    sum(user_classes_count.values()) / (user_count or 1),
+                )
+            self.server.send_to_client(Message("spawn", data, worker_id))
+        self._users_on_workers = users_on_workers
+
+    def _check_spawning_complete(self):
+        if self.relay_state != STATE_SPAWNING or set(self._users_on_workers) - set(self.clients):
+            return
+        for worker_id, user_classes_count in self._users_on_workers.items():
+            reported = self.clients[worker_id].user_classes_count
+            if any(reported.get(name, 0) != count for name, count in user_classes_count.items()):
+                return
+        self.client.send(
+            Message(
+                "spawning_complete",
+                {"user_classes_count": dict(self.reported_user_classes_count), "user_count": self.user_count},
+                self.client_id,
+            )
+        )
+        self.relay_state = STATE_RUNNING
+
+    def _client_ready_data(self):
+        """
+        Unlike workers, relays send their weight in their client_ready messages, so that the master doesn't
+        dispatch users to them as if they were a single worker until their next heartbeat
+        """
+        return {"version": __version__, "weight": self.worker_count}
+
+    def upstream_heartbeat(self):
+        while True:
+            try:
+                if self._job is not None and set(self._users_on_workers) != {
+                    c.id for c in self.clients.ready + self.clients.spawning + self.clients.running
+                }:
+                    # workers have connected or disconnected, so our users need to be redistributed
+                    self._dispatch_to_workers()
+                self._check_spawning_complete()
+                self.client.send(
+                    Message(
+                        "heartbeat",
+                        {
+                            "state": self.relay_state,
+                            "current_cpu_usage": self.current_cpu_usage,
+                            "current_memory_usage": self.current_memory_usage,
+                            "weight": self.worker_count,
+                            **self._stats_capabilities(),
+                        },
+                        self.client_id,
+                    )
+                )
+            except RPCError as e:
+                logger.error("RPCError found when sending heartbeat: %s" % (e))
+                self.reset_upstream_connection()
+            gevent.sleep(HEARTBEAT_INTERVAL)
+
+    def reset_upstream_connection(self):
+        logger.info("Reset connection to master")
+        try:
+            self.client.close()
+            self.client = rpc.Client(self.master_host, self.master_port, self.client_id)
+            if self._stats_encoder is not None:
+                self._stats_encoder.reset()
+        except RPCError as e:
+            logger.error("Temporary failure when resetting connection: %s, will retry later." % (e))
+
+    def upstream_listener(self):
+        last_received_spawn_timestamp = 0
+        while True:
+            try:
+                msg = self.client.recv()
+            except RPCError as e:
+                logger.error("RPCError found when receiving from master: %s" % (e))
+                continue
+            if msg.type == "spawn":
+                self.client.send(Message("spawning", None, self.client_id))
+                job = msg.data
+                if job["timestamp"] <= last_received_spawn_timestamp:
+                    logger.info(
+                        "Discard spawn message with older or equal timestamp than timestamp of previous spawn message"
+                    )
+                    continue
+                last_received_spawn_timestamp = job["timestamp"]
+                self.environment.host = job["host"]
+                self.environment.stop_timeout = job["stop_timeout"]
+                self._job = job
+                self._start_request_recorder(job["parsed_options"])
+                if "arrival_rate" in job and self.environment.arrival_executor is None:
+                    # the relay doesn't run any users, but it merges the dropped and late iterations of its workers
+                    self.environment.create_arrival_executor()
+                self.relay_state = STATE_SPAWNING
+                self.update_state(STATE_SPAWNING)
+                self._dispatch_to_workers()
+                self._check_spawning_complete()
+            elif msg.type == "stop":
+                self.stop()
+                self.client.send(Message("client_stopped", None, self.client_id))
+                self.client.send(Message("client_ready", self._client_ready_data(), self.client_id))
+                self.relay_state = STATE_INIT
+            elif msg.type == "stats_codec":
+                if msg.data == STATS_CODEC:
+                    if self._stats_encoder is None:
+                        self._stats_encoder = StatsEncoder()
+                    else:
+                        self._stats_encoder.reset()
+            elif msg.type == "quit":
+                logger.info("Got quit message from master, shutting down...")
+                self.quit()
+            elif msg.type in self.custom_messages:
+                logger.debug(f"Recieved {msg.type} message from master")
+                self.custom_messages[msg.type](environment=self.environment, msg=msg)
+            else:
+                # custom messages that we don't handle ourselves are meant for our workers
+                self.send_message(msg.type, msg.data)
+
+    def stats_reporter(self):
+        while True:
+            try:
+                self._send_stats()
+            except RPCError as e:
+                logger.error("Temporary connection lost to master server: %s, will retry later." % (e))
+            gevent.sleep(WORKER_REPORT_INTERVAL)
+
     def _send_stats(self):
         data = {}
+        if self._stats_encoder is not None:
+            data["stats_names"], data["stats_delta"] = self._stats_encoder.encode(self.stats)
         self.environment.events.report_to_master.fire(client_id=self.client_id, data=data)
         self.client.send(Message("stats", data, self.client_id))
 
 
+def _split_user_classes_count(
+    user_classes_count: Dict[str, int], worker_ids: List[str], previous: Dict[str, Dict[str, int]]
+) -> Dict[str, Dict[str, int]]:
+    """
+    Split the users among the workers so that every worker gets the same number of users (give or take one),
+    while moving as few users as possible compared to the previous split.
+    """
+    users_on_workers = {
+        worker_id: {name: previous.get(worker_id, {}).get(name, 0) for name in user_classes_count}
+        for worker_id in worker_ids
+    }
+    user_counts = {worker_id: sum(users.values()) for worker_id, users in users_on_workers.items()}
+    for name, count in sorted(user_classes_count.items()):
+        current = sum(users[name] for users in users_on_workers.values())
+        while current > count:
+            worker_id = max(worker_ids, key=lambda w: (users_on_workers[w][name], user_counts[w]))
+            users_on_workers[worker_id][name] -= 1
+            user_counts[worker_id] -= 1
+            current -= 1
+        while current < count:
+            worker_id = min(worker_ids, key=lambda w: (user_counts[w], users_on_workers[w][name]))
+            users_on_workers[worker_id][name] += 1
+            user_counts[worker_id] += 1
+            current += 1
+    # move users from the busiest to the least busy workers (e.g. when a new worker has connected)
+    while True:
+        busiest = max(worker_ids, key=lambda w: user_counts[w])
+        least_busy = min(worker_ids, key=lambda w: user_counts[w])
+        if user_counts[busiest] - user_counts[least_busy] <= 1:
+            break
+        name = max(
+            users_on_workers[busiest], key=lambda n: users_on_workers[busiest][n] - users_on_workers[least_busy][n]
+        )
+        users_on_workers[busiest][name] -= 1
+        users_on_workers[least_busy][name] += 1
+        user_counts[busiest] -= 1
+        user_counts[least_busy] += 1
+    return users_on_workers
+
+
+def _add_arrival_rate_share(data: dict, rate: float, ramp: Union[float, None], share: float) -> None:
+    """
+    Add the part of the arrival rate (and ramp) that a worker should run, given its share of the users, to the data
+    of a spawn message
+    """
+    data["arrival_rate"] = rate * share
+    data["arrival_rate_ramp"] = ramp * share if ramp else None
+
+
 def _format_user_classes_count_for_log(user_classes_count: Dict[str, int]) -> str:
     return "{} ({} total users)".format(
         json.dumps(dict(sorted(user_classes_count.items(), key=itemgetter(0)))),
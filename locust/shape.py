@@ -33,13 +33,17 @@ class LoadTestShape:
         """
         return self.runner.user_count
 
-    def tick(self) -> Optional[Tuple[int, float]]:
+    def tick(self) -> Optional[Tuple]:
         """
         Returns a tuple with 2 elements to control the running load test:
 
             user_count -- Total user count
             spawn_rate -- Number of users to start/stop per second when changing number of users
 
+        When running with an arrival rate (--arrival-rate), a third element can be added:
+
+            arrival_rate -- Number of task iterations to start per second
+
         If `None` is returned then the running load test will be stopped.
 
         """
@@ -244,73 +244,116 @@ const markerFlags = {
     stop: false,
 }
 
-function updateStats() {
-    $.get('./stats/requests', function (report) {
-        window.report = report;
-        try{
-            renderTable(report);
-            renderWorkerTable(report);
-
-            const time = new Date().toLocaleTimeString();
-
-            if (report.state === "stopped") {
-                if (markerFlags.stop) {
-                    markerFlags.stop = false;
-    
-                    // placeholders to show a skip in the lines between test runs
-                    stats_history["time"].push(time);
-                    stats_history["user_count"].push({"value": null});
-                    stats_history["current_rps"].push({"value": null});
-                    stats_history["current_fail_per_sec"].push({"value": null});
-                    stats_history["response_time_percentile_50"].push({"value": null});
-                    stats_history["response_time_percentile_95"].push({"value": null});
-                }
-
-                // update stats chart to ensure the stop spacing appears as part 
-                // of the update loop, otherwise we will "jump" 2 plots on the next run 
-                update_stats_charts();
-
-                appearStopped();
-                return;
+function handleReport(report) {
+    window.report = report;
+    try{
+        renderTable(report);
+        renderWorkerTable(report);
+
+        const time = new Date().toLocaleTimeString();
+
+        if (report.state === "stopped") {
+            if (markerFlags.stop) {
+                markerFlags.stop = false;
+
+                // placeholders to show a skip in the lines between test runs
+                stats_history["time"].push(time);
+                stats_history["user_count"].push({"value": null});
+                stats_history["current_rps"].push({"value": null});
+                stats_history["current_fail_per_sec"].push({"value": null});
+                stats_history["response_time_percentile_50"].push({"value": null});
+                stats_history["response_time_percentile_95"].push({"value": null});
             }
 
-            // add markers between test runs, based on a new run being started
-            if (stats_history["time"].length > 0 && markerFlags.start) {
-                markerFlags.start = false;
-
-                // mark the first run when we start the second run
-                if (stats_history["markers"].length === 0) {
-                    stats_history["markers"].push({xAxis: stats_history["time"][0]});
-                }
+            // update stats chart to ensure the stop spacing appears as part 
+            // of the update loop, otherwise we will "jump" 2 plots on the next run 
+            update_stats_charts();
 
-                stats_history["markers"].push({xAxis: time});
-            }
+            appearStopped();
+            return;
+        }
 
-            // get total stats row
-            var total = report.stats[report.stats.length-1];
+        // add markers between test runs, based on a new run being started
+        if (stats_history["time"].length > 0 && markerFlags.start) {
+            markerFlags.start = false;
 
-            // ignore stats without requests
-            if (total.num_requests < 1) {
-                return;
+            // mark the first run when we start the second run
+            if (stats_history["markers"].length === 0) {
+                stats_history["markers"].push({xAxis: stats_history["time"][0]});
             }
 
-            // update charts
-            stats_history["time"].push(time);
-            stats_history["user_count"].push({"value": report.user_count});
-            stats_history["current_rps"].push({"value": total.current_rps, "users": report.user_count});
-            stats_history["current_fail_per_sec"].push({"value": total.current_fail_per_sec, "users": report.user_count});
-            stats_history["response_time_percentile_50"].push({"value": report.current_response_time_percentile_50, "users": report.user_count});
-            stats_history["response_time_percentile_95"].push({"value": report.current_response_time_percentile_95, "users": report.user_count});
-            update_stats_charts();
+            stats_history["markers"].push({xAxis: time});
+        }
+
+        // get total stats row
+        var total = report.stats[report.stats.length-1];
 
-        } catch(i){
-            console.debug(i);
+        // ignore stats without requests
+        if (total.num_requests < 1) {
+            return;
         }
-    }).always(function() {
+
+        // update charts
+        stats_history["time"].push(time);
+        stats_history["user_count"].push({"value": report.user_count});
+        stats_history["current_rps"].push({"value": total.current_rps, "users": report.user_count});
+        stats_history["current_fail_per_sec"].push({"value": total.current_fail_per_sec, "users": report.user_count});
+        stats_history["response_time_percentile_50"].push({"value": report.current_response_time_percentile_50, "users": report.user_count});
+        stats_history["response_time_percentile_95"].push({"value": report.current_response_time_percentile_95, "users": report.user_count});
+        update_stats_charts();
+
+    } catch(i){
+        console.debug(i);
+    }
+}
+
+function updateStats() {
+    $.get('./stats/requests', handleReport).always(function() {
         setTimeout(updateStats, 2000);
     });
 }
-updateStats();
+
+// Rows of the stats entries, in the order the server sent them, updated by the stats stream
+var streamedStats = [];
+var streamedStatsByKey = {};
+var streamedErrors = [];
+
+function streamStats() {
+    var source = new EventSource('./stats/stream');
+    source.onmessage = function (event) {
+        var update = JSON.parse(event.data);
+        if (update.full) {
+            // all the rows, sorted and truncated by the server like /stats/requests
+            streamedStats = update.stats;
+            streamedStatsByKey = {};
+            streamedStats.forEach(function (row) {
+                streamedStatsByKey[row.method + " " + row.name] = row;
+            });
+        } else {
+            // only the fields that have changed
+            update.stats.forEach(function (changes) {
+                var row = streamedStatsByKey[changes.method + " " + changes.name];
+                if (row) {
+                    Object.assign(row, changes);
+                }
+            });
+        }
+        update.stats = streamedStats.concat([update.total]);
+        // the errors are left out when they haven't changed
+        if (update.errors === undefined) {
+            update.errors = streamedErrors;
+        } else {
+            streamedErrors = update.errors;
+        }
+        handleReport(update);
+    };
+}
+
+if (window.EventSource) {
+    streamStats();
+} else {
+    updateStats();
+}
 
 function updateExceptions() {
     $.get('./exceptions', function (data) {
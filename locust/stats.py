@@ -1,19 +1,27 @@
-import datetime
 import hashlib
+import io
 import time
-from collections import namedtuple, OrderedDict
-from copy import copy
-from itertools import chain
+from itertools import chain, repeat
 import os
 import csv
 import signal
 import gevent
 
 from .exception import StopUser, CatchResponseError
+from .reporter_io import reporter_io
+from .timeseries import StatsHistory
+from .histogram import (
+    RoundedHistogram,
+    ResponseTimeWindow,
+    add_with_expected_interval,
+    calculate_response_time_percentile,
+    median_from_dict,
+)
 
 import logging
 
 console_logger = logging.getLogger("locust.stats_logger")
+logger = logging.getLogger(__name__)
 
 """Space in table for request name. Auto shrink it if terminal is small (<160 characters)"""
 try:
@@ -49,6 +57,7 @@ HISTORY_STATS_INTERVAL_SEC = 5
 """Default interval for how frequently CSV files are written if this option is configured."""
 CSV_STATS_INTERVAL_SEC = 1
 CSV_STATS_FLUSH_INTERVAL_SEC = 10
+"""Longest time that rows of the stats history CSV file are buffered before they're written"""
 
 
 """
@@ -57,8 +66,14 @@ response time percentile
 """
 CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW = 10
 
+"""
+Number of seconds before the last request that current_rps and current_fail_per_sec look back over (the last
+2 seconds are left out, as they may not have been reported by all workers yet)
+"""
+CURRENT_RPS_WINDOW = 12
 
-CachedResponseTimes = namedtuple("CachedResponseTimes", ["response_times", "num_requests"])
+"""Number of entries of a worker report the master unserializes or merges before yielding to other greenlets"""
+STATS_MERGE_YIELD_INTERVAL = 100
 
 PERCENTILES_TO_REPORT = [0.50, 0.66, 0.75, 0.80, 0.90, 0.95, 0.98, 0.99, 0.999, 0.9999, 1.0]
 
@@ -79,60 +94,45 @@ def get_readable_percentiles(percentile_list):
     ]
 
 
-def calculate_response_time_percentile(response_times, num_requests, percent):
-    """
-    Get the response time that a certain number of percent of the requests
-    finished within. Arguments:
-
-    response_times: A StatsEntry.response_times dict
-    num_requests: Number of request made (could be derived from response_times,
-                  but we save some CPU cycles by using the value which we already store)
-    percent: The percentile we want to calculate. Specified in range: 0.0 - 1.0
-    """
-    num_of_request = int((num_requests * percent))
-
-    processed_count = 0
-    for response_time in sorted(response_times.keys(), reverse=True):
-        processed_count += response_times[response_time]
-        if num_requests - processed_count <= num_of_request:
-            return response_time
-    # if all response times were None
-    return 0
-
-
-def diff_response_time_dicts(latest, old):
-    """
-    Returns the delta between two {response_times:request_count} dicts.
-
-    Used together with the response_times cache to get the response times for the
-    last X seconds, which in turn is used to calculate the current response time
-    percentiles.
-    """
-    new = {}
-    for t in latest:
-        diff = latest[t] - old.get(t, 0)
-        if diff:
-            new[t] = diff
-    return new
-
-
 class RequestStats:
     """
     Class that holds the request statistics. Accessible in a User from self.environment.stats
     """
 
-    def __init__(self, use_response_times_cache=True):
+    def __init__(
+        self,
+        use_response_times_cache=True,
+        histogram_factory=None,
+        response_times_window_size=None,
+        history=None,
+        correct_coordinated_omission=False,
+    ):
         """
         :param use_response_times_cache: The value of use_response_times_cache will be set for each StatsEntry()
                                          when they are created. Settings it to False saves some memory and CPU
-                                         cycles which we can do on Worker nodes where the response_times_cache
+                                         cycles which we can do on Worker nodes where the response_times_window
                                          is not needed.
+        :param histogram_factory: Callable that creates the response time histogram of each StatsEntry().
+                                  Defaults to :class:`RoundedHistogram <locust.histogram.RoundedHistogram>`.
+                                  See :func:`get_histogram_factory <locust.histogram.get_histogram_factory>`.
+        :param response_times_window_size: Size - in seconds - of the sliding window used to calculate the
+                                           current response time percentiles. Defaults to
+                                           CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW.
+        :param history: :class:`StatsHistory <locust.timeseries.StatsHistory>` to record the history of the stats in
+                        (see :func:`stats_history`). Defaults to one that only records the aggregated stats.
+        :param correct_coordinated_omission: If True, each StatsEntry() also records its response times in a
+                                             corrected_response_times histogram, which is corrected for
+                                             coordinated omission (see :meth:`StatsEntry.log`)
         """
         self.use_response_times_cache = use_response_times_cache
+        self.histogram_factory = histogram_factory or RoundedHistogram
+        self.response_times_window_size = response_times_window_size or CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW
+        self.history = history if history is not None else StatsHistory()
+        self.correct_coordinated_omission = correct_coordinated_omission
         self.entries: dict[str, StatsEntry] = {}
         self.errors: dict[str, StatsError] = {}
         self.total = StatsEntry(self, "Aggregated", None, use_response_times_cache=self.use_response_times_cache)
-        self.history = []
+        self.history.track(self.total, total=True)
 
     @property
     def num_requests(self):
@@ -154,9 +154,34 @@ class RequestStats:
     def start_time(self):
         return self.total.start_time
 
-    def log_request(self, method, name, response_time, content_length):
-        self.total.log(response_time, content_length)
-        self.get(name, method).log(response_time, content_length)
+    def log_request(self, method, name, response_time, content_length, expected_interval=None):
+        self.total.log(response_time, content_length, expected_interval)
+        self.get(name, method).log(response_time, content_length, expected_interval)
+
+    def log_request_batch(self, methods, names, response_times, content_lengths, errors, expected_intervals=None):
+        """
+        Log a batch of requests (see the request_batch event). The arguments are lists with one element per request,
+        and errors should be None for successful requests.
+        """
+        current_time = time.time()
+        self.total.log_many(response_times, content_lengths, current_time, expected_intervals)
+        requests_by_entry = {}
+        for i, key in enumerate(zip(names, methods)):
+            indexes = requests_by_entry.get(key)
+            if indexes is None:
+                requests_by_entry[key] = [i]
+            else:
+                indexes.append(i)
+        for (name, method), indexes in requests_by_entry.items():
+            self.get(name, method).log_many(
+                [response_times[i] for i in indexes],
+                [content_lengths[i] for i in indexes],
+                current_time,
+                expected_intervals and [expected_intervals[i] for i in indexes],
+            )
+        for method, name, error in zip(methods, names, errors):
+            if error:
+                self.log_error(method, name, error)
 
     def log_error(self, method, name, error):
         self.total.log_error(error)
@@ -178,26 +203,30 @@ class RequestStats:
         if not entry:
             entry = StatsEntry(self, name, method, use_response_times_cache=self.use_response_times_cache)
             self.entries[(name, method)] = entry
+            self.history.track(entry)
         return entry
 
     def reset_all(self):
         """
         Go through all stats entries and reset them to zero
         """
+        self.history.clear()
         self.total.reset()
+        self.history.track(self.total, total=True)
         self.errors = {}
         for r in self.entries.values():
             r.reset()
-        self.history = []
+            self.history.track(r)
 
     def clear_all(self):
         """
         Remove all stats entries and errors
         """
+        self.history.clear()
         self.total = StatsEntry(self, "Aggregated", None, use_response_times_cache=self.use_response_times_cache)
+        self.history.track(self.total, total=True)
         self.entries = {}
         self.errors = {}
-        self.history = []
 
     def serialize_stats(self):
         return [
@@ -223,10 +252,9 @@ class StatsEntry:
         """ Method (GET, POST, PUT, etc.) """
         self.use_response_times_cache = use_response_times_cache
         """
-        If set to True, the copy of the response_time dict will be stored in response_times_cache
-        every second, and kept for 20 seconds (by default, will be CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW + 10).
-        We can use this dict to calculate the *current*  median response time, as well as other response
-        time percentiles.
+        If set to True, the response times logged during each of the last few seconds (by default
+        CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW) will be kept in response_times_window. We use it to
+        calculate the *current* median response time, as well as other response time percentiles.
         """
         self.num_requests = 0
         """ The number of requests made """
@@ -244,20 +272,36 @@ class StatsEntry:
         """ A {second => request_count} dict that holds the number of requests made per second """
         self.num_fail_per_sec = {}
         """ A (second => failure_count) dict that hold the number of failures per second """
-        self.response_times = {}
+        self.histogram_factory = stats.histogram_factory if stats is not None else RoundedHistogram
+        """ Callable used to create the response_times histogram """
+        self.response_times = self.histogram_factory()
         """
-        A {response_time => count} dict that holds the response time distribution of all
-        the requests.
-
-        The keys (the response time in ms) are rounded to store 1, 2, ... 9, 10, 20. .. 90,
+        A histogram that holds the response time distribution of all the requests. By default
+        it's a {response_time => count} dict (:class:`RoundedHistogram <locust.histogram.RoundedHistogram>`)
+        where the keys (the response time in ms) are rounded to store 1, 2, ... 9, 10, 20. .. 90,
         100, 200 .. 900, 1000, 2000 ... 9000, in order to save memory.
 
-        This dict is used to calculate the median and percentile response times.
+        This histogram is used to calculate the median and percentile response times.
+        """
+        self.corrected_response_times = None
+        """
+        If the stats are corrected for coordinated omission (see RequestStats.correct_coordinated_omission), a
+        histogram of the response times that also contains the back-filled response times of the requests that
+        paced users would have made while they were waiting for slow responses (see :meth:`log`)
         """
-        self.response_times_cache = None
+        self.num_corrected_requests = 0
+        """ The number of response times (including the back-filled ones) in corrected_response_times """
+        self.response_times_window = None
         """
-        If use_response_times_cache is set to True, this will be a {timestamp => CachedResponseTimes()}
-        OrderedDict that holds a copy of the response_times dict for each of the last 20 seconds.
+        If use_response_times_cache is set to True, this will be a
+        :class:`ResponseTimeWindow <locust.histogram.ResponseTimeWindow>` ring buffer that holds the
+        response times logged during each of the last seconds.
+        """
+        self.history = None
+        """
+        The :class:`ResponseTimeSeries <locust.timeseries.ResponseTimeSeries>` that the seconds leaving
+        response_times_window are stored in, if the history of this entry is recorded (see
+        :class:`StatsHistory <locust.timeseries.StatsHistory>`)
         """
         self.total_content_length = 0
         """ The sum of the content length of all the requests for this entry """
@@ -273,33 +317,83 @@ class StatsEntry:
         self.num_none_requests = 0
         self.num_failures = 0
         self.total_response_time = 0
-        self.response_times = {}
+        self.response_times = self.histogram_factory()
         self.min_response_time = None
         self.max_response_time = 0
         self.last_request_timestamp = None
         self.num_reqs_per_sec = {}
         self.num_fail_per_sec = {}
         self.total_content_length = 0
+        self.num_corrected_requests = 0
+        if self.stats is not None and self.stats.correct_coordinated_omission:
+            self.corrected_response_times = self.histogram_factory()
+        else:
+            self.corrected_response_times = None
         if self.use_response_times_cache:
-            self.response_times_cache = OrderedDict()
-            self._cache_response_times(int(time.time()))
+            if self.stats is not None:
+                window_size = self.stats.response_times_window_size
+            else:
+                window_size = CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW
+            self.response_times_window = ResponseTimeWindow(self.response_times, window_size)
 
-    def log(self, response_time, content_length):
+    def log(self, response_time, content_length, expected_interval=None):
+        """
+        Log a request. If the stats are corrected for coordinated omission and *expected_interval* (the number of
+        seconds between the task iterations of the user that made the request) is set, response times longer than
+        the interval are also recorded along with the response times of the requests that the user would have made
+        while waiting for them (see :func:`add_with_expected_interval <locust.histogram.add_with_expected_interval>`).
+        """
         # get the time
         current_time = time.time()
-        t = int(current_time)
-
-        if self.use_response_times_cache and self.last_request_timestamp and t > int(self.last_request_timestamp):
-            # see if we shall make a copy of the response_times dict and store in the cache
-            self._cache_response_times(t - 1)
 
         self.num_requests += 1
         self._log_time_of_request(current_time)
-        self._log_response_time(response_time)
+        key = self._log_response_time(response_time)
+        if self.corrected_response_times is not None and response_time is not None:
+            self.num_corrected_requests += add_with_expected_interval(
+                self.corrected_response_times, response_time, expected_interval and expected_interval * 1000
+            )
+
+        if self.use_response_times_cache:
+            self.response_times_window.log(int(current_time), key)
 
         # increase total content-length
         self.total_content_length += content_length
 
+    def log_many(self, response_times, content_lengths, current_time=None, expected_intervals=None):
+        """
+        Log several requests at once, which is cheaper than calling log() for each of them. *expected_intervals*
+        is an optional list with the expected interval of each request (see :meth:`log`).
+        """
+        num_requests = len(response_times)
+        if num_requests == 0:
+            return
+        if current_time is None:
+            current_time = time.time()
+        t = int(current_time)
+
+        self.num_requests += num_requests
+        self.num_reqs_per_sec[t] = self.num_reqs_per_sec.setdefault(t, 0) + num_requests
+        self.last_request_timestamp = current_time
+
+        keys = {}
+        for response_time in response_times:
+            key = self._log_response_time(response_time)
+            if key is not None:
+                keys[key] = keys.get(key, 0) + 1
+        if self.corrected_response_times is not None:
+            if expected_intervals is None:
+                expected_intervals = repeat(None)
+            for response_time, expected_interval in zip(response_times, expected_intervals):
+                if response_time is not None:
+                    self.num_corrected_requests += add_with_expected_interval(
+                        self.corrected_response_times, response_time, expected_interval and expected_interval * 1000
+                    )
+        if self.use_response_times_cache:
+            self.response_times_window.extend(t, keys, num_requests)
+
+        self.total_content_length += sum(content_lengths)
+
     def _log_time_of_request(self, current_time):
         t = int(current_time)
         self.num_reqs_per_sec[t] = self.num_reqs_per_sec.setdefault(t, 0) + 1
@@ -318,26 +412,14 @@ class StatsEntry:
         self.min_response_time = min(self.min_response_time, response_time)
         self.max_response_time = max(self.max_response_time, response_time)
 
-        # to avoid to much data that has to be transferred to the master node when
-        # running in distributed mode, we save the response time rounded in a dict
-        # so that 147 becomes 150, 3432 becomes 3400 and 58760 becomes 59000
-        if response_time < 100:
-            rounded_response_time = round(response_time)
-        elif response_time < 1000:
-            rounded_response_time = round(response_time, -1)
-        elif response_time < 10000:
-            rounded_response_time = round(response_time, -2)
-        else:
-            rounded_response_time = round(response_time, -3)
-
-        # increase request count for the rounded key in response time dict
-        self.response_times.setdefault(rounded_response_time, 0)
-        self.response_times[rounded_response_time] += 1
+        return self.response_times.add(response_time)
 
     def log_error(self, error):
         self.num_failures += 1
         t = int(time.time())
         self.num_fail_per_sec[t] = self.num_fail_per_sec.setdefault(t, 0) + 1
+        if self.use_response_times_cache:
+            self.response_times_window.log_failure(t)
 
     @property
     def fail_ratio(self):
@@ -360,7 +442,7 @@ class StatsEntry:
     def median_response_time(self):
         if not self.response_times:
             return 0
-        median = median_from_dict(self.num_requests - self.num_none_requests, self.response_times) or 0
+        median = self.response_times.median(self.num_requests - self.num_none_requests) or 0
 
         # Since we only use two digits of precision when calculating the median response time
         # while still using the exact values for min and max response times, the following checks
@@ -377,7 +459,9 @@ class StatsEntry:
     def current_rps(self):
         if self.stats.last_request_timestamp is None:
             return 0
-        slice_start_time = max(int(self.stats.last_request_timestamp) - 12, int(self.stats.start_time or 0))
+        slice_start_time = max(
+            int(self.stats.last_request_timestamp) - CURRENT_RPS_WINDOW, int(self.stats.start_time or 0)
+        )
 
         reqs = [
             self.num_reqs_per_sec.get(t, 0) for t in range(slice_start_time, int(self.stats.last_request_timestamp) - 2)
@@ -388,7 +472,9 @@ class StatsEntry:
     def current_fail_per_sec(self):
         if self.stats.last_request_timestamp is None:
             return 0
-        slice_start_time = max(int(self.stats.last_request_timestamp) - 12, int(self.stats.start_time or 0))
+        slice_start_time = max(
+            int(self.stats.last_request_timestamp) - CURRENT_RPS_WINDOW, int(self.stats.start_time or 0)
+        )
 
         reqs = [
             self.num_fail_per_sec.get(t, 0) for t in range(slice_start_time, int(self.stats.last_request_timestamp) - 2)
@@ -425,10 +511,6 @@ class StatsEntry:
         Extend the data from the current StatsEntry with the stats from another
         StatsEntry instance.
         """
-        # save the old last_request_timestamp, to see if we should store a new copy
-        # of the response times in the response times cache
-        old_last_request_timestamp = self.last_request_timestamp
-
         if self.last_request_timestamp is not None and other.last_request_timestamp is not None:
             self.last_request_timestamp = max(self.last_request_timestamp, other.last_request_timestamp)
         elif other.last_request_timestamp is not None:
@@ -447,26 +529,30 @@ class StatsEntry:
             self.min_response_time = other.min_response_time
         self.total_content_length = self.total_content_length + other.total_content_length
 
-        for key in other.response_times:
-            self.response_times[key] = self.response_times.get(key, 0) + other.response_times[key]
+        if self.use_response_times_cache:
+            # The requests are added to the window at the time they are received rather than the time they
+            # were made. Worker reports are sent every few seconds, so this will cause the window to lag behind
+            # a second or two, but it keeps the current response time percentiles unaffected by workers
+            # whose clocks aren't in sync with ours.
+            keys = {}
+            for response_time, count in other.response_times.items():
+                key = self.response_times.add(response_time, count)
+                keys[key] = keys.get(key, 0) + count
+            self.response_times_window.extend(int(time.time()), keys, other.num_requests, other.num_failures)
+        else:
+            self.response_times.merge(other.response_times)
+        if other.corrected_response_times is not None:
+            if self.corrected_response_times is None:
+                self.corrected_response_times = self.histogram_factory()
+            self.corrected_response_times.merge(other.corrected_response_times)
+            self.num_corrected_requests += other.num_corrected_requests
         for key in other.num_reqs_per_sec:
             self.num_reqs_per_sec[key] = self.num_reqs_per_sec.get(key, 0) + other.num_reqs_per_sec[key]
         for key in other.num_fail_per_sec:
             self.num_fail_per_sec[key] = self.num_fail_per_sec.get(key, 0) + other.num_fail_per_sec[key]
 
-        if self.use_response_times_cache:
-            # If we've entered a new second, we'll cache the response times. Note that there
-            # might still be reports from other worker nodes - that contains requests for the same
-            # time periods - that hasn't been received/accounted for yet. This will cause the cache to
-            # lag behind a second or two, but since StatsEntry.current_response_time_percentile()
-            # (which is what the response times cache is used for) uses an approximation of the
-            # last 10 seconds anyway, it should be fine to ignore this.
-            last_time = self.last_request_timestamp and int(self.last_request_timestamp) or None
-            if last_time and last_time > (old_last_request_timestamp and int(old_last_request_timestamp) or 0):
-                self._cache_response_times(last_time)
-
     def serialize(self):
-        return {
+        data = {
             "name": self.name,
             "method": self.method,
             "last_request_timestamp": self.last_request_timestamp,
@@ -478,10 +564,14 @@ class StatsEntry:
             "max_response_time": self.max_response_time,
             "min_response_time": self.min_response_time,
             "total_content_length": self.total_content_length,
-            "response_times": self.response_times,
+            "response_times": self.response_times.serialize(),
             "num_reqs_per_sec": self.num_reqs_per_sec,
             "num_fail_per_sec": self.num_fail_per_sec,
         }
+        if self.corrected_response_times is not None:
+            data["corrected_response_times"] = self.corrected_response_times.serialize()
+            data["num_corrected_requests"] = self.num_corrected_requests
+        return data
 
     @classmethod
     def unserialize(cls, data):
@@ -496,11 +586,15 @@ class StatsEntry:
             "max_response_time",
             "min_response_time",
             "total_content_length",
-            "response_times",
             "num_reqs_per_sec",
             "num_fail_per_sec",
         ]:
             setattr(obj, key, data[key])
+        obj.response_times.merge(data["response_times"])
+        if "corrected_response_times" in data:
+            obj.corrected_response_times = obj.histogram_factory()
+            obj.corrected_response_times.merge(data["corrected_response_times"])
+            obj.num_corrected_requests = data["num_corrected_requests"]
         return obj
 
     def get_stripped_report(self):
@@ -545,80 +639,63 @@ class StatsEntry:
 
         Percent specified in range: 0.0 - 1.0
         """
-        return calculate_response_time_percentile(self.response_times, self.num_requests, percent)
+        return self.response_times.percentile(self.num_requests, percent)
+
+    def get_corrected_response_time_percentile(self, percent):
+        """
+        Get the response time percentile from the response times that are corrected for coordinated omission (see
+        :meth:`log`). Returns the uncorrected percentile if the stats aren't corrected.
+
+        Percent specified in range: 0.0 - 1.0
+        """
+        if self.corrected_response_times is None:
+            return self.get_response_time_percentile(percent)
+        return self.corrected_response_times.percentile(self.num_corrected_requests, percent)
 
     def get_current_response_time_percentile(self, percent):
         """
         Calculate the *current* response time for a certain percentile. We use a sliding
-        window of (approximately) the last 10 seconds (specified by CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW)
-        when calculating this.
+        window of the last 10 seconds (specified by RequestStats.response_times_window_size, which
+        defaults to CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW) when calculating this.
         """
         if not self.use_response_times_cache:
             raise ValueError(
                 "StatsEntry.use_response_times_cache must be set to True if we should be able to calculate the _current_ response time percentile"
             )
-        # First, we want to determine which of the cached response_times dicts we should
-        # use to get response_times for approximately 10 seconds ago.
-        t = int(time.time())
-        # Since we can't be sure that the cache contains an entry for every second.
-        # We'll construct a list of timestamps which we consider acceptable keys to be used
-        # when trying to fetch the cached response_times. We construct this list in such a way
-        # that it's ordered by preference by starting to add t-10, then t-11, t-9, t-12, t-8,
-        # and so on
-        acceptable_timestamps = []
-        acceptable_timestamps.append(t - CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW)
-        for i in range(1, 9):
-            acceptable_timestamps.append(t - CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW - i)
-            acceptable_timestamps.append(t - CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW + i)
-
-        cached = None
-        for ts in acceptable_timestamps:
-            if ts in self.response_times_cache:
-                cached = self.response_times_cache[ts]
-                break
-
-        if cached:
-            # If we found an acceptable cached response times, we'll calculate a new response
-            # times dict of the last 10 seconds (approximately) by diffing it with the current
-            # total response times. Then we'll use that to calculate a response time percentile
-            # for that timeframe
-            return calculate_response_time_percentile(
-                diff_response_time_dicts(self.response_times, cached.response_times),
-                self.num_requests - cached.num_requests,
-                percent,
+        return self.response_times_window.percentile(time.time(), percent)
+
+    def get_current_response_time_percentiles(self, percents):
+        """
+        Calculate several *current* response time percentiles at once (see get_current_response_time_percentile)
+        """
+        if not self.use_response_times_cache:
+            raise ValueError(
+                "StatsEntry.use_response_times_cache must be set to True if we should be able to calculate the _current_ response time percentile"
             )
-        # if time was not in response times cache window
-        return None
+        return self.response_times_window.percentiles(time.time(), percents)
 
-    def percentile(self):
+    def percentile(self, corrected=False):
+        """
+        Return the response time percentiles as a string suitable for console output. If corrected is True, the
+        percentiles that are corrected for coordinated omission are returned, with "(corrected)" after the name.
+        """
         if not self.num_requests:
             raise ValueError("Can't calculate percentile on url with no successful requests")
 
         tpl = f" %-{str(STATS_TYPE_WIDTH)}s %-{str(STATS_NAME_WIDTH)}s %8d {' '.join(['%6d'] * len(PERCENTILES_TO_REPORT))}"
 
+        if corrected:
+            return tpl % (
+                (self.method, self.name + " (corrected)")
+                + tuple([self.get_corrected_response_time_percentile(p) for p in PERCENTILES_TO_REPORT])
+                + (self.num_corrected_requests,)
+            )
         return tpl % (
             (self.method, self.name)
             + tuple([self.get_response_time_percentile(p) for p in PERCENTILES_TO_REPORT])
             + (self.num_requests,)
         )
 
-    def _cache_response_times(self, t):
-        self.response_times_cache[t] = CachedResponseTimes(
-            response_times=copy(self.response_times),
-            num_requests=self.num_requests,
-        )
-
-        # We'll use a cache size of CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW + 10 since - in the extreme case -
-        # we might still use response times (from the cache) for t-CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW-10
-        # to calculate the current response time percentile, if we're missing cached values for the subsequent
-        # 20 seconds
-        cache_size = CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW + 10
-
-        if len(self.response_times_cache) > cache_size:
-            # only keep the latest 20 response_times dicts
-            for i in range(len(self.response_times_cache) - cache_size):
-                self.response_times_cache.popitem(last=False)
-
 
 class StatsError:
     def __init__(self, method, name, error, occurrences=0):
@@ -681,40 +758,53 @@ def avg(values):
     return sum(values, 0.0) / max(len(values), 1)
 
 
-def median_from_dict(total, count):
-    """
-    total is the number of requests made
-    count is a dict {response_time: count}
-    """
-    pos = (total - 1) / 2
-    for k in sorted(count.keys()):
-        if pos < count[k]:
-            return k
-        pos -= count[k]
-
-
 def setup_distributed_stats_event_listeners(events, stats):
     def on_report_to_master(client_id, data):
-        data["stats"] = stats.serialize_stats()
-        data["stats_total"] = stats.total.get_stripped_report()
+        # if the stats have already been added using the compact encoding (see locust.stats_codec), or
+        # written to shared memory (see locust.stats_shm), there's nothing left to serialize
+        if "stats_names" not in data:
+            data["stats"] = stats.serialize_stats()
+            data["stats_total"] = stats.total.get_stripped_report()
         data["errors"] = stats.serialize_errors()
         stats.errors = {}
 
+    def _unserialize(stats_data):
+        # reports sent using the compact encoding have already been decoded by the master (see locust.stats_codec)
+        if isinstance(stats_data, dict):
+            return StatsEntry.unserialize(stats_data)
+        return stats_data
+
     def on_worker_report(client_id, data):
-        for stats_data in data["stats"]:
-            entry = StatsEntry.unserialize(stats_data)
+        # Other greenlets (e.g. the one handling heartbeats from the workers) get to run every
+        # STATS_MERGE_YIELD_INTERVAL entries, both while the entries are unserialized and while they are merged.
+        # The total is merged last, so the web UI and the other readers of the stats may briefly see some of the
+        # entries of a report before it shows up in the total, but never the other way around.
+        entries = []
+        for i, stats_data in enumerate(data["stats"], 1):
+            entries.append(_unserialize(stats_data))
+            if i % STATS_MERGE_YIELD_INTERVAL == 0:
+                gevent.sleep(0)
+        total = _unserialize(data["stats_total"])
+
+        for i, entry in enumerate(entries, 1):
             request_key = (entry.name, entry.method)
             if request_key not in stats.entries:
-                stats.entries[request_key] = StatsEntry(stats, entry.name, entry.method, use_response_times_cache=True)
+                stats.entries[request_key] = StatsEntry(
+                    stats, entry.name, entry.method, use_response_times_cache=stats.use_response_times_cache
+                )
             stats.entries[request_key].extend(entry)
+            if i % STATS_MERGE_YIELD_INTERVAL == 0:
+                gevent.sleep(0)
 
-        for error_key, error in data["errors"].items():
+        for i, (error_key, error) in enumerate(data["errors"].items(), 1):
             if error_key not in stats.errors:
                 stats.errors[error_key] = StatsError.from_dict(error)
             else:
                 stats.errors[error_key].occurrences += error["occurrences"]
+            if i % STATS_MERGE_YIELD_INTERVAL == 0:
+                gevent.sleep(0)
 
-        stats.total.extend(StatsEntry.unserialize(data["stats_total"]))
+        stats.total.extend(total)
 
     events.report_to_master.add_listener(on_report_to_master)
     events.worker_report.add_listener(on_worker_report)
@@ -752,10 +842,14 @@ def print_percentile_stats(stats):
         r = stats.entries[key]
         if r.response_times:
             console_logger.info(r.percentile())
+            if r.corrected_response_times:
+                console_logger.info(r.percentile(corrected=True))
     console_logger.info(separator)
 
     if stats.total.response_times:
         console_logger.info(stats.total.percentile())
+        if stats.total.corrected_response_times:
+            console_logger.info(stats.total.percentile(corrected=True))
     console_logger.info("")
 
 
@@ -791,15 +885,7 @@ def stats_history(runner):
         if not stats.total.use_response_times_cache:
             break
         if runner.state != "stopped":
-            r = {
-                "time": datetime.datetime.utcnow().strftime("%H:%M:%S"),
-                "current_rps": stats.total.current_rps or 0,
-                "current_fail_per_sec": stats.total.current_fail_per_sec or 0,
-                "response_time_percentile_95": stats.total.get_current_response_time_percentile(0.95) or 0,
-                "response_time_percentile_50": stats.total.get_current_response_time_percentile(0.5) or 0,
-                "user_count": runner.user_count or 0,
-            }
-            stats.history.append(r)
+            stats.history.record(runner.user_count)
         gevent.sleep(HISTORY_STATS_INTERVAL_SEC)
 
 
@@ -826,6 +912,10 @@ class StatsCSV:
             "Requests/s",
             "Failures/s",
         ] + get_readable_percentiles(self.percentiles_to_report)
+        if environment.stats.correct_coordinated_omission:
+            self.requests_csv_columns += [
+                "Corrected " + percentile for percentile in get_readable_percentiles(self.percentiles_to_report)
+            ]
 
         self.failures_columns = [
             "Method",
@@ -845,10 +935,17 @@ class StatsCSV:
         if not stats_entry.num_requests:
             return self.percentiles_na
         elif use_current:
-            return [int(stats_entry.get_current_response_time_percentile(x) or 0) for x in self.percentiles_to_report]
+            return [int(x or 0) for x in stats_entry.get_current_response_time_percentiles(self.percentiles_to_report)]
         else:
             return [int(stats_entry.get_response_time_percentile(x) or 0) for x in self.percentiles_to_report]
 
+    def _corrected_percentile_fields(self, stats_entry):
+        if not self.environment.stats.correct_coordinated_omission:
+            return []
+        elif not stats_entry.num_requests:
+            return self.percentiles_na
+        return [int(stats_entry.get_corrected_response_time_percentile(x) or 0) for x in self.percentiles_to_report]
+
     def requests_csv(self, csv_writer):
         """Write requests csv with header and data rows."""
         csv_writer.writerow(self.requests_csv_columns)
@@ -874,6 +971,7 @@ class StatsCSV:
                         stats_entry.total_fail_per_sec,
                     ],
                     self._percentile_fields(stats_entry),
+                    self._corrected_percentile_fields(stats_entry),
                 )
             )
 
@@ -904,24 +1002,17 @@ class StatsCSV:
 class StatsCSVFileWriter(StatsCSV):
     """Write statistics to to CSV files"""
 
-    def __init__(self, environment, percentiles_to_report, base_filepath, full_history=False):
+    def __init__(self, environment, percentiles_to_report, base_filepath, full_history=False, snapshot_interval=None):
+        """
+        :param snapshot_interval: Number of seconds between the rewrites of the _stats.csv, _failures.csv and
+                                  _exceptions.csv files. Defaults to every time the stats are written.
+        """
         super().__init__(environment, percentiles_to_report)
         self.base_filepath = base_filepath
         self.full_history = full_history
+        self.snapshot_interval = snapshot_interval
 
-        self.requests_csv_filehandle = open(self.base_filepath + "_stats.csv", "w")
-        self.requests_csv_writer = csv.writer(self.requests_csv_filehandle)
-
-        self.stats_history_csv_filehandle = open(self.stats_history_file_name(), "w")
-        self.stats_history_csv_writer = csv.writer(self.stats_history_csv_filehandle)
-
-        self.failures_csv_filehandle = open(self.base_filepath + "_failures.csv", "w")
-        self.failures_csv_writer = csv.writer(self.failures_csv_filehandle)
-        self.failures_csv_data_start = 0
-
-        self.exceptions_csv_filehandle = open(self.base_filepath + "_exceptions.csv", "w")
-        self.exceptions_csv_writer = csv.writer(self.exceptions_csv_filehandle)
-        self.exceptions_csv_data_start = 0
+        self._open_files()
 
         self.stats_history_csv_columns = [
             "Timestamp",
@@ -940,6 +1031,21 @@ class StatsCSVFileWriter(StatsCSV):
             "Total Average Content Size",
         ]
 
+    def _open_files(self):
+        self.requests_csv_filehandle = open(self.base_filepath + "_stats.csv", "w")
+        self.requests_csv_writer = csv.writer(self.requests_csv_filehandle)
+
+        self.stats_history_csv_filehandle = open(self.stats_history_file_name(), "w")
+        self.stats_history_csv_writer = csv.writer(self.stats_history_csv_filehandle)
+
+        self.failures_csv_filehandle = open(self.base_filepath + "_failures.csv", "w")
+        self.failures_csv_writer = csv.writer(self.failures_csv_filehandle)
+        self.failures_csv_data_start = 0
+
+        self.exceptions_csv_filehandle = open(self.base_filepath + "_exceptions.csv", "w")
+        self.exceptions_csv_writer = csv.writer(self.exceptions_csv_filehandle)
+        self.exceptions_csv_data_start = 0
+
     def __call__(self):
         self.stats_writer()
 
@@ -960,22 +1066,25 @@ class StatsCSVFileWriter(StatsCSV):
 
         # Continuously write date rows for all files
         last_flush_time = 0
+        last_snapshot_time = 0
         while True:
             now = time.time()
 
-            self.requests_csv_filehandle.seek(requests_csv_data_start)
-            self._requests_data_rows(self.requests_csv_writer)
-            self.requests_csv_filehandle.truncate()
-
             self._stats_history_data_rows(self.stats_history_csv_writer, now)
 
-            self.failures_csv_filehandle.seek(self.failures_csv_data_start)
-            self._failures_data_rows(self.failures_csv_writer)
-            self.failures_csv_filehandle.truncate()
+            if now - last_snapshot_time >= (self.snapshot_interval or 0):
+                self.requests_csv_filehandle.seek(requests_csv_data_start)
+                self._requests_data_rows(self.requests_csv_writer)
+                self.requests_csv_filehandle.truncate()
 
-            self.exceptions_csv_filehandle.seek((self.exceptions_csv_data_start))
-            self._exceptions_data_rows(self.exceptions_csv_writer)
-            self.exceptions_csv_filehandle.truncate()
+                self.failures_csv_filehandle.seek(self.failures_csv_data_start)
+                self._failures_data_rows(self.failures_csv_writer)
+                self.failures_csv_filehandle.truncate()
+
+                self.exceptions_csv_filehandle.seek((self.exceptions_csv_data_start))
+                self._exceptions_data_rows(self.exceptions_csv_writer)
+                self.exceptions_csv_filehandle.truncate()
+                last_snapshot_time = now
 
             if now - last_flush_time > CSV_STATS_FLUSH_INTERVAL_SEC:
                 self.requests_flush()
@@ -1045,3 +1154,101 @@ class StatsCSVFileWriter(StatsCSV):
 
     def stats_history_file_name(self):
         return self.base_filepath + "_stats_history.csv"
+
+
+class AtomicStatsCSVFileWriter(StatsCSVFileWriter):
+    """
+    Write statistics to CSV files without blocking the gevent loop (enabled with ``--csv-atomic``).
+
+    The _stats.csv, _failures.csv and _exceptions.csv snapshots are written to a temporary file which is then
+    renamed over the previous snapshot, so the files are never seen half written, and the rows of _stats_history.csv
+    are buffered and appended in batches. The files are written by the :mod:`reporter I/O <locust.reporter_io>`
+    thread, so that a slow disk doesn't block the gevent loop. If the disk can't keep up, history rows keep being
+    buffered and only the latest snapshot is written.
+
+    The snapshot files are only created when the first snapshot is written, and the ``requests_csv_filehandle``,
+    ``failures_csv_filehandle`` and ``exceptions_csv_filehandle`` attributes are None.
+    """
+
+    def _open_files(self):
+        self.requests_csv_filehandle = self.failures_csv_filehandle = self.exceptions_csv_filehandle = None
+        self.stats_history_csv_filehandle = open(self.stats_history_file_name(), "w")
+        self._stats_history_buffer = io.StringIO()
+        self.stats_history_csv_writer = csv.writer(self._stats_history_buffer)
+
+        self._pending_write = None
+        self._pending_snapshots = None
+
+    def stats_writer(self):
+        """Writes all the csv files for the locust run."""
+        self.stats_history_csv_writer.writerow(self.stats_history_csv_columns)
+
+        last_snapshot_time = 0
+        last_write_time = 0
+        while True:
+            now = time.time()
+
+            self._stats_history_data_rows(self.stats_history_csv_writer, now)
+            if now - last_snapshot_time >= (self.snapshot_interval or 0):
+                self._pending_snapshots = self._snapshots()
+                last_snapshot_time = now
+
+            if (self._pending_write is None or self._pending_write.ready()) and (
+                self._pending_snapshots is not None or now - last_write_time >= CSV_STATS_FLUSH_INTERVAL_SEC
+            ):
+                self._write_pending()
+                last_write_time = now
+
+            gevent.sleep(CSV_STATS_INTERVAL_SEC)
+
+    def _snapshots(self):
+        snapshots = []
+        for suffix, write_rows in (
+            ("_stats.csv", self.requests_csv),
+            ("_failures.csv", self.failures_csv),
+            ("_exceptions.csv", self.exceptions_csv),
+        ):
+            buffer = io.StringIO()
+            write_rows(csv.writer(buffer))
+            snapshots.append((self.base_filepath + suffix, buffer.getvalue()))
+        return snapshots
+
+    def _write_pending(self):
+        if self._pending_write is not None:
+            # raise any exception from the previous write
+            self._pending_write.get()
+        history = self._stats_history_buffer.getvalue()
+        self._stats_history_buffer.seek(0)
+        self._stats_history_buffer.truncate()
+        snapshots, self._pending_snapshots = self._pending_snapshots, None
+        size = len(history) + sum(len(data) for _, data in snapshots or ())
+        self._pending_write = reporter_io.submit(self._write_files, history, snapshots, size=size)
+
+    def _write_files(self, history, snapshots):
+        # runs in the background thread
+        if history:
+            self.stats_history_csv_filehandle.write(history)
+            self.stats_history_csv_filehandle.flush()
+        for path, data in snapshots or ():
+            with open(path + ".tmp", "w") as f:
+                f.write(data)
+            try:
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                # e.g. on Windows, if another program has the file open
+                logger.warning("Failed to replace %s: %s", path, e)
+
+    def _flush(self):
+        """Write the buffered history rows and the latest snapshot, and wait for them to be written"""
+        if self._pending_write is not None:
+            self._pending_write.wait()
+        self._write_pending()
+        self._pending_write.get()
+
+    requests_flush = stats_history_flush = failures_flush = exceptions_flush = _flush
+
+    def close_files(self):
+        """Write a final snapshot and the buffered history rows, and close the files"""
+        self._pending_snapshots = self._snapshots()
+        self._flush()
+        reporter_io.call(self.stats_history_csv_filehandle.close)
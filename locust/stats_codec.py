@@ -0,0 +1,453 @@
+"""
+Compact encoding of the stats that workers report to the master.
+
+By default workers send every :class:`StatsEntry <locust.stats.StatsEntry>` as a dict (see
+:meth:`StatsEntry.serialize() <locust.stats.StatsEntry.serialize>`), which means that the name and method of
+every entry, as well as the string keys of every field, are sent and unpacked on the master in every report.
+
+When both the master and the worker support it (the worker advertises it in its heartbeats, and the master
+confirms it with a ``stats_codec`` message), the worker will instead send:
+
+* The name and method of each entry only the first time the entry is reported. After that the entry is
+  referenced by an integer id.
+* The fields of each entry as a msgpack array, without keys.
+* The response times (and the response times corrected for coordinated omission, if any) as two arrays: the
+  differences between consecutive (sorted, integer) response times and the counts. Both are small integers, which
+  msgpack stores in 1 to 3 bytes each.
+* The per second request and failure counters in the same way, as offsets from a base timestamp and counts.
+
+The master decodes the entries into lightweight :class:`DecodedStatsEntry` objects, which have the attributes that
+:meth:`StatsEntry.extend() <locust.stats.StatsEntry.extend>` needs. Their response times aren't unpacked into
+dicts until they are merged.
+
+Workers that write their stats to shared memory (see :mod:`locust.stats_shm`) use a flat layout instead (see
+:meth:`StatsEncoder.encode_flat`): all the integer fields and histogram buckets of a report in one array of native
+64 bit integers, and the other fields in one array of doubles. Both sides are on the same machine, so the master
+reads the arrays straight from the bytes, rather than parsing them.
+"""
+import math
+import struct
+from array import array
+from itertools import accumulate
+
+import msgpack
+
+STATS_CODEC = "delta-v3"
+"""Name of the encoding, which is what workers advertise and the master confirms in a ``stats_codec`` message"""
+
+TOTAL_ENTRY_ID = 0
+"""Entry id reserved for the aggregated (total) stats entry"""
+
+RESPONSE_TIME_SCALE = 1000
+"""
+Response times are sent as integers. If a histogram has keys that aren't whole milliseconds (e.g. an
+:class:`HdrHistogram <locust.histogram.HdrHistogram>` with sub-millisecond resolution), they are sent in units of
+1 / RESPONSE_TIME_SCALE ms instead
+"""
+
+
+_flat_header = struct.Struct("<QQ")  # number of integers, number of doubles
+
+
+def _integer_histogram(histogram):
+    """
+    Returns (scale, integer response times, counts) for a {response_time: count} dict, sorted by response time
+    """
+    keys = sorted(histogram)
+    scale = 1
+    if any(key != int(key) for key in keys):
+        scale = RESPONSE_TIME_SCALE
+    int_keys = [round(key * scale) for key in keys] if scale != 1 else [int(key) for key in keys]
+    return scale, int_keys, [histogram[key] for key in keys]
+
+
+def _encode_histogram(histogram):
+    """
+    Returns (scale, key deltas, counts) for a {response_time: count} dict
+    """
+    scale, keys, counts = _integer_histogram(histogram)
+    deltas = [key - previous for previous, key in zip([0] + keys, keys)]
+    return [scale, deltas, counts]
+
+
+class DecodedHistogram:
+    """
+    The response times of a decoded entry. Rather than building a dict, the (response time, count) pairs are
+    generated from the arrays when the histogram is merged into the master's, which iterates over them anyway.
+    """
+
+    __slots__ = ("scale", "deltas", "counts")
+
+    def __init__(self, scale, deltas, counts):
+        self.scale = scale
+        self.deltas = deltas
+        self.counts = counts
+
+    def items(self):
+        if self.scale == 1:
+            return zip(accumulate(self.deltas), self.counts)
+        return zip([key / self.scale for key in accumulate(self.deltas)], self.counts)
+
+    def serialize(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return "<DecodedHistogram %r>" % self.serialize()
+
+
+class FlatHistogram:
+    """
+    The response times of an entry decoded from the flat layout, as arrays of response times and counts
+    """
+
+    __slots__ = ("scale", "keys", "counts")
+
+    def __init__(self, scale, keys, counts):
+        self.scale = scale
+        self.keys = keys
+        self.counts = counts
+
+    def items(self):
+        if self.scale == 1:
+            return zip(self.keys, self.counts)
+        return zip([key / self.scale for key in self.keys], self.counts)
+
+    def serialize(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return "<FlatHistogram %r>" % self.serialize()
+
+
+def _flatten_histogram(histogram, ints):
+    scale, keys, counts = _integer_histogram(histogram.serialize())
+    ints.append(scale)
+    ints.append(len(keys))
+    ints.extend(keys)
+    ints.extend(counts)
+
+
+def _unflatten_histogram(ints, i):
+    scale, n = ints[i], ints[i + 1]
+    i += 2
+    return FlatHistogram(scale, ints[i : i + n], ints[i + n : i + 2 * n]), i + 2 * n
+
+
+def _flatten_per_sec(counters, ints):
+    ints.append(len(counters))
+    ints.extend(counters)
+    ints.extend(counters.values())
+
+
+def _unflatten_per_sec(ints, i):
+    n = ints[i]
+    i += 1
+    return dict(zip(ints[i : i + n], ints[i + n : i + 2 * n])), i + 2 * n
+
+
+def _double(value):
+    """
+    Turn a field that may be None into a double for the flat layout, with None as NaN
+    """
+    return math.nan if value is None else float(value)
+
+
+def _number(value):
+    """
+    Turn a double from the flat layout back into an int if it is one (or into None if it is NaN)
+    """
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else value
+
+
+def _encode_per_sec(counters, base):
+    return [[t - base for t in counters], list(counters.values())]
+
+
+def _decode_per_sec(base, offsets, counts):
+    return dict(zip([base + offset for offset in offsets], counts))
+
+
+class DecodedStatsEntry:
+    """
+    The stats of one entry of a worker report, as decoded by :class:`StatsDecoder`. Has the same attributes as
+    :class:`StatsEntry <locust.stats.StatsEntry>` that :meth:`StatsEntry.extend()
+    <locust.stats.StatsEntry.extend>` uses, but the histograms are :class:`DecodedHistogram` instances.
+    """
+
+    __slots__ = (
+        "name",
+        "method",
+        "num_requests",
+        "num_none_requests",
+        "num_failures",
+        "total_response_time",
+        "min_response_time",
+        "max_response_time",
+        "total_content_length",
+        "start_time",
+        "last_request_timestamp",
+        "response_times",
+        "num_reqs_per_sec",
+        "num_fail_per_sec",
+        "corrected_response_times",
+        "num_corrected_requests",
+    )
+
+    def __repr__(self):
+        return "<DecodedStatsEntry %s %s>" % (self.method, self.name)
+
+
+class StatsEncoder:
+    """
+    Encodes the stats of a worker. Keeps track of which entries have been sent to the master, so
+    that their names only need to be sent once.
+    """
+
+    def __init__(self):
+        self._entry_ids = {}
+        self._resend_names = False
+
+    def reset(self):
+        """
+        Send the names of all entries again in the next report. Should be called whenever the master might have
+        lost track of them (e.g. if we reconnect). The ids of the entries don't change, so that reports that are
+        already on their way to the master still reference the right entries.
+        """
+        self._resend_names = True
+
+    def encode_entry(self, entry_id, entry):
+        per_sec_timestamps = list(entry.num_reqs_per_sec) + list(entry.num_fail_per_sec)
+        base = min(per_sec_timestamps) if per_sec_timestamps else 0
+        if entry.corrected_response_times is not None:
+            corrected_response_times = _encode_histogram(entry.corrected_response_times.serialize())
+        else:
+            corrected_response_times = None
+        return [
+            entry_id,
+            entry.num_requests,
+            entry.num_none_requests,
+            entry.num_failures,
+            entry.total_response_time,
+            entry.min_response_time,
+            entry.max_response_time,
+            entry.total_content_length,
+            entry.start_time,
+            entry.last_request_timestamp,
+            _encode_histogram(entry.response_times.serialize()),
+            base,
+            _encode_per_sec(entry.num_reqs_per_sec, base),
+            _encode_per_sec(entry.num_fail_per_sec, base),
+            corrected_response_times,
+            entry.num_corrected_requests,
+        ]
+
+    def _entries(self, stats, new_names):
+        """
+        Yields (entry_id, entry) for the total and all non-empty entries of *stats*, and resets each of them once
+        it has been encoded. Appends [id, name, method] to new_names for the entries that haven't been sent before
+        (or for all entries, after a reset).
+        """
+        if self._resend_names:
+            self._resend_names = False
+            new_names.extend([entry_id, name, method] for (name, method), entry_id in self._entry_ids.items())
+        yield TOTAL_ENTRY_ID, stats.total
+        stats.total.reset()
+        for key, entry in stats.entries.items():
+            if entry.num_requests == 0 and entry.num_failures == 0:
+                continue
+            entry_id = self._entry_ids.get(key)
+            if entry_id is None:
+                entry_id = self._entry_ids[key] = len(self._entry_ids) + 1
+                new_names.append([entry_id, entry.name, entry.method])
+            yield entry_id, entry
+            entry.reset()
+
+    def encode(self, stats):
+        """
+        Encode all non-empty entries of *stats* (a :class:`RequestStats <locust.stats.RequestStats>` instance) as
+        well as the total, and reset them (like :meth:`StatsEntry.get_stripped_report()
+        <locust.stats.StatsEntry.get_stripped_report>` does).
+
+        Returns a tuple of (new_names, payload), where new_names is a list of [id, name, method] for the entries
+        that haven't been sent before, and payload is bytes.
+        """
+        new_names = []
+        entries = [self.encode_entry(entry_id, entry) for entry_id, entry in self._entries(stats, new_names)]
+        return new_names, msgpack.packb(entries)
+
+    def encode_flat(self, stats):
+        """
+        Like :meth:`encode`, but the payload uses the flat layout, for readers on the same machine
+        (see :meth:`StatsDecoder.decode_flat`).
+        """
+        new_names = []
+        ints = array("q")
+        floats = array("d")
+        for entry_id, entry in self._entries(stats, new_names):
+            ints.extend(
+                (
+                    entry_id,
+                    entry.num_requests,
+                    entry.num_none_requests,
+                    entry.num_failures,
+                    entry.total_content_length,
+                    entry.num_corrected_requests,
+                )
+            )
+            _flatten_histogram(entry.response_times, ints)
+            _flatten_per_sec(entry.num_reqs_per_sec, ints)
+            _flatten_per_sec(entry.num_fail_per_sec, ints)
+            if entry.corrected_response_times is not None:
+                _flatten_histogram(entry.corrected_response_times, ints)
+            else:
+                ints.append(0)  # a scale of 0 means that there are no corrected response times
+            floats.extend(
+                (
+                    entry.total_response_time,
+                    _double(entry.min_response_time),
+                    entry.max_response_time,
+                    entry.start_time,
+                    _double(entry.last_request_timestamp),
+                )
+            )
+        return new_names, _flat_header.pack(len(ints), len(floats)) + ints.tobytes() + floats.tobytes()
+
+
+class StatsDecoder:
+    """
+    Decodes the stats reports from a single worker
+    """
+
+    def __init__(self):
+        self._names = {}
+        # entries whose names haven't been received yet, by id
+        self._pending = {}
+        # ids of the entries of the last decoded report whose names haven't been received. Their stats are kept
+        # and returned by the first report that includes the names, so the worker should be asked to send its
+        # names again (see StatsEncoder.reset)
+        self.unknown_ids = set()
+
+    def _add_names(self, new_names):
+        """
+        Store the names of new entries, and return the entries that were waiting for them
+        """
+        self.unknown_ids = set()
+        entries = []
+        for entry_id, name, method in new_names:
+            self._names[entry_id] = (name, method)
+            for entry in self._pending.pop(entry_id, ()):
+                entry.name, entry.method = name, method
+                entries.append(entry)
+        return entries
+
+    def _add_entry(self, entry_id, entry, entries):
+        name = self._names.get(entry_id)
+        if name is None:
+            self._pending.setdefault(entry_id, []).append(entry)
+            self.unknown_ids.add(entry_id)
+        else:
+            entry.name, entry.method = name
+            entries.append(entry)
+
+    def decode(self, new_names, payload):
+        """
+        Decode a report created by :meth:`StatsEncoder.encode`. Returns a tuple of (total, entries), where
+        entries is a list of :class:`DecodedStatsEntry` instances.
+
+        Entries whose names haven't been received are left out until they are, and their ids are added to
+        ``unknown_ids``.
+        """
+        entries = self._add_names(new_names)
+        total = None
+        for (
+            entry_id,
+            num_requests,
+            num_none_requests,
+            num_failures,
+            total_response_time,
+            min_response_time,
+            max_response_time,
+            total_content_length,
+            start_time,
+            last_request_timestamp,
+            response_times,
+            base,
+            num_reqs_per_sec,
+            num_fail_per_sec,
+            corrected_response_times,
+            num_corrected_requests,
+        ) in msgpack.unpackb(payload, use_list=True):
+            entry = DecodedStatsEntry()
+            if entry_id == TOTAL_ENTRY_ID:
+                entry.name, entry.method = "Aggregated", None
+                total = entry
+            else:
+                self._add_entry(entry_id, entry, entries)
+            entry.num_requests = num_requests
+            entry.num_none_requests = num_none_requests
+            entry.num_failures = num_failures
+            entry.total_response_time = total_response_time
+            entry.min_response_time = min_response_time
+            entry.max_response_time = max_response_time
+            entry.total_content_length = total_content_length
+            entry.start_time = start_time
+            entry.last_request_timestamp = last_request_timestamp
+            entry.response_times = DecodedHistogram(*response_times)
+            entry.num_reqs_per_sec = _decode_per_sec(base, *num_reqs_per_sec)
+            entry.num_fail_per_sec = _decode_per_sec(base, *num_fail_per_sec)
+            if corrected_response_times is not None:
+                entry.corrected_response_times = DecodedHistogram(*corrected_response_times)
+            else:
+                entry.corrected_response_times = None
+            entry.num_corrected_requests = num_corrected_requests
+        return total, entries
+
+    def decode_flat(self, new_names, payload):
+        """
+        Decode a report created by :meth:`StatsEncoder.encode_flat`. Returns the same as :meth:`decode`.
+        """
+        entries = self._add_names(new_names)
+
+        num_ints, num_floats = _flat_header.unpack_from(payload)
+        ints = array("q")
+        ints.frombytes(payload[_flat_header.size : _flat_header.size + num_ints * ints.itemsize])
+        floats = array("d")
+        floats.frombytes(payload[_flat_header.size + num_ints * ints.itemsize :])
+        if len(floats) != num_floats:
+            raise ValueError("Truncated stats payload")
+
+        total = None
+        i = 0
+        f = 0
+        while i < num_ints:
+            entry = DecodedStatsEntry()
+            entry_id = ints[i]
+            if entry_id == TOTAL_ENTRY_ID:
+                entry.name, entry.method = "Aggregated", None
+                total = entry
+            else:
+                self._add_entry(entry_id, entry, entries)
+            (
+                entry.num_requests,
+                entry.num_none_requests,
+                entry.num_failures,
+                entry.total_content_length,
+                entry.num_corrected_requests,
+            ) = ints[i + 1 : i + 6]
+            entry.response_times, i = _unflatten_histogram(ints, i + 6)
+            entry.num_reqs_per_sec, i = _unflatten_per_sec(ints, i)
+            entry.num_fail_per_sec, i = _unflatten_per_sec(ints, i)
+            if ints[i]:
+                entry.corrected_response_times, i = _unflatten_histogram(ints, i)
+            else:
+                entry.corrected_response_times = None
+                i += 1
+            entry.total_response_time = _number(floats[f])
+            entry.min_response_time = _number(floats[f + 1])
+            entry.max_response_time = _number(floats[f + 2])
+            entry.start_time = floats[f + 3]
+            entry.last_request_timestamp = _number(floats[f + 4])
+            f += 5
+        return total, entries
@@ -0,0 +1,235 @@
+"""
+Server side index of the request stats, used by the web UI's ``/stats/requests/v2`` endpoint.
+
+Instead of building a row for every entry (and sorting all of them) on every poll, the index keeps the rows it
+has built, and on refresh only rebuilds the rows of the entries whose counters have changed. Every refresh that
+changes something increments the version, and every row remembers the version it was last changed in, so clients
+that pass the version they last saw only get the rows that have changed since. For every field that has been sorted
+on, a sorted list of (value, key) pairs is kept, and only the changed rows are moved in it (unless many rows
+changed, in which case it is sorted again when it is next used).
+
+The current request and failure rates depend on the time of the last request of *any* entry, so they are not kept
+in the rows, but calculated for the rows that are returned (and for all rows when sorting on them). The rows of
+entries that have had requests within the window they are calculated over are returned to clients as changed,
+without being rebuilt.
+"""
+import time
+from bisect import bisect_left, insort
+from html import escape
+from itertools import islice
+
+from .stats import CURRENT_RPS_WINDOW
+from .util.rounding import proper_round
+
+STATS_INDEX_REFRESH_INTERVAL = 1.0
+"""Minimum number of seconds between two refreshes of a :class:`StatsIndex`"""
+
+SORT_FIELDS = (
+    "method",
+    "name",
+    "num_requests",
+    "num_failures",
+    "avg_response_time",
+    "min_response_time",
+    "max_response_time",
+    "current_rps",
+    "current_fail_per_sec",
+    "median_response_time",
+    "ninetieth_response_time",
+    "avg_content_length",
+)
+"""Fields of the rows that can be sorted on"""
+
+RATE_FIELDS = ("current_rps", "current_fail_per_sec")
+"""Fields that are calculated when the rows are returned, rather than kept in the index"""
+
+RESORT_FRACTION = 0.1
+"""Fraction of the rows above which the sort indexes are sorted again, rather than updated row by row"""
+
+
+def stats_row(entry):
+    """
+    Row shown in the web UI for a :class:`StatsEntry <locust.stats.StatsEntry>`
+    """
+    row = _counters_row(entry)
+    row["current_rps"] = entry.current_rps
+    row["current_fail_per_sec"] = entry.current_fail_per_sec
+    return row
+
+
+def _counters_row(entry):
+    """
+    The fields of the row of an entry that only change when its counters change
+    """
+    return {
+        "method": entry.method,
+        "name": entry.name,
+        "safe_name": escape(entry.name, quote=False),
+        "num_requests": entry.num_requests,
+        "num_failures": entry.num_failures,
+        "avg_response_time": entry.avg_response_time,
+        "min_response_time": 0 if entry.min_response_time is None else proper_round(entry.min_response_time),
+        "max_response_time": proper_round(entry.max_response_time),
+        "median_response_time": entry.median_response_time,
+        "ninetieth_response_time": entry.get_response_time_percentile(0.9),
+        "avg_content_length": entry.avg_content_length,
+    }
+
+
+class StatsIndex:
+    """
+    Maintains the rows of the entries of a :class:`RequestStats <locust.stats.RequestStats>` instance
+    """
+
+    def __init__(self, stats, refresh_interval=STATS_INDEX_REFRESH_INTERVAL):
+        self.stats = stats
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        """Incremented every time a refresh finds changed entries"""
+        self.reset_version = 0
+        """Version in which entries were last removed (clients that are older than that need a full update)"""
+        self.rows = {}
+        """Rows of the entries by (name, method), without the fields in :data:`RATE_FIELDS`"""
+        self.total_row = None
+        self._entries = None
+        self._signatures = {}
+        self._active = {}  # key -> second of the last refresh in which the entry had a current rate
+        self._row_versions = {}  # key -> version the row last changed in
+        self._changes = []  # (version, key) for every change, in order (compacted when it gets long)
+        self._sort_indexes = {}  # field -> sorted list of (value, key)
+        self._last_refresh = None
+
+    def refresh(self):
+        """
+        Rebuild the rows of the entries that have changed since the last refresh
+        """
+        stats = self.stats
+        self._last_refresh = time.time()
+        if stats.entries is not self._entries:
+            # the entries have been cleared (RequestStats.clear_all() replaces the dict)
+            if self.rows:
+                self.version += 1
+                self.reset_version = self.version
+            self._entries = stats.entries
+            self.rows = {}
+            self._signatures = {}
+            self._active = {}
+            self._row_versions = {}
+            self._changes = []
+            self._sort_indexes = {}
+
+        current_second = int(stats.last_request_timestamp or 0)
+        active_since = current_second - CURRENT_RPS_WINDOW
+        signatures = self._signatures
+        active = self._active
+        changed = []  # entries whose counters have changed
+        returned = []  # keys of the rows to return as changed: those, and those whose current rates have changed
+        for key, entry in stats.entries.items():
+            signature = (entry.num_requests, entry.num_failures)
+            if signatures.get(key) != signature:
+                signatures[key] = signature
+                changed.append((key, entry))
+                returned.append(key)
+            # the current rates of entries that have had requests within the window they're calculated over change
+            # every second, and they change one last time when the last of those requests leaves the window
+            if entry.last_request_timestamp is not None and entry.last_request_timestamp >= active_since:
+                rates_changed = active.get(key) != current_second
+                active[key] = current_second
+            else:
+                rates_changed = active.pop(key, None) is not None
+            if rates_changed and (not returned or returned[-1] != key):
+                returned.append(key)
+        self.total_row = stats_row(stats.total)
+        if not returned:
+            return
+
+        self.version += 1
+        if len(changed) > RESORT_FRACTION * len(self.rows):
+            self._sort_indexes = {}
+        for key, entry in changed:
+            row = _counters_row(entry)
+            old_row = self.rows.get(key)
+            self.rows[key] = row
+            for field, index in self._sort_indexes.items():
+                if old_row is not None:
+                    del index[bisect_left(index, (old_row[field], key))]
+                insort(index, (row[field], key))
+        for key in returned:
+            self._row_versions[key] = self.version
+            self._changes.append((self.version, key))
+        if len(self._changes) > 2 * len(self.rows):
+            self._changes = sorted(((v, key) for key, v in self._row_versions.items()), key=lambda change: change[0])
+
+    def refresh_if_stale(self):
+        if self._last_refresh is None or time.time() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def _sort_index(self, field):
+        if field in RATE_FIELDS:
+            entries = self._entries
+            return sorted((getattr(entries[key], field), key) for key in self.rows)
+        index = self._sort_indexes.get(field)
+        if index is None:
+            index = self._sort_indexes[field] = sorted((row[field], key) for key, row in self.rows.items())
+        return index
+
+    def _row(self, key):
+        entry = self._entries[key]
+        row = dict(self.rows[key])
+        row["current_rps"] = entry.current_rps
+        row["current_fail_per_sec"] = entry.current_fail_per_sec
+        return row
+
+    def _changed_since(self, version):
+        start = bisect_left(self._changes, (version + 1,))
+        row_versions = self._row_versions
+        # a row that has changed more than once is only returned at its last change
+        return [key for row_version, key in self._changes[start:] if row_versions[key] == row_version]
+
+    def query(self, since=0, sort=None, descending=False, name_filter=None, offset=0, limit=None):
+        """
+        Returns a dict with the current version, the rows of the entries that have changed since version *since*
+        (or of all entries, in which case "full" is True) and the row of the total.
+
+        The rows are sorted on *sort* (one of :data:`SORT_FIELDS`, or None to keep them in the order the entries
+        were created in), filtered on *name_filter* (a case insensitive substring of the name), and then *offset*
+        and *limit* are applied. "total_count" is the number of rows before applying *offset* and *limit*.
+        """
+        if sort is not None and sort not in SORT_FIELDS:
+            raise ValueError("Can't sort on %r" % sort)
+        self.refresh_if_stale()
+
+        full = since <= 0 or since < self.reset_version or since > self.version
+        if full:
+            if sort:
+                index = self._sort_index(sort)
+                keys = (key for _, key in (reversed(index) if descending else index))
+            else:
+                keys = list(self.rows)[::-1] if descending else self.rows
+        else:
+            keys = self._changed_since(since)
+            if sort in RATE_FIELDS:
+                entries = self._entries
+                keys.sort(key=lambda key: (getattr(entries[key], sort), key), reverse=descending)
+            elif sort:
+                keys.sort(key=lambda key: (self.rows[key][sort], key), reverse=descending)
+            elif descending:
+                keys.reverse()
+
+        if name_filter:
+            name_filter = name_filter.lower()
+            keys = [key for key in keys if name_filter in key[0].lower()]
+            total_count = len(keys)
+        elif full:
+            total_count = len(self.rows)
+        else:
+            total_count = len(keys)
+
+        page = islice(keys, offset, None if limit is None else offset + limit)
+        return {
+            "version": self.version,
+            "full": full,
+            "total_count": total_count,
+            "stats": [self._row(key) for key in page],
+            "total": self.total_row,
+        }
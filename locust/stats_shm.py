@@ -0,0 +1,157 @@
+"""
+Shared memory transport for the stats reports of workers that run on the same machine as the master.
+
+Normally the stats reports are sent to the master over zmq, together with the rest of the report data. When a
+worker is started with ``--shared-memory-stats``, it instead creates a file backed ring buffer, and tells the master
+where to find it in its heartbeats. If the master can open the file (i.e. if it is running on the
+same machine) it removes the file, which stays mapped by both processes (so that nothing is left behind if either
+of them crashes), and confirms with a ``stats_shm`` message. After that the worker writes the stats of every report
+to the ring buffer, as flat arrays of native integers and doubles that the master reads without parsing them (see
+:meth:`StatsEncoder.encode_flat <locust.stats_codec.StatsEncoder.encode_flat>`), and only sends the position of
+the report, along with the names of any new entries and the rest of the report data, over zmq. If the ring buffer
+is full, the worker sends the flat arrays over zmq instead.
+
+There is a single writer (the worker) and a single reader (the master) for every ring buffer. The worker owns the
+write position, and the master owns the read position, both of which are stored in the header of the file.
+"""
+import mmap
+import os
+import struct
+import tempfile
+from uuid import uuid4
+
+STATS_SHM_SIZE = 4 * 1024 * 1024
+"""Size of the file backing the ring buffer of each worker, in bytes"""
+
+MAGIC = b"LOCUSTSM"
+
+_header = struct.Struct(
+    "<8s"  # magic
+    "32s"  # token, which is also sent in the heartbeats so that the master can verify that it opened the right file
+    "Q"  # capacity
+    "Q"  # write position (total number of bytes written)
+    "Q"  # read position (total number of bytes read)
+)
+_WRITE_POS_OFFSET = 48
+_READ_POS_OFFSET = 56
+_position = struct.Struct("<Q")
+_length = struct.Struct("<I")
+_WRAP = 0xFFFFFFFF
+
+
+class StatsRing:
+    def __init__(self, path, mm):
+        self.path = path
+        self._mmap = mm
+        self.capacity = len(mm) - _header.size
+
+    def _get_position(self, offset):
+        return _position.unpack_from(self._mmap, offset)[0]
+
+    def _set_position(self, offset, value):
+        _position.pack_into(self._mmap, offset, value)
+
+    def _record_start(self, position, length):
+        """
+        Returns the position at which a record written at position is actually stored. Records are never split, so if
+        there isn't room for it at the end of the buffer, it is stored at the beginning instead.
+        """
+        offset = position % self.capacity
+        if self.capacity - offset < _length.size + length:
+            return position + self.capacity - offset
+        return position
+
+    def close(self):
+        self._mmap.close()
+
+
+class StatsRingWriter(StatsRing):
+    """
+    The worker side of the ring buffer. Creates a new file in the temp directory.
+    """
+
+    def __init__(self, size=STATS_SHM_SIZE, directory=None):
+        fd, path = tempfile.mkstemp(prefix="locust-stats-", suffix=".shm", dir=directory)
+        try:
+            os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        super().__init__(path, mm)
+        self.token = uuid4().hex
+        _header.pack_into(self._mmap, 0, MAGIC, self.token.encode(), self.capacity, 0, 0)
+
+    def write(self, payload):
+        """
+        Write payload to the ring buffer. Returns the position of the record, which the reader needs in order to
+        read it, or None if there isn't enough room in the ring buffer.
+        """
+        position = self._get_position(_WRITE_POS_OFFSET)
+        start = self._record_start(position, len(payload))
+        end = start + _length.size + len(payload)
+        if end - self._get_position(_READ_POS_OFFSET) > self.capacity:
+            return None
+        offset = _header.size + position % self.capacity
+        if start != position and start - position >= _length.size:
+            _length.pack_into(self._mmap, offset, _WRAP)
+        offset = _header.size + start % self.capacity
+        _length.pack_into(self._mmap, offset, len(payload))
+        self._mmap[offset + _length.size : offset + _length.size + len(payload)] = payload
+        self._set_position(_WRITE_POS_OFFSET, end)
+        return position
+
+    def close(self):
+        super().close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class StatsRingReader(StatsRing):
+    """
+    The master side of the ring buffer. Raises ValueError if the file at path isn't the ring buffer identified
+    by token, and OSError if it can't be opened at all (e.g. because the worker is running on another machine).
+    Removes the file once it is mapped, as both sides have it open by then.
+    """
+
+    def __init__(self, path, token):
+        with open(path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        try:
+            magic, file_token, capacity, write_pos, _ = _header.unpack_from(mm, 0)
+            if magic != MAGIC or file_token != token.encode() or capacity != len(mm) - _header.size:
+                raise ValueError("%s is not the stats ring buffer of this worker" % path)
+        except (ValueError, struct.error):
+            mm.close()
+            raise
+        super().__init__(path, mm)
+        # anything that has been written before we opened the file isn't for us
+        self._set_position(_READ_POS_OFFSET, write_pos)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def read(self, position):
+        """
+        Read the record that was written at position, and release it (and any records before it) so that the
+        space can be reused by the writer. Raises ValueError if there is no such record.
+        """
+        write_pos = self._get_position(_WRITE_POS_OFFSET)
+        if not self._get_position(_READ_POS_OFFSET) <= position < write_pos:
+            raise ValueError("No stats record at position %i" % position)
+        offset = _header.size + position % self.capacity
+        if (
+            self.capacity - position % self.capacity < _length.size
+            or _length.unpack_from(self._mmap, offset)[0] == _WRAP
+        ):
+            position += self.capacity - position % self.capacity
+            offset = _header.size
+        (length,) = _length.unpack_from(self._mmap, offset)
+        end = position + _length.size + length
+        if end > write_pos:
+            raise ValueError("No stats record at position %i" % position)
+        payload = self._mmap[offset + _length.size : offset + _length.size + length]
+        self._set_position(_READ_POS_OFFSET, end)
+        return payload
@@ -0,0 +1,131 @@
+"""
+Pushes the stats shown in the web UI to the browser as server-sent events, instead of every browser tab polling
+``/stats/requests``.
+
+A single greenlet builds an update every :data:`STATS_STREAM_INTERVAL` seconds, and the same (already serialized)
+update is sent to every subscriber, so the cost doesn't depend on the number of people watching the test. Like
+``/stats/requests``, the rows are sorted by name and method and capped at :data:`STATS_STREAM_MAX_ROWS` (the rows
+come from the :class:`StatsIndex <locust.stats_index.StatsIndex>`, which only rebuilds those that have changed).
+An update only contains the fields of the rows that have changed since the previous update (and the errors if they
+have changed), unless the rows themselves have changed (e.g. because an entry was added), in which case it contains
+all of them, in order. New subscribers first get an update with all rows.
+"""
+import json
+import logging
+
+import gevent
+from gevent.queue import Full, Queue
+
+from .log import greenlet_exception_logger
+
+logger = logging.getLogger(__name__)
+greenlet_exception_handler = greenlet_exception_logger(logger)
+
+STATS_STREAM_INTERVAL = 2.0
+"""Number of seconds between the stats updates pushed to the web UI"""
+
+STATS_STREAM_MAX_ROWS = 500
+"""Maximum number of rows sent to the web UI (not counting the total), like ``/stats/requests``"""
+
+MAX_QUEUED_UPDATES = 10
+"""Number of updates that can be waiting to be sent to a subscriber before it is disconnected (the browser will
+reconnect, and get all rows again)"""
+
+
+class StatsStream:
+    """
+    Sends the stats of a :class:`WebUI <locust.web.WebUI>` to its subscribers
+    """
+
+    def __init__(self, web_ui, interval=STATS_STREAM_INTERVAL):
+        self.web_ui = web_ui
+        self.interval = interval
+        self.subscribers = set()
+        self.greenlet = None
+        self.rows = []
+        """The rows as of the last update"""
+        self.full_event = None
+        """Server-sent event with all the rows as of the last update, for new subscribers"""
+        self.errors = None
+        """The errors as of the last update that contained them"""
+
+    def update(self):
+        """
+        Returns a server-sent event with the rows (or the fields of them) that have changed since the previous
+        update, the total row and the :meth:`stats summary <locust.web.WebUI.stats_summary>`, and builds
+        :attr:`full_event`.
+        """
+        stats_index = self.web_ui.get_stats_index()
+        # sorted like sort_stats() sorts the rows of /stats/requests: by name, then method
+        rows = stats_index.query(sort="name", limit=STATS_STREAM_MAX_ROWS)["stats"]
+        summary = self.web_ui.stats_summary()
+        summary["total"] = stats_index.total_row
+        full = [(row["method"], row["name"]) for row in rows] != [(row["method"], row["name"]) for row in self.rows]
+        if full:
+            changes = rows
+        else:
+            changes = []
+            for row, previous in zip(rows, self.rows):
+                changed = {field: value for field, value in row.items() if previous[field] != value}
+                if changed:
+                    changed["method"] = row["method"]
+                    changed["name"] = row["name"]
+                    changes.append(changed)
+        self.rows = rows
+        self.full_event = "data: %s\n\n" % json.dumps(dict(summary, full=True, stats=rows))
+        if full:
+            self.errors = summary["errors"]
+            return self.full_event
+        if summary["errors"] == self.errors:
+            # the browser keeps the errors it got last
+            del summary["errors"]
+        else:
+            self.errors = summary["errors"]
+        return "data: %s\n\n" % json.dumps(dict(summary, full=False, stats=changes))
+
+    def subscribe(self):
+        """
+        Returns a queue that the updates will be put in, starting with an update containing all rows. None is put
+        in the queue if the subscriber has been disconnected.
+        """
+        if self.greenlet is None or self.greenlet.dead:
+            self.rows = []
+            self.update()
+            self.greenlet = gevent.spawn(self._broadcast)
+            self.greenlet.link_exception(greenlet_exception_handler)
+        subscription = Queue(MAX_QUEUED_UPDATES)
+        subscription.put(self.full_event)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def _broadcast(self):
+        while self.subscribers:
+            gevent.sleep(self.interval)
+            if not self.subscribers:
+                return
+            event = self.update()
+            for subscription in list(self.subscribers):
+                try:
+                    subscription.put_nowait(event)
+                except Full:
+                    logger.debug("Disconnecting a stats stream subscriber that isn't keeping up")
+                    self._disconnect(subscription)
+
+    def _disconnect(self, subscription):
+        self.subscribers.discard(subscription)
+        # drop the updates it hasn't received, to make room for the None
+        while not subscription.empty():
+            subscription.get_nowait()
+        subscription.put_nowait(None)
+
+    def stop(self):
+        """
+        Disconnect all subscribers
+        """
+        if self.greenlet is not None:
+            self.greenlet.kill(block=False)
+        for subscription in list(self.subscribers):
+            self._disconnect(subscription)
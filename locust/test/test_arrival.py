@@ -0,0 +1,200 @@
+import gevent
+
+from locust import LoadTestShape, TaskSet, User, task
+from locust.arrival import ArrivalRateExecutor
+from locust.env import Environment
+from locust.exception import StopUser
+from locust.runners import _add_arrival_rate_share
+
+from .testcases import LocustTestCase
+
+
+class SleepingUser(User):
+    iterations = 0
+    sleep = 0.0
+
+    @task
+    def t(self):
+        SleepingUser.iterations += 1
+        gevent.sleep(self.sleep)
+
+
+class TestArrivalRateExecutor(LocustTestCase):
+    def setUp(self):
+        super().setUp()
+        SleepingUser.iterations = 0
+        SleepingUser.sleep = 0.0
+        self.environment = Environment(user_classes=[SleepingUser])
+        self.runner = self.environment.create_local_runner()
+
+    def tearDown(self):
+        self.runner.quit()
+        super().tearDown()
+
+    def test_constant_rate(self):
+        executor = self.environment.create_arrival_executor(100)
+        self.runner.start(10, spawn_rate=10, wait=True)
+        gevent.sleep(1)
+        self.assertAlmostEqual(100, SleepingUser.iterations, delta=20)
+        self.assertEqual(SleepingUser.iterations, executor.iterations)
+        self.assertEqual(0, executor.dropped)
+        self.assertEqual(10, executor.pool_size)
+
+    def test_iterations_run_concurrently(self):
+        # with a closed model, each of the 5 users would run 2 iterations of 0.5s in a second
+        SleepingUser.sleep = 0.5
+        executor = self.environment.create_arrival_executor(40)
+        self.runner.start(40, spawn_rate=40, wait=True)
+        gevent.sleep(1)
+        self.assertAlmostEqual(40, SleepingUser.iterations, delta=8)
+        self.assertEqual(0, executor.dropped)
+
+    def test_dropped_iterations(self):
+        SleepingUser.sleep = 1
+        executor = self.environment.create_arrival_executor(50)
+        self.runner.start(5, spawn_rate=5, wait=True)
+        gevent.sleep(0.5)
+        self.assertEqual(5, SleepingUser.iterations)
+        self.assertAlmostEqual(20, executor.dropped, delta=5)
+
+    def test_ramp(self):
+        executor = self.environment.create_arrival_executor(200, ramp=200)
+        self.runner.start(10, spawn_rate=10, wait=True)
+        gevent.sleep(0.5)
+        self.assertAlmostEqual(100, executor.rate, delta=25)
+        # half of the iterations that a constant rate would have started
+        self.assertAlmostEqual(25, SleepingUser.iterations, delta=10)
+        gevent.sleep(0.7)
+        self.assertEqual(200, executor.rate)
+
+    def test_set_rate(self):
+        executor = self.environment.create_arrival_executor(0)
+        self.runner.start(10, spawn_rate=10, wait=True)
+        gevent.sleep(0.3)
+        self.assertEqual(0, SleepingUser.iterations)
+        executor.set_rate(50)
+        gevent.sleep(1)
+        self.assertAlmostEqual(50, SleepingUser.iterations, delta=10)
+
+    def test_shape(self):
+        class TestShape(LoadTestShape):
+            def tick(self):
+                if self.get_run_time() < 0.5:
+                    return 10, 10, 20
+                return 10, 10, 100
+
+        self.environment.shape_class = TestShape()
+        executor = self.environment.create_arrival_executor()
+        self.environment.shape_class.reset_time()
+        self.runner.start_shape()
+        gevent.sleep(0.3)
+        self.assertEqual(20, executor.target_rate)
+        gevent.sleep(1.5)
+        self.assertEqual(100, executor.target_rate)
+
+    def test_stop(self):
+        SleepingUser.sleep = 0.3
+        self.environment.stop_timeout = 1
+        executor = self.environment.create_arrival_executor(20)
+        self.runner.start(5, spawn_rate=5, wait=True)
+        gevent.sleep(0.2)
+        self.runner.stop()
+        self.assertEqual(0, self.runner.user_count)
+        self.assertEqual(0, executor.pool_size)
+        self.assertIsNone(executor._scheduler_greenlet)
+        iterations = SleepingUser.iterations
+        gevent.sleep(0.2)
+        self.assertEqual(iterations, SleepingUser.iterations)
+
+    def test_stop_user(self):
+        class MyUser(User):
+            @task
+            def t(self):
+                raise StopUser()
+
+        environment = Environment(user_classes=[MyUser])
+        runner = environment.create_local_runner()
+        executor = environment.create_arrival_executor(100)
+        try:
+            runner.start(3, spawn_rate=3, wait=True)
+            gevent.sleep(0.2)
+            self.assertEqual(0, executor.pool_size)
+            self.assertEqual(3, executor.iterations)
+        finally:
+            runner.quit()
+
+    def test_exception_in_task(self):
+        class MyUser(User):
+            @task
+            def t(self):
+                raise ValueError("oops")
+
+        environment = Environment(user_classes=[MyUser], catch_exceptions=True)
+        errors = []
+        environment.events.user_error.add_listener(lambda exception, **kw: errors.append(exception))
+        runner = environment.create_local_runner()
+        environment.create_arrival_executor(20)
+        try:
+            runner.start(1, spawn_rate=1, wait=True)
+            gevent.sleep(0.3)
+            self.assertGreater(len(errors), 2)
+            self.assertEqual(1, runner.user_count)
+        finally:
+            runner.quit()
+
+    def test_nested_taskset(self):
+        runs = []
+
+        class MyTaskSet(TaskSet):
+            def on_start(self):
+                runs.append("on_start")
+
+            @task
+            def t(self):
+                runs.append("t")
+                if runs.count("t") == 3:
+                    self.interrupt()
+
+            def on_stop(self):
+                runs.append("on_stop")
+
+        class MyUser(User):
+            tasks = [MyTaskSet]
+
+        environment = Environment(user_classes=[MyUser])
+        runner = environment.create_local_runner()
+        executor = environment.create_arrival_executor(20)
+        try:
+            runner.start(1, spawn_rate=1, wait=True)
+            gevent.sleep(0.4)
+            # one task of the nested TaskSet per iteration, and a new TaskSet after it was interrupted
+            self.assertEqual(executor.iterations, runs.count("t"))
+            self.assertEqual(["on_start", "t", "t", "t", "on_stop", "on_start", "t"], runs[:7])
+        finally:
+            runner.quit()
+
+
+class TestArrivalRateReports(LocustTestCase):
+    def test_report_to_master(self):
+        executor = ArrivalRateExecutor(self.environment)
+        executor.iterations, executor.dropped, executor.late = 10, 2, 1
+        data = {}
+        self.environment.events.report_to_master.fire(client_id="worker", data=data)
+        self.assertEqual([10, 2, 1], data["arrival_rate"])
+        executor.iterations += 5
+        self.environment.events.report_to_master.fire(client_id="worker", data=data)
+        self.assertEqual([5, 0, 0], data["arrival_rate"])
+
+    def test_worker_report(self):
+        executor = ArrivalRateExecutor(self.environment)
+        self.environment.events.worker_report.fire(client_id="worker1", data={"arrival_rate": [10, 2, 1]})
+        self.environment.events.worker_report.fire(client_id="worker2", data={"arrival_rate": [5, 0, 3]})
+        self.environment.events.worker_report.fire(client_id="worker3", data={})
+        self.assertEqual((15, 2, 4), (executor.iterations, executor.dropped, executor.late))
+
+    def test_rate_share(self):
+        data = {}
+        _add_arrival_rate_share(data, 100, None, 0.25)
+        self.assertEqual({"arrival_rate": 25, "arrival_rate_ramp": None}, data)
+        _add_arrival_rate_share(data, 100, 10, 0.5)
+        self.assertEqual({"arrival_rate": 50, "arrival_rate_ramp": 5}, data)
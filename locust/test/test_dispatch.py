@@ -1,3 +1,4 @@
+import itertools
 import time
 import unittest
 from operator import attrgetter
@@ -3387,6 +3388,78 @@ class TestRampUpUsersFromZeroWithFixed(unittest.TestCase):
                                 )
 
 
+class TestWeightedWorkers(unittest.TestCase):
+    def test_dispatch_users_to_weighted_workers(self):
+        class User1(User):
+            weight = 1
+
+        class User2(User):
+            weight = 2
+
+        worker_nodes = [WorkerNode(str(i + 1)) for i in range(3)]
+        worker_nodes[1].weight = 3
+
+        users_dispatcher = UsersDispatcher(worker_nodes=worker_nodes, user_classes=[User1, User2])
+        users_dispatcher.new_dispatch(target_user_count=25, spawn_rate=25)
+        users_dispatcher._wait_between_dispatch = 0
+        dispatched_users = list(users_dispatcher)[-1]
+
+        self.assertDictEqual(_aggregate_dispatched_users(dispatched_users), {"User1": 8, "User2": 17})
+        self.assertEqual(_user_count_on_worker(dispatched_users, "1"), 5)
+        self.assertEqual(_user_count_on_worker(dispatched_users, "2"), 15)
+        self.assertEqual(_user_count_on_worker(dispatched_users, "3"), 5)
+
+    def test_worker_with_zero_weight_gets_no_users(self):
+        class User1(User):
+            weight = 1
+
+        worker_nodes = [WorkerNode(str(i + 1)) for i in range(2)]
+        worker_nodes[0].weight = 0
+
+        users_dispatcher = UsersDispatcher(worker_nodes=worker_nodes, user_classes=[User1])
+        users_dispatcher.new_dispatch(target_user_count=4, spawn_rate=4)
+        users_dispatcher._wait_between_dispatch = 0
+        dispatched_users = list(users_dispatcher)[-1]
+
+        self.assertEqual(_user_count_on_worker(dispatched_users, "1"), 0)
+        self.assertEqual(_user_count_on_worker(dispatched_users, "2"), 4)
+
+    def test_update_worker_weight(self):
+        class User1(User):
+            weight = 1
+
+        worker_nodes = [WorkerNode(str(i + 1)) for i in range(2)]
+
+        users_dispatcher = UsersDispatcher(worker_nodes=worker_nodes, user_classes=[User1])
+        users_dispatcher.new_dispatch(target_user_count=6, spawn_rate=6)
+        users_dispatcher._wait_between_dispatch = 0
+        dispatched_users = list(users_dispatcher)[-1]
+        self.assertEqual(_user_count_on_worker(dispatched_users, "1"), 3)
+        self.assertEqual(_user_count_on_worker(dispatched_users, "2"), 3)
+
+        users_dispatcher.update_worker_weight(worker_nodes[1], 2)
+        self.assertEqual(2, worker_nodes[1].weight)
+        users_dispatcher.new_dispatch(target_user_count=6, spawn_rate=6)
+        users_dispatcher._wait_between_dispatch = 0
+        dispatched_users = list(users_dispatcher)[-1]
+        self.assertEqual(_user_count_on_worker(dispatched_users, "1"), 2)
+        self.assertEqual(_user_count_on_worker(dispatched_users, "2"), 4)
+
+    def test_worker_node_gen_is_lazy(self):
+        class User1(User):
+            weight = 1
+
+        worker_nodes = [WorkerNode(str(i + 1)) for i in range(2)]
+        worker_nodes[0].weight = 10**9
+        worker_nodes[1].weight = 10**9
+
+        users_dispatcher = UsersDispatcher(worker_nodes=worker_nodes, user_classes=[User1])
+        ts = time.perf_counter()
+        worker_gen = users_dispatcher._worker_node_gen()
+        self.assertEqual(["1", "2", "1", "2"], [w.id for w in itertools.islice(worker_gen, 4)])
+        self.assertLess(time.perf_counter() - ts, 0.1)
+
+
 def _aggregate_dispatched_users(d: Dict[str, Dict[str, int]]) -> Dict[str, int]:
     user_classes = list(next(iter(d.values())).keys())
     return {u: sum(d[u] for d in d.values()) for u in user_classes}
@@ -0,0 +1,198 @@
+import unittest
+
+import mock
+
+from locust.argument_parser import parse_options
+from locust.env import Environment
+from locust.histogram import HdrHistogram, RoundedHistogram, add_with_expected_interval, get_histogram_factory
+from locust.rpc.protocol import Message
+from locust.stats import RequestStats, StatsEntry
+
+
+class TestRoundedHistogram(unittest.TestCase):
+    def test_add_rounds_response_times(self):
+        h = RoundedHistogram()
+        h.add(147)
+        h.add(3432)
+        h.add(58760, 2)
+        self.assertEqual({150: 1, 3400: 1, 59000: 2}, h)
+
+    def test_merge(self):
+        h = RoundedHistogram({10: 1})
+        h.merge({10: 2, 20: 1})
+        self.assertEqual({10: 3, 20: 1}, h)
+
+
+class TestAddWithExpectedInterval(unittest.TestCase):
+    def test_fast_response(self):
+        h = RoundedHistogram()
+        self.assertEqual(1, add_with_expected_interval(h, 80, 100))
+        self.assertEqual({80: 1}, h)
+
+    def test_back_fills_missed_requests(self):
+        h = RoundedHistogram()
+        self.assertEqual(4, add_with_expected_interval(h, 450, 100))
+        self.assertEqual({450: 1, 350: 1, 250: 1, 150: 1}, h)
+
+    def test_same_as_adding_each_value(self):
+        for histogram_class in (RoundedHistogram, HdrHistogram):
+            for response_time, expected_interval in ((450, 100), (300, 100), (12345.5, 7), (98765, 3.25), (10, 0.5)):
+                expected = histogram_class()
+                expected.add(response_time)
+                missing = response_time - expected_interval
+                while missing >= expected_interval:
+                    expected.add(missing)
+                    missing -= expected_interval
+                h = histogram_class()
+                count = add_with_expected_interval(h, response_time, expected_interval)
+                self.assertEqual(expected.serialize(), h.serialize(), (histogram_class, response_time))
+                self.assertEqual(sum(expected.serialize().values()), count)
+
+    def test_long_stall(self):
+        h = HdrHistogram()
+        # an hour long stall with a 1 ms interval
+        with mock.patch.object(h, "add", wraps=h.add) as add:
+            self.assertEqual(3_600_000, add_with_expected_interval(h, 3_600_000, 1))
+        self.assertEqual(3_600_000, h.total_count)
+        # one call per bucket, rather than one per value
+        self.assertLess(add.call_count, 3000)
+
+    def test_no_expected_interval(self):
+        h = HdrHistogram()
+        self.assertEqual(1, add_with_expected_interval(h, 450, None))
+        self.assertEqual(1, h.total_count)
+
+
+class TestHdrHistogram(unittest.TestCase):
+    def test_empty(self):
+        h = HdrHistogram()
+        self.assertFalse(h)
+        self.assertEqual(0, h.percentile(0, 0.5))
+        self.assertEqual(None, h.median(0))
+        self.assertEqual({}, h.serialize())
+
+    def test_precision(self):
+        h = HdrHistogram(significant_digits=2, resolution=0.001)
+        for value in [0.123, 0.5, 1, 45, 999.9, 12345, 3_000_000]:
+            h.add(value)
+            recorded = h.value_of(h.add(value))
+            self.assertLessEqual(abs(recorded - value), value / 100, value)
+
+    def test_sub_millisecond_precision(self):
+        h = HdrHistogram(resolution=0.001)
+        h.add(0.25)
+        h.add(0.75)
+        self.assertEqual({0.25: 1, 0.75: 1}, h.serialize())
+
+    def test_default_resolution_keeps_sub_millisecond_values(self):
+        h = HdrHistogram()
+        h.add(0.3)
+        [(value, count)] = h.serialize().items()
+        self.assertAlmostEqual(0.3, value, delta=0.003)
+        env = Environment(parsed_options=parse_options(args=["--response-time-histogram", "hdr"]))
+        self.assertEqual(0.001, env.stats.total.response_times.resolution)
+
+    def test_millisecond_resolution(self):
+        h = HdrHistogram(resolution=1)
+        h.add(0.25)
+        h.add(0.75)
+        h.add(12.4)
+        self.assertEqual({0: 1, 1: 1, 12: 1}, h.serialize())
+
+    def test_counters_are_allocated_lazily(self):
+        h = HdrHistogram(resolution=1)
+        self.assertEqual([], [chunk for chunk in h._chunks if chunk is not None])
+        h.add(10)
+        h.add(11)
+        self.assertEqual(1, len([chunk for chunk in h._chunks if chunk is not None]))
+        h.add(100_000)
+        self.assertEqual(2, len([chunk for chunk in h._chunks if chunk is not None]))
+        self.assertEqual(1, h.count_at(h.add(100_000)) - 1)
+
+    def test_values_above_highest_trackable_value(self):
+        h = HdrHistogram(highest_trackable_value=1000)
+        h.add(10_000_000)
+        self.assertEqual(1, h.count_at(h.length - 1))
+
+    def test_percentile(self):
+        h = HdrHistogram()
+        for x in range(100):
+            h.add(x)
+        self.assertEqual(50, round(h.percentile(100, 0.5)))
+        self.assertEqual(95, round(h.percentile(100, 0.95)))
+        self.assertEqual(99, round(h.percentile(100, 1.0)))
+        self.assertEqual(49, round(h.median(100)))
+
+    def test_merge(self):
+        h1 = HdrHistogram()
+        h2 = HdrHistogram()
+        h1.add(10)
+        h2.add(10)
+        h2.add(2000)
+        h1.merge(h2)
+        self.assertEqual(3, h1.total_count)
+        expected = HdrHistogram()
+        expected.add(10, 2)
+        expected.add(2000)
+        self.assertEqual(expected, h1)
+
+    def test_merge_dict(self):
+        h = HdrHistogram()
+        h.merge({10: 2, 20: 1})
+        self.assertEqual(3, h.total_count)
+        self.assertEqual([10, 20], [round(value) for value in h.serialize()])
+        self.assertEqual([2, 1], list(h.serialize().values()))
+
+    def test_serialize_round_trip(self):
+        h1 = HdrHistogram(resolution=0.001)
+        for value in [0.1, 3.3, 47, 555, 9999, 123456]:
+            h1.add(value)
+        h2 = HdrHistogram(resolution=0.001)
+        h2.merge(h1.serialize())
+        self.assertEqual(h1, h2)
+
+    def test_invalid_significant_digits(self):
+        self.assertRaises(ValueError, HdrHistogram, significant_digits=0)
+
+
+class TestHistogramBackends(unittest.TestCase):
+    def test_get_histogram_factory(self):
+        self.assertIs(RoundedHistogram, get_histogram_factory("legacy"))
+        self.assertIsInstance(get_histogram_factory("hdr", 3)(), HdrHistogram)
+        self.assertEqual(3, get_histogram_factory("hdr", 3)().significant_digits)
+        self.assertEqual(0.01, get_histogram_factory("hdr", 2, 0.01)().resolution)
+        self.assertRaises(ValueError, get_histogram_factory, "foo")
+
+    def test_environment_uses_histogram_from_options(self):
+        env = Environment(parsed_options=parse_options(args=["--response-time-histogram", "hdr"]))
+        self.assertIsInstance(env.stats.total.response_times, HdrHistogram)
+        self.assertIsInstance(env.stats.get("/", "GET").response_times, HdrHistogram)
+        env = Environment(parsed_options=parse_options(args=[]))
+        self.assertIsInstance(env.stats.total.response_times, RoundedHistogram)
+
+    def test_stats_entry_with_hdr_histogram(self):
+        stats = RequestStats(histogram_factory=get_histogram_factory("hdr"))
+        s = stats.get("/", "GET")
+        for x in [12, 12, 38, 0.5, None]:
+            s.log(x, 0)
+        self.assertEqual(12, round(s.median_response_time))
+        self.assertEqual(38, round(s.get_response_time_percentile(0.95)))
+
+    def test_history_with_hdr_histogram(self):
+        stats = RequestStats(histogram_factory=get_histogram_factory("hdr"))
+        for x in [12, 12, 38, 0.5]:
+            stats.log_request("GET", "/", x, 0)
+        self.assertEqual(38, round(stats.history.total.percentile(0.95)))
+
+    def test_extend_and_serialize_with_hdr_histogram(self):
+        stats = RequestStats(histogram_factory=get_histogram_factory("hdr"))
+        worker_entry = StatsEntry(stats, "/", "GET")
+        for x in [10, 20, 40]:
+            worker_entry.log(x, 0)
+        data = Message.unserialize(Message("dummy", worker_entry.serialize(), "none").serialize()).data
+
+        master_entry = StatsEntry(stats, "/", "GET")
+        master_entry.extend(StatsEntry.unserialize(data))
+        self.assertIsInstance(master_entry.response_times, HdrHistogram)
+        self.assertEqual(worker_entry.response_times, master_entry.response_times)
+        self.assertEqual(20, round(master_entry.median_response_time))
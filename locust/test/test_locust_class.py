@@ -1,3 +1,5 @@
+import random
+
 import gevent
 from gevent import sleep
 from gevent.pool import Group
@@ -6,6 +8,7 @@ from locust.exception import InterruptTaskSet, ResponseError
 from locust import HttpUser, User, TaskSet, task, constant
 from locust.env import Environment
 from locust.exception import CatchResponseError, RescheduleTask, RescheduleTaskImmediately, StopUser
+from locust.user.task import TASK_FUNCTION, TASK_METHOD, TASK_TASKSET, WeightedTasks, choose_task, get_task_kind
 
 from .testcases import LocustTestCase, WebserverTestCase
 
@@ -277,6 +280,62 @@ class TestTaskSet(LocustTestCase):
         taskset.execute_next_task()
         self.assertTrue(taskset.t2_executed)
 
+    def test_schedule_task_first(self):
+        executed = []
+
+        class MyTasks(TaskSet):
+            def t1(self):
+                executed.append("t1")
+
+            def t2(self):
+                executed.append("t2")
+
+        taskset = MyTasks(self.locust)
+        taskset.schedule_task(taskset.t1)
+        taskset.schedule_task(taskset.t2, first=True)
+        taskset.execute_next_task()
+        taskset.execute_next_task()
+        self.assertEqual(["t2", "t1"], executed)
+
+    def test_task_kinds(self):
+        def t1(l):
+            pass
+
+        class MyTasks(TaskSet):
+            tasks = [t1]
+
+            def t2(self):
+                pass
+
+        self.assertEqual(TASK_FUNCTION, get_task_kind(t1))
+        self.assertEqual(TASK_TASKSET, get_task_kind(MyTasks))
+        self.assertEqual(TASK_METHOD, get_task_kind(MyTasks(self.locust).t2))
+
+        tasks = WeightedTasks([(t1, 1), (MyTasks, 2)])
+        self.assertEqual([TASK_FUNCTION, TASK_TASKSET], tasks.kinds)
+        self.assertEqual(TASK_TASKSET, tasks.kind_of(MyTasks))
+        self.assertEqual(TASK_METHOD, tasks.kind_of(MyTasks(self.locust).t2))
+        tasks[0] = MyTasks(self.locust).t2
+        self.assertEqual([TASK_METHOD, TASK_TASKSET], tasks.kinds)
+
+    def test_task_queue_list(self):
+        executed = []
+
+        class MyTasks(TaskSet):
+            def t1(self):
+                executed.append("t1")
+
+            def t2(self):
+                executed.append("t2")
+
+        taskset = MyTasks(self.locust)
+        # the queue used to be a list, and may have been replaced with one
+        taskset._task_queue = [taskset.t1]
+        taskset.schedule_task(taskset.t2, first=True)
+        taskset.execute_next_task()
+        taskset.execute_next_task()
+        self.assertEqual(["t2", "t1"], executed)
+
     def test_taskset_inheritance(self):
         def t1(l):
             pass
@@ -318,6 +377,7 @@ class TestTaskSet(LocustTestCase):
 
         taskset = MyTaskSet3(self.locust)
         self.assertEqual(len(taskset.tasks), 3)
+        self.assertEqual([3], taskset.tasks.weights)
 
     def test_wait_function(self):
         class MyTaskSet(TaskSet):
@@ -432,6 +492,92 @@ class TestTaskSet(LocustTestCase):
         self.assertTrue(MyTaskSet.raised_attribute_error)
 
 
+class TestWeightedTasks(LocustTestCase):
+    def test_duplicates_are_merged(self):
+        t1 = lambda l: None
+        t2 = lambda l: None
+        tasks = WeightedTasks([(t1, 997), (t2, 3), (t1, 1), (t2, 0)])
+        self.assertEqual([t1, t2], tasks.choices)
+        self.assertEqual([(t1, 998), (t2, 3)], tasks.items())
+        self.assertEqual([t1] * 998 + [t2] * 3, tasks)
+
+    def test_alias_table(self):
+        weights = [997, 3, 50, 1, 1, 200]
+        tasks = WeightedTasks(zip(range(len(weights)), weights))
+        # the probability of each task, as given by the alias table
+        n = len(weights)
+        probabilities = [p / n for p in tasks._probabilities]
+        for i, alias in enumerate(tasks._aliases):
+            probabilities[alias] += (1 - tasks._probabilities[i]) / n
+        for p, weight in zip(probabilities, weights):
+            self.assertAlmostEqual(weight / sum(weights), p)
+
+    def test_choose(self):
+        t1 = lambda l: None
+        t2 = lambda l: None
+        t3 = lambda l: None
+        tasks = WeightedTasks([(t1, 90), (t2, 10)])
+        picked = [choose_task(tasks) for _ in range(10000)]
+        self.assertAlmostEqual(0.1, picked.count(t2) / len(picked), delta=0.02)
+        picked = [random.choice(tasks) for _ in range(10000)]
+        self.assertAlmostEqual(0.1, picked.count(t2) / len(picked), delta=0.02)
+
+        tasks[:10] = [t3] * 10
+        picked = [choose_task(tasks) for _ in range(10000)]
+        self.assertAlmostEqual(0.1, picked.count(t3) / len(picked), delta=0.02)
+        self.assertEqual(t1, choose_task([t1]))
+
+    def test_behaves_like_list_of_repeated_tasks(self):
+        t1 = lambda l: None
+        t2 = lambda l: None
+        tasks = WeightedTasks([(t1, 3), (t2, 2)])
+        expected = [t1, t1, t1, t2, t2]
+        self.assertIsInstance(tasks, list)
+        self.assertEqual(expected, tasks)
+        self.assertEqual(5, len(tasks))
+        self.assertEqual(t2, tasks[-1])
+        self.assertEqual(expected[1:4], tasks[1:4])
+        self.assertEqual(3, tasks.count(t1))
+        self.assertEqual(3, tasks.index(t2))
+
+        for modify in [
+            lambda l: l.__setitem__(0, t2),
+            lambda l: l.__setitem__(slice(1, 3), [t2]),
+            lambda l: l.__delitem__(-1),
+            lambda l: l.insert(1, t2),
+            lambda l: l.append(t1),
+            lambda l: l.extend([t2, t1]),
+            lambda l: l.pop(0),
+            lambda l: l.remove(t2),
+            lambda l: l.reverse(),
+        ]:
+            modify(expected)
+            modify(tasks)
+            self.assertEqual(expected, tasks)
+            self.assertEqual(len(expected), sum(tasks.weights))
+            self.assertEqual([(t, expected.count(t)) for t in dict.fromkeys(expected)], tasks.items())
+        tasks.clear()
+        self.assertEqual([], tasks)
+        self.assertFalse(tasks)
+
+    def test_get_next_task(self):
+        class MyTasks(TaskSet):
+            @task(1000)
+            def t1(self):
+                pass
+
+            @task(1)
+            def t2(self):
+                pass
+
+        class MyUser(User):
+            host = "127.0.0.1"
+
+        self.assertEqual([1000, 1], MyTasks.tasks.weights)
+        ts = MyTasks(MyUser(self.environment))
+        self.assertIn(ts.get_next_task(), [MyTasks.t1, MyTasks.t2])
+
+
 class TestLocustClass(LocustTestCase):
     def test_locust_wait(self):
         log = []
@@ -305,6 +305,25 @@ class LocustProcessIntegrationTest(TestCase):
             self.assertIn("Shutting down (exit code 0)", stderr)
             self.assertEqual(0, proc.returncode)
 
+    def test_metrics_port_headless(self):
+        port = get_free_tcp_port()
+        with mock_locustfile() as mocked:
+            proc = subprocess.Popen(
+                ["locust", "-f", mocked.file_path, "--headless", "-u", "1", "--metrics-port", str(port)],
+                stdout=PIPE,
+                stderr=PIPE,
+            )
+            gevent.sleep(1.9)
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/metrics")
+            finally:
+                proc.send_signal(signal.SIGTERM)
+                stdout, stderr = proc.communicate()
+            self.assertEqual(200, response.status_code)
+            self.assertIn("locust_users 1", response.text)
+            self.assertIn("Serving metrics at", stderr.decode("utf-8"))
+            self.assertNotIn("Traceback", stderr.decode("utf-8"))
+
     def test_default_headless_spawn_options(self):
         with mock_locustfile() as mocked:
             output = (
@@ -879,3 +898,43 @@ class SecondUser(HttpUser):
             self.assertNotIn("task2", stdout_worker)
             self.assertEqual(0, proc.returncode)
             self.assertEqual(0, proc_worker.returncode)
+
+    def test_processes(self):
+        with mock_locustfile() as mocked:
+            proc = subprocess.Popen(
+                [
+                    "locust",
+                    "-f",
+                    mocked.file_path,
+                    "--headless",
+                    "--processes",
+                    "2",
+                    "-t",
+                    "2",
+                    "-u",
+                    "2",
+                    "--exit-code-on-error",
+                    "0",
+                ],
+                stdout=PIPE,
+                stderr=PIPE,
+            )
+            _, stderr = proc.communicate(timeout=20)
+            stderr = stderr.decode("utf-8")
+            self.assertIn("Currently 2 clients ready to swarm", stderr)
+            self.assertIn("Sending spawn jobs of 2 users at 1.00 spawn rate to 2 ready clients", stderr)
+            # the master and both workers shut down
+            self.assertEqual(3, stderr.count("Shutting down (exit code 0)"), stderr)
+            self.assertIn("Aggregated", stderr)
+            self.assertEqual(0, proc.returncode)
+
+    def test_processes_cannot_be_combined_with_worker(self):
+        with mock_locustfile() as mocked:
+            proc = subprocess.Popen(
+                ["locust", "-f", mocked.file_path, "--processes", "2", "--worker"],
+                stdout=PIPE,
+                stderr=PIPE,
+            )
+            _, stderr = proc.communicate(timeout=10)
+            self.assertIn("cannot be combined with --master, --worker or --relay", stderr.decode("utf-8"))
+            self.assertEqual(1, proc.returncode)
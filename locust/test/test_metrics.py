@@ -0,0 +1,57 @@
+from locust.env import Environment
+from locust.histogram import get_histogram_factory
+from locust.metrics import MetricsExporter
+from locust.stats import RequestStats
+from .testcases import LocustTestCase
+
+
+class TestMetricsExporter(LocustTestCase):
+    def setUp(self):
+        super().setUp()
+        self.exporter = MetricsExporter(self.environment, cache_time=0, buckets=(10, 100, 1000))
+
+    def samples(self):
+        return dict(
+            line.rsplit(" ", 1) for line in self.exporter.render().splitlines() if line and not line.startswith("#")
+        )
+
+    def test_metrics(self):
+        for response_time in (5, 10, 50, 500, 5000):
+            self.environment.stats.log_request("GET", "/", response_time, 100)
+        self.environment.stats.log_error("GET", "/", "oops")
+        self.environment.stats.log_request("POST", '/a"b', 20, 10)
+        samples = self.samples()
+        self.assertEqual("0", samples["locust_users"])
+        self.assertEqual("5", samples['locust_requests_total{method="GET",name="/"}'])
+        self.assertEqual("1", samples['locust_failures_total{method="GET",name="/"}'])
+        self.assertEqual("500", samples['locust_response_size_bytes_total{method="GET",name="/"}'])
+        self.assertEqual("2", samples['locust_response_time_seconds_bucket{method="GET",name="/",le="0.01"}'])
+        self.assertEqual("3", samples['locust_response_time_seconds_bucket{method="GET",name="/",le="0.1"}'])
+        self.assertEqual("4", samples['locust_response_time_seconds_bucket{method="GET",name="/",le="1.0"}'])
+        self.assertEqual("5", samples['locust_response_time_seconds_bucket{method="GET",name="/",le="+Inf"}'])
+        self.assertEqual("5", samples['locust_response_time_seconds_count{method="GET",name="/"}'])
+        self.assertEqual("5.565", samples['locust_response_time_seconds_sum{method="GET",name="/"}'])
+        self.assertEqual("1", samples['locust_requests_total{method="POST",name="/a\\"b"}'])
+        # the aggregated entry isn't included, it can be calculated using sum()
+        self.assertNotIn("Aggregated", self.exporter.render())
+
+    def test_hdr_histogram(self):
+        environment = Environment()
+        environment.stats = RequestStats(histogram_factory=get_histogram_factory("hdr"))
+        environment.create_local_runner()
+        exporter = MetricsExporter(environment, buckets=(10, 100, 1000))
+        for response_time in (5, 50, 500):
+            environment.stats.log_request("GET", "/", response_time, 100)
+        text = exporter.render()
+        self.assertIn('locust_response_time_seconds_bucket{method="GET",name="/",le="0.1"} 2', text)
+        self.assertIn('locust_response_time_seconds_bucket{method="GET",name="/",le="+Inf"} 3', text)
+        self.assertIn("locust_reporter_io_pending_writes 0", text)
+        environment.runner.quit()
+
+    def test_cached(self):
+        self.exporter.cache_time = 60
+        self.exporter.render()
+        self.environment.stats.log_request("GET", "/", 5, 100)
+        self.assertNotIn("locust_requests_total", self.samples())
+        self.exporter.cache_time = 0
+        self.assertIn('locust_requests_total{method="GET",name="/"}', self.samples())
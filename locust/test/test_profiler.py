@@ -0,0 +1,76 @@
+import sys
+
+import gevent
+
+from locust import User, constant, task
+from locust.env import Environment
+from locust.event import EventHook
+from locust.profiler import MESSAGE_TYPE, Profiler, fold_stack
+from locust.rpc import Message
+
+from .testcases import LocustTestCase
+
+
+class TestFoldStack(LocustTestCase):
+    def test_frames(self):
+        stack = fold_stack(sys._getframe()).split(";")
+        self.assertEqual("other", stack[0])
+        self.assertEqual("test_frames (locust/test/test_profiler.py:15)", stack[-1])
+
+    def test_event_listener(self):
+        stacks = []
+        hook = EventHook()
+        hook.add_listener(lambda: stacks.append(fold_stack(sys._getframe())))
+        hook.fire()
+        self.assertEqual("events", stacks[0].split(";")[0])
+        self.assertIn("fire (locust/event.py:", stacks[0])
+
+    def test_user_task(self):
+        stacks = []
+
+        class MyUser(User):
+            wait_time = constant(0)
+
+            @task
+            def my_task(self):
+                stacks.append(fold_stack(sys._getframe()))
+                raise gevent.GreenletExit()
+
+        MyUser(self.environment).run()
+        self.assertEqual("user", stacks[0].split(";")[0])
+
+
+class TestProfiler(LocustTestCase):
+    def test_sampling(self):
+        profiler = Profiler(self.environment, interval=0.001)
+        profiler.start()
+        try:
+            gevent.sleep(0.2)
+        finally:
+            profiler.stop()
+        summary = profiler.summary()
+        self.assertAlmostEqual(1.0, sum(summary.values()))
+        self.assertGreater(summary["idle"], 0.5)
+        self.assertGreater(profiler.node_samples["local"], 10)
+        self.assertTrue(profiler.folded().startswith("idle;"))
+
+    def test_merges_samples_from_workers(self):
+        environment = Environment()
+        runner = environment.create_master_runner("*", 0)
+        try:
+            profiler = environment.create_profiler()
+            profiler.stop()
+            runner.custom_messages[MESSAGE_TYPE](
+                environment=environment, msg=Message(MESSAGE_TYPE, {"user;a;b": 3, "stats;a;c": 1}, "worker1")
+            )
+            runner.custom_messages[MESSAGE_TYPE](
+                environment=environment, msg=Message(MESSAGE_TYPE, {"user;a;b": 1}, "worker2")
+            )
+            self.assertEqual(4, profiler.samples["user;a;b"])
+            self.assertEqual(
+                {"worker1": 4, "worker2": 1}, {k: v for k, v in profiler.node_samples.items() if k != "local"}
+            )
+            self.assertIn("stats;a;c 1\n", profiler.folded())
+            self.assertAlmostEqual(0.2, profiler.summary()["stats"], delta=0.05)
+        finally:
+            runner.quit()
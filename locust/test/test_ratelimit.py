@@ -0,0 +1,204 @@
+import gevent
+import mock
+
+from locust import RateLimit, User, __version__, rate_limited, task
+from locust.env import Environment
+from locust.ratelimit import MESSAGE_TYPE, allocate, rate_limits
+from locust.rpc import Message
+
+from .testcases import LocustTestCase
+from .test_runners import mocked_rpc
+
+
+class TestRateLimit(LocustTestCase):
+    def tearDown(self):
+        rate_limits.clear()
+        super().tearDown()
+
+    def test_acquire(self):
+        rate_limit = RateLimit("test", 100)
+        count = 0
+
+        def acquire():
+            nonlocal count
+            while True:
+                rate_limit.acquire()
+                count += 1
+
+        greenlets = [gevent.spawn(acquire) for _ in range(10)]
+        gevent.sleep(1)
+        gevent.killall(greenlets)
+        self.assertAlmostEqual(100, count, delta=10)
+
+    def test_burst(self):
+        rate_limit = RateLimit("test", 10, burst=5)
+        self.assertEqual([0.0] * 5, [rate_limit.reserve() for _ in range(5)])
+        self.assertAlmostEqual(0.1, rate_limit.reserve(), delta=0.01)
+        self.assertAlmostEqual(0.2, rate_limit.reserve(), delta=0.01)
+
+    def test_try_acquire(self):
+        rate_limit = RateLimit("test", 10)
+        self.assertTrue(rate_limit.try_acquire())
+        self.assertFalse(rate_limit.try_acquire())
+        gevent.sleep(0.11)
+        self.assertTrue(rate_limit.try_acquire())
+        self.assertEqual(2, rate_limit.take_usage())
+        self.assertEqual(0, rate_limit.take_usage())
+
+    def test_wait_for_budget(self):
+        rate_limit = RateLimit("test", 10)
+        rate_limit.set_local_rate(None)
+        greenlet = gevent.spawn(rate_limit.acquire)
+        gevent.sleep(0.1)
+        self.assertFalse(greenlet.ready())
+        self.assertFalse(rate_limit.try_acquire())
+        rate_limit.set_local_rate(5)
+        greenlet.join(timeout=1)
+        self.assertTrue(greenlet.ready())
+        self.assertAlmostEqual(0.2, rate_limit.reserve(), delta=0.01)
+
+    def test_duplicate_name(self):
+        RateLimit("test", 10)
+        rate_limit = RateLimit("test", 20)
+        self.assertIs(rate_limit, rate_limits["test"])
+        self.assertEqual({"test": rate_limit}, Environment().rate_limits)
+
+    def test_environment_rate_limits(self):
+        rate_limit = RateLimit("test", 10)
+        environment = Environment()
+        RateLimit("later", 20)
+        self.assertEqual({"test": rate_limit}, environment.rate_limits)
+        other = RateLimit("other", 30)
+        self.assertEqual({"other": other}, Environment(rate_limits=[other]).rate_limits)
+
+    def test_rate_limited(self):
+        class MyUser(User):
+            wait_time = rate_limited(RateLimit("test", 50))
+            runs = 0
+
+            @task
+            def t(self):
+                MyUser.runs += 1
+
+        environment = Environment(user_classes=[MyUser])
+        runner = environment.create_local_runner()
+        try:
+            runner.start(10, spawn_rate=10, wait=True)
+            gevent.sleep(1)
+            # plus the first task of each user, which runs before its first wait
+            self.assertAlmostEqual(60, MyUser.runs, delta=8)
+        finally:
+            runner.quit()
+
+
+class TestAllocate(LocustTestCase):
+    def test_unknown_usage(self):
+        self.assertEqual({"a": 50, "b": 50}, allocate(100, {"a": (None, None), "b": (None, None)}))
+
+    def test_all_unconstrained(self):
+        self.assertEqual({"a": 50, "b": 50}, allocate(100, {"a": (10, 50), "b": (20, 50)}))
+
+    def test_constrained(self):
+        shares = allocate(100, {"a": (10, 25), "b": (25, 25), "c": (25, 25), "d": (0, 25)})
+        self.assertAlmostEqual(12, shares["a"])
+        self.assertAlmostEqual(2.5, shares["d"])
+        self.assertAlmostEqual(42.75, shares["b"])
+        self.assertAlmostEqual(42.75, shares["c"])
+        self.assertAlmostEqual(100, sum(shares.values()))
+
+
+class TestRateLimitBalancer(LocustTestCase):
+    def tearDown(self):
+        rate_limits.clear()
+        super().tearDown()
+
+    def test_master_rebalances(self):
+        RateLimit("test", 100)
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            environment = Environment()
+            master = environment.create_master_runner("*", 0)
+            try:
+                for i in range(2):
+                    server.mocked_send(Message("client_ready", __version__, "fake_client%i" % i))
+                environment.events.test_start.fire(environment=environment)
+                budgets = {node_id: msg.data for node_id, msg in server.outbox if msg.type == MESSAGE_TYPE}
+                self.assertEqual({"fake_client0": {"test": 50}, "fake_client1": {"test": 50}}, budgets)
+
+                server.outbox.clear()
+                environment.rate_limit_balancer.on_worker_report("fake_client0", {"rate_limits": {"test": 30}})
+                environment.rate_limit_balancer.on_worker_report("fake_client1", {"rate_limits": {"test": 150}})
+                budgets = {node_id: msg.data for node_id, msg in server.outbox if msg.type == MESSAGE_TYPE}
+                # fake_client0 used 10/s of its 50/s, and gets 12/s
+                self.assertAlmostEqual(12, budgets["fake_client0"]["test"], delta=0.1)
+                self.assertAlmostEqual(88, budgets["fake_client1"]["test"], delta=0.1)
+            finally:
+                master.quit()
+
+    def test_worker_connecting_after_test_start(self):
+        RateLimit("test", 100)
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            environment = Environment()
+            master = environment.create_master_runner("*", 0)
+            try:
+                server.mocked_send(Message("client_ready", __version__, "fake_client0"))
+                environment.events.test_start.fire(environment=environment)
+                server.outbox.clear()
+                server.mocked_send(Message("client_ready", __version__, "fake_client1"))
+                budgets = {node_id: msg.data for node_id, msg in server.outbox if msg.type == MESSAGE_TYPE}
+                self.assertEqual({"fake_client0": {"test": 50}, "fake_client1": {"test": 50}}, budgets)
+            finally:
+                master.quit()
+
+    def test_worker(self):
+        rate_limit = RateLimit("test", 100)
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            environment = Environment()
+            worker = environment.create_worker_runner("localhost", 5557)
+            try:
+                self.assertIsNone(rate_limit.local_rate)
+                client.mocked_send(Message(MESSAGE_TYPE, {"test": 25, "other": 10}, "dummy_client_id"))
+                self.assertEqual(25, rate_limit.local_rate)
+
+                rate_limit.acquire(3)
+                data = {}
+                environment.events.report_to_master.fire(client_id=worker.client_id, data=data)
+                self.assertEqual({"test": 3}, data["rate_limits"])
+            finally:
+                worker.quit()
+
+    def test_worker_only_waits_for_its_rate_limits(self):
+        rate_limit = RateLimit("test", 100)
+        other = RateLimit("other", 100)
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            environment = Environment(rate_limits=[rate_limit])
+            worker = environment.create_worker_runner("localhost", 5557)
+            try:
+                self.assertIsNone(rate_limit.local_rate)
+                self.assertEqual(100, other.local_rate)
+                client.mocked_send(Message(MESSAGE_TYPE, {"test": 25, "other": 10}, "dummy_client_id"))
+                self.assertEqual(25, rate_limit.local_rate)
+                self.assertEqual(100, other.local_rate)
+            finally:
+                worker.quit()
+
+    def test_relay(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server, mock.patch(
+            "locust.rpc.rpc.Client", mocked_rpc()
+        ) as client:
+            environment = Environment()
+            relay = environment.create_relay_runner("localhost", 5557, "*", 0)
+            try:
+                for i in range(2):
+                    server.mocked_send(Message("client_ready", __version__, "fake_client%i" % i))
+                server.outbox.clear()
+                client.mocked_send(Message(MESSAGE_TYPE, {"test": 40}, "dummy_client_id"))
+                budgets = {node_id: msg.data for node_id, msg in server.outbox if msg.type == MESSAGE_TYPE}
+                self.assertEqual({"fake_client0": {"test": 20}, "fake_client1": {"test": 20}}, budgets)
+
+                environment.rate_limit_balancer.on_worker_report("fake_client0", {"rate_limits": {"test": 5}})
+                environment.rate_limit_balancer.on_worker_report("fake_client1", {"rate_limits": {"test": 7}})
+                data = {}
+                environment.events.report_to_master.fire(client_id=relay.client_id, data=data)
+                self.assertEqual({"test": 12}, data["rate_limits"])
+            finally:
+                relay.quit()
@@ -0,0 +1,76 @@
+import math
+import os
+import tempfile
+
+from locust.env import Environment
+from locust.event import Events
+from locust.recorder import read_recording
+from .testcases import LocustTestCase
+
+
+class TestRequestRecorder(LocustTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "requests.rec")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def fire_request(self, environment, name="/", **kwargs):
+        kwargs.setdefault("request_type", "GET")
+        kwargs.setdefault("response_time", 12.5)
+        kwargs.setdefault("response_length", 100)
+        kwargs.setdefault("exception", None)
+        kwargs.setdefault("context", {})
+        environment.events.request.fire(name=name, **kwargs)
+
+    def test_record_requests(self):
+        environment = Environment(events=Events())
+        recorder = environment.create_request_recorder(self.path)
+        recorder.chunk_size = 3
+        self.fire_request(environment, "/a", start_time=1000.0)
+        self.fire_request(environment, "/b", start_time=1001.0, request_type="POST", context={"user": 1})
+        self.fire_request(environment, "/a", start_time=1002.0, exception=ValueError("oops"), response_length=None)
+        self.assertEqual(0, recorder.buffered_requests)
+        self.fire_request(environment, "/c", response_time=None)
+        self.assertEqual(1, recorder.buffered_requests)
+        environment.events.quitting.fire(environment=environment)
+
+        chunks = list(read_recording(self.path))
+        self.assertEqual([3, 1], [len(chunk["name"]) for chunk in chunks])
+        chunk = chunks[0]
+        self.assertEqual("local", chunk["node"])
+        self.assertEqual([1000.0, 1001.0, 1002.0], list(chunk["start_time"]))
+        self.assertEqual([12.5, 12.5, 12.5], list(chunk["response_time"]))
+        self.assertEqual([100, 100, 0], list(chunk["response_length"]))
+        self.assertEqual(["GET", "POST", "GET"], chunk["request_type"])
+        self.assertEqual(["/a", "/b", "/a"], chunk["name"])
+        self.assertEqual([None, None, "ValueError('oops')"], chunk["exception"])
+        self.assertEqual([None, '{"user": 1}', None], chunk["context"])
+        # requests without a response time are recorded as nan
+        self.assertTrue(math.isnan(chunks[1]["response_time"][0]))
+        self.assertEqual(["/c"], chunks[1]["name"])
+
+    def test_requests_from_workers_are_merged(self):
+        master_environment = Environment(events=Events())
+        master_environment.create_request_recorder(self.path)
+        for worker_id in ("worker1", "worker2"):
+            environment = Environment(events=Events())
+            recorder = environment.create_request_recorder(node=worker_id)
+            self.fire_request(environment, "/" + worker_id, start_time=1000.0)
+            data = {}
+            environment.events.report_to_master.fire(client_id=worker_id, data=data)
+            self.assertEqual(0, recorder.buffered_requests)
+            self.assertEqual(1, len(data["request_records"]))
+            master_environment.events.worker_report.fire(client_id=worker_id, data=data)
+        # there's nothing to send in the next report
+        data = {}
+        environment.events.report_to_master.fire(client_id="worker2", data=data)
+        self.assertEqual([], data["request_records"])
+        master_environment.events.quitting.fire(environment=master_environment)
+
+        chunks = list(read_recording(self.path))
+        self.assertEqual(["worker1", "worker2"], [chunk["node"] for chunk in chunks])
+        self.assertEqual([["/worker1"], ["/worker2"]], [chunk["name"] for chunk in chunks])
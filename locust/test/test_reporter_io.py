@@ -0,0 +1,89 @@
+import logging
+import os
+import tempfile
+import time
+
+import gevent
+import mock
+
+from locust.log import BackgroundFileHandler
+from locust.reporter_io import ReporterIO
+from locust.reporter_io import reporter_io as shared_reporter_io
+
+from .testcases import LocustTestCase
+
+
+class TestReporterIO(LocustTestCase):
+    def test_writes_in_order_without_blocking(self):
+        reporter_io = ReporterIO()
+        with tempfile.TemporaryFile("w+") as f:
+            start = time.time()
+            reporter_io.submit(time.sleep, 0.1)
+            for i in range(10):
+                reporter_io.write(f, "%i\n" % i)
+            self.assertLess(time.time() - start, 0.05)
+            stats = reporter_io.stats()
+            self.assertEqual(11, stats["pending_writes"])
+            self.assertEqual(20, stats["pending_bytes"])
+
+            reporter_io.call(f.seek, 0)
+            self.assertEqual([str(i) for i in range(10)], f.read().split())
+        stats = reporter_io.stats()
+        self.assertEqual(0, stats["pending_writes"])
+        self.assertEqual(0, stats["pending_bytes"])
+        self.assertEqual(12, stats["completed_writes"])
+        self.assertEqual(12, stats["max_pending_writes"])
+
+    def test_failed_writes(self):
+        reporter_io = ReporterIO()
+
+        def fail():
+            raise OSError("disk full")
+
+        result = reporter_io.submit(fail)
+        self.assertRaises(OSError, result.get)
+        self.assertEqual(1, reporter_io.stats()["failed_writes"])
+        self.assertEqual(1, len(self.mocked_log.error))
+
+    def test_background_file_handler(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "test.log")
+            handler = BackgroundFileHandler(path)
+            logger = logging.getLogger("test_background_file_handler")
+            logger.addHandler(handler)
+            try:
+                for i in range(3):
+                    logger.warning("message %i", i)
+                gevent.sleep(0)
+                handler.flush()
+                with open(path) as f:
+                    self.assertEqual(["message 0", "message 1", "message 2"], f.read().splitlines())
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+
+    def test_called_from_another_thread_first(self):
+        reporter_io = ReporterIO()
+        calls = []
+        gevent.get_hub().threadpool.apply(reporter_io.submit, (calls.append, "thread"))
+        # run directly, without taking the other thread for the loop thread
+        self.assertEqual(["thread"], calls)
+        reporter_io.call(calls.append, "loop")
+        self.assertEqual(["thread", "loop"], calls)
+        self.assertEqual(1, reporter_io.stats()["completed_writes"])
+
+    @mock.patch("locust.log.HANDLER_FLUSH_TIMEOUT", new=0.1)
+    def test_background_file_handler_flush_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            handler = BackgroundFileHandler(os.path.join(tmp_dir, "test.log"))
+            shared_reporter_io.submit(time.sleep, 1)
+            start = time.time()
+            # like logging.shutdown()
+            handler.acquire()
+            try:
+                handler.flush()
+                handler.close()
+            finally:
+                handler.release()
+            self.assertLess(time.time() - start, 0.5)
+            shared_reporter_io.call(lambda: None)
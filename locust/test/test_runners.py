@@ -18,6 +18,7 @@ import locust
 from locust import (
     LoadTestShape,
     constant,
+    constant_pacing,
     runners,
     __version__,
 )
@@ -28,6 +29,7 @@ from locust.exception import (
     StopUser,
 )
 from locust.main import create_environment
+from locust.profiler import CATEGORIES
 from locust.rpc import Message
 from locust.runners import (
     LocalRunner,
@@ -39,8 +41,11 @@ from locust.runners import (
     STATE_STOPPED,
     WorkerNode,
     WorkerRunner,
+    _split_user_classes_count,
 )
 from locust.stats import RequestStats
+from locust.stats_codec import STATS_CODEC, StatsDecoder, StatsEncoder
+from locust.stats_shm import StatsRingReader, StatsRingWriter
 from .testcases import LocustTestCase
 from locust.user import (
     TaskSet,
@@ -91,6 +96,13 @@ def mocked_rpc():
     return MockedRpcServerClient
 
 
+def heartbeat_data(state=STATE_INIT, **data):
+    """
+    The data of a heartbeat message from a worker, which can advertise the stats encodings it supports
+    """
+    return {"state": state, "current_cpu_usage": 0, "current_memory_usage": 0, **data}
+
+
 class mocked_options:
     def __init__(self):
         self.spawn_rate = 5
@@ -1817,6 +1829,270 @@ class TestMasterRunner(LocustTestCase):
             self.assertEqual(3, len(master.clients))
             self.assertEqual(1, len(self.mocked_log.warning))
 
+    def test_worker_stats_codec_negotiation(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "old_worker"))
+            server.mocked_send(Message("heartbeat", heartbeat_data(), "old_worker"))
+            self.assertEqual(0, len(server.outbox))
+            server.mocked_send(Message("client_ready", __version__, "new_worker"))
+            self.assertEqual(0, len(server.outbox))
+            server.mocked_send(Message("heartbeat", heartbeat_data(stats_codecs=[STATS_CODEC]), "new_worker"))
+            self.assertEqual(2, len(master.clients))
+            self.assertEqual([("new_worker", "stats_codec")], [(client_id, m.type) for client_id, m in server.outbox])
+            self.assertEqual(STATS_CODEC, server.outbox[0][1].data)
+
+            old_stats = RequestStats()
+            old_stats.log_request("GET", "/", 100, 0)
+            server.mocked_send(
+                Message(
+                    "stats",
+                    {
+                        "stats": old_stats.serialize_stats(),
+                        "stats_total": old_stats.total.get_stripped_report(),
+                        "errors": old_stats.serialize_errors(),
+                        "user_count": 1,
+                    },
+                    "old_worker",
+                )
+            )
+            encoder = StatsEncoder()
+            new_stats = RequestStats()
+            new_stats.log_request("GET", "/", 300, 0)
+            new_stats.log_request("GET", "/new", 200, 0)
+            new_stats.log_error("GET", "/new", "oops")
+            stats_names, stats_delta = encoder.encode(new_stats)
+            server.mocked_send(
+                Message(
+                    "stats",
+                    {
+                        "stats_names": stats_names,
+                        "stats_delta": stats_delta,
+                        "errors": new_stats.serialize_errors(),
+                        "user_count": 1,
+                    },
+                    "new_worker",
+                )
+            )
+            master._stats_queue.join()
+            self.assertEqual(3, master.stats.total.num_requests)
+            self.assertEqual(2, master.stats.get("/", "GET").num_requests)
+            self.assertEqual(300, master.stats.get("/", "GET").max_response_time)
+            self.assertEqual(1, master.stats.get("/new", "GET").num_failures)
+            self.assertEqual(1, len(master.stats.errors))
+
+    def test_worker_stats_codec_unknown_entry(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "fake_client"))
+            server.mocked_send(Message("heartbeat", heartbeat_data(stats_codecs=[STATS_CODEC]), "fake_client"))
+            encoder = StatsEncoder()
+            stats = RequestStats()
+
+            def send_stats():
+                stats_names, stats_delta = encoder.encode(stats)
+                server.mocked_send(
+                    Message(
+                        "stats",
+                        {"stats_names": stats_names, "stats_delta": stats_delta, "errors": {}, "user_count": 1},
+                        "fake_client",
+                    )
+                )
+                master._stats_queue.join()
+
+            stats.log_request("GET", "/", 300, 0)
+            stats.log_request("GET", "/other", 100, 0)
+            send_stats()
+            # the master loses track of the names, e.g. because the worker was considered missing for a while
+            master._stats_decoders["fake_client"] = StatsDecoder()
+            stats.log_request("GET", "/", 300, 0)
+            stats.log_request("GET", "/", 300, 0)
+            stats.log_request("GET", "/new", 50, 0)
+            send_stats()
+            self.assertEqual(5, master.stats.total.num_requests)
+            self.assertEqual(1, master.stats.get("/", "GET").num_requests)
+            # the worker is asked to send the names again
+            self.assertEqual(["stats_codec", "stats_codec"], [m.type for _, m in server.outbox])
+            self.assertEqual(0, len(self.mocked_log.warning))
+
+            encoder.reset()
+            stats.log_request("GET", "/other", 100, 0)
+            send_stats()
+            self.assertEqual(6, master.stats.total.num_requests)
+            self.assertEqual(3, master.stats.get("/", "GET").num_requests)
+            self.assertEqual(2, master.stats.get("/other", "GET").num_requests)
+            self.assertEqual(1, master.stats.get("/new", "GET").num_requests)
+            self.assertEqual(
+                master.stats.total.num_requests, sum(e.num_requests for e in master.stats.entries.values())
+            )
+            self.assertEqual(2, len(server.outbox))
+
+    def test_relay_weight(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "worker"))
+            server.mocked_send(Message("client_ready", {"version": __version__, "weight": 2}, "relay"))
+            self.assertEqual(1, master.clients["worker"].weight)
+            self.assertEqual(2, master.clients["relay"].weight)
+            server.mocked_send(Message("heartbeat", heartbeat_data(weight=3), "relay"))
+            self.assertEqual(3, master.clients["relay"].weight)
+            # a relay sends client_ready again after a test has been stopped
+            server.mocked_send(Message("client_stopped", None, "relay"))
+            server.mocked_send(Message("client_ready", {"version": __version__, "weight": 3}, "relay"))
+            self.assertEqual(3, master.clients["relay"].weight)
+            self.assertEqual(0, len(self.mocked_log.warning))
+
+    def test_worker_stats_shm(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            ring = StatsRingWriter()
+            try:
+                server.mocked_send(Message("client_ready", __version__, "fake_client"))
+                server.mocked_send(
+                    Message(
+                        "heartbeat",
+                        heartbeat_data(stats_codecs=[STATS_CODEC], stats_shm={"path": ring.path, "token": ring.token}),
+                        "fake_client",
+                    )
+                )
+                self.assertEqual(["stats_codec", "stats_shm"], [m.type for _, m in server.outbox])
+                # the file is removed as soon as the master has opened it
+                self.assertFalse(os.path.exists(ring.path))
+
+                encoder = StatsEncoder()
+                stats = RequestStats()
+                stats.log_request("GET", "/", 300, 0)
+                stats_names, payload = encoder.encode_flat(stats)
+                server.mocked_send(
+                    Message(
+                        "stats",
+                        {"stats_names": stats_names, "stats_shm": ring.write(payload), "errors": {}, "user_count": 1},
+                        "fake_client",
+                    )
+                )
+                master._stats_queue.join()
+                self.assertEqual(1, master.stats.total.num_requests)
+                self.assertEqual(1, master.stats.get("/", "GET").num_requests)
+
+                # a report that isn't in the ring buffer is discarded
+                server.mocked_send(
+                    Message(
+                        "stats",
+                        {"stats_names": [], "stats_shm": 12345, "errors": {}, "user_count": 1},
+                        "fake_client",
+                    )
+                )
+                master._stats_queue.join()
+                self.assertEqual(1, master.stats.total.num_requests)
+                self.assertEqual(1, len(self.mocked_log.warning))
+
+                # when the ring buffer is full, the same layout is sent over zmq
+                stats.log_request("GET", "/", 300, 0)
+                stats_names, payload = encoder.encode_flat(stats)
+                server.mocked_send(
+                    Message(
+                        "stats",
+                        {"stats_names": stats_names, "stats_flat": payload, "errors": {}, "user_count": 1},
+                        "fake_client",
+                    )
+                )
+                master._stats_queue.join()
+                self.assertEqual(2, master.stats.total.num_requests)
+            finally:
+                ring.close()
+
+    def test_worker_stats_shm_on_another_machine(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "fake_client"))
+            server.mocked_send(
+                Message(
+                    "heartbeat",
+                    heartbeat_data(
+                        stats_codecs=[STATS_CODEC], stats_shm={"path": "/this/file/does/not/exist", "token": "token"}
+                    ),
+                    "fake_client",
+                )
+            )
+            # the worker isn't told to use shared memory, so it will keep sending its stats over zmq
+            self.assertEqual(["stats_codec"], [m.type for _, m in server.outbox])
+
+    def test_final_stats_report_is_merged_when_worker_quits(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "fake_client"))
+            server.mocked_send(Message("heartbeat", heartbeat_data(stats_codecs=[STATS_CODEC]), "fake_client"))
+            stats = RequestStats()
+            stats.log_request("GET", "/", 300, 0)
+            stats_names, stats_delta = StatsEncoder().encode(stats)
+            # the quit message is received before the final report has been merged
+            server.queue.put(
+                Message(
+                    "stats",
+                    {"stats_names": stats_names, "stats_delta": stats_delta, "errors": {}, "user_count": 0},
+                    "fake_client",
+                ).serialize()
+            )
+            server.queue.put(Message("quit", None, "fake_client").serialize())
+            sleep(0.1)
+            self.assertEqual(0, len(master.clients))
+            self.assertEqual(1, master.stats.total.num_requests)
+            self.assertEqual({}, master._stats_decoders)
+
+    def test_messages_are_handled_while_merging_large_stats_reports(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            stats_when_probed = []
+
+            def on_probe(environment, msg, **kwargs):
+                stats_when_probed.append((len(master.stats.entries), master.stats.total.num_requests))
+
+            master.register_message("probe", on_probe)
+            server.mocked_send(Message("client_ready", __version__, "fake_client"))
+
+            stats = RequestStats()
+            for i in range(1000):
+                stats.log_request("GET", "/%i" % i, 100, 0)
+            server.mocked_send(
+                Message(
+                    "stats",
+                    {
+                        "stats": stats.serialize_stats(),
+                        "stats_total": stats.total.get_stripped_report(),
+                        "errors": stats.serialize_errors(),
+                        "user_count": 1,
+                    },
+                    "fake_client",
+                )
+            )
+            server.mocked_send(Message("probe", None, "fake_client"))
+            # the probe was handled while the report was being unserialized, and none of it was merged yet
+            self.assertEqual([(0, 0)], stats_when_probed)
+
+            sleep(0.1)
+            self.assertTrue(master._stats_queue.empty())
+            self.assertEqual(1000, len(master.stats.entries))
+            self.assertEqual(1000, master.stats.total.num_requests)
+
+    def test_stats_reports_are_merged_before_quitting(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "fake_client"))
+            stats = RequestStats()
+            for i in range(1000):
+                stats.log_request("GET", "/%i" % i, 100, 0)
+            data = {
+                "stats": stats.serialize_stats(),
+                "stats_total": stats.total.get_stripped_report(),
+                "errors": {},
+                "user_count": 1,
+            }
+            for _ in range(2):
+                server.mocked_send(Message("stats", data, "fake_client"))
+            self.assertFalse(master._stats_queue.empty())
+            master.quit()
+            self.assertEqual(2000, master.stats.total.num_requests)
+
     def test_worker_stats_report_median(self):
         with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
             master = self.get_runner()
@@ -1831,6 +2107,7 @@ class TestMasterRunner(LocustTestCase):
             master.stats.clear_all()
 
             server.mocked_send(Message("stats", data, "fake_client"))
+            master._stats_queue.join()
             s = master.stats.get("/", "GET")
             self.assertEqual(700, s.median_response_time)
 
@@ -1853,6 +2130,7 @@ class TestMasterRunner(LocustTestCase):
             master.stats.clear_all()
 
             server.mocked_send(Message("stats", data, "fake_client"))
+            master._stats_queue.join()
             s1 = master.stats.get("/mixed", "GET")
             self.assertEqual(700, s1.median_response_time)
             self.assertEqual(500, s1.avg_response_time)
@@ -1994,6 +2272,7 @@ class TestMasterRunner(LocustTestCase):
                     "fake_client",
                 )
             )
+            master._stats_queue.join()
             self.assertEqual(700, master.stats.total.median_response_time)
 
     def test_master_total_stats_with_none_response_times(self):
@@ -2045,6 +2324,7 @@ class TestMasterRunner(LocustTestCase):
                     "fake_client",
                 )
             )
+            master._stats_queue.join()
             self.assertEqual(700, master.stats.total.median_response_time)
 
     def test_master_current_response_times(self):
@@ -2071,6 +2351,7 @@ class TestMasterRunner(LocustTestCase):
                         "fake_client",
                     )
                 )
+                master._stats_queue.join()
                 mocked_time.return_value += 1
                 stats2 = RequestStats()
                 stats2.log_request("GET", "/2", 400, 2201)
@@ -2086,6 +2367,7 @@ class TestMasterRunner(LocustTestCase):
                         "fake_client",
                     )
                 )
+                master._stats_queue.join()
                 mocked_time.return_value += 4
                 self.assertEqual(400, master.stats.total.get_current_response_time_percentile(0.5))
                 self.assertEqual(800, master.stats.total.get_current_response_time_percentile(0.95))
@@ -2108,6 +2390,7 @@ class TestMasterRunner(LocustTestCase):
                         "fake_client",
                     )
                 )
+                master._stats_queue.join()
                 self.assertEqual(30, master.stats.total.get_current_response_time_percentile(0.5))
                 self.assertEqual(3000, master.stats.total.get_current_response_time_percentile(0.95))
 
@@ -2332,6 +2615,26 @@ class TestMasterRunner(LocustTestCase):
 
             self.assertEqual(2, num_users, "Total number of locusts that would have been spawned is not 2")
 
+    def test_spawn_messages_split_arrival_rate(self):
+        class TestUser(User):
+            @task
+            def my_task(self):
+                pass
+
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server:
+            master = self.get_runner(user_classes=[TestUser])
+            self.environment.create_arrival_executor(100, ramp=10)
+
+            for i in range(4):
+                server.mocked_send(Message("client_ready", __version__, "fake_client%i" % i))
+
+            master.start(8, 8)
+            spawn_messages = [msg for _, msg in server.outbox if msg.type == "spawn"]
+            self.assertEqual(4, len(spawn_messages))
+            for msg in spawn_messages:
+                self.assertEqual(25, msg.data["arrival_rate"])
+                self.assertEqual(2.5, msg.data["arrival_rate_ramp"])
+
     def test_custom_shape_scale_up(self):
         class MyUser(User):
             @task
@@ -2655,6 +2958,37 @@ class TestWorkerRunner(LocustTestCase):
         environment.user_classes = user_classes
         return WorkerRunner(environment, master_host="localhost", master_port=5557)
 
+    def test_worker_corrects_batched_requests_for_coordinated_omission(self):
+        class MyUser(User):
+            wait_time = constant_pacing(1)
+
+            @task
+            def my_task(self):
+                pass
+
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            environment = Environment()
+            environment.events.request.enable_batching()
+            worker = self.get_runner(environment=environment, user_classes=[MyUser])
+            self.assertIsNone(environment.events.request.expected_interval)
+            client.mocked_send(
+                Message(
+                    "spawn",
+                    {
+                        "timestamp": 1605538584,
+                        "user_classes_count": {"MyUser": 1},
+                        "host": "",
+                        "stop_timeout": None,
+                        "parsed_options": {"correct_coordinated_omission": True},
+                    },
+                    "dummy_client_id",
+                )
+            )
+            worker.spawning_greenlet.join()
+            self.assertTrue(worker.stats.correct_coordinated_omission)
+            self.assertEqual(worker._expected_interval, environment.events.request.expected_interval)
+            worker.quit()
+
     def test_worker_stop_timeout(self):
         class MyTestUser(User):
             _test_state = 0
@@ -2888,6 +3222,171 @@ class TestWorkerRunner(LocustTestCase):
 
             worker.quit()
 
+    def test_worker_stats_codec(self):
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            environment = Environment()
+            worker = self.get_runner(environment=environment, user_classes=[])
+            self.assertEqual("client_ready", client.outbox[0].type)
+            # the data of client_ready is the version, as old masters expect
+            self.assertEqual(__version__, client.outbox[0].data)
+            sleep(0)
+            heartbeat = next(m for m in client.outbox if m.type == "heartbeat")
+            self.assertEqual([STATS_CODEC], heartbeat.data["stats_codecs"])
+
+            # the stats are sent uncompressed until the master has agreed to use the compact encoding
+            environment.stats.log_request("GET", "/", 100, 0)
+            worker._send_stats()
+            self.assertIn("stats", client.outbox[-1].data)
+            self.assertNotIn("stats_delta", client.outbox[-1].data)
+
+            client.mocked_send(Message("stats_codec", STATS_CODEC, "dummy_client_id"))
+            environment.stats.log_request("GET", "/", 100, 0)
+            worker._send_stats()
+            data = client.outbox[-1].data
+            self.assertNotIn("stats", data)
+            self.assertEqual([[1, "/", "GET"]], data["stats_names"])
+            total, entries = StatsDecoder().decode(data["stats_names"], data["stats_delta"])
+            self.assertEqual(1, total.num_requests)
+            self.assertEqual(["/"], [e.name for e in entries])
+            # the worker stops advertising the encoding once the master has confirmed it
+            self.assertNotIn("stats_codecs", worker._stats_capabilities())
+            worker.quit()
+
+    def test_worker_stats_shm(self):
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            options = mocked_options()
+            options.shared_memory_stats = True
+            environment = Environment(parsed_options=options)
+            worker = self.get_runner(environment=environment, user_classes=[])
+            sleep(0)
+            stats_shm = next(m for m in client.outbox if m.type == "heartbeat").data["stats_shm"]
+            ring = StatsRingReader(stats_shm["path"], stats_shm["token"])
+            try:
+                client.mocked_send(Message("stats_codec", STATS_CODEC, "dummy_client_id"))
+                # the stats are sent over zmq until the master has confirmed that it can read the ring buffer
+                environment.stats.log_request("GET", "/", 100, 0)
+                worker._send_stats()
+                self.assertIn("stats_delta", client.outbox[-1].data)
+
+                client.mocked_send(Message("stats_shm", None, "dummy_client_id"))
+                environment.stats.log_request("GET", "/", 100, 0)
+                worker._send_stats()
+                data = client.outbox[-1].data
+                self.assertNotIn("stats_delta", data)
+                self.assertNotIn("stats", data)
+                total, entries = StatsDecoder().decode_flat([[1, "/", "GET"]], ring.read(data["stats_shm"]))
+                self.assertEqual(1, total.num_requests)
+                self.assertEqual(["/"], [e.name for e in entries])
+            finally:
+                ring.close()
+            worker.quit()
+            self.assertFalse(os.path.exists(stats_shm["path"]))
+
+    def test_worker_records_requests_when_master_does(self):
+        class MyUser(User):
+            wait_time = constant(1)
+
+            @task
+            def my_task(self):
+                self.environment.events.request.fire(
+                    request_type="GET",
+                    name="/",
+                    response_time=1,
+                    response_length=0,
+                    exception=None,
+                    context={},
+                )
+
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            environment = Environment()
+            worker = self.get_runner(environment=environment, user_classes=[MyUser])
+            client.mocked_send(
+                Message(
+                    "spawn",
+                    {
+                        "timestamp": 1605538584,
+                        "user_classes_count": {"MyUser": 1},
+                        "host": "",
+                        "stop_timeout": None,
+                        "parsed_options": {"record_requests": "requests.rec"},
+                    },
+                    "dummy_client_id",
+                )
+            )
+            sleep(0.1)
+            self.assertIsNotNone(environment.request_recorder)
+            self.assertEqual(worker.client_id, environment.request_recorder.node)
+            worker._send_stats()
+            self.assertEqual(1, len(client.outbox[-1].data["request_records"]))
+            worker.quit()
+
+    def test_worker_profiles_when_master_does(self):
+        class MyUser(User):
+            wait_time = constant(0.01)
+
+            @task
+            def my_task(self):
+                sum(range(10000))
+
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client, mock.patch(
+            "locust.profiler.PROFILE_REPORT_INTERVAL", new=0.2
+        ):
+            # the profiler sends its samples through environment.runner
+            environment = Environment(user_classes=[MyUser])
+            worker = environment.create_worker_runner("localhost", 5557)
+            client.mocked_send(
+                Message(
+                    "spawn",
+                    {
+                        "timestamp": 1605538584,
+                        "user_classes_count": {"MyUser": 1},
+                        "host": "",
+                        "stop_timeout": None,
+                        "parsed_options": {"profile": True},
+                    },
+                    "dummy_client_id",
+                )
+            )
+            sleep(0.5)
+            self.assertIsNotNone(environment.profiler)
+            messages = [m for m in client.outbox if m.type == "profile_samples"]
+            self.assertTrue(messages)
+            self.assertEqual(worker.client_id, messages[0].node_id)
+            self.assertTrue(all(stack.split(";")[0] in CATEGORIES for stack in messages[0].data))
+            environment.profiler.stop()
+            worker.quit()
+
+    def test_worker_runs_arrival_rate_from_master(self):
+        class MyUser(User):
+            @task
+            def my_task(self):
+                pass
+
+        with mock.patch("locust.rpc.rpc.Client", mocked_rpc()) as client:
+            environment = Environment(user_classes=[MyUser])
+            worker = environment.create_worker_runner("localhost", 5557)
+            client.mocked_send(
+                Message(
+                    "spawn",
+                    {
+                        "timestamp": 1605538584,
+                        "user_classes_count": {"MyUser": 2},
+                        "host": "",
+                        "stop_timeout": None,
+                        "parsed_options": {},
+                        "arrival_rate": 25.0,
+                        "arrival_rate_ramp": None,
+                    },
+                    "dummy_client_id",
+                )
+            )
+            sleep(0.5)
+            self.assertIsNotNone(environment.arrival_executor)
+            self.assertEqual(25.0, environment.arrival_executor.rate)
+            self.assertEqual(2, environment.arrival_executor.pool_size)
+            self.assertAlmostEqual(12, environment.arrival_executor.iterations, delta=4)
+            worker.quit()
+
     def test_worker_heartbeat_messages_sent_to_master(self):
         """
         Validate content of the heartbeat payload sent to the master.
@@ -2910,10 +3409,12 @@ class TestWorkerRunner(LocustTestCase):
                 sleep(0.1)
 
             message = next((m for m in reversed(client.outbox) if m.type == "heartbeat"))
-            self.assertEqual(len(message.data), 3)
+            self.assertEqual(len(message.data), 4)
             self.assertIn("state", message.data)
             self.assertIn("current_cpu_usage", message.data)
             self.assertIn("current_memory_usage", message.data)
+            # sent until the master confirms that it supports the compact stats encoding
+            self.assertIn("stats_codecs", message.data)
 
             worker.quit()
 
@@ -3257,6 +3758,162 @@ class TestWorkerRunner(LocustTestCase):
             self.assertEqual(2, run_count[0])
 
 
+class TestRelayRunner(LocustTestCase):
+    def setUp(self):
+        super().setUp()
+
+        class MyUser(User):
+            wait_time = constant(1)
+
+            @task
+            def my_task(self):
+                pass
+
+        self.environment = Environment(user_classes=[MyUser])
+
+    def get_runner(self):
+        return self.environment.create_relay_runner("localhost", 5557, relay_bind_port=5558)
+
+    def _spawn_messages(self, server):
+        return {client_id: m.data["user_classes_count"] for client_id, m in server.outbox if m.type == "spawn"}
+
+    def test_relay_splits_users_among_workers(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server, mock.patch(
+            "locust.rpc.rpc.Client", mocked_rpc()
+        ) as client:
+            relay = self.get_runner()
+            self.assertEqual("client_ready", client.outbox[0].type)
+            self.assertEqual({"version": __version__, "weight": 0}, client.outbox[0].data)
+            sleep(0)
+            self.assertEqual(0, [m for m in client.outbox if m.type == "heartbeat"][0].data["weight"])
+            server.mocked_send(Message("client_ready", __version__, "worker1"))
+            server.mocked_send(Message("client_ready", __version__, "worker2"))
+            self.assertEqual(2, relay.worker_count)
+
+            client.mocked_send(
+                Message(
+                    "spawn",
+                    {
+                        "timestamp": 1605538584,
+                        "user_classes_count": {"MyUser": 5},
+                        "host": "",
+                        "stop_timeout": None,
+                        "parsed_options": {},
+                    },
+                    "dummy_client_id",
+                )
+            )
+            self.assertIn("spawning", [m.type for m in client.outbox])
+            self.assertEqual({"worker1": {"MyUser": 3}, "worker2": {"MyUser": 2}}, self._spawn_messages(server))
+            self.assertEqual(STATE_SPAWNING, relay.relay_state)
+
+            server.mocked_send(Message("spawning_complete", {"user_classes_count": {"MyUser": 3}}, "worker1"))
+            server.mocked_send(Message("spawning_complete", {"user_classes_count": {"MyUser": 2}}, "worker2"))
+            relay._check_spawning_complete()
+            self.assertEqual(STATE_RUNNING, relay.relay_state)
+            message = client.outbox[-1]
+            self.assertEqual("spawning_complete", message.type)
+            self.assertEqual({"MyUser": 5}, message.data["user_classes_count"])
+            self.assertEqual(5, message.data["user_count"])
+            relay.quit()
+
+    def test_relay_merges_stats_from_workers(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server, mock.patch(
+            "locust.rpc.rpc.Client", mocked_rpc()
+        ) as client:
+            relay = self.get_runner()
+            for i in range(2):
+                server.mocked_send(Message("client_ready", __version__, "worker%i" % i))
+                stats = RequestStats()
+                stats.log_request("GET", "/", 100 * (i + 1), 0)
+                stats.log_error("GET", "/", "oops")
+                server.mocked_send(
+                    Message(
+                        "stats",
+                        {
+                            "stats": stats.serialize_stats(),
+                            "stats_total": stats.total.get_stripped_report(),
+                            "errors": stats.serialize_errors(),
+                            "user_classes_count": {"MyUser": i + 1},
+                            "user_count": i + 1,
+                        },
+                        "worker%i" % i,
+                    )
+                )
+                relay._stats_queue.join()
+
+            relay._send_stats()
+            message = client.outbox[-1]
+            self.assertEqual("stats", message.type)
+            self.assertEqual(1, len(message.data["stats"]))
+            self.assertEqual(2, message.data["stats"][0]["num_requests"])
+            self.assertEqual({100: 1, 200: 1}, message.data["stats"][0]["response_times"])
+            self.assertEqual(2, message.data["stats_total"]["num_requests"])
+            self.assertEqual(2, list(message.data["errors"].values())[0]["occurrences"])
+            self.assertEqual({"MyUser": 3}, message.data["user_classes_count"])
+            self.assertEqual(3, message.data["user_count"])
+
+            # the stats are only forwarded once
+            relay._send_stats()
+            self.assertEqual([], client.outbox[-1].data["stats"])
+            relay.quit()
+
+    def test_relay_forwards_messages(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server, mock.patch(
+            "locust.rpc.rpc.Client", mocked_rpc()
+        ) as client:
+            relay = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "worker1"))
+            client.mocked_send(Message("test_custom_msg", {"foo": "bar"}, "dummy_client_id"))
+            self.assertEqual([("worker1", "test_custom_msg")], [(c, m.type) for c, m in server.outbox])
+
+            server.mocked_send(Message("exception", {"msg": "oops", "traceback": "tb"}, "worker1"))
+            server.mocked_send(Message("test_custom_msg_to_master", None, "worker1"))
+            self.assertEqual(["exception", "test_custom_msg_to_master"], [m.type for m in client.outbox[-2:]])
+            self.assertEqual(relay.client_id, client.outbox[-1].node_id)
+            relay.quit()
+
+    def test_relay_redistributes_users_when_workers_connect(self):
+        with mock.patch("locust.rpc.rpc.Server", mocked_rpc()) as server, mock.patch(
+            "locust.rpc.rpc.Client", mocked_rpc()
+        ) as client:
+            relay = self.get_runner()
+            server.mocked_send(Message("client_ready", __version__, "worker1"))
+            client.mocked_send(
+                Message(
+                    "spawn",
+                    {
+                        "timestamp": 1605538584,
+                        "user_classes_count": {"MyUser": 4},
+                        "host": "",
+                        "stop_timeout": None,
+                        "parsed_options": {},
+                    },
+                    "dummy_client_id",
+                )
+            )
+            self.assertEqual({"worker1": {"MyUser": 4}}, self._spawn_messages(server))
+            server.outbox.clear()
+            server.mocked_send(Message("client_ready", __version__, "worker2"))
+            sleep(runners.HEARTBEAT_INTERVAL + 0.1)
+            self.assertEqual({"worker1": {"MyUser": 2}, "worker2": {"MyUser": 2}}, self._spawn_messages(server))
+            self.assertEqual(2, [m for m in client.outbox if m.type == "heartbeat"][-1].data["weight"])
+            relay.quit()
+
+    def test_split_user_classes_count(self):
+        split = _split_user_classes_count({"A": 5, "B": 1}, ["w1", "w2"], {})
+        self.assertEqual({"w1": {"A": 3, "B": 0}, "w2": {"A": 2, "B": 1}}, split)
+        # adding users doesn't move existing ones
+        split2 = _split_user_classes_count({"A": 6, "B": 2}, ["w1", "w2"], split)
+        self.assertEqual({"w1": {"A": 3, "B": 1}, "w2": {"A": 3, "B": 1}}, split2)
+        # users on workers that have disconnected are moved to the remaining ones
+        self.assertEqual({"w2": {"A": 6, "B": 2}}, _split_user_classes_count({"A": 6, "B": 2}, ["w2"], split2))
+        # new workers get a share of the users
+        split3 = _split_user_classes_count({"A": 6, "B": 2}, ["w1", "w2", "w3"], split2)
+        self.assertEqual([3, 3, 2], sorted([sum(users.values()) for users in split3.values()], reverse=True))
+        self.assertEqual(6, sum(users["A"] for users in split3.values()))
+
+
 class TestMessageSerializing(unittest.TestCase):
     def test_message_serialize(self):
         msg = Message("client_ready", __version__, "my_id")
@@ -1,4 +1,5 @@
 import csv
+import io
 import time
 import unittest
 import re
@@ -8,12 +9,15 @@ import json
 import gevent
 import mock
 import locust
-from locust import HttpUser, TaskSet, task, User, constant, __version__
+from locust import HttpUser, TaskSet, task, User, constant, constant_pacing, __version__
+from locust.argument_parser import parse_options
 from locust.env import Environment
+from locust.event import Events
+from locust.exception import StopUser
 from locust.rpc.protocol import Message
-from locust.stats import CachedResponseTimes, RequestStats, StatsEntry, diff_response_time_dicts, PERCENTILES_TO_REPORT
-from locust.stats import StatsCSVFileWriter
-from locust.stats import stats_history
+from locust.stats import RequestStats, StatsEntry, PERCENTILES_TO_REPORT, CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW
+from locust.stats import AtomicStatsCSVFileWriter, StatsCSV, StatsCSVFileWriter
+from locust.stats import setup_distributed_stats_event_listeners, stats_history
 from locust.test.testcases import LocustTestCase
 from locust.user.inspectuser import _get_task_ratio
 
@@ -302,6 +306,126 @@ class TestRequestStats(unittest.TestCase):
 
         self.assertEqual(20, u1.median_response_time)
 
+    def test_log_request_batch(self):
+        stats = RequestStats()
+        stats.log_request_batch(
+            ["GET", "GET", "GET", "POST"],
+            ["test_entry", "test_entry", "/other", "test_entry"],
+            [45, None, 135, 601],
+            [1, 2, 3, 4],
+            [None, None, Exception("dummy fail"), None],
+        )
+        self.assertEqual(4, stats.total.num_requests)
+        self.assertEqual(1, stats.total.num_failures)
+        self.assertEqual(10, stats.total.total_content_length)
+        entry = stats.get("test_entry", "GET")
+        self.assertEqual(2, entry.num_requests)
+        self.assertEqual(1, entry.num_none_requests)
+        self.assertEqual(45, entry.min_response_time)
+        self.assertEqual(45, entry.max_response_time)
+        self.assertEqual(3, entry.total_content_length)
+        self.assertEqual({45: 1}, entry.response_times)
+        self.assertEqual(1, stats.get("/other", "GET").num_failures)
+        self.assertEqual(1, len(stats.errors))
+        self.assertEqual(601, stats.get("test_entry", "POST").max_response_time)
+
+    def test_log_many(self):
+        s1 = StatsEntry(self.stats, "test", "GET", use_response_times_cache=True)
+        s2 = StatsEntry(self.stats, "test", "GET", use_response_times_cache=True)
+        for response_time in [10, 20, None, 40]:
+            s1.log(response_time, 5)
+        s2.log_many([10, 20, None, 40], [5, 5, 5, 5])
+        for attr in ["num_requests", "num_none_requests", "total_response_time", "total_content_length"]:
+            self.assertEqual(getattr(s1, attr), getattr(s2, attr), attr)
+        self.assertEqual(s1.response_times, s2.response_times)
+        self.assertEqual(dict(s1.num_reqs_per_sec), dict(s2.num_reqs_per_sec))
+        self.assertEqual(s1.get_current_response_time_percentile(0.95), s2.get_current_response_time_percentile(0.95))
+
+    def test_worker_report_merge_yields(self):
+        worker_stats = RequestStats()
+        for i in range(250):
+            worker_stats.log_request("GET", "/%i" % i, 10, 0)
+            worker_stats.log_error("GET", "/%i" % i, "oops")
+        events = Events()
+        data = {}
+        setup_distributed_stats_event_listeners(events, worker_stats)
+        events.report_to_master.fire(client_id="worker", data=data)
+
+        master_stats = RequestStats()
+        events = Events()
+        setup_distributed_stats_event_listeners(events, master_stats)
+        with mock.patch("locust.stats.gevent.sleep") as sleep:
+            events.worker_report.fire(client_id="worker", data=data)
+        # twice while the entries are unserialized, twice while they are merged and twice for the errors
+        self.assertEqual(6, sleep.call_count)
+        self.assertEqual(250, master_stats.total.num_requests)
+        self.assertEqual(250, len(master_stats.entries))
+        self.assertEqual(250, len(master_stats.errors))
+
+
+class TestRequestBatch(LocustTestCase):
+    def setUp(self):
+        super().setUp()
+        self.environment = Environment()
+        self.environment.events.request.enable_batching(batch_size=3)
+        self.runner = self.environment.create_local_runner()
+
+    def tearDown(self):
+        self.runner.quit()
+        super().tearDown()
+
+    def fire_request(self, name="/", exception=None):
+        self.environment.events.request.fire(
+            request_type="GET",
+            name=name,
+            response_time=10,
+            response_length=1,
+            exception=exception,
+            context={},
+        )
+
+    def test_stats_are_updated_per_batch(self):
+        self.fire_request()
+        self.fire_request(exception=Exception("oops"))
+        self.assertEqual(0, self.runner.stats.total.num_requests)
+        self.fire_request("/other")
+        self.assertEqual(3, self.runner.stats.total.num_requests)
+        self.assertEqual(1, self.runner.stats.total.num_failures)
+        self.assertEqual(2, self.runner.stats.get("/", "GET").num_requests)
+
+        self.fire_request()
+        self.assertEqual(3, self.runner.stats.total.num_requests)
+        gevent.sleep(locust.runners.REQUEST_BATCH_INTERVAL + 0.05)
+        self.assertEqual(4, self.runner.stats.total.num_requests)
+
+    def test_request_listeners_are_still_called(self):
+        batches = []
+        requests = []
+        self.environment.events.request_batch.add_listener(lambda names, **kw: batches.append(names))
+        self.environment.events.request.add_listener(lambda name, **kw: requests.append(name))
+        self.fire_request("/a")
+        self.fire_request("/b")
+        self.assertEqual(["/a", "/b"], requests)
+        self.assertEqual([], batches)
+        self.environment.events.request.flush()
+        self.assertEqual([["/a", "/b"]], batches)
+        self.environment.events.request.flush()
+        self.assertEqual(1, len(batches))
+
+    def test_stop_flushes_batch(self):
+        self.fire_request()
+        self.runner.stop()
+        self.assertEqual(1, self.runner.stats.total.num_requests)
+
+    def test_deprecated_events_are_fired_after_request_listeners(self):
+        calls = []
+        self.environment.events.request.add_listener(lambda **kw: calls.append("request"))
+        self.environment.events.request_success.add_listener(lambda **kw: calls.append("request_success"))
+        self.environment.events.request_failure.add_listener(lambda **kw: calls.append("request_failure"))
+        self.fire_request()
+        self.fire_request(exception=Exception("oops"))
+        self.assertEqual(["request", "request_success", "request", "request_failure"], calls)
+
 
 class TestStatsPrinting(LocustTestCase):
     def test_print_percentile_stats(self):
@@ -317,6 +441,128 @@ class TestStatsPrinting(LocustTestCase):
         self.assertEqual(len(headlines), len(info[5].split()))
 
 
+class TestCoordinatedOmission(LocustTestCase):
+    def _log_stall(self, stats):
+        for i in range(50):
+            stats.log_request("GET", "/", 10, 0, expected_interval=0.1)
+        stats.log_request("GET", "/", 1000, 0, expected_interval=0.1)
+
+    def test_corrected_percentiles(self):
+        stats = RequestStats(correct_coordinated_omission=True)
+        self._log_stall(stats)
+        entry = stats.get("/", "GET")
+        self.assertEqual(51, entry.num_requests)
+        self.assertEqual(60, entry.num_corrected_requests)
+        self.assertEqual(10, entry.get_response_time_percentile(0.95))
+        self.assertEqual(800, entry.get_corrected_response_time_percentile(0.95))
+        self.assertEqual(60, stats.total.num_corrected_requests)
+        self.assertIn("/ (corrected)", entry.percentile(corrected=True))
+
+    def test_not_corrected_by_default(self):
+        stats = RequestStats()
+        self._log_stall(stats)
+        entry = stats.get("/", "GET")
+        self.assertIsNone(entry.corrected_response_times)
+        self.assertNotIn("corrected_response_times", entry.serialize())
+        self.assertEqual(entry.get_response_time_percentile(0.95), entry.get_corrected_response_time_percentile(0.95))
+
+    def test_serialize_and_extend(self):
+        stats = RequestStats(correct_coordinated_omission=True)
+        self._log_stall(stats)
+        entry = StatsEntry.unserialize(stats.get("/", "GET").serialize())
+        self.assertEqual(60, entry.num_corrected_requests)
+
+        master_stats = RequestStats(correct_coordinated_omission=True)
+        master_stats.get("/", "GET").extend(entry)
+        master_stats.get("/", "GET").extend(entry)
+        self.assertEqual(120, master_stats.get("/", "GET").num_corrected_requests)
+        self.assertEqual(800, master_stats.get("/", "GET").get_corrected_response_time_percentile(0.95))
+
+    def test_expected_interval_of_paced_user(self):
+        class PacedUser(User):
+            wait_time = constant_pacing(0.1)
+
+            @task
+            def t(self):
+                self.environment.events.request.fire(
+                    request_type="GET",
+                    name="/",
+                    response_time=450,
+                    response_length=0,
+                    exception=None,
+                    context={},
+                )
+                raise StopUser()
+
+        environment = Environment(
+            user_classes=[PacedUser], parsed_options=parse_options(args=["--correct-coordinated-omission"])
+        )
+        runner = environment.create_local_runner()
+        try:
+            runner.start(1, spawn_rate=1, wait=True)
+            gevent.sleep(0.1)
+            self.assertEqual(1, environment.stats.total.num_requests)
+            self.assertEqual(4, environment.stats.total.num_corrected_requests)
+        finally:
+            runner.quit()
+
+    def test_expected_interval_of_paced_user_with_batching(self):
+        class PacedUser(User):
+            wait_time = constant_pacing(0.1)
+
+            @task
+            def t(self):
+                self.environment.events.request.fire(
+                    request_type="GET",
+                    name="/",
+                    response_time=450,
+                    response_length=0,
+                    exception=None,
+                    context={},
+                )
+                raise StopUser()
+
+        environment = Environment(
+            user_classes=[PacedUser],
+            parsed_options=parse_options(args=["--correct-coordinated-omission", "--batch-requests"]),
+        )
+        runner = environment.create_local_runner()
+        try:
+            runner.start(1, spawn_rate=1, wait=True)
+            gevent.sleep(0.1)
+            environment.events.request.flush()
+            self.assertEqual(1, environment.stats.total.num_requests)
+            self.assertEqual(4, environment.stats.total.num_corrected_requests)
+            self.assertEqual(4, environment.stats.get("/", "GET").num_corrected_requests)
+        finally:
+            runner.quit()
+
+    def test_log_request_batch(self):
+        stats = RequestStats(correct_coordinated_omission=True)
+        stats.log_request_batch(["GET"] * 3, ["/", "/", "/other"], [450, 10, 450], [0, 0, 0], [None] * 3, [0.1] * 3)
+        self.assertEqual(9, stats.total.num_corrected_requests)
+        self.assertEqual(5, stats.get("/", "GET").num_corrected_requests)
+        self.assertEqual(4, stats.get("/other", "GET").num_corrected_requests)
+
+    def test_print_percentile_stats(self):
+        stats = RequestStats(correct_coordinated_omission=True)
+        self._log_stall(stats)
+        locust.stats.print_percentile_stats(stats)
+        info = self.mocked_log.info
+        self.assertEqual(9, len(info))
+        self.assertIn("/ (corrected)", info[4])
+        self.assertIn("Aggregated (corrected)", info[7])
+
+    def test_requests_csv(self):
+        environment = Environment(parsed_options=parse_options(args=["--correct-coordinated-omission"]))
+        self._log_stall(environment.stats)
+        output = io.StringIO()
+        StatsCSV(environment, PERCENTILES_TO_REPORT).requests_csv(csv.writer(output))
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual("10", rows[0]["95%"])
+        self.assertEqual("800", rows[0]["Corrected 95%"])
+
+
 class TestCsvStats(LocustTestCase):
     STATS_BASE_NAME = "test"
     STATS_FILENAME = "{}_stats.csv".format(STATS_BASE_NAME)
@@ -355,6 +601,48 @@ class TestCsvStats(LocustTestCase):
         self.assertTrue(os.path.exists(self.STATS_FAILURES_FILENAME))
         self.assertTrue(os.path.exists(self.STATS_EXCEPTIONS_FILENAME))
 
+    def test_csv_files_are_created_by_default_writer(self):
+        stats_writer = StatsCSVFileWriter(self.environment, PERCENTILES_TO_REPORT, self.STATS_BASE_NAME)
+        for filename in (self.STATS_FILENAME, self.STATS_FAILURES_FILENAME, self.STATS_EXCEPTIONS_FILENAME):
+            self.assertTrue(os.path.exists(filename))
+        self.assertFalse(stats_writer.requests_csv_filehandle.closed)
+        stats_writer.requests_flush()
+        stats_writer.failures_flush()
+        stats_writer.exceptions_flush()
+        stats_writer.close_files()
+        self.assertTrue(stats_writer.requests_csv_filehandle.closed)
+
+    @mock.patch("locust.stats.CSV_STATS_INTERVAL_SEC", new=0.05)
+    def test_csv_snapshot_interval(self):
+        stats_writer = AtomicStatsCSVFileWriter(
+            self.environment, PERCENTILES_TO_REPORT, self.STATS_BASE_NAME, snapshot_interval=60
+        )
+        # the snapshot files are only created by the first snapshot
+        self.assertFalse(os.path.exists(self.STATS_FILENAME))
+        self.runner.stats.log_request("GET", "/", 100, content_length=666)
+        greenlet = gevent.spawn(stats_writer)
+        gevent.sleep(0.1)
+        self.runner.stats.log_request("GET", "/", 100, content_length=666)
+        gevent.sleep(0.2)
+        gevent.kill(greenlet)
+        stats_writer.stats_history_flush()
+
+        # the snapshot is only written once, but the history rows are written every time
+        with open(self.STATS_FILENAME) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual("1", rows[-1]["Request Count"])
+        with open(self.STATS_HISTORY_FILENAME) as f:
+            rows = list(csv.DictReader(f))
+        self.assertGreater(len(rows), 3)
+        self.assertEqual("2", rows[-1]["Total Request Count"])
+
+        # and a final snapshot is written when the files are closed
+        stats_writer.close_files()
+        with open(self.STATS_FILENAME) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual("2", rows[-1]["Request Count"])
+        self.assertFalse(os.path.exists(self.STATS_FILENAME + ".tmp"))
+
     @mock.patch("locust.stats.CSV_STATS_INTERVAL_SEC", new=_TEST_CSV_STATS_INTERVAL_SEC)
     def test_csv_stats_writer(self):
         _write_csv_files(self.environment, self.STATS_BASE_NAME)
@@ -445,6 +733,7 @@ class TestCsvStats(LocustTestCase):
             master.stats.clear_all()
 
             server.mocked_send(Message("stats", data, "fake_client"))
+            master._stats_queue.join()
             s = master.stats.get("/", "GET")
             self.assertEqual(700, s.median_response_time)
 
@@ -544,109 +833,80 @@ class TestCsvStats(LocustTestCase):
         self.assertEqual(0, len(hs2))
 
 
-class TestStatsEntryResponseTimesCache(unittest.TestCase):
+class TestStatsEntryResponseTimesWindow(unittest.TestCase):
     def setUp(self, *args, **kwargs):
         super().setUp(*args, **kwargs)
         self.stats = RequestStats()
 
-    def test_response_times_cached(self):
+    def test_response_times_window(self):
         s = StatsEntry(self.stats, "/", "GET", use_response_times_cache=True)
-        self.assertEqual(1, len(s.response_times_cache))
-        s.log(11, 1337)
-        self.assertEqual(1, len(s.response_times_cache))
-        s.last_request_timestamp -= 1
-        s.log(666, 1337)
-        self.assertEqual(2, len(s.response_times_cache))
-        self.assertEqual(
-            CachedResponseTimes(
-                response_times={11: 1},
-                num_requests=1,
-            ),
-            s.response_times_cache[int(s.last_request_timestamp) - 1],
-        )
-
-    def test_response_times_not_cached_if_not_enabled(self):
+        self.assertEqual(CURRENT_RESPONSE_TIME_PERCENTILE_WINDOW, s.response_times_window.size)
+        with mock.patch("time.time", return_value=1000.5):
+            s.log(11, 1337)
+            s.log(666, 1337)
+            s.log(None, 0)
+        self.assertEqual(1, s.response_times_window._slots.count({11: 1, 670: 1}))
+        self.assertEqual(3, sum(s.response_times_window._num_requests))
+
+    def test_response_times_window_not_created_if_not_enabled(self):
         s = StatsEntry(self.stats, "/", "GET")
         s.log(11, 1337)
-        self.assertEqual(None, s.response_times_cache)
-        s.last_request_timestamp -= 1
-        s.log(666, 1337)
-        self.assertEqual(None, s.response_times_cache)
-
-    def test_latest_total_response_times_pruned(self):
-        """
-        Check that RequestStats.latest_total_response_times are pruned when exceeding 20 entries
-        """
-        s = StatsEntry(self.stats, "/", "GET", use_response_times_cache=True)
-        t = int(time.time())
-        for i in reversed(range(2, 30)):
-            s.response_times_cache[t - i] = CachedResponseTimes(response_times={}, num_requests=0)
-        self.assertEqual(29, len(s.response_times_cache))
-        s.log(17, 1337)
-        s.last_request_timestamp -= 1
-        s.log(1, 1)
-        self.assertEqual(20, len(s.response_times_cache))
-        self.assertEqual(
-            CachedResponseTimes(response_times={17: 1}, num_requests=1),
-            s.response_times_cache.popitem(last=True)[1],
-        )
+        self.assertEqual(None, s.response_times_window)
+        self.assertRaises(ValueError, s.get_current_response_time_percentile, 0.95)
 
     def test_get_current_response_time_percentile(self):
         s = StatsEntry(self.stats, "/", "GET", use_response_times_cache=True)
-        t = int(time.time())
-        s.response_times_cache[t - 10] = CachedResponseTimes(
-            response_times={i: 1 for i in range(100)}, num_requests=200
-        )
-        s.response_times_cache[t - 10].response_times[1] = 201
-
-        s.response_times = {i: 2 for i in range(100)}
-        s.response_times[1] = 202
-        s.num_requests = 300
-
-        self.assertEqual(95, s.get_current_response_time_percentile(0.95))
-
-    def test_get_current_response_time_percentile_outside_cache_window(self):
+        with mock.patch("time.time", return_value=1010.0):
+            for i in range(100):
+                s.log(1000, 0)
+        with mock.patch("time.time", return_value=1015.0):
+            for i in range(100):
+                s.log(i, 0)
+            self.assertEqual(1000, s.get_current_response_time_percentile(0.95))
+            self.assertEqual(50, s.get_current_response_time_percentile(0.25))
+        with mock.patch("time.time", return_value=1021.0):
+            # the requests logged at t=1010 have left the window
+            self.assertEqual(95, s.get_current_response_time_percentile(0.95))
+            self.assertEqual(50, s.get_current_response_time_percentile(0.5))
+        with mock.patch("time.time", return_value=1100.0):
+            self.assertEqual(0, s.get_current_response_time_percentile(0.95))
+
+    def test_ring_buffer_slots_are_reused(self):
+        stats = RequestStats(response_times_window_size=3)
+        s = StatsEntry(stats, "/", "GET", use_response_times_cache=True)
+        self.assertEqual(3, len(s.response_times_window._slots))
+        for t in range(1000, 1010):
+            with mock.patch("time.time", return_value=float(t)):
+                s.log(t - 1000, 0)
+        self.assertEqual(3, len(s.response_times_window._slots))
+        self.assertEqual([1, 1, 1], s.response_times_window._num_requests)
+        with mock.patch("time.time", return_value=1009.0):
+            self.assertEqual(9, s.get_current_response_time_percentile(1.0))
+            self.assertEqual(7, s.get_current_response_time_percentile(0.0))
+
+    def test_dropped_seconds_are_passed_to_sink(self):
+        stats = RequestStats(response_times_window_size=3)
+        s = StatsEntry(stats, "/", "GET", use_response_times_cache=True)
+        dropped = []
+        s.response_times_window.sink = lambda *args: dropped.append(args)
+        for t in range(1000, 1005):
+            with mock.patch("time.time", return_value=float(t)):
+                s.log(t - 1000, 0)
+                s.log_error(Exception("oops"))
+        self.assertEqual([(1000, {0: 1}, 1, 1), (1001, {1: 1}, 1, 1)], dropped)
+        self.assertEqual([1002, 1003, 1004], [second[0] for second in s.response_times_window.seconds()])
+        with mock.patch("time.time", return_value=1004.0):
+            self.assertEqual([4, 3], s.get_current_response_time_percentiles([1.0, 0.5]))
+
+    def test_extend_adds_to_current_window(self):
         s = StatsEntry(self.stats, "/", "GET", use_response_times_cache=True)
-        # an empty response times cache, current time will not be in this cache
-        s.response_times_cache = {}
-        self.assertEqual(None, s.get_current_response_time_percentile(0.95))
-
-    def test_diff_response_times_dicts(self):
-        self.assertEqual(
-            {1: 5, 6: 8},
-            diff_response_time_dicts(
-                {1: 6, 6: 16, 2: 2},
-                {1: 1, 6: 8, 2: 2},
-            ),
-        )
-        self.assertEqual(
-            {},
-            diff_response_time_dicts(
-                {},
-                {},
-            ),
-        )
-        self.assertEqual(
-            {10: 15},
-            diff_response_time_dicts(
-                {10: 15},
-                {},
-            ),
-        )
-        self.assertEqual(
-            {10: 10},
-            diff_response_time_dicts(
-                {10: 10},
-                {},
-            ),
-        )
-        self.assertEqual(
-            {},
-            diff_response_time_dicts(
-                {1: 1},
-                {1: 1},
-            ),
-        )
+        other = StatsEntry(self.stats, "/", "GET")
+        for i in range(10):
+            other.log(i * 10, 0)
+        with mock.patch("time.time", return_value=1000.0):
+            s.extend(other)
+            self.assertEqual(90, s.get_current_response_time_percentile(0.95))
+            self.assertEqual(50, s.get_current_response_time_percentile(0.5))
 
 
 class TestStatsEntry(unittest.TestCase):
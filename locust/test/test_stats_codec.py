@@ -0,0 +1,178 @@
+import struct
+import unittest
+
+from locust.rpc.protocol import Message
+from locust.stats import RequestStats, StatsEntry
+from locust.histogram import get_histogram_factory
+from locust.stats_codec import DecodedStatsEntry, StatsDecoder, StatsEncoder
+
+
+def _log_some_requests(stats):
+    stats.log_request("GET", "/", 120, 1024)
+    stats.log_request("GET", "/", 3432, 2048)
+    stats.log_request("POST", "/login", 0.5, 0)
+    stats.log_request("GET", "/async", None, 0)
+    stats.log_error("POST", "/login", "BadStatusCode")
+
+
+def _extended(entry, stats=None):
+    """
+    A StatsEntry extended with a decoded entry, so that it can be compared with the original one
+    """
+    result = StatsEntry(stats or RequestStats(), entry.name, entry.method)
+    result.extend(entry)
+    return result.serialize()
+
+
+class TestStatsCodec(unittest.TestCase):
+    def _round_trip(self, encoder, decoder, stats):
+        new_names, payload = encoder.encode(stats)
+        data = Message.unserialize(Message("stats", [new_names, payload], "worker").serialize()).data
+        return decoder.decode(*data)
+
+    def test_round_trip(self):
+        stats = RequestStats()
+        _log_some_requests(stats)
+        expected = {key: entry.serialize() for key, entry in stats.entries.items()}
+        expected_total = stats.total.serialize()
+
+        total, entries = self._round_trip(StatsEncoder(), StatsDecoder(), stats)
+        self.assertEqual(set(expected), {(e.name, e.method) for e in entries})
+        for entry in entries:
+            self.assertIsInstance(entry, DecodedStatsEntry)
+            self.assertEqual(expected[(entry.name, entry.method)], _extended(entry))
+        self.assertEqual(expected_total, _extended(total))
+
+    def test_round_trip_sub_millisecond_response_times(self):
+        stats = RequestStats(histogram_factory=get_histogram_factory("hdr", resolution=0.001))
+        for response_time in [0.25, 0.5, 12.5, 3000]:
+            stats.log_request("GET", "/", response_time, 0)
+        expected = stats.get("/", "GET").serialize()
+        total, entries = self._round_trip(StatsEncoder(), StatsDecoder(), stats)
+        self.assertEqual(expected["response_times"], entries[0].response_times.serialize())
+
+    def test_round_trip_corrected_response_times(self):
+        stats = RequestStats(correct_coordinated_omission=True)
+        _log_some_requests(stats)
+        stats.log_request("GET", "/", 520, 0, expected_interval=0.1)
+        expected = stats.get("/", "GET").serialize()
+        self.assertEqual(7, expected["num_corrected_requests"])
+
+        total, entries = self._round_trip(StatsEncoder(), StatsDecoder(), stats)
+        entry = next(e for e in entries if e.name == "/")
+        self.assertEqual(expected, _extended(entry, RequestStats(correct_coordinated_omission=True)))
+        self.assertEqual(8, total.num_corrected_requests)
+
+    def test_entries_are_reset(self):
+        stats = RequestStats()
+        _log_some_requests(stats)
+        StatsEncoder().encode(stats)
+        self.assertEqual(0, stats.total.num_requests)
+        self.assertEqual([], stats.serialize_stats())
+
+    def test_names_are_only_sent_once(self):
+        encoder = StatsEncoder()
+        decoder = StatsDecoder()
+        stats = RequestStats()
+        _log_some_requests(stats)
+        new_names, payload = encoder.encode(stats)
+        self.assertEqual(3, len(new_names))
+        decoder.decode(new_names, payload)
+
+        stats.log_request("GET", "/", 10, 0)
+        stats.log_request("GET", "/new", 10, 0)
+        new_names, payload = encoder.encode(stats)
+        self.assertEqual([[4, "/new", "GET"]], new_names)
+        total, entries = decoder.decode(new_names, payload)
+        self.assertEqual(2, total.num_requests)
+        self.assertEqual([("/", "GET"), ("/new", "GET")], sorted((e.name, e.method) for e in entries))
+
+    def test_reset_sends_names_again(self):
+        encoder = StatsEncoder()
+        stats = RequestStats()
+        stats.log_request("GET", "/", 10, 0)
+        encoder.encode(stats)
+        stats.log_request("GET", "/", 10, 0)
+        encoder.reset()
+        new_names, payload = encoder.encode(stats)
+        total, entries = StatsDecoder().decode(new_names, payload)
+        self.assertEqual("/", entries[0].name)
+
+    def test_unknown_entry(self):
+        encoder = StatsEncoder()
+        decoder = StatsDecoder()
+        stats = RequestStats()
+        stats.log_request("GET", "/", 10, 0)
+        encoder.encode(stats)  # this report is lost
+        stats.log_request("GET", "/", 10, 0)
+        total, entries = decoder.decode(*encoder.encode(stats))
+        self.assertEqual(1, total.num_requests)
+        self.assertEqual([], entries)
+        self.assertEqual({1}, decoder.unknown_ids)
+
+        # the entry is kept until its name is sent again
+        encoder.reset()
+        stats.log_request("GET", "/", 20, 0)
+        new_names, payload = encoder.encode(stats)
+        self.assertEqual([[1, "/", "GET"]], new_names)
+        total, entries = decoder.decode(new_names, payload)
+        self.assertEqual(set(), decoder.unknown_ids)
+        self.assertEqual([("/", "GET", 1), ("/", "GET", 1)], [(e.name, e.method, e.num_requests) for e in entries])
+
+    def test_reset_keeps_ids(self):
+        encoder = StatsEncoder()
+        stats = RequestStats()
+        stats.log_request("GET", "/", 10, 0)
+        stats.log_request("GET", "/other", 10, 0)
+        encoder.encode(stats)
+        encoder.reset()
+        stats.log_request("GET", "/other", 10, 0)
+        new_names, payload = encoder.encode(stats)
+        self.assertEqual([[1, "/", "GET"], [2, "/other", "GET"]], new_names)
+        new_names, payload = encoder.encode(stats)
+        self.assertEqual([], new_names)
+
+    def test_smaller_than_serialized_stats(self):
+        legacy_stats = RequestStats()
+        stats = RequestStats()
+        for i in range(100):
+            for stats_ in (legacy_stats, stats):
+                stats_.log_request("GET", "/some/fairly/long/url/%i" % i, i, 0)
+        legacy_size = len(Message("stats", legacy_stats.serialize_stats(), "worker").serialize())
+        size = len(Message("stats", StatsEncoder().encode(stats), "worker").serialize())
+        self.assertLess(size, legacy_size / 2)
+
+    def test_extend(self):
+        stats = RequestStats()
+        _log_some_requests(stats)
+        _, entries = self._round_trip(StatsEncoder(), StatsDecoder(), stats)
+        master_entry = StatsEntry(RequestStats(), "/", "GET", use_response_times_cache=True)
+        master_entry.extend([e for e in entries if e.name == "/"][0])
+        self.assertEqual(2, master_entry.num_requests)
+        self.assertEqual({120: 1, 3400: 1}, master_entry.response_times)
+
+
+class TestFlatStatsCodec(TestStatsCodec):
+    def _round_trip(self, encoder, decoder, stats):
+        return decoder.decode_flat(*encoder.encode_flat(stats))
+
+    def test_flat_payload_is_native_arrays(self):
+        stats = RequestStats()
+        stats.log_request("GET", "/", 120, 1024)
+        new_names, payload = StatsEncoder().encode_flat(stats)
+        self.assertEqual([[1, "/", "GET"]], new_names)
+        num_ints, num_floats = struct.unpack_from("<QQ", payload)
+        self.assertEqual(16 + 8 * (num_ints + num_floats), len(payload))
+        self.assertEqual(10, num_floats)
+
+    def test_flat_shares_names_with_msgpack(self):
+        encoder = StatsEncoder()
+        decoder = StatsDecoder()
+        stats = RequestStats()
+        stats.log_request("GET", "/", 10, 0)
+        decoder.decode(*encoder.encode(stats))
+        stats.log_request("GET", "/", 20, 0)
+        total, entries = decoder.decode_flat(*encoder.encode_flat(stats))
+        self.assertEqual(["/"], [e.name for e in entries])
+        self.assertEqual(20, entries[0].max_response_time)
+        self.assertIsInstance(entries[0].max_response_time, int)
@@ -0,0 +1,111 @@
+import unittest
+
+import mock
+
+from locust.stats import RequestStats
+from locust.stats_index import StatsIndex
+
+
+class TestStatsIndex(unittest.TestCase):
+    def setUp(self):
+        self.stats = RequestStats()
+        self.index = StatsIndex(self.stats, refresh_interval=0)
+
+    def names(self, report):
+        return [row["name"] for row in report["stats"]]
+
+    def test_full(self):
+        for name, response_time in (("/c", 300), ("/a", 100), ("/b", 200)):
+            self.stats.log_request("GET", name, response_time, 10)
+        report = self.index.query()
+        self.assertTrue(report["full"])
+        self.assertEqual(3, report["total_count"])
+        self.assertEqual(["/c", "/a", "/b"], self.names(report))
+        self.assertEqual(["/b", "/a", "/c"], self.names(self.index.query(descending=True)))
+        self.assertEqual(["/a", "/b", "/c"], self.names(self.index.query(sort="name")))
+        self.assertEqual(["/c", "/b"], self.names(self.index.query(sort="avg_response_time", descending=True, limit=2)))
+        self.assertEqual(["/b"], self.names(self.index.query(sort="name", offset=1, limit=1)))
+        self.assertEqual(3, report["total"]["num_requests"])
+        self.assertRaises(ValueError, self.index.query, sort="safe_name")
+
+    def test_changed_since(self):
+        for name in ("/a", "/b", "/c"):
+            self.stats.log_request("GET", name, 100, 10)
+        version = self.index.query()["version"]
+        report = self.index.query(since=version)
+        self.assertFalse(report["full"])
+        self.assertEqual([], report["stats"])
+
+        self.stats.log_request("GET", "/c", 500, 10)
+        self.stats.log_request("GET", "/b", 100, 10)
+        self.stats.log_request("GET", "/d", 100, 10)
+        report = self.index.query(since=version)
+        self.assertEqual(["/b", "/c", "/d"], self.names(report))
+        self.assertEqual(
+            ["/c", "/d", "/b"], self.names(self.index.query(since=version, sort="avg_response_time", descending=True))
+        )
+        self.assertEqual(["/d"], self.names(self.index.query(since=version, name_filter="d")))
+
+        # the sort index is kept up to date (rows with equal values are sorted by name and method)
+        self.assertEqual(
+            ["/c", "/d", "/b", "/a"], self.names(self.index.query(sort="avg_response_time", descending=True))
+        )
+        self.stats.log_request("GET", "/a", 1000, 10)
+        self.stats.log_request("GET", "/a", 1000, 10)
+        self.assertEqual(
+            ["/a", "/c", "/d", "/b"], self.names(self.index.query(sort="avg_response_time", descending=True))
+        )
+
+        # a row that changed in several versions is only returned once
+        self.assertEqual(["/b", "/c", "/d", "/a"], self.names(self.index.query(since=version)))
+
+    def test_cleared(self):
+        self.stats.log_request("GET", "/a", 100, 10)
+        version = self.index.query()["version"]
+        self.stats.clear_all()
+        self.stats.log_request("GET", "/b", 100, 10)
+        report = self.index.query(since=version)
+        self.assertTrue(report["full"])
+        self.assertEqual(["/b"], self.names(report))
+        self.assertFalse(self.index.query(since=report["version"])["full"])
+
+    def test_rates_are_calculated_when_returned(self):
+        self.stats.total.start_time = 990
+        with mock.patch("time.time", return_value=1000.0):
+            for name in ("/a", "/b", "/b"):
+                self.stats.log_request("GET", name, 100, 10)
+            version = self.index.query(sort="avg_response_time")["version"]
+        rows = dict(self.index.rows)
+        with mock.patch("time.time", return_value=1005.0):
+            self.stats.log_request("GET", "/c", 100, 10)
+            self.stats.log_request("GET", "/c", 100, 10)
+            report = self.index.query(since=version, sort="current_rps", descending=True)
+        # /a and /b haven't changed, but their current rates have, so they're returned without being rebuilt
+        self.assertEqual(["/b", "/a", "/c"], self.names(report))
+        self.assertEqual([0.2, 0.1, 0], [row["current_rps"] for row in report["stats"]])
+        self.assertEqual(rows[("/a", "GET")], self.index.rows[("/a", "GET")])
+        self.assertNotIn("current_rps", self.index.rows[("/a", "GET")])
+
+        with mock.patch("time.time", return_value=1020.0):
+            self.stats.log_request("GET", "/c", 100, 10)
+            version = self.index.query()["version"]
+        with mock.patch("time.time", return_value=1021.0):
+            self.stats.log_request("GET", "/c", 100, 10)
+            # /a and /b have left the window, and are no longer returned
+            self.assertEqual(["/c"], self.names(self.index.query(since=version)))
+
+    def test_sort_index_is_rebuilt_when_many_rows_change(self):
+        for i in range(20):
+            self.stats.log_request("GET", "/%02i" % i, 100, 10)
+        self.assertEqual("/00", self.names(self.index.query(sort="avg_response_time"))[0])
+        sort_index = self.index._sort_indexes["avg_response_time"]
+        # a few changed rows are moved in the sort index
+        self.stats.log_request("GET", "/05", 1, 10)
+        self.assertEqual(["/05", "/00"], self.names(self.index.query(sort="avg_response_time", limit=2)))
+        self.assertIs(sort_index, self.index._sort_indexes["avg_response_time"])
+        # but if many rows have changed, it's sorted again
+        for i in range(10, 20):
+            self.stats.log_request("GET", "/%02i" % i, 1, 10)
+        self.index.refresh()
+        self.assertEqual({}, self.index._sort_indexes)
+        self.assertEqual(["/05", "/10"], self.names(self.index.query(sort="avg_response_time", limit=2)))
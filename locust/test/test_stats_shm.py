@@ -0,0 +1,72 @@
+import os
+import unittest
+
+from locust.stats_shm import StatsRingReader, StatsRingWriter
+
+
+class TestStatsRing(unittest.TestCase):
+    def setUp(self):
+        self.writer = StatsRingWriter(size=1024)
+        self.reader = StatsRingReader(self.writer.path, self.writer.token)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_write_read(self):
+        position = self.writer.write(b"hello")
+        position2 = self.writer.write(b"world")
+        self.assertEqual(b"hello", self.reader.read(position))
+        self.assertEqual(b"world", self.reader.read(position2))
+        self.assertRaises(ValueError, self.reader.read, position2)
+
+    def test_wrap_around(self):
+        payload = bytes(range(200))
+        for i in range(50):
+            position = self.writer.write(payload[i:])
+            self.assertIsNotNone(position)
+            self.assertEqual(payload[i:], self.reader.read(position))
+
+    def test_full(self):
+        positions = []
+        while True:
+            position = self.writer.write(b"x" * 100)
+            if position is None:
+                break
+            positions.append(position)
+        self.assertLess(len(positions), 10)
+        # reading a record releases the space of all the records written before it
+        self.assertEqual(b"x" * 100, self.reader.read(positions[-2]))
+        self.assertIsNotNone(self.writer.write(b"x" * 100))
+        self.assertIsNotNone(self.writer.write(b"x" * 100))
+
+    def test_too_large(self):
+        self.assertIsNone(self.writer.write(b"x" * 1024))
+
+    def test_wrong_token(self):
+        writer = StatsRingWriter(size=1024)
+        self.assertRaises(ValueError, StatsRingReader, writer.path, "not the token")
+        # the file is only removed by a reader that has opened the right one
+        self.assertTrue(os.path.exists(writer.path))
+        writer.close()
+
+    def test_stale_records_are_discarded(self):
+        writer = StatsRingWriter(size=1024)
+        position = writer.write(b"stale")
+        reader = StatsRingReader(writer.path, writer.token)
+        self.assertRaises(ValueError, reader.read, position)
+        reader.close()
+        writer.close()
+
+    def test_file_is_removed_once_opened(self):
+        # a worker that crashes doesn't leave the file behind
+        self.assertFalse(os.path.exists(self.writer.path))
+        position = self.writer.write(b"hello")
+        self.assertEqual(b"hello", self.reader.read(position))
+
+    def test_close_removes_file(self):
+        writer = StatsRingWriter(size=1024)
+        self.assertTrue(os.path.exists(writer.path))
+        writer.close()
+        self.assertFalse(os.path.exists(writer.path))
+        self.assertRaises(OSError, StatsRingReader, writer.path, writer.token)
@@ -0,0 +1,221 @@
+import csv
+import os
+import tempfile
+import unittest
+from collections.abc import Sequence
+from unittest import mock
+
+from locust.histogram import ResponseTimeWindow, RoundedHistogram
+from locust.stats import RequestStats
+from locust.timeseries import HISTORY_FIELDS, ResponseTimeSeries, StatsHistory, TimeSeries
+
+
+class TestTimeSeries(unittest.TestCase):
+    def test_downsampling(self):
+        series = TimeSeries(("value",), tiers=((1, 10), (5, 20), (10, None)))
+        for t in range(100):
+            series.append(1000 + t, (t,))
+        samples = list(series)
+        times = [t for t, _ in samples]
+        self.assertEqual(sorted(times), times)
+        # the last 10 seconds at full resolution
+        self.assertEqual([(1000.0 + t, (float(t),)) for t in range(89, 100)], samples[-11:])
+        # the 20 seconds before that averaged over 5 seconds
+        self.assertEqual([(1080.0, (82.0,)), (1085.0, (86.5,))], samples[-13:-11])
+        # and everything older averaged over 10 seconds
+        self.assertEqual((1000.0, (4.5,)), samples[0])
+        self.assertEqual((1060.0, (64.5,)), samples[6])
+        self.assertEqual(len(samples), len(series))
+
+    def test_bounded(self):
+        series = TimeSeries(("value",), tiers=((1, 10), (10, 100)))
+        for t in range(10_000):
+            series.append(t, (t,))
+        self.assertLessEqual(len(series), 22)
+        self.assertEqual([(9990.0, (9990.0,))], list(series.since(9990))[:1])
+
+    def test_averages_samples_within_resolution(self):
+        series = TimeSeries(("a", "b"), tiers=((5, None),))
+        series.append(1000, (1, 10))
+        series.append(1002, (3, 20))
+        series.append(1005, (5, 30))
+        self.assertEqual([(1000.0, (2.0, 15.0)), (1005.0, (5.0, 30.0))], list(series))
+
+    def test_spill(self):
+        spilled = []
+        series = TimeSeries(
+            ("value",), tiers=((1, 10), (10, None)), spill=lambda t, values: spilled.append((t, values))
+        )
+        for t in range(30):
+            series.append(t, (t,))
+        self.assertEqual([(float(t), (float(t),)) for t in range(19)], spilled)
+
+
+class TestResponseTimeSeries(unittest.TestCase):
+    def test_fed_from_window(self):
+        stats = RequestStats(response_times_window_size=2, history=StatsHistory(tiers=((5, 20), (10, None))))
+        for t in range(100):
+            with mock.patch("time.time", return_value=1000 + t + 0.5):
+                stats.log_request("GET", "/", t, 10)
+                if t % 4 == 0:
+                    stats.log_error("GET", "/", Exception("oops"))
+        series = stats.history.total
+        buckets = list(series.buckets())
+        # the last 20 seconds in buckets of 5 seconds, everything before that in buckets of 10 seconds
+        self.assertEqual(list(range(1000, 1080, 10)), [b[0] for b in buckets[:8]])
+        self.assertEqual(list(range(1080, 1100, 5)), [b[0] for b in buckets[8:]])
+        self.assertEqual(10, buckets[0][2])
+        # the seconds that are still in the window are included
+        self.assertEqual((100, 25), series.counts())
+        self.assertEqual((5, 1), series.counts(since=1095))
+        self.assertEqual((10, 3), series.counts(since=1080, until=1090))
+        self.assertEqual(99, series.percentile(0.95, since=1095))
+        self.assertEqual(50, series.percentile(0.5))
+
+    def test_merged_tiers_are_exact(self):
+        series = ResponseTimeSeries(RoundedHistogram(), tiers=((1, 10), (10, 100), (100, None)))
+        for t in range(1000):
+            series.add(t, {t % 10: 1}, 1, 0)
+        self.assertLess(len(series), 35)
+        self.assertEqual((1000, 0), series.counts())
+        self.assertEqual(9, series.percentile(0.95))
+        self.assertEqual(5, series.percentile(0.5, since=100, until=200))
+
+    def test_spill(self):
+        spilled = []
+        series = ResponseTimeSeries(
+            RoundedHistogram(), tiers=((1, 10), (10, None)), spill=lambda t, values: spilled.append((t, values))
+        )
+        for t in range(30):
+            series.add(t, {100: 2}, 2, 1)
+        self.assertEqual(19, len(spilled))
+        self.assertEqual((0.0, (2.0, 1.0, 100, 100, 2, 1)), spilled[0])
+
+    def test_flush_spill(self):
+        spilled = []
+        series = ResponseTimeSeries(
+            RoundedHistogram(), tiers=((1, 10), (10, None)), spill=lambda t, values: spilled.append(t)
+        )
+        for t in range(5):
+            series.add(t, {100: 1}, 1, 0)
+        self.assertEqual([], spilled)
+        series.flush_spill()
+        self.assertEqual([0.0, 1.0, 2.0, 3.0, 4.0], spilled)
+        # the flushed buckets aren't spilled again when they leave the first tier
+        for t in range(5, 20):
+            series.add(t, {100: 1}, 1, 0)
+        self.assertEqual([float(t) for t in range(9)], spilled)
+
+    def test_flush_spill_includes_window(self):
+        spilled = []
+        series = ResponseTimeSeries(RoundedHistogram(), spill=lambda t, values: spilled.append((t, values[-2:])))
+        window = ResponseTimeWindow(series.histogram, 10, sink=series.add)
+        series.window = window
+        for t in range(1000, 1012):
+            window.log(t, series.histogram.add(100))
+        window.log_failure(1011)
+        # only 2 seconds have dropped out of the window, and nothing has left the first tier
+        self.assertEqual([], spilled)
+        series.flush_spill()
+        self.assertEqual([(1000.0, (5, 0)), (1005.0, (5, 0)), (1010.0, (2, 1))], spilled)
+
+
+class TestStatsHistory(unittest.TestCase):
+    def test_record(self):
+        stats = RequestStats(history=StatsHistory(per_entry=True))
+        with mock.patch("time.time", return_value=3.0):
+            stats.log_request("GET", "/", 100, 10)
+            stats.log_request("GET", "/", 200, 10)
+        stats.history.record(5, timestamp=0)
+        stats.history.record(6, timestamp=5)
+        rows = list(stats.history)
+        self.assertEqual(2, len(stats.history))
+        self.assertEqual("00:00:05", rows[1]["time"])
+        self.assertEqual(6, rows[1]["user_count"])
+        self.assertEqual(set(HISTORY_FIELDS) | {"time"}, set(rows[0]))
+        self.assertEqual(0.4, rows[0]["current_rps"])
+        self.assertEqual(200, rows[0]["response_time_percentile_95"])
+        self.assertEqual(0, rows[1]["current_rps"])
+        entry_rows = list(stats.history.rows(stats.history.entries[("/", "GET")]))
+        self.assertEqual(rows, entry_rows)
+        self.assertIs(stats.history.entries[("/", "GET")], stats.get("/", "GET").history)
+
+        stats.reset_all()
+        self.assertEqual(0, len(stats.history))
+        self.assertEqual(0, len(stats.history.entries[("/", "GET")]))
+
+    def test_sequence(self):
+        stats = RequestStats()
+        with mock.patch("time.time", return_value=3.0):
+            stats.log_request("GET", "/", 100, 10)
+        for i in range(3):
+            stats.history.record(i + 1, timestamp=i * 5)
+        rows = list(stats.history)
+        self.assertEqual(rows[0], stats.history[0])
+        self.assertEqual(rows[2], stats.history[-1])
+        self.assertEqual(rows[1:], stats.history[1:])
+        self.assertEqual(3, stats.history[-1]["user_count"])
+        self.assertEqual([1, 2, 3], [row["user_count"] for row in reversed(stats.history)][::-1])
+        self.assertRaises(IndexError, lambda: stats.history[3])
+        self.assertRaises(IndexError, lambda: stats.history[-4])
+        self.assertIsInstance(stats.history, Sequence)
+
+    def test_only_aggregated_by_default(self):
+        stats = RequestStats()
+        stats.log_request("GET", "/", 100, 10)
+        stats.history.record(1)
+        self.assertEqual(1, len(stats.history))
+        self.assertEqual(1, len(stats.history.total))
+        self.assertEqual({}, stats.history.entries)
+        self.assertIsNone(stats.get("/", "GET").history)
+
+    def test_not_recorded_without_window(self):
+        stats = RequestStats(use_response_times_cache=False)
+        stats.log_request("GET", "/", 100, 10)
+        stats.history.record(1)
+        self.assertIsNone(stats.history.total)
+        self.assertEqual(0, list(stats.history)[0]["current_rps"])
+
+    def test_spill_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "history.csv")
+            history = StatsHistory(per_entry=True, tiers=((1, 10), (10, None)), spill_path=path)
+            stats = RequestStats(response_times_window_size=2, history=history)
+            for t in range(15):
+                with mock.patch("time.time", return_value=t):
+                    stats.log_request("GET", "/", 100, 10)
+            history.close()
+            with open(path) as f:
+                rows = list(csv.DictReader(f))
+        # seconds 0 and 1 left the first tier, and the rest (including the window) was spilled when closing
+        self.assertEqual(["Aggregated", "/", "Aggregated", "/"], [row["name"] for row in rows[:4]])
+        self.assertEqual(["", "GET", "", "GET"], [row["method"] for row in rows[:4]])
+        self.assertEqual(["0.0", "0.0", "1.0", "1.0"], [row["timestamp"] for row in rows[:4]])
+        self.assertEqual(
+            [("Aggregated", "%.1f" % t) for t in range(2, 15)], [(r["name"], r["timestamp"]) for r in rows[4:17]]
+        )
+        self.assertEqual([("/", "%.1f" % t) for t in range(2, 15)], [(r["name"], r["timestamp"]) for r in rows[17:]])
+        self.assertEqual(["1"] * 30, [row["num_requests"] for row in rows])
+
+    def test_spill_file_short_run(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "history.csv")
+            history = StatsHistory(spill_path=path)
+            stats = RequestStats(history=history)
+            for t in range(1000, 1030):
+                with mock.patch("time.time", return_value=t):
+                    stats.log_request("GET", "/", 100, 10)
+                    if t % 10 == 0:
+                        stats.log_error("GET", "/", "error")
+            self.assertFalse(os.path.exists(path))
+            history.close()
+            with open(path) as f:
+                rows = list(csv.DictReader(f))
+        # nothing left the first tier (which holds an hour) during the test, but all of it is in the file
+        self.assertEqual(
+            ["1000.0", "1005.0", "1010.0", "1015.0", "1020.0", "1025.0"], [row["timestamp"] for row in rows]
+        )
+        self.assertEqual({"Aggregated"}, {row["name"] for row in rows})
+        self.assertEqual(["5"] * 6, [row["num_requests"] for row in rows])
+        self.assertEqual(["1", "0"] * 3, [row["num_failures"] for row in rows])
+        self.assertEqual(["1.0"] * 6, [row["current_rps"] for row in rows])
@@ -3,6 +3,7 @@ import time
 
 from locust import User, TaskSet, between, constant, constant_throughput
 from locust.exception import MissingWaitTimeError
+from locust.user.wait_time import get_expected_interval
 
 from .testcases import LocustTestCase
 
@@ -77,3 +78,13 @@ class TestWaitTime(LocustTestCase):
             time.sleep(random.random() * 0.1)
             _ = ts2.wait_time()
             _ = ts2.wait_time()
+
+    def test_expected_interval(self):
+        class PacedUser(User):
+            wait_time = constant_throughput(4)
+
+        class MyUser(User):
+            wait_time = between(1, 2)
+
+        self.assertEqual(0.25, get_expected_interval(PacedUser(self.environment)))
+        self.assertIsNone(get_expected_interval(MyUser(self.environment)))
@@ -4,6 +4,7 @@ import json
 import os
 import traceback
 from io import StringIO
+from unittest import mock
 from tempfile import NamedTemporaryFile
 
 import gevent
@@ -11,7 +12,7 @@ import requests
 from pyquery import PyQuery as pq
 
 import locust
-from locust import constant
+from locust import constant, html
 from locust.argument_parser import get_parser, parse_options
 from locust.user import User, task
 from locust.env import Environment
@@ -166,6 +167,105 @@ class TestWebUI(LocustTestCase, _HeaderCheckMixin):
         self.assertEqual(200, response.status_code)
         self.assertIn("Error1337", response.text)
 
+    def test_request_stats_v2(self):
+        self.stats.log_request("GET", "/a", 120, 5612)
+        self.stats.log_request("GET", "/b", 300, 10)
+        self.stats.log_request("POST", "/b", 200, 10)
+        url = "http://127.0.0.1:%i/stats/requests/v2" % self.web_port
+        response = requests.get(url, params={"sort": "avg_response_time", "order": "desc", "limit": 2})
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertTrue(data["full"])
+        self.assertEqual(3, data["total_count"])
+        self.assertEqual([("/b", "GET"), ("/b", "POST")], [(row["name"], row["method"]) for row in data["stats"]])
+        self.assertEqual(3, data["total"]["num_requests"])
+
+        response = requests.get(url, params={"filter": "/A"})
+        self.assertEqual(["/a"], [row["name"] for row in response.json()["stats"]])
+
+        self.environment.web_ui.stats_index.refresh_interval = 0
+        self.stats.log_request("GET", "/a", 120, 5612)
+        response = requests.get(url, params={"since": data["version"]})
+        self.assertFalse(response.json()["full"])
+        self.assertEqual([("/a", 2)], [(row["name"], row["num_requests"]) for row in response.json()["stats"]])
+
+    def test_request_stats_v2_invalid_arguments(self):
+        url = "http://127.0.0.1:%i/stats/requests/v2" % self.web_port
+        self.assertEqual(400, requests.get(url, params={"sort": "nonexistent"}).status_code)
+        self.assertEqual(400, requests.get(url, params={"since": "x"}).status_code)
+
+    def test_stats_stream(self):
+        self.stats.log_request("GET", "/a", 120, 5612)
+        self.web_ui.stats_stream.interval = 0.1
+        response = requests.get("http://127.0.0.1:%i/stats/stream" % self.web_port, stream=True, timeout=5)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("text/event-stream", response.headers["Content-Type"].split(";")[0])
+        events = (json.loads(line[len("data: ") :]) for line in response.iter_lines() if line)
+
+        update = next(events)
+        self.assertTrue(update["full"])
+        self.assertEqual(["/a"], [row["name"] for row in update["stats"]])
+        self.assertEqual(1, update["total"]["num_requests"])
+        self.assertEqual("ready", update["state"])
+
+        self.web_ui.get_stats_index().refresh_interval = 0
+        self.stats.log_request("GET", "/b", 120, 5612)
+        update = next(events)
+        # a new row: all rows are sent again, in order
+        self.assertTrue(update["full"])
+        self.assertEqual(["/a", "/b"], [row["name"] for row in update["stats"]])
+        self.assertEqual(2, update["total"]["num_requests"])
+        self.assertEqual([], update["errors"])
+
+        self.stats.log_request("GET", "/b", 120, 5612)
+        while True:
+            update = next(events)
+            if update["stats"]:
+                break
+        self.assertFalse(update["full"])
+        self.assertEqual(["/b"], [row["name"] for row in update["stats"]])
+        self.assertEqual(2, update["stats"][0]["num_requests"])
+        self.assertNotIn("num_failures", update["stats"][0])
+        self.assertNotIn("errors", update)
+        self.assertEqual(3, update["total"]["num_requests"])
+        self.assertEqual(1, len(self.web_ui.stats_stream.subscribers))
+
+        response.close()
+        gevent.sleep(0.3)
+        self.assertEqual(0, len(self.web_ui.stats_stream.subscribers))
+
+    def test_stats_stream_max_rows(self):
+        for i in range(5):
+            self.stats.log_request("GET", "/%i" % (4 - i), 120, 5612)
+        stream = self.web_ui.stats_stream
+        with mock.patch("locust.stats_stream.STATS_STREAM_MAX_ROWS", new=3):
+            update = json.loads(stream.update()[len("data: ") :])
+        self.assertEqual(["/0", "/1", "/2"], [row["name"] for row in update["stats"]])
+        self.assertEqual(5, update["total"]["num_requests"])
+
+    def test_metrics(self):
+        self.stats.log_request("GET", "/a", 120, 5612)
+        response = requests.get("http://127.0.0.1:%i/metrics" % self.web_port)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("text/plain; version=0.0.4; charset=utf-8", response.headers["Content-Type"])
+        self.assertIn('locust_requests_total{method="GET",name="/a"} 1', response.text)
+
+    def test_profile(self):
+        response = requests.get("http://127.0.0.1:%i/profile" % self.web_port)
+        self.assertEqual(404, response.status_code)
+
+        profiler = self.environment.create_profiler()
+        profiler.stop()
+        profiler.take_samples()
+        profiler.samples.clear()
+        profiler.samples.update({"user;my_task (locustfile.py:10)": 3, "stats;log (locust/stats.py:1)": 1})
+        response = requests.get("http://127.0.0.1:%i/profile" % self.web_port)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("stats;log (locust/stats.py:1) 1\nuser;my_task (locustfile.py:10) 3\n", response.text)
+        summary = requests.get("http://127.0.0.1:%i/profile/summary" % self.web_port).json()
+        self.assertEqual(0.75, summary["categories"]["user"])
+        self.assertEqual(0.25, summary["categories"]["stats"])
+
     def test_reset_stats(self):
         try:
             raise Exception("A cool test exception")
@@ -345,6 +445,37 @@ class TestWebUI(LocustTestCase, _HeaderCheckMixin):
         self.assertIn("attachment", r.headers.get("Content-Disposition", ""))
         self.assertNotIn("Download the Report", r.text, "Download report link found in HTML content")
 
+    def test_report_gzip(self):
+        self.stats.log_request("GET", "/test", 120, 5612)
+        r = requests.get("http://127.0.0.1:%i/stats/report" % self.web_port, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", r.headers["Content-Encoding"])
+        self.assertEqual("Accept-Encoding", r.headers["Vary"])
+        plain = requests.get(
+            "http://127.0.0.1:%i/stats/report" % self.web_port, headers={"Accept-Encoding": "identity"}
+        )
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertIn("// jquery-1.11.3.min.js", r.text)
+        self.assertIn("/* tables.css */", r.text)
+        self.assertNotIn("\x00", r.text)
+        self.assertEqual(plain.text, r.text)
+        self.assertEqual(html.get_html_report(self.environment), r.text)
+
+    def test_report_template_is_cached(self):
+        html.get_html_report(self.environment)
+        with mock.patch("locust.html.read_static_file") as read_static_file:
+            with mock.patch("locust.html.Environment") as jinja_environment:
+                report = html.get_html_report(self.environment)
+        self.assertEqual(0, read_static_file.call_count)
+        self.assertEqual(0, jinja_environment.call_count)
+        self.assertIn("charts-container", report)
+
+    def test_save_html_report(self):
+        self.stats.log_request("GET", "/test", 120, 5612)
+        with NamedTemporaryFile(suffix=".html") as f:
+            html.save_html_report(self.environment, f.name)
+            with open(f.name, encoding="utf-8") as report:
+                self.assertEqual(html.get_html_report(self.environment, show_download_link=False), report.read())
+
     def test_report_host(self):
         self.environment.host = "http://test.com"
         self.stats.log_request("GET", "/test", 120, 5612)
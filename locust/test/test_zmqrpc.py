@@ -1,3 +1,5 @@
+import os
+import tempfile
 from time import sleep
 import zmq
 from locust.rpc import zmqrpc, Message
@@ -52,3 +54,19 @@ class ZMQRPC_tests(LocustTestCase):
         server.close()
         with self.assertRaises(RPCError):
             server.send_to_client(Message("test", "message", "identity"))
+
+    def test_ipc(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ipc_endpoint = "ipc://%s" % os.path.join(tmp_dir, "locust.ipc")
+            server = zmqrpc.Server(ipc_endpoint, 0)
+            client = zmqrpc.Client(ipc_endpoint, 0, "identity")
+            try:
+                client.send(Message("test", "message", "identity"))
+                addr, msg = server.recv_from_client()
+                self.assertEqual(addr, "identity")
+                self.assertEqual(msg.data, "message")
+                server.send_to_client(Message("test", "reply", "identity"))
+                self.assertEqual(client.recv().data, "reply")
+            finally:
+                server.close()
+                client.close()
@@ -0,0 +1,505 @@
+"""
+Bounded memory storage of the stats history (used for the charts in the web UI and the HTML report).
+
+The number of requests and failures and the response time distribution of the aggregated stats (and optionally of
+every stats entry) are stored in a :class:`ResponseTimeSeries`, which is fed incrementally: every second that drops
+out of a stats entry's :class:`ResponseTimeWindow <locust.histogram.ResponseTimeWindow>` is added to it, so
+recording the history costs nothing per request, and the response time percentiles of any time range can be
+calculated by merging a few small {key: count} dicts.
+
+The samples are stored in a number of tiers with decreasing resolution (see :data:`HISTORY_TIERS`). They are
+merged into buckets of the first tier's resolution, and when they get older than the retention of a tier, they are
+merged into the buckets of the next tier, so memory usage only grows very slowly in long tests. Optionally, the
+samples that leave the first tier (and, when the history is closed, those that are still in it) can be written to a
+file, so that the full resolution history isn't lost.
+"""
+import csv
+import datetime
+import io
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+from itertools import islice
+
+from .histogram import calculate_response_time_percentile
+from .reporter_io import reporter_io
+
+HISTORY_TIERS = ((5, 3600), (60, 24 * 3600), (600, None))
+"""(resolution, retention) in seconds of the tiers of the stats history (a retention of None means forever)"""
+
+HISTORY_FIELDS = (
+    "current_rps",
+    "current_fail_per_sec",
+    "response_time_percentile_95",
+    "response_time_percentile_50",
+    "user_count",
+)
+"""Fields of the aggregated stats history"""
+
+ENTRY_HISTORY_FIELDS = HISTORY_FIELDS[:-1]
+"""Fields of the history of a stats entry"""
+
+SPILL_FIELDS = ("timestamp", "method", "name") + ENTRY_HISTORY_FIELDS + ("num_requests", "num_failures")
+"""Columns of the history spill file"""
+
+
+class _Tier:
+    def __init__(self, resolution, retention, width):
+        self.resolution = resolution
+        self.retention = retention
+        self.times = array("d")
+        self.columns = [array("d") for _ in range(width)]
+        self._bucket = None
+        self._sums = [0.0] * width
+        self._count = 0
+
+    def add(self, timestamp, values):
+        bucket = timestamp // self.resolution
+        if bucket != self._bucket:
+            self.flush()
+            self._bucket = bucket
+        sums = self._sums
+        for i, value in enumerate(values):
+            sums[i] += value
+        self._count += 1
+
+    def flush(self):
+        """Store the bucket that samples are currently added to"""
+        if not self._count:
+            return
+        self.times.append(self._bucket * self.resolution)
+        for column, total in zip(self.columns, self._sums):
+            column.append(total / self._count)
+        self._sums = [0.0] * len(self._sums)
+        self._count = 0
+
+    def pending(self):
+        """Returns the bucket that samples are currently added to as a (timestamp, values) tuple, or None"""
+        if not self._count:
+            return None
+        return self._bucket * self.resolution, tuple(total / self._count for total in self._sums)
+
+    def __len__(self):
+        return len(self.times) + (1 if self._count else 0)
+
+
+class TimeSeries:
+    """
+    A time series of samples with the given fields, stored in tiers with decreasing resolution
+    """
+
+    def __init__(self, fields, tiers=HISTORY_TIERS, spill=None):
+        """
+        :param fields: Names of the values of the samples
+        :param tiers: (resolution, retention) of each tier, see :data:`HISTORY_TIERS`
+        :param spill: Optional callable that is called with the timestamp and values of every sample that leaves
+                      the first tier
+        """
+        self.fields = fields
+        self.tiers = [_Tier(resolution, retention, len(fields)) for resolution, retention in tiers]
+        self.spill = spill
+
+    def append(self, timestamp, values):
+        """
+        Add a sample. Samples must be added in chronological order.
+        """
+        self.tiers[0].add(timestamp, values)
+        self._expire(timestamp)
+
+    def _expire(self, now):
+        for i, tier in enumerate(self.tiers):
+            if tier.retention is None:
+                break
+            count = bisect_left(tier.times, now - tier.retention)
+            if not count:
+                continue
+            next_tier = self.tiers[i + 1] if i + 1 < len(self.tiers) else None
+            for j in range(count):
+                values = tuple(column[j] for column in tier.columns)
+                if i == 0 and self.spill is not None:
+                    self.spill(tier.times[j], values)
+                if next_tier is not None:
+                    next_tier.add(tier.times[j], values)
+            del tier.times[:count]
+            for column in tier.columns:
+                del column[:count]
+
+    def samples(self):
+        """
+        Yields the samples, oldest first, as (timestamp, resolution, values) tuples
+        """
+        for tier in reversed(self.tiers):
+            columns = tier.columns
+            for i, timestamp in enumerate(tier.times):
+                yield timestamp, tier.resolution, tuple(column[i] for column in columns)
+            pending = tier.pending()
+            if pending is not None:
+                yield pending[0], tier.resolution, pending[1]
+
+    def __iter__(self):
+        """
+        Yields the samples, oldest first, as (timestamp, values) tuples
+        """
+        for timestamp, _, values in self.samples():
+            yield timestamp, values
+
+    def __len__(self):
+        return sum(len(tier) for tier in self.tiers)
+
+    def since(self, timestamp):
+        """
+        Yields the samples at or after *timestamp*, as (timestamp, values) tuples
+        """
+        for sample in self:
+            if sample[0] >= timestamp:
+                yield sample
+
+
+class _HistogramTier:
+    def __init__(self, resolution, retention):
+        self.resolution = resolution
+        self.retention = retention
+        self.times = array("d")
+        self.num_requests = array("q")
+        self.num_failures = array("q")
+        self.histograms = []
+        self._bucket = None
+        self._num_requests = 0
+        self._num_failures = 0
+        self._keys = {}
+
+    def add(self, timestamp, keys, num_requests, num_failures):
+        bucket = timestamp // self.resolution
+        if self._bucket is None or bucket > self._bucket:
+            self.flush()
+            self._bucket = bucket
+        # older seconds (e.g. ones that a worker reported late) end up in the current bucket
+        self._num_requests += num_requests
+        self._num_failures += num_failures
+        merged = self._keys
+        for key, count in keys.items():
+            merged[key] = merged.get(key, 0) + count
+
+    def flush(self):
+        """Store the bucket that samples are currently added to"""
+        if not (self._num_requests or self._num_failures):
+            return
+        self.times.append(self._bucket * self.resolution)
+        self.num_requests.append(self._num_requests)
+        self.num_failures.append(self._num_failures)
+        self.histograms.append(self._keys)
+        self._num_requests = self._num_failures = 0
+        self._keys = {}
+
+    def pending(self):
+        """
+        Returns the bucket that samples are currently added to as a (timestamp, num_requests, num_failures, keys)
+        tuple, or None
+        """
+        if not (self._num_requests or self._num_failures):
+            return None
+        return self._bucket * self.resolution, self._num_requests, self._num_failures, self._keys
+
+    def __len__(self):
+        return len(self.times) + (1 if self._num_requests or self._num_failures else 0)
+
+
+class ResponseTimeSeries:
+    """
+    The number of requests, the number of failures and the response time distribution of a stats entry over time,
+    stored in tiers with decreasing resolution.
+
+    It's fed by the entry's :class:`ResponseTimeWindow <locust.histogram.ResponseTimeWindow>` (see
+    :meth:`StatsHistory.track`), with the seconds that drop out of it. The seconds that are still in the window are
+    included when reading from the series.
+    """
+
+    def __init__(self, histogram, tiers=HISTORY_TIERS, spill=None):
+        """
+        :param histogram: The histogram that the response time keys of the samples belong to
+        :param tiers: (resolution, retention) of each tier, see :data:`HISTORY_TIERS`
+        :param spill: Optional callable that is called with the timestamp and values (see :data:`SPILL_FIELDS`)
+                      of every bucket that leaves the first tier, and of the remaining ones on :meth:`flush_spill`
+        """
+        self.histogram = histogram
+        self.tiers = [_HistogramTier(resolution, retention) for resolution, retention in tiers]
+        self.spill = spill
+        self._spilled_until = None
+        self.window = None
+        """The ResponseTimeWindow that feeds this series, if any"""
+
+    def add(self, t, keys, num_requests, num_failures):
+        """
+        Add the requests of second *t*, where *keys* is a {key: count} dict of their response times
+        """
+        self.tiers[0].add(t, keys, num_requests, num_failures)
+        self._expire(t)
+
+    def _expire(self, now):
+        for i, tier in enumerate(self.tiers):
+            if tier.retention is None:
+                break
+            count = bisect_left(tier.times, now - tier.retention)
+            if not count:
+                continue
+            next_tier = self.tiers[i + 1] if i + 1 < len(self.tiers) else None
+            for j in range(count):
+                timestamp = tier.times[j]
+                keys = tier.histograms[j]
+                if i == 0:
+                    self._spill(timestamp, tier.resolution, tier.num_requests[j], tier.num_failures[j], keys)
+                if next_tier is not None:
+                    next_tier.add(timestamp, keys, tier.num_requests[j], tier.num_failures[j])
+            del tier.times[:count]
+            del tier.num_requests[:count]
+            del tier.num_failures[:count]
+            del tier.histograms[:count]
+
+    def _spill(self, timestamp, resolution, num_requests, num_failures, keys):
+        if self.spill is None or (self._spilled_until is not None and timestamp < self._spilled_until):
+            return
+        values = self.summarize(keys, num_requests, num_failures, resolution)
+        self.spill(float(timestamp), values + (num_requests, num_failures))
+
+    def flush_spill(self):
+        """
+        Spill the buckets that are still in the first tier (including the seconds that are still in the window),
+        e.g. when the test ends. They won't be spilled again when they leave the first tier.
+        """
+        last = None
+        for bucket in self._first_tier_buckets():
+            self._spill(*bucket)
+            last = bucket[0] + bucket[1]
+        if last is not None:
+            self._spilled_until = last
+
+    def buckets(self):
+        """
+        Yields the buckets, oldest first, as (timestamp, resolution, num_requests, num_failures, keys) tuples.
+        The keys dicts must not be modified.
+        """
+        for tier in reversed(self.tiers[1:]):
+            for i, timestamp in enumerate(tier.times):
+                yield timestamp, tier.resolution, tier.num_requests[i], tier.num_failures[i], tier.histograms[i]
+            pending = tier.pending()
+            if pending is not None:
+                yield (pending[0], tier.resolution) + pending[1:]
+        yield from self._first_tier_buckets()
+
+    def _first_tier_buckets(self):
+        first = self.tiers[0]
+        resolution = first.resolution
+        for i, timestamp in enumerate(first.times):
+            yield timestamp, resolution, first.num_requests[i], first.num_failures[i], first.histograms[i]
+        # merge the pending bucket with the seconds that are still in the window
+        tail = {}
+        pending = first.pending()
+        if pending is not None:
+            tail[pending[0]] = [pending[1], pending[2], dict(pending[3])]
+        if self.window is not None:
+            for t, keys, num_requests, num_failures in self.window.seconds():
+                if not (num_requests or num_failures):
+                    continue
+                bucket = tail.setdefault(t // resolution * resolution, [0, 0, {}])
+                bucket[0] += num_requests
+                bucket[1] += num_failures
+                merged = bucket[2]
+                for key, count in keys.items():
+                    merged[key] = merged.get(key, 0) + count
+        for timestamp in sorted(tail):
+            yield (timestamp, resolution) + tuple(tail[timestamp])
+
+    def __len__(self):
+        return sum(1 for _ in self.buckets())
+
+    def _merge(self, since, until):
+        num_requests = num_failures = 0
+        merged = {}
+        for timestamp, _, bucket_requests, bucket_failures, keys in self.buckets():
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp >= until:
+                break
+            num_requests += bucket_requests
+            num_failures += bucket_failures
+            for key, count in keys.items():
+                merged[key] = merged.get(key, 0) + count
+        return num_requests, num_failures, merged
+
+    def counts(self, since=None, until=None):
+        """
+        Returns the number of requests and failures in the buckets that start between *since* and *until*
+        """
+        num_requests, num_failures, _ = self._merge(since, until)
+        return num_requests, num_failures
+
+    def percentile(self, percent, since=None, until=None):
+        """
+        Get the response time percentile of the requests in the buckets that start between *since* and *until*,
+        e.g. ``series.percentile(0.95, since=time.time() - 1800)`` for the last half hour (the range is rounded to
+        the resolution of the buckets)
+        """
+        num_requests, _, merged = self._merge(since, until)
+        return self._percentile(merged, num_requests, percent)
+
+    def _percentile(self, keys, num_requests, percent):
+        if not num_requests:
+            return 0
+        return self.histogram.value_of(calculate_response_time_percentile(keys, num_requests, percent))
+
+    def summarize(self, keys, num_requests, num_failures, duration):
+        """
+        Returns the :data:`ENTRY_HISTORY_FIELDS` values of *duration* seconds of requests
+        """
+        return (
+            num_requests / duration,
+            num_failures / duration,
+            self._percentile(keys, num_requests, 0.95),
+            self._percentile(keys, num_requests, 0.5),
+        )
+
+
+class StatsHistory(Sequence):
+    """
+    The history of the aggregated stats (and optionally of every stats entry) of a
+    :class:`RequestStats <locust.stats.RequestStats>` instance.
+
+    It is a read-only sequence (like the list that ``RequestStats.history`` used to be, except that it can't be
+    appended to) of a dict for every user count sample (see :meth:`record`), with the time (as HH:MM:SS in UTC)
+    and the :data:`HISTORY_FIELDS` of the aggregated stats during that sample. The dicts are calculated by
+    :meth:`rows` every time they are accessed, so iterating over the history is cheaper than indexing it in a loop.
+    """
+
+    def __init__(self, per_entry=False, tiers=HISTORY_TIERS, spill_path=None):
+        """
+        :param per_entry: Whether to record the history of every stats entry, and not only of the aggregated stats
+        :param tiers: See :data:`HISTORY_TIERS`
+        :param spill_path: Optional path of a CSV file that samples are appended to when they leave the first tier,
+                           and when the history is closed
+        """
+        self.per_entry = per_entry
+        self.tiers = tiers
+        self.spill_path = spill_path
+        self._spill_file = None
+        self.clear()
+
+    def clear(self):
+        self.user_counts = TimeSeries(("user_count",), self.tiers)
+        self.total = None
+        """ResponseTimeSeries of the aggregated stats"""
+        self.entries = {}
+        """ResponseTimeSeries of every stats entry, by (name, method)"""
+
+    def track(self, entry, total=False):
+        """
+        Start recording the history of a :class:`StatsEntry <locust.stats.StatsEntry>`, if it has a response time
+        window and it's the aggregated entry or *per_entry* is set
+        """
+        window = entry.response_times_window
+        if window is None or not (total or self.per_entry):
+            return
+        series = ResponseTimeSeries(window.histogram, self.tiers, self._spiller(entry.method, entry.name))
+        series.window = window
+        window.sink = series.add
+        entry.history = series
+        if total:
+            self.total = series
+        else:
+            self.entries[(entry.name, entry.method)] = series
+
+    def _spiller(self, method, name):
+        if self.spill_path is None:
+            return None
+
+        def spill(timestamp, values):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow((timestamp, method or "", name) + values)
+            data = buffer.getvalue()
+            reporter_io.submit(self._write_spill_file, data, size=len(data))
+
+        return spill
+
+    def _write_spill_file(self, data):
+        # runs in the reporter I/O thread, like everything else that touches the spill file
+        if self._spill_file is None:
+            self._spill_file = open(self.spill_path, "a", newline="")
+            if self._spill_file.tell() == 0:
+                csv.writer(self._spill_file).writerow(SPILL_FIELDS)
+        self._spill_file.write(data)
+        self._spill_file.flush()
+
+    def _close_spill_file(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def record(self, user_count, timestamp=None):
+        """
+        Add a sample of the user count. The request stats are recorded continuously, but they're only included in
+        the charts for the time that user counts were recorded (i.e. while the test was running).
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.user_counts.append(timestamp, (user_count or 0,))
+
+    def close(self):
+        """
+        Spill the samples that are still in the first tier, and close the spill file (if any)
+        """
+        if self.spill_path is None:
+            return
+        for series in [self.total] + list(self.entries.values()):
+            if series is not None:
+                series.flush_spill()
+        reporter_io.call(self._close_spill_file)
+
+    def rows(self, series=None):
+        """
+        Yields a dict with the time and the :data:`HISTORY_FIELDS` for every user count sample, with the values
+        of *series* (defaults to the aggregated stats)
+        """
+        if series is None:
+            series = self.total
+        buckets = series.buckets() if series is not None else iter(())
+        bucket = next(buckets, None)
+        now = time.time()
+        for timestamp, resolution, (user_count,) in self.user_counts.samples():
+            end = timestamp + resolution
+            # skip the requests made while no samples were recorded (e.g. while the test was stopped)
+            while bucket is not None and bucket[0] < timestamp:
+                bucket = next(buckets, None)
+            num_requests = num_failures = 0
+            merged = {}
+            while bucket is not None and bucket[0] < end:
+                num_requests += bucket[2]
+                num_failures += bucket[3]
+                for key, count in bucket[4].items():
+                    merged[key] = merged.get(key, 0) + count
+                bucket = next(buckets, None)
+            if series is not None:
+                # the last sample may not have lasted its full resolution yet
+                duration = max(1.0, min(resolution, now - timestamp))
+                values = series.summarize(merged, num_requests, num_failures, duration)
+            else:
+                values = (0, 0, 0, 0)
+            row = dict(zip(ENTRY_HISTORY_FIELDS, values))
+            row["user_count"] = user_count
+            row["time"] = datetime.datetime.utcfromtimestamp(timestamp).strftime("%H:%M:%S")
+            yield row
+
+    def __iter__(self):
+        return self.rows()
+
+    def __len__(self):
+        return len(self.user_counts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.rows())[index]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("history index out of range")
+        return next(islice(self.rows(), index, None))
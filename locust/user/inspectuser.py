@@ -1,8 +1,7 @@
-from collections import defaultdict
 import inspect
 from json import dumps
 
-from .task import TaskSet
+from .task import TaskSet, get_task_weights
 
 
 def print_task_ratio(user_classes, num_users, total):
@@ -62,11 +61,10 @@ def get_ratio(user_classes, user_spawned, total):
 
 def _get_task_ratio(tasks, total, parent_ratio):
     parent_ratio = parent_ratio if total else 1.0
-    ratio = defaultdict(int)
-    for task in tasks:
-        ratio[task] += 1
+    weights = get_task_weights(tasks)
+    total_weight = sum(weight for _, weight in weights)
 
-    ratio_percent = {t: r * parent_ratio / len(tasks) for t, r in ratio.items()}
+    ratio_percent = {t: w * parent_ratio / total_weight for t, w in weights}
 
     task_dict = {}
     for t, r in ratio_percent.items():
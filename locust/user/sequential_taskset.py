@@ -1,6 +1,6 @@
 import logging
 from locust.exception import LocustError
-from .task import TaskSet, TaskSetMeta
+from .task import TaskSet, TaskSetMeta, WeightedTasks
 
 
 class SequentialTaskSetMeta(TaskSetMeta):
@@ -17,7 +17,11 @@ class SequentialTaskSetMeta(TaskSetMeta):
         for base in bases:
             # first get tasks from base classes
             if hasattr(base, "tasks") and base.tasks:
-                new_tasks += base.tasks
+                if isinstance(base.tasks, WeightedTasks):
+                    for task, weight in base.tasks.items():
+                        new_tasks.extend([task] * weight)
+                else:
+                    new_tasks += base.tasks
         for key, value in class_dict.items():
             if key == "tasks":
                 # we want to insert tasks from the tasks attribute at the point of it's declaration
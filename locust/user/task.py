@@ -2,6 +2,9 @@ import logging
 import random
 import sys
 import traceback
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate, repeat
 from time import time
 from typing import Any, Callable, List, Union
 from typing_extensions import final
@@ -16,6 +19,9 @@ logger = logging.getLogger(__name__)
 
 LOCUST_STATE_RUNNING, LOCUST_STATE_WAITING, LOCUST_STATE_STOPPING = ["running", "waiting", "stopping"]
 
+# the kinds of tasks, which decide how a task is called
+TASK_FUNCTION, TASK_TASKSET, TASK_METHOD = ["function", "taskset", "method"]
+
 
 def task(weight=1):
     """
@@ -85,7 +91,8 @@ def tag(*tags):
 
     def decorator_func(decorated):
         if hasattr(decorated, "tasks"):
-            decorated.tasks = list(map(tag(*tags), decorated.tasks))
+            for task in decorated.tasks:
+                tag(*tags)(task)
         else:
             if "locust_tag_set" not in decorated.__dict__:
                 decorated.locust_tag_set = set()
@@ -98,6 +105,297 @@ def tag(*tags):
     return decorator_func
 
 
+class WeightedTasks(list):
+    """
+    The tasks of a TaskSet or User class. It behaves like a list where each task is repeated as many times as its
+    weight (so e.g. ``len()`` and ``random.choice()`` take the weights into account, just like they did when the
+    tasks were stored that way), but every run of equal tasks is only stored once, along with its length, so
+    ``@task(1000)`` doesn't make a 1000 element list.
+
+    The weights are compiled into an alias table (using Vose's method), so that :meth:`choose` picks a task in
+    constant time whatever the weights. Modifying the list (e.g. ``tasks[0] = f`` or ``tasks.append(f)``)
+    compiles it again.
+    """
+
+    def __init__(self, items=()):
+        """
+        :param items: (task, weight) tuples. The weights of a task that occurs more than once are added up.
+        """
+        super().__init__()
+        weights = {}
+        for task, weight in items:
+            weights[task] = weights.get(task, 0) + weight
+        self._set_runs(weights.items())
+
+    @classmethod
+    def _from_runs(cls, runs):
+        tasks = cls()
+        tasks._set_runs(runs)
+        return tasks
+
+    def _set_runs(self, runs):
+        choices = []
+        weights = []
+        for task, weight in runs:
+            if weight <= 0:
+                continue
+            if choices and choices[-1] == task:
+                weights[-1] += weight
+            else:
+                choices.append(task)
+                weights.append(weight)
+        self.choices = choices
+        """The task of each run of equal tasks (which is every distinct task once, unless the list was modified)"""
+        self.weights = weights
+        """The length of each run, i.e. the weight of each task"""
+        self.kinds = [get_task_kind(task) for task in choices]
+        """The kind of each task (see :func:`get_task_kind`)"""
+        self._kinds_by_task = dict(zip(choices, self.kinds))
+        self._ends = list(accumulate(weights))
+        self._length = self._ends[-1] if self._ends else 0
+        self._probabilities, self._aliases = _build_alias_table(weights)
+
+    def _runs(self):
+        return list(zip(self.choices, self.weights))
+
+    def _splice(self, start, stop, tasks):
+        # replace the tasks from start to stop (as indexes of the list with the repeated tasks) with tasks
+        before = []
+        after = []
+        position = 0
+        for task, weight in zip(self.choices, self.weights):
+            if position < start:
+                before.append((task, min(weight, start - position)))
+            if position + weight > stop:
+                after.append((task, min(weight, position + weight - stop)))
+            position += weight
+        self._set_runs(before + [(task, 1) for task in tasks] + after)
+
+    def _position(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("list index out of range")
+        return index
+
+    def items(self):
+        """
+        Returns a list of (task, weight) tuples, with each distinct task once
+        """
+        weights = {}
+        for task, weight in zip(self.choices, self.weights):
+            weights[task] = weights.get(task, 0) + weight
+        return list(weights.items())
+
+    def choose(self):
+        """
+        Returns the index (in :attr:`choices`, :attr:`weights` and :attr:`kinds`) of a random task, picked
+        according to the weights
+        """
+        x = random.random() * len(self._probabilities)
+        i = int(x)
+        if x - i >= self._probabilities[i]:
+            i = self._aliases[i]
+        return i
+
+    def kind_of(self, task):
+        """
+        Returns the kind of *task*, which is only worked out if it isn't one of the tasks in the list
+        """
+        kind = self._kinds_by_task.get(task)
+        return get_task_kind(task) if kind is None else kind
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for task, weight in zip(self.choices, self.weights):
+            yield from repeat(task, weight)
+
+    def __reversed__(self):
+        for task, weight in zip(reversed(self.choices), reversed(self.weights)):
+            yield from repeat(task, weight)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        return self.choices[bisect_right(self._ends, self._position(index))]
+
+    def __contains__(self, task):
+        return task in self.choices
+
+    def __eq__(self, other):
+        if isinstance(other, WeightedTasks):
+            return self._runs() == other._runs()
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "WeightedTasks(%r)" % self._runs()
+
+    def __reduce__(self):
+        return self._from_runs, (self._runs(),)
+
+    def __add__(self, other):
+        return list(self) + other
+
+    def __radd__(self, other):
+        return other + list(self)
+
+    def __mul__(self, n):
+        return list(self) * n
+
+    __rmul__ = __mul__
+
+    def __iadd__(self, tasks):
+        self.extend(tasks)
+        return self
+
+    def __imul__(self, n):
+        self._set_runs(self._runs() * n)
+        return self
+
+    def count(self, task):
+        return sum(weight for t, weight in zip(self.choices, self.weights) if t == task)
+
+    def index(self, task, start=0, stop=sys.maxsize):
+        start, stop, _ = slice(start, stop).indices(self._length)
+        position = 0
+        for t, weight in zip(self.choices, self.weights):
+            if t == task and position + weight > start and max(position, start) < stop:
+                return max(position, start)
+            position += weight
+        raise ValueError("%r is not in list" % (task,))
+
+    def copy(self):
+        return self._from_runs(self._runs())
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step == 1:
+                self._splice(start, max(start, stop), list(value))
+            else:
+                tasks = list(self)
+                tasks[index] = value
+                self._set_runs((task, 1) for task in tasks)
+        else:
+            index = self._position(index)
+            self._splice(index, index + 1, [value])
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            tasks = list(self)
+            del tasks[index]
+            self._set_runs((task, 1) for task in tasks)
+        else:
+            index = self._position(index)
+            self._splice(index, index + 1, [])
+
+    def insert(self, index, task):
+        if index < 0:
+            index += self._length
+        index = min(max(index, 0), self._length)
+        self._splice(index, index, [task])
+
+    def append(self, task):
+        self._splice(self._length, self._length, [task])
+
+    def extend(self, tasks):
+        self._splice(self._length, self._length, list(tasks))
+
+    def pop(self, index=-1):
+        if not self._length:
+            raise IndexError("pop from empty list")
+        task = self[index]
+        del self[index]
+        return task
+
+    def remove(self, task):
+        del self[self.index(task)]
+
+    def clear(self):
+        self._set_runs(())
+
+    def reverse(self):
+        self._set_runs(self._runs()[::-1])
+
+    def sort(self, *, key=None, reverse=False):
+        # sorting the runs gives the same order as sorting the repeated tasks, since the sort is stable
+        self._set_runs(sorted(self._runs(), key=lambda run: run[0] if key is None else key(run[0]), reverse=reverse))
+
+
+def _build_alias_table(weights):
+    # each slot i is picked with probability 1/n, and then returns task i with probability probabilities[i]
+    # and task aliases[i] otherwise
+    n = len(weights)
+    total = sum(weights)
+    probabilities = [weight * n / total for weight in weights]
+    aliases = list(range(n))
+    small = [i for i, p in enumerate(probabilities) if p < 1]
+    large = [i for i, p in enumerate(probabilities) if p >= 1]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        aliases[less] = more
+        probabilities[more] -= 1 - probabilities[less]
+        if probabilities[more] < 1:
+            small.append(more)
+        else:
+            large.append(more)
+    # whatever is left is only off from 1 because of rounding errors
+    for i in small + large:
+        probabilities[i] = 1.0
+    return probabilities, aliases
+
+
+def get_task_kind(task):
+    """
+    Returns TASK_TASKSET if task is a TaskSet class, TASK_METHOD if it's a bound method and TASK_FUNCTION otherwise
+    """
+    if hasattr(task, "__self__"):
+        return TASK_METHOD
+    elif hasattr(task, "tasks") and issubclass(task, TaskSet):
+        return TASK_TASKSET
+    return TASK_FUNCTION
+
+
+def _kind_of(task, tasks):
+    # the kind of a task that is (usually) from the tasks attribute of a TaskSet or User class
+    if isinstance(tasks, WeightedTasks):
+        return tasks.kind_of(task)
+    return get_task_kind(task)
+
+
+def get_task_weights(tasks):
+    """
+    Returns a list of (task, weight) tuples for the tasks attribute of a TaskSet or User class. A task that occurs
+    more than once in a plain list gets a weight that is the number of occurrences.
+    """
+    if isinstance(tasks, WeightedTasks):
+        return tasks.items()
+    weights = {}
+    for task in tasks:
+        weights[task] = weights.get(task, 0) + 1
+    return list(weights.items())
+
+
+def choose_task(tasks):
+    """
+    Returns a random task from the tasks attribute of a TaskSet or User class
+    """
+    if isinstance(tasks, WeightedTasks):
+        return tasks.choices[tasks.choose()]
+    return random.choice(tasks)
+
+
 def get_tasks_from_base_classes(bases, class_dict):
     """
     Function used by both TaskSetMeta and UserMeta for collecting all declared tasks
@@ -106,7 +404,7 @@ def get_tasks_from_base_classes(bases, class_dict):
     new_tasks = []
     for base in bases:
         if hasattr(base, "tasks") and base.tasks:
-            new_tasks += base.tasks
+            new_tasks += get_task_weights(base.tasks)
 
     if "tasks" in class_dict and class_dict["tasks"] is not None:
         tasks = class_dict["tasks"]
@@ -115,18 +413,15 @@ def get_tasks_from_base_classes(bases, class_dict):
 
         for task in tasks:
             if isinstance(task, tuple):
-                task, count = task
-                for _ in range(count):
-                    new_tasks.append(task)
-            else:
                 new_tasks.append(task)
+            else:
+                new_tasks.append((task, 1))
 
     for item in class_dict.values():
         if "locust_task_weight" in dir(item):
-            for i in range(item.locust_task_weight):
-                new_tasks.append(item)
+            new_tasks.append((item, item.locust_task_weight))
 
-    return new_tasks
+    return WeightedTasks(new_tasks)
 
 
 def filter_tasks_by_tags(task_holder, tags=None, exclude_tags=None, checked=None):
@@ -138,10 +433,10 @@ def filter_tasks_by_tags(task_holder, tags=None, exclude_tags=None, checked=None
     new_tasks = []
     if checked is None:
         checked = {}
-    for task in task_holder.tasks:
+    for task, weight in get_task_weights(task_holder.tasks):
         if task in checked:
             if checked[task]:
-                new_tasks.append(task)
+                new_tasks.append((task, weight))
             continue
 
         passing = True
@@ -155,10 +450,10 @@ def filter_tasks_by_tags(task_holder, tags=None, exclude_tags=None, checked=None
                 passing &= "locust_tag_set" not in dir(task) or len(task.locust_tag_set & exclude_tags) == 0
 
         if passing:
-            new_tasks.append(task)
+            new_tasks.append((task, weight))
         checked[task] = passing
 
-    task_holder.tasks = new_tasks
+    task_holder.tasks = WeightedTasks(new_tasks)
 
 
 class TaskSetMeta(type):
@@ -204,6 +499,9 @@ class TaskSet(object, metaclass=TaskSetMeta):
 
         class ForumPage(TaskSet):
             tasks = {ThreadPage:15, write_post:1}
+
+    When the class is created, the tasks are turned into a :class:`WeightedTasks <locust.user.task.WeightedTasks>`
+    list, which contains each task once, along with its weight.
     """
 
     min_wait = None
@@ -234,7 +532,7 @@ class TaskSet(object, metaclass=TaskSetMeta):
     _parent = None
 
     def __init__(self, parent):
-        self._task_queue = []
+        self._task_queue = deque()
         self._time_start = time()
 
         if isinstance(parent, TaskSet):
@@ -285,13 +583,14 @@ class TaskSet(object, metaclass=TaskSetMeta):
             else:
                 raise RescheduleTask(e.reschedule).with_traceback(e.__traceback__)
 
+        user = self._user
         while True:
             try:
                 if not self._task_queue:
                     self.schedule_task(self.get_next_task())
 
                 try:
-                    if self.user._state == LOCUST_STATE_STOPPING:
+                    if user._state == LOCUST_STATE_STOPPING:
                         raise StopUser()
                     self.execute_next_task()
                 except RescheduleTaskImmediately:
@@ -310,26 +609,32 @@ class TaskSet(object, metaclass=TaskSetMeta):
                 self.on_stop()
                 raise
             except Exception as e:
-                self.user.environment.events.user_error.fire(user_instance=self, exception=e, tb=e.__traceback__)
-                if self.user.environment.catch_exceptions:
+                user.environment.events.user_error.fire(user_instance=self, exception=e, tb=e.__traceback__)
+                if user.environment.catch_exceptions:
                     logger.error("%s\n%s", e, traceback.format_exc())
                     self.wait()
                 else:
                     raise
 
     def execute_next_task(self):
-        self.execute_task(self._task_queue.pop(0))
+        self.execute_task(self._pop_next_task())
+
+    def _pop_next_task(self):
+        queue = self._task_queue
+        # the queue is a deque, unless it has been replaced with a list
+        return queue.popleft() if isinstance(queue, deque) else queue.pop(0)
 
     def execute_task(self, task):
-        # check if the function is a method bound to the current locust, and if so, don't pass self as first argument
-        if hasattr(task, "__self__") and task.__self__ == self:
-            # task is a bound method on self
-            task()
-        elif hasattr(task, "tasks") and issubclass(task, TaskSet):
+        kind = _kind_of(task, self.tasks)
+        if kind is TASK_FUNCTION:
+            task(self)
+        elif kind is TASK_TASKSET:
             # task is another (nested) TaskSet class
             task(self).run()
+        elif task.__self__ == self:
+            # task is a method bound to the current TaskSet, so don't pass self as first argument
+            task()
         else:
-            # task is a function
             task(self)
 
     def schedule_task(self, task_callable, first=False):
@@ -339,17 +644,19 @@ class TaskSet(object, metaclass=TaskSetMeta):
         :param task_callable: User task to schedule.
         :param first: Optional keyword argument. If True, the task will be put first in the queue.
         """
-        if first:
-            self._task_queue.insert(0, task_callable)
-        else:
+        if not first:
             self._task_queue.append(task_callable)
+        elif isinstance(self._task_queue, deque):
+            self._task_queue.appendleft(task_callable)
+        else:
+            self._task_queue.insert(0, task_callable)
 
     def get_next_task(self):
         if not self.tasks:
             raise Exception(
                 f"No tasks defined on {self.__class__.__name__}. use the @task decorator or set the tasks property of the TaskSet"
             )
-        return random.choice(self.tasks)
+        return choose_task(self.tasks)
 
     def wait_time(self):
         """
@@ -361,8 +668,8 @@ class TaskSet(object, metaclass=TaskSetMeta):
             class Tasks(TaskSet):
                 wait_time = between(3, 25)
         """
-        if self.user.wait_time:
-            return self.user.wait_time()
+        if self._user.wait_time:
+            return self._user.wait_time()
         elif self.min_wait is not None and self.max_wait is not None:
             return random.randint(self.min_wait, self.max_wait) / 1000.0
         else:
@@ -384,13 +691,14 @@ class TaskSet(object, metaclass=TaskSetMeta):
         set a stop_timeout. If this behaviour is not desired you should make the user wait using
         gevent.sleep() instead.
         """
-        if self.user._state == LOCUST_STATE_STOPPING:
+        user = self._user
+        if user._state == LOCUST_STATE_STOPPING:
             raise StopUser()
-        self.user._state = LOCUST_STATE_WAITING
+        user._state = LOCUST_STATE_WAITING
         self._sleep(self.wait_time())
-        if self.user._state == LOCUST_STATE_STOPPING:
+        if user._state == LOCUST_STATE_STOPPING:
             raise StopUser()
-        self.user._state = LOCUST_STATE_RUNNING
+        user._state = LOCUST_STATE_RUNNING
 
     def _sleep(self, seconds):
         gevent.sleep(seconds)
@@ -423,12 +731,12 @@ class DefaultTaskSet(TaskSet):
             raise Exception(
                 f"No tasks defined on {self.user.__class__.__name__}. use the @task decorator or set the tasks property of the User (or mark it as abstract = True if you only intend to subclass it)"
             )
-        return random.choice(self.user.tasks)
+        return choose_task(self.user.tasks)
 
     def execute_task(self, task):
-        if hasattr(task, "tasks") and issubclass(task, TaskSet):
+        if _kind_of(task, self.user.tasks) is TASK_TASKSET:
             # task is  (nested) TaskSet class
-            task(self.user).run()
+            task(self._user).run()
         else:
             # task is a function
-            task(self.user)
+            task(self._user)
@@ -92,6 +92,9 @@ class User(object, metaclass=UserMeta):
 
         class ForumPage(TaskSet):
             tasks = {ThreadPage:15, write_post:1}
+
+    When the class is created, the tasks are turned into a :class:`WeightedTasks <locust.user.task.WeightedTasks>`
+    list, which contains each task once, along with its weight.
     """
 
     weight = 1
@@ -136,7 +139,11 @@ class User(object, metaclass=UserMeta):
             # run the TaskSet on_start method, if it has one
             self.on_start()
 
-            self._taskset_instance.run()
+            if self.environment.arrival_executor is not None:
+                # open model: run task iterations when the executor tells us to
+                self.environment.arrival_executor.run_user(self)
+            else:
+                self._taskset_instance.run()
         except (GreenletExit, StopUser):
             # run the on_stop method, if it has one
             self.on_stop()
@@ -57,6 +57,8 @@ def constant_pacing(wait_time):
             self._cp_last_run = time()
             return self._cp_last_wait_time
 
+    # used to correct the response times for coordinated omission (see get_expected_interval)
+    wait_time_func.expected_interval = wait_time
     return wait_time_func
 
 
@@ -84,3 +86,29 @@ def constant_throughput(task_runs_per_second):
     the next task.
     """
     return constant_pacing(1 / task_runs_per_second)
+
+
+def rate_limited(rate_limit):
+    """
+    Returns a function that waits until the :class:`RateLimit <locust.ratelimit.RateLimit>` passed as argument
+    allows the next task to run, so that all the users with this wait_time together (on all workers) run no more
+    than rate_limit.rate tasks per second.
+
+    In the following example the users run 1000 tasks per second in total, however many users there are (as long
+    as there are enough of them)::
+
+        class MyUser(User):
+            wait_time = rate_limited(RateLimit("my_user", 1000))
+            @task
+            def my_task(self):
+                time.sleep(random.random())
+    """
+    return lambda instance: rate_limit.reserve()
+
+
+def get_expected_interval(user):
+    """
+    Returns the number of seconds between the starts of the tasks of *user* that its wait_time aims for (if it's
+    :func:`constant_pacing` or :func:`constant_throughput`), or None if the user doesn't follow a fixed schedule
+    """
+    return getattr(user.wait_time, "expected_interval", None)
@@ -11,21 +11,23 @@ from itertools import chain
 from time import time
 
 import gevent
-from flask import Flask, make_response, jsonify, render_template, request, send_file
+from flask import Flask, Response, make_response, jsonify, render_template, request, send_file
 from flask_basicauth import BasicAuth
 from gevent import pywsgi
 
 from .exception import AuthCredentialsError
 from .runners import MasterRunner
 from .log import greenlet_exception_logger
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsExporter
 from .stats import sort_stats
 from . import stats as stats_module, __version__ as version, argument_parser
 from .stats import StatsCSV
+from .stats_index import SORT_FIELDS, StatsIndex, stats_row
+from .stats_stream import StatsStream
 from .user.inspectuser import get_ratio
 from .util.cache import memoize
-from .util.rounding import proper_round
 from .util.timespan import parse_timespan
-from .html import get_html_report
+from .html import stream_gzipped_html_report, stream_html_report
 from flask_cors import CORS
 from json import dumps
 
@@ -109,6 +111,9 @@ class WebUI:
         self.auth = None
         self.greenlet = None
         self._swarm_greenlet = None
+        self.stats_index = None
+        self.stats_stream = StatsStream(self)
+        self.metrics_exporter = MetricsExporter(environment)
 
         if auth_credentials is not None:
             credentials = auth_credentials.split(":")
@@ -187,9 +192,14 @@ class WebUI:
         @app.route("/stats/report")
         @self.auth_required_if_enabled
         def stats_report():
-            res = get_html_report(self.environment, show_download_link=not request.args.get("download"))
+            show_download_link = not request.args.get("download")
+            if "gzip" in request.accept_encodings:
+                res = Response(stream_gzipped_html_report(self.environment, show_download_link), mimetype="text/html")
+                res.headers["Content-Encoding"] = "gzip"
+            else:
+                res = Response(stream_html_report(self.environment, show_download_link), mimetype="text/html")
+            res.headers["Vary"] = "Accept-Encoding"
             if request.args.get("download"):
-                res = app.make_response(res)
                 res.headers["Content-Disposition"] = "attachment;filename=report_%s.html" % time()
             return res
 
@@ -258,68 +268,83 @@ class WebUI:
             stats = []
 
             for s in chain(sort_stats(self.environment.runner.stats.entries), [environment.runner.stats.total]):
-                stats.append(
-                    {
-                        "method": s.method,
-                        "name": s.name,
-                        "safe_name": escape(s.name, quote=False),
-                        "num_requests": s.num_requests,
-                        "num_failures": s.num_failures,
-                        "avg_response_time": s.avg_response_time,
-                        "min_response_time": 0 if s.min_response_time is None else proper_round(s.min_response_time),
-                        "max_response_time": proper_round(s.max_response_time),
-                        "current_rps": s.current_rps,
-                        "current_fail_per_sec": s.current_fail_per_sec,
-                        "median_response_time": s.median_response_time,
-                        "ninetieth_response_time": s.get_response_time_percentile(0.9),
-                        "avg_content_length": s.avg_content_length,
-                    }
-                )
-
-            errors = []
-            for e in environment.runner.errors.values():
-                err_dict = e.to_dict()
-                err_dict["name"] = escape(err_dict["name"])
-                err_dict["error"] = escape(err_dict["error"])
-                errors.append(err_dict)
+                stats.append(stats_row(s))
 
-            # Truncate the total number of stats and errors displayed since a large number of rows will cause the app
+            # Truncate the total number of stats displayed since a large number of rows will cause the app
             # to render extremely slowly. Aggregate stats should be preserved.
-            report = {"stats": stats[:500], "errors": errors[:500]}
+            report = {"stats": stats[:500]}
             if len(stats) > 500:
                 report["stats"] += [stats[-1]]
+            report.update(self.stats_summary())
 
-            if stats:
-                report["total_rps"] = stats[len(stats) - 1]["current_rps"]
-                report["fail_ratio"] = environment.runner.stats.total.fail_ratio
-                report[
-                    "current_response_time_percentile_95"
-                ] = environment.runner.stats.total.get_current_response_time_percentile(0.95)
-                report[
-                    "current_response_time_percentile_50"
-                ] = environment.runner.stats.total.get_current_response_time_percentile(0.5)
-
-            is_distributed = isinstance(environment.runner, MasterRunner)
-            if is_distributed:
-                workers = []
-                for worker in environment.runner.clients.values():
-                    workers.append(
-                        {
-                            "id": worker.id,
-                            "state": worker.state,
-                            "user_count": worker.user_count,
-                            "cpu_usage": worker.cpu_usage,
-                            "memory_usage": worker.memory_usage,
-                        }
-                    )
+            return jsonify(report)
 
-                report["workers"] = workers
+        @app.route("/stats/requests/v2")
+        @self.auth_required_if_enabled
+        def request_stats_v2():
+            try:
+                since = int(request.args.get("since", 0))
+                offset = int(request.args.get("offset", 0))
+                limit = int(request.args["limit"]) if "limit" in request.args else None
+            except ValueError:
+                return make_response(jsonify({"error": "since, offset and limit must be integers"}), 400)
+            sort = request.args.get("sort") or None
+            if sort is not None and sort not in SORT_FIELDS:
+                return make_response(
+                    jsonify({"error": "Can't sort on %s, must be one of: %s" % (sort, ", ".join(SORT_FIELDS))}), 400
+                )
 
+            report = self.get_stats_index().query(
+                since=since,
+                sort=sort,
+                descending=request.args.get("order") == "desc",
+                name_filter=request.args.get("filter"),
+                offset=max(offset, 0),
+                limit=None if limit is None else max(limit, 0),
+            )
             report["state"] = environment.runner.state
             report["user_count"] = environment.runner.user_count
-
             return jsonify(report)
 
+        @app.route("/stats/stream")
+        @self.auth_required_if_enabled
+        def stats_stream():
+            subscription = self.stats_stream.subscribe()
+
+            def events():
+                try:
+                    while True:
+                        event = subscription.get()
+                        if event is None:
+                            return
+                        yield event
+                finally:
+                    self.stats_stream.unsubscribe(subscription)
+
+            return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+        @app.route("/metrics")
+        @self.auth_required_if_enabled
+        def metrics():
+            return Response(self.metrics_exporter.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+        @app.route("/profile")
+        @self.auth_required_if_enabled
+        def profile():
+            if environment.profiler is None:
+                return make_response("Profiling is not enabled (use --profile)", 404)
+            res = Response(environment.profiler.folded(), mimetype="text/plain")
+            if request.args.get("download"):
+                res.headers["Content-Disposition"] = "attachment;filename=profile_%s.folded" % time()
+            return res
+
+        @app.route("/profile/summary")
+        @self.auth_required_if_enabled
+        def profile_summary():
+            if environment.profiler is None:
+                return make_response("Profiling is not enabled (use --profile)", 404)
+            return jsonify({"categories": environment.profiler.summary(), "nodes": environment.profiler.node_samples})
+
         @app.route("/exceptions")
         @self.auth_required_if_enabled
         def exceptions():
@@ -375,8 +400,60 @@ class WebUI:
         """
         Stop the running web server
         """
+        self.stats_stream.stop()
         self.server.stop()
 
+    def get_stats_index(self):
+        """
+        Returns the :class:`StatsIndex <locust.stats_index.StatsIndex>` of the runner's stats
+        """
+        stats = self.environment.runner.stats
+        if self.stats_index is None or self.stats_index.stats is not stats:
+            self.stats_index = StatsIndex(stats)
+        return self.stats_index
+
+    def stats_summary(self):
+        """
+        Everything shown in the web UI's statistics tab except for the rows of the stats entries: the errors,
+        the current total rps, fail ratio and response time percentiles, the workers and the runner's state.
+        """
+        runner = self.environment.runner
+        total = runner.stats.total
+        errors = []
+        for e in runner.errors.values():
+            err_dict = e.to_dict()
+            err_dict["name"] = escape(err_dict["name"])
+            err_dict["error"] = escape(err_dict["error"])
+            errors.append(err_dict)
+
+        summary = {
+            # Truncate the total number of errors displayed, like the stats
+            "errors": errors[:500],
+            "total_rps": total.current_rps,
+            "fail_ratio": total.fail_ratio,
+            "current_response_time_percentile_95": total.get_current_response_time_percentile(0.95),
+            "current_response_time_percentile_50": total.get_current_response_time_percentile(0.5),
+        }
+
+        if isinstance(runner, MasterRunner):
+            workers = []
+            for worker in runner.clients.values():
+                workers.append(
+                    {
+                        "id": worker.id,
+                        "state": worker.state,
+                        "user_count": worker.user_count,
+                        "cpu_usage": worker.cpu_usage,
+                        "memory_usage": worker.memory_usage,
+                    }
+                )
+
+            summary["workers"] = workers
+
+        summary["state"] = runner.state
+        summary["user_count"] = runner.user_count
+        return summary
+
     def auth_required_if_enabled(self, view_func):
         """
         Decorator that can be used on custom route methods that will turn on Basic Auth